@@ -15,7 +15,9 @@ import bluew.errors
 from .api import connect, disconnect, remove
 from .api import pair, info, trust, distrust
 from .api import write_attribute, read_attribute
-from .api import Connection, devices, controllers
+from .api import Connection, devices, controllers, power
+from .api import find_devices
+from .api import keep_warm
 from .device import Device
 from .controller import Controller
 
@@ -47,7 +49,10 @@ __all__ = ['__version__',
            'read_attribute',
            'Connection',
            'devices',
+           'find_devices',
            'controllers',
+           'power',
+           'keep_warm',
            'Device',
            'Controller',
            'errors']
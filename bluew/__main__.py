@@ -0,0 +1,18 @@
+"""
+bluew.__main__
+~~~~~~~~~~~~~~
+
+This module runs the bluew command, see bluew.cli.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import sys
+
+from bluew.cli import main
+
+
+sys.exit(main())
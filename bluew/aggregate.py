@@ -0,0 +1,230 @@
+"""
+bluew.aggregate
+~~~~~~~~~~~~~~~
+
+This module provides a pipeline stage for high rate notifications, that
+decodes values, gathers the samples in windows, and delivers the min, max
+and mean of every window, instead of every sample.
+
+Windows are either counted in samples or timed in seconds. They're
+tumbling, one after the other, unless `step` is smaller than `size`, which
+makes them sliding, starting every `step` samples or seconds. Timed
+windows close when the first sample past their end arrives, or on flush().
+
+Per characteristic, through a Pipeline:
+
+    >>> pipeline = Pipeline(connection)
+    >>> pipeline.subscribe(uuid, print, size=1.0, by=TIME,
+    ...                    decode=decoder(fmt))
+
+Or as a handler of its own:
+
+    >>> connection.notify(uuid, Aggregate(print, size=200))
+
+Statistics are computed over a window at once, with numpy if it's
+installed, and with the builtins otherwise.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import bisect
+import math
+import threading
+import time
+
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional  # noqa: F401
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+COUNT = 'count'
+TIME = 'time'
+
+Window = namedtuple('Window', ['start', 'end', 'count', 'min', 'max',
+                               'mean'])
+
+
+def _samples(decoded) -> list:
+    # Decoders return a number, or a sequence of them for packets carrying
+    # several samples.
+    if isinstance(decoded, (int, float)):
+        return [decoded]
+    return list(decoded)
+
+
+def _stats(values: list):
+    if numpy is not None:
+        array = numpy.asarray(values, dtype=float)
+        return float(array.min()), float(array.max()), float(array.mean())
+    return min(values), max(values), math.fsum(values) / len(values)
+
+
+class Aggregate(object):
+    """
+    A notification handler, delivering a Window of the samples of every
+    window to deliver.
+    :param size: Samples, or seconds, per window.
+    :param step: Samples, or seconds, between window starts, size if None.
+    :param by: COUNT or TIME.
+    :param decode: Turns a value into a number, or a sequence of numbers.
+    By default every byte of the value is a sample.
+    """
+
+    def __init__(self, deliver: Callable[[Window], None], size: float,
+                 step: Optional[float] = None, by: str = COUNT,
+                 decode: Optional[Callable] = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        # pylint: disable=too-many-arguments
+        if by not in (COUNT, TIME):
+            raise ValueError('windows are by COUNT or by TIME')
+        step = size if step is None else step
+        if size <= 0 or step <= 0:
+            raise ValueError('size and step must be positive')
+        if by == COUNT and (size != int(size) or step != int(step)):
+            raise ValueError('counted windows need whole sizes and steps')
+        self.deliver = deliver
+        self.size = size
+        self.step = step
+        self.by = by  # pylint: disable=invalid-name
+        self.decode = decode
+        self.clock = clock
+        self.windows = 0
+        self._values = []  # type: List[float]
+        self._times = []  # type: List[float]
+        self._base = 0
+        self._total = 0
+        self._start = None  # type: Optional[float]
+        self._lock = threading.Lock()
+
+    def __call__(self, value) -> None:
+        decoded = value if self.decode is None else self.decode(value)
+        self.add(_samples(decoded), self.clock())
+
+    def add(self, samples: list, timestamp: Optional[float] = None) -> None:
+        """Add samples that arrived at timestamp, defaults to now."""
+        if timestamp is None:
+            timestamp = self.clock()
+        with self._lock:
+            self._values.extend(samples)
+            self._times.extend([timestamp] * len(samples))
+            self._total += len(samples)
+            if self.by == COUNT:
+                ready = self._close_counted()
+            else:
+                ready = self._close_timed(timestamp)
+        for window in ready:
+            self.deliver(window)
+
+    def _window(self, low: int, high: int, start: float,
+                end: float) -> Window:
+        self.windows += 1
+        return Window(start, end, high - low,
+                      *_stats(self._values[low:high]))
+
+    def _drop(self, count: int) -> None:
+        count = min(count, len(self._values))
+        del self._values[:count]
+        del self._times[:count]
+        self._base += count
+
+    def _close_counted(self) -> List[Window]:
+        ready = []
+        size, step = int(self.size), int(self.step)
+        start = self._start or 0
+        while start + size <= self._total:
+            low = int(start) - self._base
+            ready.append(self._window(low, low + size, self._times[low],
+                                      self._times[low + size - 1]))
+            start += step
+        self._start = start
+        self._drop(int(start) - self._base)
+        return ready
+
+    def _close_timed(self, now: float) -> List[Window]:
+        ready = []
+        if self._start is None:
+            self._start = self._times[0]
+        while now >= self._start + self.size:
+            end = self._start + self.size
+            low = bisect.bisect_left(self._times, self._start)
+            high = bisect.bisect_left(self._times, end)
+            if high > low:
+                ready.append(self._window(low, high, self._start, end))
+                self._start += self.step
+            else:
+                # Nothing came in this window, go straight to the first one
+                # holding the oldest sample left, or the newest one.
+                oldest = self._times[low] if low < len(self._times) else now
+                skip = math.floor((oldest - end) / self.step) + 1
+                self._start += max(skip, 1) * self.step
+            self._drop(bisect.bisect_left(self._times, self._start))
+        return ready
+
+    def flush(self) -> Optional[Window]:
+        """Deliver the samples of the window that's still open, if any."""
+        with self._lock:
+            if self.by == COUNT:
+                low = max(int(self._start or 0) - self._base, 0)
+            else:
+                low = bisect.bisect_left(self._times, self._start or 0)
+            window = None
+            if low < len(self._values):
+                high = len(self._values)
+                if self.by == COUNT:
+                    start, end = self._times[low], self._times[high - 1]
+                else:
+                    start, end = self._start, self._start + self.size
+                window = self._window(low, high, start, end)
+            self._drop(len(self._values))
+            self._start = self._total if self.by == COUNT else None
+        if window is not None:
+            self.deliver(window)
+        return window
+
+
+class Pipeline(object):
+    """
+    Aggregate stages of the characteristics of one connection, each with
+    a windowing of its own.
+    """
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+        self.stages = {}  # type: Dict[str, Aggregate]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def subscribe(self, attribute: str, deliver: Callable[[Window], None],
+                  **window) -> Aggregate:
+        """
+        Turn on notifications of attribute, and deliver its windows.
+        :param window: size, step, by and decode, see Aggregate.
+        """
+        stage = Aggregate(deliver, **window)
+        self.unsubscribe(attribute)
+        self.stages[attribute] = stage
+        self.connection.notify(attribute, stage)
+        return stage
+
+    def unsubscribe(self, attribute: str) -> None:
+        """Turn off notifications of attribute, and flush its stage."""
+        stage = self.stages.pop(attribute, None)
+        if stage is not None:
+            self.connection.stop_notify(attribute)
+            stage.flush()
+
+    def close(self) -> None:
+        """Unsubscribe from every characteristic."""
+        for attribute in list(self.stages):
+            self.unsubscribe(attribute)
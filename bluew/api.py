@@ -12,36 +12,162 @@ Basic usage:
     >>> bluew.read_attribute(mac, attr)
     [b'0', b'0']
 
+Every call brings an engine up and stops it again. Scripts making a few
+calls in a row can keep the engines warm instead, with their bus
+connection, loop thread and controller list, until they're done:
+
+    >>> bluew.keep_warm()
+    >>> bluew.read_attribute(mac, attr)
+    >>> bluew.keep_warm(False)
+
 
 :copyright: (c) 2017 by Ahmed Alsharif.
 :license: MIT, see LICENSE for more details.
 """
 
 
-from typing import List
+import threading
+
+from contextlib import contextmanager
+from typing import Dict, List, Optional  # noqa: F401
 
 from .connections import Connection
-from .plugables import UsedEngine
+from .engine import EngineBluew  # pylint: disable=unused-import
+from .plugables import get_engine
 from .device import Device
 from .controller import Controller
 
 
+# Arguments that are for a Connection, and not for the engine under it.
+_CONNECTION_KWARGS = frozenset({'keep_alive', 'wait_for_services',
+                                'reconnect', 'reconnect_attempts',
+                                'op_timeout'})
+
+_WARM_LOCK = threading.Lock()
+_warm = None  # type: Optional[Dict[tuple, EngineBluew]]
+_reaper = None  # type: Optional[threading.Thread]
+
+
+def keep_warm(on: bool = True) -> None:
+    """
+    Keep the engines API calls start running from one call to the next,
+    one per engine and set of engine arguments, instead of bringing one up
+    and stopping it every call. keep_warm(False) stops them, and so does
+    the main thread ending.
+    """
+    # pylint: disable=invalid-name,global-statement
+
+    global _warm, _reaper
+    with _WARM_LOCK:
+        if on:
+            if _warm is None:
+                _warm = {}
+            if _reaper is None:
+                _reaper = threading.Thread(target=_stop_at_exit,
+                                           name='bluew-warm', daemon=True)
+                _reaper.start()
+            return
+        engines, _warm = _warm or {}, None
+    for engine in engines.values():
+        engine.stop_engine()
+
+
+def _stop_at_exit() -> None:
+    # An atexit hook only runs once the non-daemon threads are done, and
+    # the dbusted main loop is one of them. Stop the warm engines as soon as
+    # the main thread is done instead.
+    threading.main_thread().join()
+    keep_warm(False)
+
+
+def _warm_engine(args, kwargs, engine=None) -> Optional[EngineBluew]:
+    cls = get_engine(engine)
+    engine_kwargs = {key: value for key, value in kwargs.items()
+                     if key not in _CONNECTION_KWARGS}
+    key = (cls, repr(args), tuple(sorted(
+        (name, repr(value)) for name, value in engine_kwargs.items())))
+    with _WARM_LOCK:
+        if _warm is None:
+            return None
+        instance = _warm.get(key)
+        # An engine stopped under the cache is replaced, instead of every
+        # later call failing on it.
+        if instance is None or getattr(instance, '_stopped', False):
+            instance = _warm[key] = cls(*args, **engine_kwargs)
+            instance.start_engine()
+        return instance
+
+
+@contextmanager
+def _engine(*args, engine=None, **kwargs):
+    """
+    Instantiate the engine, importing it on first use, or get the warm one,
+    see keep_warm().
+    :param engine: Name of a registered engine or an EngineBluew subclass,
+    see bluew.plugables.
+    """
+    warm = _warm_engine(args, kwargs, engine)
+    if warm is not None:
+        yield warm
+        return
+    with get_engine(engine)(*args, **kwargs) as instance:
+        yield instance
+
+
+def _connection(mac: str, *args, engine=None, **kwargs) -> Connection:
+    warm = _warm_engine(args, kwargs, engine)
+    return Connection(mac, *args, engine=warm or engine, **kwargs)
+
+
 def devices(*args, **kwargs) -> List[Device]:
     """Get list of devices around."""
-    with UsedEngine(*args, **kwargs) as engine:
+    with _engine(*args, **kwargs) as engine:
         return engine.devices
 
 
+def find_devices(*args, uuid: Optional[str] = None,
+                 name: Optional[str] = None,
+                 manufacturer: Optional[int] = None,
+                 address_type: Optional[str] = None,
+                 min_rssi: Optional[int] = None, top: Optional[int] = None,
+                 scan: float = 0, **kwargs) -> List[Device]:
+    """Find devices by their properties, without scanning unless asked to.
+    :param uuid: A service UUID the device advertises, 16 bits will do.
+    :param name: A prefix of the device's name, in any case.
+    :param manufacturer: A manufacturer ID of its ManufacturerData.
+    :param address_type: 'public' or 'random'.
+    :param min_rssi: The weakest RSSI, in dBm, accepted.
+    :param top: Only the top devices by RSSI, strongest first.
+    :param scan: Seconds to scan for more matches, stopping early once
+    there's top of them. Scans are filtered by uuid and min_rssi.
+    """
+    # pylint: disable=too-many-arguments
+
+    with _engine(*args, **kwargs) as engine:
+        return engine.find_devices(uuid, name, manufacturer, address_type,
+                                   min_rssi, top, scan)
+
+
 def controllers(*args, **kwargs) -> List[Controller]:
     """Get list of available controllers."""
-    with UsedEngine(*args, **kwargs) as engine:
+    with _engine(*args, **kwargs) as engine:
         return engine.controllers
 
 
+def power(on: bool = True, *args, **kwargs) -> None:
+    """Power the bluetooth controller on or off.
+    :param on: Power on if True, off otherwise.
+    """
+    # pylint: disable=invalid-name,keyword-arg-before-vararg
+
+    with _engine(*args, **kwargs) as engine:
+        return engine.power(on)
+
+
 def get_devices(*args, **kwargs) -> List[Device]:
     """Get list of devices around."""
 
-    with UsedEngine(*args, **kwargs) as engine:
+    with _engine(*args, **kwargs) as engine:
         return engine.get_devices()
 
 
@@ -50,7 +176,7 @@ def connect(mac: str, *args, **kwargs) -> None:
     :param mac: MAC address of bluetooth device.
     """
 
-    with UsedEngine(*args, **kwargs) as engine:
+    with _engine(*args, **kwargs) as engine:
         return engine.connect(mac)
 
 
@@ -59,7 +185,7 @@ def disconnect(mac: str, *args, **kwargs) -> None:
     :param mac: MAC address of bluetooth device.
     """
 
-    with UsedEngine(*args, **kwargs) as engine:
+    with _engine(*args, **kwargs) as engine:
         return engine.disconnect(mac)
 
 
@@ -68,7 +194,7 @@ def trust(mac: str, *args, **kwargs) -> None:
     :param mac: MAC address of bluetooth device.
     """
 
-    with UsedEngine(*args, **kwargs) as engine:
+    with _engine(*args, **kwargs) as engine:
         return engine.trust(mac)
 
 
@@ -77,7 +203,7 @@ def distrust(mac: str, *args, **kwargs) -> None:
     :param mac: MAC address of bluetooth device.
     """
 
-    with UsedEngine(*args, **kwargs) as engine:
+    with _engine(*args, **kwargs) as engine:
         return engine.distrust(mac)
 
 
@@ -86,7 +212,7 @@ def pair(mac: str, *args, **kwargs) -> None:
     :param mac: MAC address of bluetooth device.
     """
 
-    with UsedEngine(*args, **kwargs) as engine:
+    with _engine(*args, **kwargs) as engine:
         return engine.pair(mac)
 
 
@@ -95,7 +221,7 @@ def remove(mac: str, *args, **kwargs) -> None:
     :param mac: MAC address of bluetooth device.
     """
 
-    with UsedEngine(*args, **kwargs) as engine:
+    with _engine(*args, **kwargs) as engine:
         return engine.remove(mac)
 
 
@@ -107,7 +233,7 @@ def write_attribute(mac: str, attribute: str, data: List[int],
     :param data: Data to write to attribute.
     """
 
-    with Connection(mac, *args, **kwargs) as connection:
+    with _connection(mac, *args, **kwargs) as connection:
         return connection.write_attribute(attribute, data)
 
 
@@ -117,7 +243,7 @@ def read_attribute(mac: str, attribute: str, *args, **kwargs) -> List[bytes]:
     :param attribute: Bluetooth attribute to read.
     """
 
-    with Connection(mac, *args, **kwargs) as connection:
+    with _connection(mac, *args, **kwargs) as connection:
         return connection.read_attribute(attribute)
 
 
@@ -126,5 +252,5 @@ def info(mac: str, *args, **kwargs) -> Device:
     :param mac: MAC address of bluetooth device.
     """
 
-    with UsedEngine(*args, **kwargs) as engine:
+    with _engine(*args, **kwargs) as engine:
         return engine.info(mac)
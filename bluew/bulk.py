@@ -0,0 +1,336 @@
+"""
+bluew.bulk
+~~~~~~~~~~
+
+This module provides bulk transfers, for pushing a large binary like a
+firmware image to a characteristic, one chunk after the other.
+
+Chunks are written without response, with up to `window` writes in flight,
+which keeps the link busy instead of waiting a round trip per chunk. Every
+`checkpoint` bytes, and for the last chunk, the transfer waits for the
+writes in flight, and writes the next chunk with response. Everything
+before an acknowledged chunk is known to have reached the device, so a
+transfer that failed can be resumed from the last checkpoint, which the
+BulkWriteError raised carries as `offset`.
+
+Engines pass a `lane`, that the transfer holds a GATT slot of the adapter
+with, see bluew.scheduler. It's held for a stretch of up to `window`
+chunks, or up to the next acknowledged chunk, then given back with
+nothing in flight, so other operations get in between stretches.
+
+The engines run the transfers, see EngineBluew.bulk_write():
+
+    >>> with open('firmware.bin', 'rb') as image:
+    ...     stats = connection.bulk_write(uuid, image, progress=print)
+    >>> stats.throughput
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import io
+import os
+import threading
+import time
+
+from typing import Callable, Iterable, Iterator, Optional  # noqa: F401
+
+from bluew.errors import BulkWriteError
+
+
+WINDOW = 8
+CHECKPOINT = 4096
+
+
+class BulkStats(object):
+    """Progress and throughput of a bulk transfer. Offsets are absolute."""
+
+    def __init__(self, offset: int = 0, total: Optional[int] = None) -> None:
+        self.start_offset = offset
+        self.total = total
+        self.sent = offset
+        self.acked = offset
+        self.chunks = 0
+        self.checkpoints = 0
+        self._started = time.monotonic()
+        self._stopped = None  # type: Optional[float]
+
+    def stop(self) -> None:
+        """Stop the clock."""
+        self._stopped = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds the transfer took, or has been running."""
+        return (self._stopped or time.monotonic()) - self._started
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second sent by this transfer."""
+        elapsed = self.elapsed
+        if not elapsed:
+            return 0.0
+        return (self.sent - self.start_offset) / elapsed
+
+    def __repr__(self):
+        return ('BulkStats(sent={}, acked={}, total={}, chunks={}, '
+                'elapsed={:.3f}s, throughput={:.0f}B/s)').format(
+                    self.sent, self.acked, self.total, self.chunks,
+                    self.elapsed, self.throughput)
+
+
+def _rechunk(pieces: Iterable[bytes], size: int,
+             skip: int = 0) -> Iterator[bytes]:
+    buf = bytearray()
+    for piece in pieces:
+        if skip:
+            dropped = min(skip, len(piece))
+            piece, skip = piece[dropped:], skip - dropped
+        buf += piece
+        while len(buf) >= size:
+            yield bytes(buf[:size])
+            del buf[:size]
+    if buf:
+        yield bytes(buf)
+
+
+def read_chunks(source, size: int, offset: int = 0) -> Iterator[bytes]:
+    """
+    Split a source in chunks of size bytes, starting at offset.
+    :param source: bytes-like, a binary file, or an iterable of bytes.
+    """
+
+    if size <= 0:
+        raise ValueError('chunk size must be positive')
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        return (bytes(view[pos:pos + size])
+                for pos in range(offset, len(view), size))
+    if hasattr(source, 'read'):
+        if offset and source.seekable():
+            source.seek(offset)
+            offset = 0
+        return _rechunk(iter(lambda: source.read(size), b''), size, offset)
+    return _rechunk(source, size, offset)
+
+
+def source_size(source) -> Optional[int]:
+    """Length of a source in bytes, None if it can't be told up front."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return memoryview(source).nbytes
+    if not hasattr(source, 'read'):
+        return None
+    try:
+        return os.fstat(source.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pass
+    if source.seekable():
+        pos = source.tell()
+        size = source.seek(0, io.SEEK_END)
+        source.seek(pos)
+        return size
+    return None
+
+
+def resumable(source) -> bool:
+    """Whether a transfer of source can be restarted from an offset."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return True
+    return hasattr(source, 'read') and source.seekable()
+
+
+def _with_last(chunks: Iterator[bytes]) -> Iterator[tuple]:
+    chunk = next(chunks, None)
+    while chunk is not None:
+        following = next(chunks, None)
+        yield chunk, following is None
+        chunk = following
+
+
+def _acked(stats: BulkStats, chunk: bytes, last: bool, response: bool,
+           checkpoint: int) -> bool:
+    if response or last:
+        return True
+    return bool(checkpoint) and \
+        stats.sent + len(chunk) - stats.acked >= checkpoint
+
+
+class _Window(object):
+    """Writes in flight, completed from other threads."""
+
+    def __init__(self, size: int) -> None:
+        self._size = max(size, 1)
+        self._pending = 0
+        self._error = None  # type: Optional[BaseException]
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        """Wait for a free slot."""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._pending < self._size or self._error)
+            self._raise()
+            self._pending += 1
+
+    def done(self, error: Optional[BaseException] = None) -> None:
+        """A write completed, with error if it failed."""
+        with self._cond:
+            self._pending -= 1
+            if error is not None and self._error is None:
+                self._error = error
+            self._cond.notify_all()
+
+    def drain(self) -> None:
+        """Wait for every write in flight."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._pending)
+            self._raise()
+
+    def _raise(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+
+def _stretch_over(acked: bool, chunks: int, window: int) -> bool:
+    # Whether the lane is given back after this chunk.
+    return acked or chunks >= max(window, 1)
+
+
+def _failed(stats: BulkStats) -> BulkWriteError:
+    stats.stop()
+    reason = 'Bulk write failed, resume from offset {}.'.format(stats.acked)
+    return BulkWriteError(long_reason=reason, offset=stats.acked,
+                          stats=stats)
+
+
+def bulk_write(write: Callable, write_command: Callable, source,
+               chunk_size: int, window: int = WINDOW,
+               response: bool = False, checkpoint: int = CHECKPOINT,
+               offset: int = 0, progress: Optional[Callable] = None,
+               lane: Optional[Callable] = None) -> BulkStats:
+    """
+    Run a bulk transfer.
+    :param write: write(chunk) writes with response, and returns once the
+    device acknowledged it.
+    :param write_command: write_command(chunk, done) starts a write without
+    response, and calls done(error) once bluez is done with it.
+    :param source: bytes-like, a binary file, or an iterable of bytes.
+    :param chunk_size: Bytes per write.
+    :param window: Most writes without response in flight.
+    :param response: Write every chunk with response.
+    :param checkpoint: Write with response every this many bytes, 0 for
+    only the last chunk.
+    :param offset: Skip this many bytes of source, to resume a transfer.
+    :param progress: Called with the BulkStats after every chunk.
+    :param lane: lane() is a context manager held for every stretch of
+    the transfer, see above.
+    :return: The BulkStats of the transfer.
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+
+    stats = BulkStats(offset, source_size(source))
+    flight = _Window(window)
+    held = None
+    stretch = 0
+    try:
+        for chunk, last in _with_last(read_chunks(source, chunk_size,
+                                                  offset)):
+            if lane is not None and held is None:
+                held = lane()
+                held.__enter__()
+                stretch = 0
+            acked = _acked(stats, chunk, last, response, checkpoint)
+            if acked:
+                flight.drain()
+                write(chunk)
+                stats.sent += len(chunk)
+                stats.acked = stats.sent
+                stats.checkpoints += 1
+            else:
+                flight.acquire()
+                write_command(chunk, flight.done)
+                stats.sent += len(chunk)
+            stats.chunks += 1
+            stretch += 1
+            if held is not None and _stretch_over(acked, stretch, window):
+                flight.drain()
+                done, held = held, None
+                done.__exit__(None, None, None)
+            if progress is not None:
+                progress(stats)
+        flight.drain()
+    except Exception as exp:
+        raise _failed(stats) from exp
+    finally:
+        if held is not None:
+            held.__exit__(None, None, None)
+    stats.stop()
+    return stats
+
+
+async def async_bulk_write(write: Callable, write_command: Callable, source,
+                           chunk_size: int, window: int = WINDOW,
+                           response: bool = False,
+                           checkpoint: int = CHECKPOINT, offset: int = 0,
+                           progress: Optional[Callable] = None,
+                           lane: Optional[Callable] = None) -> BulkStats:
+    """
+    bulk_write(), with write(chunk) and write_command(chunk) coroutine
+    functions, both returning once bluez replied, and lane() an async
+    context manager.
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    # Only engines running a loop get here, import bluew doesn't pay for it.
+    import asyncio
+
+    stats = BulkStats(offset, source_size(source))
+    pending = set()  # type: set
+
+    async def _drain(most):
+        while len(pending) > most:
+            done, _ = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            for task in done:
+                task.result()
+
+    held = None
+    stretch = 0
+    try:
+        for chunk, last in _with_last(read_chunks(source, chunk_size,
+                                                  offset)):
+            if lane is not None and held is None:
+                held = lane()
+                await held.__aenter__()
+                stretch = 0
+            acked = _acked(stats, chunk, last, response, checkpoint)
+            if acked:
+                await _drain(0)
+                await write(chunk)
+                stats.sent += len(chunk)
+                stats.acked = stats.sent
+                stats.checkpoints += 1
+            else:
+                await _drain(max(window, 1) - 1)
+                pending.add(asyncio.ensure_future(write_command(chunk)))
+                stats.sent += len(chunk)
+            stats.chunks += 1
+            stretch += 1
+            if held is not None and _stretch_over(acked, stretch, window):
+                await _drain(0)
+                done, held = held, None
+                await done.__aexit__(None, None, None)
+            if progress is not None:
+                progress(stats)
+        await _drain(0)
+    except Exception as exp:
+        for task in pending:
+            task.cancel()
+        raise _failed(stats) from exp
+    finally:
+        if held is not None:
+            await held.__aexit__(None, None, None)
+    stats.stop()
+    return stats
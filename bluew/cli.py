@@ -0,0 +1,311 @@
+"""
+bluew.cli
+~~~~~~~~~
+
+This module provides the `bluew` command, for looking around and measuring
+links without writing a script:
+
+    $ bluew scan --duration 30
+    $ bluew read AA:BB:CC:DD:EE:FF 00002a19-0000-1000-8000-00805f9b34fb
+    $ bluew write AA:BB:CC:DD:EE:FF 00002a06-0000-1000-8000-00805f9b34fb 02
+    $ bluew monitor AA:BB:CC:DD:EE:FF 00002a37-0000-1000-8000-00805f9b34fb
+    $ bluew bench AA:BB:CC:DD:EE:FF 00002a19-0000-1000-8000-00805f9b34fb
+
+Every subcommand takes --engine, --controller and --timeout, which are
+passed on to the engine. `python -m bluew` runs it too.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import argparse
+import sys
+import threading
+import time
+
+from typing import Callable, Dict, List, Optional  # noqa: F401
+
+from bluew.connections import Connection
+from bluew.errors import BluewError, ReadWriteNotifyError
+from bluew.plugables import available_engines, get_engine
+from bluew.record import Recorder
+from bluew.stats import Timings, percentile
+
+
+class RateMeter(object):
+    """Arrivals of notifications, fed from the engine's thread."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.nbytes = 0
+        self.intervals = []  # type: List[float]
+        self._last = None  # type: Optional[float]
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, size: int, now: Optional[float] = None) -> None:
+        """A notification of size bytes arrived."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._last is not None:
+                self.intervals.append(now - self._last)
+            self._last = now
+            self.count += 1
+            self.nbytes += size
+
+    def summary(self, now: Optional[float] = None) -> str:
+        """One line: rate, throughput and the spread of arrival times."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            elapsed = max(now - self._started, 1e-9)
+            line = 'notifications={} rate={:.1f}/s {:.0f} B/s'.format(
+                self.count, self.count / elapsed, self.nbytes / elapsed)
+            if self.intervals:
+                line += ' interval p50={:.1f}ms p99={:.1f}ms ' \
+                        'max={:.1f}ms'.format(
+                            *(1000 * percentile(self.intervals, pct)
+                              for pct in (50, 99, 100)))
+            return line
+
+
+def _out(*args) -> None:
+    print(*args, flush=True)
+
+
+def _value(value) -> bytes:
+    # Engines return reads as a list of one byte long bytes.
+    if value is None:
+        raise ReadWriteNotifyError(long_reason='No value was read.')
+    if isinstance(value, list):
+        return b''.join(value)
+    return bytes(value)
+
+
+def _format(value: bytes, fmt: str) -> str:
+    if fmt == 'text':
+        return value.decode('utf-8', errors='replace')
+    return value.hex()
+
+
+def _engine_kwargs(args) -> dict:
+    kwargs = {'engine': args.engine, 'cntrl': args.controller}
+    if args.timeout is not None:
+        kwargs['timeout'] = args.timeout
+    return kwargs
+
+
+def _connection(args) -> Connection:
+    return Connection(args.mac, reconnect=False, wait_for_services=True,
+                      **_engine_kwargs(args))
+
+
+def _until(duration: Optional[float]) -> Callable[[], bool]:
+    deadline = None if duration is None else time.monotonic() + duration
+    return lambda: deadline is not None and time.monotonic() >= deadline
+
+
+def scan(args) -> int:
+    """
+    Print the devices that showed up, or changed name or RSSI, every
+    --interval seconds of scanning. Devices bluez knows are left alone.
+    """
+    kwargs = _engine_kwargs(args)
+    done = _until(args.duration)
+    started = time.monotonic()
+    shown = {}  # type: Dict[str, tuple]
+    with get_engine(kwargs.pop('engine'))(**kwargs) as engine:
+        try:
+            while not done():
+                for device in engine.find_devices(scan=args.interval):
+                    address = str(getattr(device, 'Address', ''))
+                    row = (getattr(device, 'RSSI', None) or '',
+                           getattr(device, 'Name', None) or '')
+                    if shown.get(address) == row:
+                        continue
+                    shown[address] = row
+                    _out('{:8.2f}  {}  {:>4}  {}'.format(
+                        time.monotonic() - started, address, *row))
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+def read(args) -> int:
+    """Print the value of an attribute."""
+    with _connection(args) as connection:
+        if args.long:
+            value = connection.read_long_attribute(args.attribute)
+        else:
+            value = connection.read_attribute(args.attribute)
+    _out(_format(_value(value), args.format))
+    return 0
+
+
+def write(args) -> int:
+    """Write a value given in hex to an attribute."""
+    data = bytes.fromhex(args.data)
+    with _connection(args) as connection:
+        if args.long:
+            connection.write_long_attribute(args.attribute, data)
+        else:
+            connection.write_attribute(args.attribute, list(data))
+    return 0
+
+
+def monitor(args) -> int:
+    """Print notifications of an attribute, with their rate."""
+    meter = RateMeter()
+
+    def _handler(value):
+        meter.record(len(value))
+        if not args.quiet:
+            _out('{:.6f}  {}'.format(time.monotonic(),
+                                     _format(bytes(value), args.format)))
+
+    done = _until(args.duration)
+    recorder = Recorder(args.record) if args.record else None
+    if recorder is not None:
+        _handler = recorder.handler(args.mac, args.attribute, _handler)
+    try:
+        with _connection(args) as connection:
+            connection.notify(args.attribute, _handler)
+            try:
+                while not done():
+                    time.sleep(args.interval)
+                    _out('# ' + meter.summary())
+            except KeyboardInterrupt:
+                pass
+            connection.stop_notify(args.attribute)
+    finally:
+        if recorder is not None:
+            recorder.close()
+    _out('# ' + meter.summary())
+    return 0
+
+
+def _cycle(args, timings: dict, data: Optional[bytes]) -> None:
+    connection = timings['connect'].time(_connection, args)
+    try:
+        for _ in range(args.ops):
+            value = timings['read'].time(connection.read_attribute,
+                                         args.attribute)
+            timings['read'].nbytes += len(_value(value))
+            if data is not None:
+                timings['write'].time(connection.write_attribute,
+                                      args.attribute, list(data),
+                                      size=len(data))
+        if args.notify:
+            timings['notify'].time(connection.notify, args.attribute,
+                                   lambda value: None)
+            connection.stop_notify(args.attribute)
+        timings['disconnect'].time(connection.engine.disconnect, args.mac)
+    finally:
+        connection.close()
+
+
+def bench(args) -> int:
+    """
+    Run connect/read/write/notify cycles, and print latency percentiles and
+    throughput of every operation. Writes, and enabling notifications, are
+    left out unless asked for, since they can change the device's state.
+    """
+    data = bytes.fromhex(args.write) if args.write is not None else None
+    timings = {name: Timings(name) for name in
+               ('connect', 'read', 'write', 'notify', 'disconnect')}
+    started = time.monotonic()
+    try:
+        for cycle in range(args.cycles):
+            try:
+                _cycle(args, timings, data)
+            except BluewError as exp:
+                _out('# cycle {} failed: {}'.format(cycle, exp))
+    except KeyboardInterrupt:
+        pass
+    _out('# {:.2f}s'.format(time.monotonic() - started))
+    for timing in timings.values():
+        if timing.samples or timing.errors:
+            _out(timing.summary())
+    return 0 if any(t.samples for t in timings.values()) else 1
+
+
+def _parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--engine', choices=available_engines(),
+                        help='engine to use, defaults to dbusted')
+    common.add_argument('--controller', metavar='HCI',
+                        help='controller to use, like hci0')
+    common.add_argument('--timeout', type=float,
+                        help='engine timeout in seconds')
+    device = argparse.ArgumentParser(add_help=False, parents=[common])
+    device.add_argument('mac', help='MAC address of the device')
+    device.add_argument('attribute', help='UUID of the characteristic')
+    shown = argparse.ArgumentParser(add_help=False)
+    shown.add_argument('--format', choices=('hex', 'text'), default='hex',
+                       help='how values are printed')
+
+    parser = argparse.ArgumentParser(
+        prog='bluew', description='Bluetooth made easy.')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    cmd = commands.add_parser('scan', parents=[common],
+                              help='stream the devices around')
+    cmd.add_argument('--duration', type=float,
+                     help='seconds to scan, until interrupted if not set')
+    cmd.add_argument('--interval', type=float, default=2.0,
+                     help='seconds per round of scanning')
+    cmd.set_defaults(func=scan)
+
+    cmd = commands.add_parser('read', parents=[device, shown],
+                              help='read a characteristic')
+    cmd.add_argument('--long', action='store_true',
+                     help='read a value longer than the MTU')
+    cmd.set_defaults(func=read)
+
+    cmd = commands.add_parser('write', parents=[device],
+                              help='write a characteristic')
+    cmd.add_argument('data', help='value to write, in hex')
+    cmd.add_argument('--long', action='store_true',
+                     help='write a value longer than the MTU')
+    cmd.set_defaults(func=write)
+
+    cmd = commands.add_parser('monitor', parents=[device, shown],
+                              help='stream notifications, with stats')
+    cmd.add_argument('--duration', type=float,
+                     help='seconds to monitor, until interrupted if not set')
+    cmd.add_argument('--interval', type=float, default=5.0,
+                     help='seconds between stats lines')
+    cmd.add_argument('--quiet', action='store_true',
+                     help='only print stats')
+    cmd.add_argument('--record', metavar='PATH',
+                     help='also record notifications to a log, see '
+                          'bluew.record')
+    cmd.set_defaults(func=monitor)
+
+    cmd = commands.add_parser('bench', parents=[device],
+                              help='measure link latency and throughput')
+    cmd.add_argument('--cycles', type=int, default=10,
+                     help='connect/disconnect cycles')
+    cmd.add_argument('--ops', type=int, default=10,
+                     help='reads, and writes, per cycle')
+    cmd.add_argument('--write', metavar='DATA',
+                     help='also write this value, in hex, every read')
+    cmd.add_argument('--notify', action='store_true',
+                     help='also turn notifications on and off every cycle')
+    cmd.set_defaults(func=bench)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the bluew command."""
+    args = _parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except BluewError as exp:
+        print('bluew: error: {}'.format(exp), file=sys.stderr)
+        return 1
+    except ValueError as exp:
+        print('bluew: error: {}'.format(exp), file=sys.stderr)
+        return 2
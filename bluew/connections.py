@@ -12,11 +12,11 @@ with one device.
 
 
 from functools import wraps
-import bluew.plugables
-from bluew.daemon import Daemon, daemonize
-
-
-UsedEngine = bluew.plugables.UsedEngine  # type: ignore
+from bluew.bulk import CHECKPOINT, WINDOW, resumable
+from bluew.engine import EngineBluew
+from bluew.errors import BulkWriteError
+from bluew.plugables import get_engine
+from bluew.daemon import Daemon, daemonize, supervised
 
 
 def close_on_error(func):
@@ -48,73 +48,212 @@ class Connection:
         >>> device = bluew.Connection(mac)
         >>> device.info()
 
+    The engine used can be picked with the `engine` keyword argument, which
+    takes the name of a registered engine or an EngineBluew subclass. An
+    engine that's already running can be passed too, the connection then
+    uses it, and leaves it running when it's closed.
+
+    Unless `reconnect=False` is passed, a dropped link is brought back by
+    the connection's daemon, see bluew.daemon. `reconnect_attempts` and
+    `op_timeout` are passed on to it.
+
+    With `wait_for_services=True`, connecting only completes once service
+    discovery is done, and `discovery_time` holds how long that took.
+
     """
 
-    def __init__(self, mac, *args, **kwargs):
+    def __init__(self, mac, *args, engine=None, **kwargs):
         self.keep_alive = kwargs.get('keep_alive', True)
-        self.engine = UsedEngine(*args, **kwargs)
+        self._owns_engine = not isinstance(engine, EngineBluew)
+        if self._owns_engine:
+            engine = get_engine(engine)(*args, **kwargs)
+        self.engine = engine
         self.mac = mac
+        self.wait_for_services = kwargs.get('wait_for_services', False)
+        self.discovery_time = None
+        self.daemon = Daemon(self,
+                             max_attempts=kwargs.get('reconnect_attempts'),
+                             op_timeout=kwargs.get('op_timeout', 30))
         self._connect()
-        self.daemon = Daemon()
+        if kwargs.get('reconnect', True):
+            self.daemon.start()
 
     def __enter__(self):
         return self
 
     @close_on_error
     def _connect(self):
-        self.engine.start_engine()
-        self.engine.connect(self.mac)
+        if self._owns_engine:
+            self.engine.start_engine()
+        self._link()
+
+    def _link(self):
+        if self.wait_for_services:
+            self.discovery_time = self.engine.connect(self.mac,
+                                                      wait_for_services=True)
+        else:
+            self.engine.connect(self.mac)
 
     @close_on_error
-    def _disconnect(self):
+    def disconnect(self):
+        """
+        Disconnect from the device, leaving the engine running. The daemon
+        stops bringing the link back.
+        """
+        self.daemon.stop()
         self.engine.disconnect(self.mac)
 
     @close_on_error
+    @supervised
     @daemonize
     def pair(self):
         """Pair with bluetooth device."""
         return self.engine.pair(self.mac)
 
     @close_on_error
+    @supervised
     def trust(self):
         """Trust a bluetooth device."""
         return self.engine.trust(self.mac)
 
     @close_on_error
+    @supervised
     def write_attribute(self, attribute, data):
         """Write to a bluetooth attribute."""
         return self.engine.write_attribute(self.mac, attribute, data)
 
     @close_on_error
-    def read_attribute(self, attribute):
-        """Read a bluetooth attribute."""
-        return self.engine.read_attribute(self.mac, attribute)
+    @supervised
+    def read_attribute(self, attribute, max_age=None):
+        """
+        Read a bluetooth attribute. With max_age, a value the engine read or
+        was notified of at most max_age seconds ago is good enough.
+        """
+        if max_age is None:
+            return self.engine.read_attribute(self.mac, attribute)
+        return self.engine.read_attribute(self.mac, attribute,
+                                          max_age=max_age)
+
+    @close_on_error
+    @supervised
+    def get_mtu(self, attribute):
+        """Get the ATT MTU negotiated with the device."""
+        return self.engine.get_mtu(self.mac, attribute)
+
+    @close_on_error
+    @supervised
+    def write_long_attribute(self, attribute, data, chunk_size=None):
+        """
+        Write a value longer than the MTU to a bluetooth attribute, in
+        chunks of chunk_size bytes, or as big as the MTU allows.
+        """
+        return self.engine.write_long_attribute(self.mac, attribute, data,
+                                                chunk_size)
+
+    @close_on_error
+    def bulk_write(self, attribute, source, chunk_size=None, window=WINDOW,
+                   response=False, checkpoint=CHECKPOINT, offset=0,
+                   progress=None):
+        """
+        Push a large binary, like a firmware image, to a bluetooth attribute,
+        see bluew.bulk. source can be bytes, a binary file or an iterable of
+        bytes. If the link drops, the daemon reconnects and the transfer
+        goes on from its last checkpoint, when source can be seeked.
+        :return: The BulkStats of the transfer.
+        """
+        # pylint: disable=too-many-arguments
+        daemon = self.daemon
+        supervising = daemon is not None and daemon.running
+        if supervising:
+            daemon.wait_linked()
+        kwargs = {'chunk_size': chunk_size, 'window': window,
+                  'response': response, 'checkpoint': checkpoint,
+                  'progress': progress}
+        try:
+            return self.engine.bulk_write(self.mac, attribute, source,
+                                          offset=offset, **kwargs)
+        except BulkWriteError as exp:
+            if not supervising or daemon.check_link() or \
+                    not resumable(source):
+                raise
+            offset = exp.offset
+        daemon.wait_linked()
+        return self.engine.bulk_write(self.mac, attribute, source,
+                                      offset=offset, **kwargs)
+
+    @close_on_error
+    @supervised
+    def read_long_attribute(self, attribute, length=None, chunk_size=None):
+        """
+        Read a value longer than the MTU from a bluetooth attribute. Pass
+        the expected length, if known, to have the buffer the value is read
+        into allocated once.
+        """
+        return self.engine.read_long_attribute(self.mac, attribute, length,
+                                               chunk_size)
 
     @close_on_error
+    @supervised
     def info(self):
         """Get device info."""
         return self.engine.info(self.mac)
 
     @property  # type: ignore
     @close_on_error
+    @supervised
     def services(self):
         """Get available BLE services of a device."""
         return self.engine.get_services(self.mac)
 
     @property  # type: ignore
     @close_on_error
+    @supervised
     def chrcs(self):
         """Get available BLE characteristics of a device."""
         return self.engine.get_chrcs(self.mac)
 
+    @property  # type: ignore
+    @close_on_error
+    @supervised
+    def descriptors(self):
+        """Get available BLE descriptors of a device."""
+        return self.engine.get_descriptors(self.mac)
+
+    @close_on_error
+    @supervised
+    def read_descriptor(self, attribute, descriptor):
+        """Read a descriptor of a bluetooth attribute."""
+        return self.engine.read_descriptor(self.mac, attribute, descriptor)
+
+    @close_on_error
+    @supervised
+    def write_descriptor(self, attribute, descriptor, data):
+        """Write data to a descriptor of a bluetooth attribute."""
+        return self.engine.write_descriptor(self.mac, attribute, descriptor,
+                                            data)
+
     @close_on_error
-    def notify(self, attribute, handler):
-        """Turn on notifications on attribute, and call handler with data."""
-        return self.engine.notify(self.mac, attribute, handler)
+    @supervised
+    def notify(self, attribute, handler=None, ring=None):
+        """
+        Turn on notifications on attribute, and call handler with data.
+        They're turned on again after a reconnect.
+        :param ring: A bluew.shmring.RingWriter, that values are written to
+        as well, keyed by ring.key_for(attribute), for other processes to
+        read.
+        """
+        if ring is not None:
+            handler = ring.handler(ring.key_for(attribute), handler)
+        elif handler is None:
+            raise ValueError('notify() needs a handler, or a ring')
+        self.engine.notify(self.mac, attribute, handler)
+        self.daemon.d_notify[attribute] = handler
 
     @close_on_error
+    @supervised
     def stop_notify(self, attribute):
         """Turn off notifications on attribute."""
+        self.daemon.d_notify.pop(attribute, None)
         return self.engine.stop_notify(self.mac, attribute)
 
     @close_on_error
@@ -124,9 +263,11 @@ class Connection:
 
     def close(self):
         """Close the conncection."""
+        self.daemon.stop()
         if not self.keep_alive:
             self.remove()
-        self.engine.stop_engine()
+        if self._owns_engine:
+            self.engine.stop_engine()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
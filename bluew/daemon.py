@@ -6,17 +6,43 @@ This module provides a Daemon object that tries its best to keep connections
 alive, and has the ability to reproduce certain steps when a reconnection is
 needed.
 
+Once started, the daemon runs a supervisor thread per connection. When the
+engine reports the device as disconnected, the supervisor reconnects with a
+jittered exponential backoff, replays the steps recorded with d_init=True,
+and turns the notifications the connection asked for back on. Operations
+started while the link is down wait for it to come back, up to op_timeout
+seconds, and fail with DeviceNotAvailable otherwise.
+
 
 :copyright: (c) 2017 by Ahmed Alsharif.
 :license: MIT, see LICENSE for more details.
 """
 
 
+import logging
+import random
+import threading
+import time
+
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Dict, Optional  # noqa: F401
+
+from bluew.errors import BluewError, DeviceNotAvailable
+
+
+LINKED = 'linked'
+LOST = 'lost'
+FAILED = 'failed'
+STOPPED = 'stopped'
+
+
 def daemonize(func):
     """
     A function wrapper that checks daemon flags. This wrapper as it is assumes
     that the calling class has a daemon attribute.
     """
+    @wraps(func)
     def _wrapper(self, *args, d_init=False, **kwargs):
         if d_init:
             self.daemon.d_init.append((func, self, args, kwargs))
@@ -25,11 +51,72 @@ def daemonize(func):
     return _wrapper
 
 
+def supervised(func):
+    """
+    A function wrapper that holds operations back while the daemon is
+    reconnecting. An operation failing because the link just dropped is run
+    once more after the reconnect, instead of surfacing the error. This
+    wrapper as it is assumes that the calling class has a daemon attribute.
+    """
+    @wraps(func)
+    def _wrapper(self, *args, **kwargs):
+        daemon = self.daemon
+        if daemon is None or not daemon.running:
+            return func(self, *args, **kwargs)
+        daemon.wait_linked()
+        try:
+            return func(self, *args, **kwargs)
+        except BluewError:
+            if daemon.check_link():
+                raise
+        daemon.wait_linked()
+        return func(self, *args, **kwargs)
+
+    return _wrapper
+
+
 class Daemon(object):
-    """The bluew daemon."""
+    """
+    The bluew daemon.
+
+    :param connection: The Connection to supervise, needed by start().
+    :param backoff: Delay before the first reconnect attempt, doubled after
+    every failed attempt.
+    :param max_backoff: Upper bound of the delay between attempts.
+    :param max_attempts: Give up after this many failed attempts, None to
+    keep trying until the daemon is stopped.
+    :param op_timeout: How long operations wait for a reconnect.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
 
-    def __init__(self):
+    def __init__(self, connection=None, backoff: float = 0.5,
+                 max_backoff: float = 30,
+                 max_attempts: Optional[int] = None,
+                 op_timeout: float = 30) -> None:
         self.d_init = []
+        self.d_notify = OrderedDict()  # type: Dict[str, Callable]
+        self.connection = connection
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.op_timeout = op_timeout
+        self.reconnects = 0
+        self.logger = logging.getLogger(__name__)
+        self._status = LINKED
+        self._cond = threading.Condition()
+        self._thread = None  # type: Optional[threading.Thread]
+        self._listening = False
+
+    @property
+    def running(self) -> bool:
+        """True while the supervisor thread is running."""
+        return self._thread is not None and self._status != STOPPED
+
+    @property
+    def status(self) -> str:
+        """One of LINKED, LOST, FAILED or STOPPED."""
+        return self._status
 
     def run_init_funcs(self):
         """
@@ -38,3 +125,170 @@ class Daemon(object):
         """
         for func, self_, args, kwargs in self.d_init:
             func(self_, *args, **kwargs)
+
+    def run_notify_funcs(self):
+        """
+        This function turns on again the notifications recorded in
+        d_notify, in the same order they were turned on in.
+        """
+        connection = self.connection
+        for attribute, handler in list(self.d_notify.items()):
+            connection.engine.notify(connection.mac, attribute, handler)
+
+    def start(self) -> None:
+        """Start supervising the connection."""
+        if self._thread is not None:
+            return
+        connection = self.connection
+        try:
+            connection.engine.add_device_listener(connection.mac,
+                                                  self.on_device_change)
+            self._listening = True
+        except BluewError:
+            # Without signals, drops are only noticed by failing ops.
+            self._listening = False
+        self._thread = threading.Thread(target=self._supervise,
+                                        name='bluew-daemon', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop supervising the connection. Operations waiting for a reconnect
+        fail right away.
+        """
+        with self._cond:
+            if self._status == STOPPED:
+                return
+            self._status = STOPPED
+            self._cond.notify_all()
+        thread, self._thread = self._thread, None
+        if self._listening:
+            self._listening = False
+            connection = self.connection
+            try:
+                connection.engine.remove_device_listener(
+                    connection.mac, self.on_device_change)
+            except BluewError:
+                pass
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def on_device_change(self, props: dict) -> None:
+        """Device property changes, as passed by the engine."""
+        if 'Connected' not in props:
+            return
+        if not props['Connected']:
+            self.link_lost()
+            return
+        with self._cond:
+            # Someone else brought the device back after we gave up.
+            if self._status == FAILED:
+                self._status = LINKED
+                self._cond.notify_all()
+
+    def link_lost(self) -> None:
+        """Tell the supervisor the link dropped."""
+        with self._cond:
+            if self._status == LINKED:
+                self._status = LOST
+                self._cond.notify_all()
+
+    def check_link(self) -> bool:
+        """
+        Ask the engine whether the device is still connected, after an
+        operation failed. Marks the link as lost if it isn't.
+        """
+        if self._status != LINKED:
+            return False
+        connection = self.connection
+        try:
+            connected = connection.engine.info(connection.mac).Connected
+        except BluewError:
+            connected = False
+        if not connected:
+            self.link_lost()
+        return bool(connected)
+
+    def wait_linked(self, timeout: Optional[float] = None) -> None:
+        """
+        Block while a reconnect is going on.
+        :param timeout: Defaults to op_timeout.
+        :raises DeviceNotAvailable: If the link isn't back in time, the
+        daemon gave up, or was stopped meanwhile.
+        """
+
+        timeout = self.op_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._status == LOST:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            status = self._status
+        if status == LINKED:
+            return
+        reasons = {
+            LOST: 'Reconnect did not finish within {} seconds.'.format(
+                timeout),
+            FAILED: 'Gave up reconnecting after {} attempts.'.format(
+                self.max_attempts),
+            STOPPED: 'Connection was closed while reconnecting.',
+        }
+        engine = self.connection.engine
+        raise DeviceNotAvailable(reasons[status], engine.name, engine.version)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        The delay before a reconnect attempt, doubling with every attempt up
+        to max_backoff, and jittered so that many connections dropped at
+        once don't retry in lockstep.
+        """
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+    def _supervise(self) -> None:
+        while True:
+            with self._cond:
+                while self._status in (LINKED, FAILED):
+                    self._cond.wait()
+                if self._status == STOPPED:
+                    return
+            self._reconnect()
+
+    def _reconnect(self) -> None:
+        connection = self.connection
+        attempt = 0
+        while True:
+            with self._cond:
+                if self._status == STOPPED:
+                    return
+            try:
+                connection._link()  # pylint: disable=protected-access
+                self.run_init_funcs()
+                self.run_notify_funcs()
+            except Exception as exp:  # pylint: disable=broad-except
+                # Anything else is a bug in a step, or the engine, but the
+                # link still needs recovering, so it's an attempt too.
+                attempt += 1
+                log = self.logger.warning if isinstance(exp, BluewError) \
+                    else self.logger.exception
+                log('Reconnecting to %s failed (%d): %s', connection.mac,
+                    attempt, exp)
+                if self.max_attempts and attempt >= self.max_attempts:
+                    self._set_status(FAILED)
+                    return
+                with self._cond:
+                    if self._status == STOPPED:
+                        return
+                    self._cond.wait(self.backoff_delay(attempt))
+                continue
+            self.reconnects += 1
+            self._set_status(LINKED)
+            return
+
+    def _set_status(self, status: str) -> None:
+        with self._cond:
+            if self._status != STOPPED:
+                self._status = status
+            self._cond.notify_all()
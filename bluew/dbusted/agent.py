@@ -4,15 +4,41 @@ bluew.dbusted.agent
 
 This module implements a pairing agent for dbusted.
 
+The agent has no means of input or output. It answers bluez with the
+passkey and pincode a pair() gave for the device being paired, see
+Agent.expect(), and accepts every other confirmation and authorization
+request. It's registered once per process, on the bus connection shared by
+every DBusted, see register().
+
 :copyright: (c) 2017 by Ahmed Alsharif.
 :license: MIT, see LICENSE for more details.
 """
 
 
+import logging
+import threading
+
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple  # noqa: F401
+
 import dbus
+import dbus.service
+
+from bluew.dbusted.interfaces import BluezAgentManagerInterface
 
 
 AGENT_INTERFACE = 'org.bluez.Agent1'
+AGENT_PATH = '/org/bluez/bluew'
+CAPABILITY = 'NoInputNoOutput'
+
+_LOCK = threading.Lock()
+_AGENTS = {}  # type: dict
+
+
+class Rejected(dbus.DBusException):
+    """Tells bluez that the agent won't answer a request."""
+
+    _dbus_error_name = 'org.bluez.Error.Rejected'
 
 
 # noinspection PyPep8Naming
@@ -22,17 +48,38 @@ class Agent(dbus.service.Object):
 
     exit_on_release = True
 
-    def __init__(self, *args, passkey='', pincode='', **kwargs):
+    def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.passkey = passkey
-        self.pincode = pincode
+        self._expected = {}  # type: Dict[str, Tuple]
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    @contextmanager
+    def expect(self, device: str, passkey: Optional[int] = None,
+               pincode: Optional[str] = None):
+        """
+        Answer requests about the device at path device with passkey and
+        pincode, for the block. Every engine pairing through the agent
+        gives its own, so they can't answer each other's devices.
+        """
+        with self._lock:
+            self._expected[device] = (passkey, pincode)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._expected.pop(device, None)
+
+    def _credentials(self, device: str) -> Tuple:
+        with self._lock:
+            return self._expected.get(str(device), (None, None))
 
     @dbus.service.method(AGENT_INTERFACE, in_signature="", out_signature="")
     def Release(self) -> None:
         """
         This method gets called when the service daemon unregisters the agent.
         """
-        pass
+        self.logger.debug('DBusted::Agent: released')
 
     @dbus.service.method(AGENT_INTERFACE, in_signature="o", out_signature="s")
     def RequestPinCode(self, device: str) -> str:
@@ -40,7 +87,10 @@ class Agent(dbus.service.Object):
         This method gets called when the service daemon needs to get the
         passkey for an authentication.
         """
-        pass
+        pincode = self._credentials(device)[1]
+        if pincode is None:
+            raise Rejected('no pincode for {}'.format(device))
+        return str(pincode)
 
     @dbus.service.method(AGENT_INTERFACE, in_signature="os", out_signature="")
     def DisplayPinCode(self, device: str, pincode: str) -> None:
@@ -48,7 +98,7 @@ class Agent(dbus.service.Object):
         This method gets called when the service daemon needs to display a
         pincode for an authentication.
         """
-        pass
+        self.logger.debug('DBusted::Agent: %s pincode %s', device, pincode)
 
     @dbus.service.method(AGENT_INTERFACE, in_signature="o", out_signature="u")
     def RequestPasskey(self, device: str) -> dbus.UInt32:
@@ -56,7 +106,10 @@ class Agent(dbus.service.Object):
         This method gets called when the service daemon needs to get the
         passkey for an authentication.
         """
-        pass
+        passkey = self._credentials(device)[0]
+        if passkey is None:
+            raise Rejected('no passkey for {}'.format(device))
+        return dbus.UInt32(passkey)
 
     @dbus.service.method(AGENT_INTERFACE, in_signature="ouq", out_signature="")
     def DisplayPasskey(self, device: str, passkey: dbus.UInt32,
@@ -65,15 +118,19 @@ class Agent(dbus.service.Object):
         This method gets called when the service daemon needs to get the
         passkey for an authentication.
         """
-        pass
+        self.logger.debug('DBusted::Agent: %s passkey %06d, %d entered',
+                          device, passkey, entered)
 
-    @dbus.service.method(AGENT_INTERFACE, in_signature="", out_signature="")
+    @dbus.service.method(AGENT_INTERFACE, in_signature="ou", out_signature="")
     def RequestConfirmation(self, device: str, passkey: dbus.UInt32) -> None:
         """
         This method gets called when the service daemon needs to confirm a
-        passkey for an authentication.
+        passkey for an authentication. When a passkey is expected for the
+        device, only that one is confirmed.
         """
-        pass
+        expected = self._credentials(device)[0]
+        if expected is not None and int(passkey) != int(expected):
+            raise Rejected('passkey mismatch for {}'.format(device))
 
     @dbus.service.method(AGENT_INTERFACE, in_signature="o", out_signature="")
     def RequestAuthorization(self, device: str) -> None:
@@ -82,7 +139,7 @@ class Agent(dbus.service.Object):
         pairing attempt which would in other circumstances trigger the
         just-works model.
         """
-        pass
+        self.logger.debug('DBusted::Agent: authorized %s', device)
 
     @dbus.service.method(AGENT_INTERFACE, in_signature="os", out_signature="")
     def AuthorizeService(self, device: str, uuid: str) -> None:
@@ -90,7 +147,8 @@ class Agent(dbus.service.Object):
         This method gets called when the service daemon needs to authorize a
         connection/service request.
         """
-        pass
+        self.logger.debug('DBusted::Agent: authorized %s for %s', uuid,
+                          device)
 
     @dbus.service.method(AGENT_INTERFACE, in_signature="", out_signature="")
     def Cancel(self) -> None:
@@ -98,4 +156,24 @@ class Agent(dbus.service.Object):
         This method gets called to indicate that the agent request failed
         before a reply was returned.
         """
-        pass
+        self.logger.debug('DBusted::Agent: request cancelled')
+
+
+def register(bus) -> Agent:
+    """
+    Export the agent on bus, and register it with bluez, unless that's
+    already done. bluez asks the agent of the connection a Pair() comes
+    from, so it's never made the default agent.
+    """
+    with _LOCK:
+        agent = _AGENTS.get(bus.get_unique_name())
+        if agent is None:
+            agent = Agent(bus, AGENT_PATH)
+            try:
+                BluezAgentManagerInterface(bus, AGENT_PATH,
+                                           CAPABILITY).register_agent()
+            except Exception:
+                agent.remove_from_connection()
+                raise
+            _AGENTS[bus.get_unique_name()] = agent
+        return agent
@@ -22,12 +22,22 @@ import dbus
 from gi.repository import GLib
 
 
+from bluew.dbusted import agent
 from bluew.dbusted.interfaces import BluezInterfaceError as IfaceError
 from bluew.dbusted.interfaces import (BluezGattCharInterface,
-                                      BluezAgentManagerInterface,
+                                      BluezGattDescInterface,
                                       BluezObjectInterface,
                                       BluezAdapterInterface,
                                       BluezDeviceInterface,
+                                      BluezSignalInterface,
+                                      SignalRegistry,
+                                      BLUEZ_SERVICE_PATH,
+                                      DBUS_UNKNOWN_OBJ_ERR,
+                                      ADAPTER_IFACE,
+                                      DEVICE_IFACE,
+                                      GATT_CHRC_IFACE,
+                                      GATT_DESC_IFACE,
+                                      GATT_SERVICE_IFACE,
                                       Controller,
                                       Device,
                                       BLECharacteristic,
@@ -43,36 +53,91 @@ from bluew.errors import (BluewError,
                           ReadWriteNotifyError,
                           InvalidArgumentsError)
 
-from bluew.engine import EngineBluew
+from bluew.bulk import BulkStats, CHECKPOINT, WINDOW, bulk_write
+from bluew.engine import EngineBluew, CAP_MULTI_ADAPTER
+from bluew.flight import SingleFlight
+from bluew.descriptors import BLEDescriptor
+from bluew.devindex import Search
+from bluew.gattcache import (GATT_DB_HASH_UUID, IFACES, desc_key,
+                             exported_as, gatt_layout, open_gatt_cache)
+from bluew.longvalue import (DEFAULT_MTU, chunks, packet_size,
+                             read_chunk_size, read_long, write_chunk_size)
+from bluew.objtree import ObjectTree
+from bluew.queues import OpQueues
+from bluew.scheduler import scheduler_for, EXCLUSIVE, GATT, PRIORITY_BULK
+from bluew.state import DeviceStateCache, ValueCache
 
 from bluew.dbusted.decorators import (mac_to_dev,
                                       check_if_available,
                                       check_if_connected,
                                       check_if_not_paired,
+                                      queued,
                                       handle_errors)
 
 
 class DBusted(EngineBluew):
     """
     DBusted is an EngineBluew implementation, Using the Bluez D-Bus API.
+
+    Passing `gatt_cache` keeps device GATT layouts on disk, see
+    bluew.gattcache. Passing `passkey` or `pincode` has the pairing agent
+    answer with them for the devices this engine pairs, see
+    bluew.dbusted.agent.
+
+    Every DBusted holds on to one bus connection and main loop thread,
+    shared by all of them, and torn down when the last one is stopped.
+    Instances can be made, used and stopped from many threads at once.
     """
 
-    __instance = None  # type: Optional[DBusted]
+    capabilities = frozenset({CAP_MULTI_ADAPTER})
+
+    __lock = threading.RLock()
     __loop = None  # type: Optional[GLib.MainLoop]
     __thread = None  # type: Optional[threading.Thread]
     __bus = None  # type: Optional[dbus.SystemBus]
+    __state = None  # type: Optional[DeviceStateCache]
+    __watcher = None  # type: Optional[BluezSignalInterface]
+    __values = None  # type: Optional[ValueCache]
+    __tree = None  # type: Optional[ObjectTree]
+    __adapters = threading.Condition()
+    __signals = None  # type: Optional[SignalRegistry]
     __count = 0
+    _stopped = False
+    _reads = SingleFlight()
+    _ops = OpQueues()
+
+    # Device state is pushed by signals, entries older than this many seconds
+    # get refreshed from the object tree before they're trusted.
+    STATE_MAX_AGE = 60
+
+    # Seconds a Pair() call is given at least, bluez waits on the user of
+    # the remote device through it.
+    PAIR_TIMEOUT = 25
 
     def __new__(cls, *args, **kwargs):
         # pylint: disable=W0612,W0613
-        DBusted.__count += 1
-        if DBusted.__instance is None:
-            DBusted.__instance = object.__new__(cls)
-            DBusGMainLoop(set_as_default=True)
-            DBusted.__bus = dbus.SystemBus()
-            DBusted.__thread = threading.Thread(target=DBusted._start_loop)
-            DBusted.__thread.start()
-        return DBusted.__instance
+        DBusted._acquire()
+        instance = object.__new__(cls)
+        instance._stopped = False  # pylint: disable=protected-access
+        return instance
+
+    @staticmethod
+    def _acquire():
+        # The first instance brings the shared bus and loop up. Holding the
+        # lock throughout keeps others from using them half way there, or
+        # while the last instance tears them down.
+        with DBusted.__lock:
+            if DBusted.__count == 0:
+                DBusGMainLoop(set_as_default=True)
+                DBusted.__bus = dbus.SystemBus()
+                DBusted.__signals = SignalRegistry()
+                DBusted._watch_state()
+                DBusted.__loop = GLib.MainLoop()
+                DBusted.__thread = threading.Thread(
+                    target=DBusted._start_loop, args=(DBusted.__loop,),
+                    name='bluew-dbusted')
+                DBusted.__thread.start()
+            DBusted.__count += 1
 
     def __init__(self, *args, **kwargs):
         name = "DBusted"
@@ -82,8 +147,25 @@ class DBusted(EngineBluew):
         super().__init__(*args, **kwargs)
         self.cntrl = kwargs.get('cntrl', None)
         self.timeout = kwargs.get('timeout', 5)
+        self.recovery_timeout = kwargs.get('recovery_timeout', self.timeout)
         self._bus = DBusted.__bus
-        self._init_cntrl()
+        self._state = DBusted.__state
+        self.value_cache = DBusted.__values
+        self._tree = DBusted.__tree
+        self._adapters = DBusted.__adapters
+        self._signals = DBusted.__signals
+        self._gatt_cache = open_gatt_cache(kwargs.get('gatt_cache', None))
+        self._gatt_validated = set()  # type: set
+        self._gatt_hashed = set()  # type: set
+        self._gatt_lock = threading.Lock()
+        self.passkey = kwargs.get('passkey', None)
+        self.pincode = kwargs.get('pincode', None)
+        try:
+            self._init_cntrl()
+        except Exception:
+            self.stop_engine()
+            raise
+        self._scheduler = scheduler_for(self.cntrl)
         self.logger = logging.getLogger(__name__)
 
     def __enter__(self):
@@ -94,13 +176,97 @@ class DBusted(EngineBluew):
         self.stop_engine()
 
     @staticmethod
-    def _start_loop():
-        DBusted.__loop = GLib.MainLoop()
+    def _watch_state():
+        DBusted.__state = DeviceStateCache(DBusted.STATE_MAX_AGE)
+        DBusted.__values = ValueCache()
+        DBusted.__watcher = BluezSignalInterface(DBusted.__bus)
+        DBusted.__watcher.watch_objects(DBusted._on_ifaces_added,
+                                        DBusted._on_ifaces_removed)
+        DBusted.__watcher.watch_properties(DBusted._on_props_changed,
+                                           (DEVICE_IFACE,))
+        DBusted.__watcher.watch_properties(DBusted._on_value_changed,
+                                           (GATT_CHRC_IFACE,))
+        DBusted.__watcher.watch_properties(
+            DBusted._on_tree_changed,
+            (ADAPTER_IFACE, GATT_SERVICE_IFACE, GATT_DESC_IFACE))
+        DBusted._load_tree()
+
+    @staticmethod
+    def _load_tree():
+        # The main loop isn't running yet, so signals that come in while the
+        # objects are fetched wait, and get applied on top of them.
+        DBusted.__tree = ObjectTree()
+        try:
+            objects = BluezObjectInterface(DBusted.__bus).get_objects()
+        except dbus.DBusException as exp:
+            logging.getLogger(__name__).debug('DBusted::ObjectTree:%s', exp)
+            return
+        DBusted.__tree.load(objects)
+
+    @staticmethod
+    def _on_ifaces_added(path, ifaces):
+        tree = DBusted.__tree
+        if tree is not None:
+            tree.add(path, ifaces)
+        if ADAPTER_IFACE in ifaces:
+            DBusted._on_adapter_changed()
+        state = DBusted.__state
+        if state is not None and DEVICE_IFACE in ifaces:
+            state.update(path, ifaces[DEVICE_IFACE])
+        values = DBusted.__values
+        if values is not None and GATT_CHRC_IFACE in ifaces:
+            values.learn(path, ifaces[GATT_CHRC_IFACE]['UUID'])
+
+    @staticmethod
+    def _on_ifaces_removed(path, ifaces):
+        tree = DBusted.__tree
+        if tree is not None:
+            tree.remove(path, ifaces)
+        if ADAPTER_IFACE in ifaces:
+            DBusted._on_adapter_changed()
+        state = DBusted.__state
+        if state is not None and DEVICE_IFACE in ifaces:
+            state.remove(path)
+        values = DBusted.__values
+        if values is not None and GATT_CHRC_IFACE in ifaces:
+            values.forget(path)
+
+    @staticmethod
+    def _on_value_changed(path, iface, props):
+        DBusted._on_tree_changed(path, iface, props)
+        values = DBusted.__values
+        if values is not None and 'Value' in props:
+            values.update_path(path, b''.join(props['Value']))
+
+    @staticmethod
+    def _on_props_changed(path, iface, props):
+        DBusted._on_tree_changed(path, iface, props)
+        state = DBusted.__state
+        if state is not None:
+            state.update(path, props)
+
+    @staticmethod
+    def _on_tree_changed(path, iface, props):
+        tree = DBusted.__tree
+        if tree is not None:
+            tree.update(path, iface, props)
+        if iface == ADAPTER_IFACE:
+            DBusted._on_adapter_changed()
+
+    @staticmethod
+    def _on_adapter_changed():
+        # Wake up whoever waits for a controller to be powered, see
+        # wait_until_powered(). The tree already has the change.
+        with DBusted.__adapters:
+            DBusted.__adapters.notify_all()
+
+    @staticmethod
+    def _start_loop(loop):
         running = True
         while running:
             try:
                 running = False
-                DBusted.__loop.run()
+                loop.run()
             except KeyboardInterrupt:
                 running = True
 
@@ -108,27 +274,25 @@ class DBusted(EngineBluew):
         controllers = self.get_controllers()
         if self.cntrl is None:
             if not controllers:
-                self.stop_engine()
                 raise NoControllerAvailable()
             cntrl = self._strip_cntrl_path(controllers[0])
             self.cntrl = cntrl
         else:
             paths = list(map(self._strip_cntrl_path, controllers))
             if self.cntrl not in paths:
-                self.stop_engine()
                 raise ControllerSpecifiedNotFound()
 
     @property
     def devices(self):
         """A property to get devices nearby."""
         self._start_scan()
-        boiface = BluezObjectInterface(self._bus)
+        boiface = BluezObjectInterface(self._bus, self._tree)
         return boiface.get_devices()
 
     @property
     def controllers(self):
         """A property to get controllers available."""
-        boiface = BluezObjectInterface(self._bus)
+        boiface = BluezObjectInterface(self._bus, self._tree)
         return boiface.get_controllers()
 
     @staticmethod
@@ -139,54 +303,85 @@ class DBusted(EngineBluew):
     def start_engine(self) -> None:
         """
         Overriding EngineBluew's start_engine method. This method get's called
-        to init the engine. We register here an agent with bluez during the
-        initialization. DBusted is a singleton, and so we only need to init
-        if it's the first instance of DBusted.
+        to init the engine. The shared bus and loop are already up once an
+        instance exists, and the pairing agent is only registered when
+        something gets paired.
         :return: None.
         """
-        if DBusted.__count == 1:
-            pass
-            # self._register_agent()
+        pass
 
     def _register_agent(self):
-        amiface = BluezAgentManagerInterface(self._bus)
-        return amiface.register_agent()
+        # Once per process, bluez keeps the agent until the bus connection
+        # goes away, which outlives every instance.
+        return agent.register(self._bus)
 
     def stop_engine(self) -> None:
         """
         Overriding EngineBluew's stop_engine method. This method get's called
-        when the engine is not needed any more. Since DBusted is a singleton
-        we should only destroy things when all instaces are gone. Otherwise
-        the engine should keep on running.
+        when the engine is not needed any more. The bus and loop shared by
+        all instances are only torn down once every instance is stopped.
+        Stopping an instance more than once does nothing, so that it can't
+        take the loop away from another one.
         :return: None.
         """
 
-        DBusted.__count -= 1
-        if not DBusted.__count:
-            # self._unregister_agent()
-            DBusted.__loop.quit()
-            DBusted.__instance = None
+        with DBusted.__lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            DBusted.__count -= 1
+            if DBusted.__count:
+                return
+            watcher, signals = DBusted.__watcher, DBusted.__signals
+            loop = DBusted.__loop
+            if watcher is not None:
+                watcher.remove()
+            if signals is not None:
+                signals.clear()
+            if loop is not None:
+                loop.quit()
+            DBusted.__watcher = None
+            DBusted.__state = None
+            DBusted.__tree = None
+            DBusted.__signals = None
             DBusted.__loop = None
             DBusted.__thread = None
             DBusted.__bus = None
 
-    def _unregister_agent(self):
-        amiface = BluezAgentManagerInterface(self._bus)
-        return amiface.unregister_agent()
-
     @mac_to_dev
     @check_if_available
     @handle_errors
-    def connect(self, mac: str) -> None:
+    def connect(self, mac: str, wait_for_services: bool = False,
+                services_timeout: Optional[float] = None) -> Optional[float]:
         """
         Overriding EngineBluew's connect method.
         :param mac: Device path. @mac_to_dev takes care of getting the proper
         path from the device's mac address.
-        :return: True if succeeded, False otherwise..
+        :param wait_for_services: Wait for the ServicesResolved property
+        change before returning.
+        :param services_timeout: Defaults to the engine's timeout.
+        :return: Seconds spent waiting for service discovery, if waiting.
         """
 
         deviface = BluezDeviceInterface(self._bus, mac, self.cntrl)
-        deviface.connect_device()
+        self._when_ready()
+        try:
+            self._scheduler.run(EXCLUSIVE, deviface.connect_device)
+        except IfaceError as exp:
+            if exp.error_name != IfaceError.BLUEZ_IN_PROGRESS_ERR:
+                raise
+            # Someone else is connecting the device, wait for the outcome.
+            connected = self._state.wait_for(
+                self._dev_path(mac), lambda state: state.connected,
+                self.timeout)
+            if not connected:
+                raise DeviceNotAvailable(self.name, self.version)
+        with self._gatt_lock:
+            self._gatt_validated.discard(mac)
+            self._gatt_hashed.discard(mac)
+        if not wait_for_services:
+            return None
+        return self._wait_for_services(mac, services_timeout)
 
     @mac_to_dev
     @check_if_connected
@@ -209,17 +404,40 @@ class DBusted(EngineBluew):
     @handle_errors
     def pair(self, mac: str) -> None:
         """
-        Overriding EngineBluew's pair method.
+        Overriding EngineBluew's pair method. Returns once bluez replies to
+        Pair(), or the Paired signal comes in, whichever is first.
         :param mac: Device path. @mac_to_dev takes care of getting the proper
         path from the device's mac address.
-        :return: True if succeeded, False otherwise..
+        :return: None.
         """
 
+        pairing = self._register_agent()
         deviface = BluezDeviceInterface(self._bus, mac, self.cntrl)
-        deviface.pair_device()
-        paired = self._is_device_paired_timeout(mac)
+        path = self._dev_path(mac)
+
+        def _pair():
+            # The agent answers for this device with this engine's
+            # passkey and pincode, while Pair() runs.
+            with pairing.expect(path, self.passkey, self.pincode):
+                deviface.pair_device(max(self.timeout, self.PAIR_TIMEOUT))
+
+        self._when_ready()
+        try:
+            self._scheduler.run(EXCLUSIVE, _pair)
+        except IfaceError as exp:
+            # A canceled pairing, or a failed connection attempt, comes out
+            # of _handle_pair_error as NotConnected, which _handle_errors
+            # would answer with a connect() and no pairing at all.
+            if exp.error_name not in (IfaceError.BLUEZ_FAILED_ERR,
+                                      IfaceError.BLUEZ_NOT_CONNECTED_ERR):
+                raise
+            raise PairError(name=self.name, version=self.version)
+        # Paired is set before bluez replies, so this only waits after a
+        # reply that D-Bus gave up on, or bluez saying it already exists.
+        paired = self._state.wait_for(
+            path, lambda state: state.paired, self.timeout)
         if not paired:
-            raise PairError(self.name, self.version)
+            raise PairError(name=self.name, version=self.version)
 
     @mac_to_dev
     @handle_errors
@@ -246,7 +464,7 @@ class DBusted(EngineBluew):
         :return: List of controllers available.
         """
 
-        boiface = BluezObjectInterface(self._bus)
+        boiface = BluezObjectInterface(self._bus, self._tree)
         return boiface.get_controllers()
 
     def get_devices(self) -> List[Device]:
@@ -264,10 +482,59 @@ class DBusted(EngineBluew):
         self._stop_scan()
         return devices
 
+    def find_devices(self, uuid: Optional[str] = None,
+                     name: Optional[str] = None,
+                     manufacturer: Optional[int] = None,
+                     address_type: Optional[str] = None,
+                     min_rssi: Optional[int] = None,
+                     top: Optional[int] = None,
+                     scan: float = 0) -> List[Device]:
+        """
+        Overriding EngineBluew's find_devices method. Devices are looked up
+        in the index the object tree keeps from signals, a scan only runs if
+        scan is given, and there aren't top matches already.
+        :return: List of devices matching.
+        """
+        # pylint: disable=too-many-arguments
+
+        search = self._tree.devices.search(
+            BLUEZ_SERVICE_PATH + self.cntrl, uuid, name, manufacturer,
+            address_type, min_rssi, top)
+        if search.wants_scan(scan):
+            self._scan_for(search, scan)
+        return [Device(**obj) for obj in search.found]
+
+    @handle_errors
+    def _scan_for(self, search: Search, duration: float) -> None:
+        # Filtered by bluez where it can, so that the index isn't fed every
+        # device around, and stopped once there's enough matches.
+        changed = threading.Event()
+
+        def _wake(_path):
+            changed.set()
+
+        adiface = BluezAdapterInterface(self._bus, self.cntrl)
+        self._when_ready()
+        with search.scanning(duration, _wake):
+            try:
+                self._scheduler.run(EXCLUSIVE, adiface.set_discovery_filter,
+                                    *search.scan_filter)
+                self._start_scan()
+                remaining = search.remaining()
+                while remaining:
+                    changed.wait(remaining)
+                    changed.clear()
+                    remaining = search.remaining()
+            finally:
+                self._stop_scan()
+                self._scheduler.run(EXCLUSIVE, adiface.set_discovery_filter)
+
     def _get_devices(self) -> List[Device]:
-        boiface = BluezObjectInterface(self._bus)
-        devices = boiface.get_devices()
-        return devices
+        boiface = BluezObjectInterface(self._bus, self._tree)
+        objects = boiface.get_device_objects()
+        for obj in objects:
+            self._state.update(obj['Path'], obj)
+        return [Device(**obj) for obj in objects]
 
     @mac_to_dev
     def get_services(self, mac: str) -> List[BLEService]:
@@ -278,8 +545,8 @@ class DBusted(EngineBluew):
         :return: List of BLE services available.
         """
 
-        boiface = BluezObjectInterface(self._bus)
-        return boiface.get_services(mac)
+        boiface = BluezObjectInterface(self._bus, self._tree)
+        return boiface.get_services(self._dev_path(mac))
 
     @mac_to_dev
     def get_chrcs(self, mac: str) -> List[BLECharacteristic]:
@@ -290,8 +557,20 @@ class DBusted(EngineBluew):
         :return: List of BLE characteristics available.
         """
 
-        boiface = BluezObjectInterface(self._bus)
-        return boiface.get_characteristics(mac)
+        boiface = BluezObjectInterface(self._bus, self._tree)
+        return boiface.get_characteristics(self._dev_path(mac))
+
+    @mac_to_dev
+    def get_descriptors(self, mac: str) -> List[BLEDescriptor]:
+        """
+        Overriding EngineBluew's get_descriptors method.
+        :param mac: Device path. @mac_to_dev takes care of getting the proper
+        path from the device's mac address.
+        :return: List of BLE descriptors available.
+        """
+
+        boiface = BluezObjectInterface(self._bus, self._tree)
+        return boiface.get_descriptors(self._dev_path(mac))
 
     @mac_to_dev
     @check_if_available
@@ -304,9 +583,12 @@ class DBusted(EngineBluew):
         :return: Device object.
         """
 
-        devices = self._get_devices()
-        device = list(filter(lambda x: mac in x.Path, devices))[0]
-        return device
+        # Matched on the whole path, so that the same device seen by another
+        # controller isn't picked.
+        found = self._find_dev(mac, self._get_devices())
+        if not found:
+            raise DeviceNotAvailable(name=self.name, version=self.version)
+        return found[0]
 
     @mac_to_dev
     @check_if_available
@@ -336,31 +618,140 @@ class DBusted(EngineBluew):
         deviface = BluezDeviceInterface(self._bus, mac, self.cntrl)
         deviface.distrust_device()
 
+    def _powered(self) -> bool:
+        path = BLUEZ_SERVICE_PATH + self.cntrl
+        ifaces = self._tree.get(path) if self._tree else None
+        if ifaces is None:
+            controllers = [cntrl for cntrl in self.get_controllers()
+                           if getattr(cntrl, 'Path') == path]
+            return bool(controllers and getattr(controllers[0], 'Powered'))
+        return bool(ifaces.get(ADAPTER_IFACE, {}).get('Powered'))
+
+    def wait_until_powered(self, timeout: Optional[float] = None) -> bool:
+        """
+        Overriding EngineBluew's wait_until_powered method. Woken up by the
+        Adapter1 signals, instead of polling the controller.
+        :param timeout: Defaults to the engine's timeout.
+        :return: False if the timeout expired first.
+        """
+
+        self._check_running()
+        timeout = self.timeout if timeout is None else timeout
+        with self._adapters:
+            return self._adapters.wait_for(self._powered, timeout)
+
+    def _check_running(self) -> None:
+        # The shared bus and loop may be gone once this instance is stopped.
+        if self._stopped:
+            raise BluewError(BluewError.UNEXPECTED_ERROR,
+                             'DBusted engine was already stopped.',
+                             self.name, self.version)
+
+    def _when_ready(self) -> None:
+        # While the controller is off, or being reset, operations wait for
+        # it here, and go out as soon as it's powered again.
+        self._check_running()
+        if self._powered():
+            return
+        if not self.wait_until_powered(self.recovery_timeout):
+            raise ControllerNotReady(name=self.name, version=self.version)
+
+    @handle_errors
+    def _set_adapter_prop(self, prop: str, value) -> None:
+        adiface = BluezAdapterInterface(self._bus, self.cntrl)
+        adiface.set_property(prop, value)
+
+    def power(self, on: bool = True) -> None:
+        """
+        Overriding EngineBluew's power method.
+        :param on: Power the controller on if True, off otherwise.
+        :return: None.
+        """
+        # pylint: disable=invalid-name
+
+        self._set_adapter_prop('Powered', dbus.Boolean(on))
+        if on and not self.wait_until_powered():
+            raise ControllerNotReady(name=self.name, version=self.version)
+
+    def set_discoverable(self, on: bool = True,
+                         timeout: Optional[int] = None) -> None:
+        """
+        Overriding EngineBluew's set_discoverable method.
+        :param on: Discoverable if True, not otherwise.
+        :param timeout: Seconds it stays discoverable for, 0 for good.
+        :return: None.
+        """
+        # pylint: disable=invalid-name
+
+        if timeout is not None:
+            self._set_adapter_prop('DiscoverableTimeout',
+                                   dbus.UInt32(timeout))
+        self._set_adapter_prop('Discoverable', dbus.Boolean(on))
+
+    def set_pairable(self, on: bool = True,
+                     timeout: Optional[int] = None) -> None:
+        """
+        Overriding EngineBluew's set_pairable method.
+        :param on: Pairable if True, not otherwise.
+        :param timeout: Seconds it stays pairable for, 0 for good.
+        :return: None.
+        """
+        # pylint: disable=invalid-name
+
+        if timeout is not None:
+            self._set_adapter_prop('PairableTimeout', dbus.UInt32(timeout))
+        self._set_adapter_prop('Pairable', dbus.Boolean(on))
+
     def _start_scan(self) -> None:
+        self._when_ready()
         adiface = BluezAdapterInterface(self._bus, self.cntrl)
-        adiface.start_discovery()
+        self._scheduler.run(EXCLUSIVE, adiface.start_discovery)
 
     def _stop_scan(self) -> None:
         adiface = BluezAdapterInterface(self._bus, self.cntrl)
-        adiface.stop_discovery()
+        self._scheduler.run(EXCLUSIVE, adiface.stop_discovery)
 
     @mac_to_dev
-    @check_if_available
-    @handle_errors
-    def read_attribute(self, mac: str, attribute: str) -> List[bytes]:
+    def read_attribute(self, mac: str, attribute: str,
+                       max_age: Optional[float] = None) -> List[bytes]:
         """
-        Overriding EngineBluew's read_attribute method.
+        Overriding EngineBluew's read_attribute method. Concurrent reads of
+        the same attribute share one ReadValue() call.
         :param mac: Device path. @mac_to_dev takes care of getting the proper
         path from the device's mac address.
         :param attribute: UUID of the BLE attribute.
+        :param max_age: Return the last value read or notified instead, if
+        it's at most this many seconds old.
         :return: Value of attribute, raise exception otherwise.
         """
 
-        path = self._uuid_to_path(attribute, mac)
-        gattchrciface = BluezGattCharInterface(self._bus, path)
-        return dbus_object_parser(gattchrciface.read_value())
+        dev_path = self._dev_path(mac)
+        cache = self.value_cache
+        if max_age is not None and cache is not None:
+            cached = cache.get(dev_path, attribute, max_age)
+            if cached is not None:
+                return [bytes([byte]) for byte in cached]
+        key = (self.cntrl, mac, attribute)
+        value = DBusted._reads.do(key, self._read_attribute, mac, attribute)
+        if value is None:
+            # Every coalesced reader gets this too, rather than a None to
+            # trip over later.
+            raise ReadWriteNotifyError(long_reason='No value was read.',
+                                       name=self.name, version=self.version)
+        if cache is not None:
+            cache.update(dev_path, attribute, b''.join(value))
+        return list(value)
+
+    @queued
+    @check_if_available
+    @handle_errors
+    def _read_attribute(self, mac: str, attribute: str) -> List[bytes]:
+        value = self._gatt_call(mac, attribute,
+                                lambda iface: iface.read_value())
+        return dbus_object_parser(value)
 
     @mac_to_dev
+    @queued
     @check_if_available
     @handle_errors
     def write_attribute(self, mac: str, attribute: str,
@@ -374,11 +765,179 @@ class DBusted(EngineBluew):
         :return: True if succeeded, False otherwise..
         """
 
-        path = self._uuid_to_path(attribute, mac)
-        gattchrciface = BluezGattCharInterface(self._bus, path)
-        gattchrciface.write_value(data)
+        self._gatt_call(mac, attribute, lambda iface: iface.write_value(data))
+
+    @mac_to_dev
+    @queued
+    @check_if_available
+    @handle_errors
+    def read_descriptor(self, mac: str, attribute: str,
+                        descriptor: str) -> bytes:
+        """
+        Overriding EngineBluew's read_descriptor method.
+        :param mac: Device path. @mac_to_dev takes care of getting the proper
+        path from the device's mac address.
+        :param attribute: UUID of the BLE characteristic.
+        :param descriptor: UUID of the descriptor of that characteristic.
+        :return: Value of the descriptor.
+        """
+
+        value = self._gatt_call(mac, desc_key(attribute, descriptor),
+                                lambda iface: iface.read_value(), 'descs')
+        return b''.join(dbus_object_parser(value))
+
+    @mac_to_dev
+    @queued
+    @check_if_available
+    @handle_errors
+    def write_descriptor(self, mac: str, attribute: str, descriptor: str,
+                         data: List[int]) -> None:
+        """
+        Overriding EngineBluew's write_descriptor method.
+        :param mac: Device path. @mac_to_dev takes care of getting the proper
+        path from the device's mac address.
+        :param attribute: UUID of the BLE characteristic.
+        :param descriptor: UUID of the descriptor of that characteristic.
+        :param data: The data you want to write.
+        """
+
+        self._gatt_call(mac, desc_key(attribute, descriptor),
+                        lambda iface: iface.write_value(list(data)), 'descs')
+
+    @mac_to_dev
+    @check_if_available
+    @handle_errors
+    def get_mtu(self, mac: str, attribute: str) -> int:
+        """
+        Overriding EngineBluew's get_mtu method.
+        :param mac: Device path. @mac_to_dev takes care of getting the proper
+        path from the device's mac address.
+        :param attribute: UUID of a BLE attribute of the device.
+        :return: The MTU bluez negotiated with the device.
+        """
+
+        mtu = self._gatt_call(mac, attribute, lambda iface: iface.get_mtu())
+        return DEFAULT_MTU if mtu is None else mtu
 
     @mac_to_dev
+    def write_long_attribute(self, mac: str, attribute: str, data: bytes,
+                             chunk_size: Optional[int] = None) -> None:
+        """
+        Overriding EngineBluew's write_long_attribute method.
+        :param mac: Device path. @mac_to_dev takes care of getting the proper
+        path from the device's mac address.
+        :param attribute: UUID of the BLE attribute.
+        :param data: The bytes you want to write.
+        :param chunk_size: Bytes per WriteValue(), picked from the MTU if
+        None.
+        """
+
+        if chunk_size is None:
+            chunk_size = write_chunk_size(self.get_mtu(mac, attribute))
+        self._write_long_attribute(mac, attribute, bytes(data), chunk_size)
+
+    @queued
+    @check_if_available
+    @handle_errors
+    def _write_long_attribute(self, mac: str, attribute: str, data: bytes,
+                              chunk_size: int) -> None:
+        for offset, chunk in chunks(data, chunk_size):
+            self._gatt_call(mac, attribute,
+                            lambda iface, chunk=chunk, offset=offset:
+                            iface.write_value(list(chunk), offset))
+
+    @mac_to_dev
+    def bulk_write(self, mac: str, attribute: str, source,
+                   chunk_size: Optional[int] = None, window: int = WINDOW,
+                   response: bool = False, checkpoint: int = CHECKPOINT,
+                   offset: int = 0,
+                   progress: Optional[Callable] = None) -> BulkStats:
+        """
+        Overriding EngineBluew's bulk_write method. The characteristic is
+        looked up once, and the writes without response are sent without
+        waiting for bluez, up to window at a time.
+        :param mac: Device path. @mac_to_dev takes care of getting the proper
+        path from the device's mac address.
+        :param attribute: UUID of the BLE attribute.
+        :param source: bytes-like, a binary file, or an iterable of bytes.
+        :return: The BulkStats of the transfer.
+        """
+        # pylint: disable=too-many-arguments
+
+        if chunk_size is None:
+            chunk_size = packet_size(self.get_mtu(mac, attribute))
+        return self._bulk_write(mac, attribute, source, chunk_size, window,
+                                response, checkpoint, offset, progress)
+
+    @queued
+    @check_if_available
+    @handle_errors
+    def _bulk_write(self, mac, attribute, source, chunk_size, window,
+                    response, checkpoint, offset, progress):
+        # pylint: disable=too-many-arguments
+
+        def _probe(iface):
+            # Touch the characteristic once, so that a stale cached path
+            # gets resolved again here, and not fail every chunk.
+            iface.get_mtu()
+            return iface
+
+        iface = self._gatt_call(mac, attribute, _probe)
+
+        def _write(chunk):
+            try:
+                iface.write_value(list(chunk), response=True)
+            except IfaceError as exp:
+                raise ReadWriteNotifyError(long_reason=exp.error_name)
+
+        def _write_command(chunk, done):
+            iface.write_command(list(chunk), done)
+
+        def _lane():
+            return self._scheduler.slot(GATT, PRIORITY_BULK)
+
+        return bulk_write(_write, _write_command, source, chunk_size, window,
+                          response, checkpoint, offset, progress, _lane)
+
+    @mac_to_dev
+    def read_long_attribute(self, mac: str, attribute: str,
+                            length: Optional[int] = None,
+                            chunk_size: Optional[int] = None) -> bytearray:
+        """
+        Overriding EngineBluew's read_long_attribute method.
+        :param mac: Device path. @mac_to_dev takes care of getting the proper
+        path from the device's mac address.
+        :param attribute: UUID of the BLE attribute.
+        :param length: Expected length of the value, the buffer it's read
+        into is allocated up front if given.
+        :param chunk_size: Most bytes one ReadValue() returns, picked from
+        the MTU if None.
+        :return: The value.
+        """
+
+        if chunk_size is None:
+            chunk_size = read_chunk_size(self.get_mtu(mac, attribute))
+        value = self._read_long_attribute(mac, attribute, length, chunk_size)
+        cache = self.value_cache
+        if value is not None and cache is not None:
+            cache.update(self._dev_path(mac), attribute, value)
+        return value
+
+    @queued
+    @check_if_available
+    @handle_errors
+    def _read_long_attribute(self, mac: str, attribute: str,
+                             length: Optional[int],
+                             chunk_size: int) -> bytearray:
+        def _read_at(offset):
+            value = self._gatt_call(mac, attribute,
+                                    lambda iface: iface.read_value(offset))
+            return b''.join(dbus_object_parser(value))
+
+        return read_long(_read_at, chunk_size, length)
+
+    @mac_to_dev
+    @queued
     @check_if_available
     @handle_errors
     def notify(self, mac: str, attribute: str, handler: Callable) -> None:
@@ -392,12 +951,12 @@ class DBusted(EngineBluew):
         :return: True if succeeded, False otherwise..
         """
 
-        path = self._uuid_to_path(attribute, mac)
-        gattchrciface = BluezGattCharInterface(self._bus, path)
         handler = self._handle_notification(handler)
-        gattchrciface.start_notify(handler)
+        self._gatt_call(mac, attribute,
+                        lambda iface: iface.start_notify(handler))
 
     @mac_to_dev
+    @queued
     @check_if_available
     @handle_errors
     def stop_notify(self, mac: str, attribute: str) -> None:
@@ -410,41 +969,81 @@ class DBusted(EngineBluew):
         """
 
         path = self._uuid_to_path(attribute, mac)
-        gattchrciface = BluezGattCharInterface(self._bus, path)
+        gattchrciface = BluezGattCharInterface(self._bus, path,
+                                               self._signals)
         gattchrciface.stop_notify()
 
-    def _handle_errors(self, exp: IfaceError, *args, **kwargs) -> None:
+    @mac_to_dev
+    def add_device_listener(self, mac: str, handler: Callable) -> None:
+        """
+        Overriding EngineBluew's add_device_listener method. The handler is
+        called from the main loop thread.
+        :param mac: Device path. @mac_to_dev takes care of getting the proper
+        path from the device's mac address.
+        :param handler: Called with a dict of the properties that changed.
+        :return: None.
+        """
+
+        self._state.add_listener(self._dev_path(mac), handler)
+
+    @mac_to_dev
+    def remove_device_listener(self, mac: str, handler: Callable) -> None:
+        """
+        Overriding EngineBluew's remove_device_listener method.
+        :param mac: Device path. @mac_to_dev takes care of getting the proper
+        path from the device's mac address.
+        :param handler: The handler passed to add_device_listener.
+        :return: None.
+        """
+
+        self._state.remove_listener(self._dev_path(mac), handler)
+
+    def _handle_errors(self, exp: IfaceError, *args, retry: bool = True,
+                       **kwargs) -> bool:
+        """
+        Turn an interface error into the bluew error to raise, or deal with
+        its cause. True is returned if the call should be made once more,
+        which it is once at most, False for errors nothing is known about.
+        The engine is left running, whoever started it stops it.
+        """
         auth_timeout = exp.error_name == IfaceError.BLUEZ_AUTH_TIMEOUT_ERR
         auth_failed = exp.error_name == IfaceError.BLUEZ_AUTH_FAILED_ERR
         auth_rejected = exp.error_name == IfaceError.BLUEZ_AUTH_REJECTED_ERR
 
         if exp.error_name == IfaceError.BLUEZ_NOT_CONNECTED_ERR:
-            self.connect(args[0], **kwargs)
+            # The link dropped, the call is made again on the new one. Its
+            # keyword arguments are its own, not connect()'s.
+            if not retry:
+                raise DeviceNotAvailable(self.name, self.version)
+            self.connect(args[0])
+            return True
 
         elif exp.error_name == IfaceError.NOT_PAIRED:
-            self.pair(args[0], **kwargs)
+            if not retry:
+                raise PairError(name=self.name, version=self.version)
+            self.pair(args[0])
+            return True
 
         elif exp.error_name == IfaceError.BLUEZ_NOT_SUPPORTED_ERR:
-            self.stop_engine()
             not_supported = ReadWriteNotifyError.NOT_SUPPORTED
             raise ReadWriteNotifyError(long_reason=not_supported)
 
         elif exp.error_name == IfaceError.BLUEZ_NOT_PERMITTED_ERR:
-            self.stop_engine()
             not_permitted = ReadWriteNotifyError.NOT_PERMITTED
             raise ReadWriteNotifyError(long_reason=not_permitted)
 
         elif exp.error_name == IfaceError.BLUEZ_NOT_READY_ERR:
-            self.stop_engine()
-            raise ControllerNotReady
+            # The controller is off, or being reset. Wait for it to come
+            # back instead of failing, or stopping the engine.
+            if retry and self.wait_until_powered(self.recovery_timeout):
+                return True
+            raise ControllerNotReady(name=self.name, version=self.version)
 
         elif exp.error_name == IfaceError.BLUEZ_NOT_AUTHORIZED_ERR:
-            self.stop_engine()
             not_authorized = ReadWriteNotifyError.NOT_AUTHORIZED
             raise ReadWriteNotifyError(long_reason=not_authorized)
 
         elif exp.error_name == IfaceError.BLUEZ_INVALID_VAL_LEN:
-            self.stop_engine()
             invalid_len = InvalidArgumentsError.INVALID_LEN
             raise InvalidArgumentsError(long_reason=invalid_len)
 
@@ -452,76 +1051,234 @@ class DBusted(EngineBluew):
             raise BluewError(BluewError.UNEXPECTED_ERROR)
 
         elif exp.error_name == IfaceError.BLUEZ_INVALID_ARGUMENTS_ERR:
-            self.stop_engine()
             invalid_args = InvalidArgumentsError.INVALID_ARGS
             raise InvalidArgumentsError(long_reason=invalid_args)
 
         elif exp.error_name == IfaceError.BLUEZ_IN_PROGRESS_ERR:
-            self.stop_engine()
+            # Our own operations are queued per attribute, so this one
+            # raced someone else's. Nothing wrong with the engine.
             in_progress = ReadWriteNotifyError.IN_PROGRESS
             raise ReadWriteNotifyError(long_reason=in_progress)
 
-        elif exp.error_name == IfaceError.UNKNOWN_ERROR:
-            self.stop_engine()
-            raise BluewError(BluewError.UNEXPECTED_ERROR)
-
         elif auth_failed or auth_timeout or auth_rejected:
-            self.stop_engine()
             raise PairError(long_reason=PairError.AUTHENTICATION_ERROR)
 
+        return False
+
+    def _dev_path(self, dev):
+        return BLUEZ_SERVICE_PATH + self.cntrl + dev
+
+    def _find_dev(self, dev, devices):
+        path = self._dev_path(dev)
+        return [device for device in devices if device.Path == path]
+
+    def _cached_state(self, dev, query):
+        # Answer from the signal driven state cache. If the entry is unknown
+        # or stale, one look at the object tree refreshes it, which is a lot
+        # cheaper than the scans the active checks fall back to.
+        path = self._dev_path(dev)
+        answer = getattr(self._state, query)(path)
+        if answer is None:
+            self._get_devices()
+            answer = getattr(self._state, query)(path)
+        return answer
+
+    def _device_known(self, dev):
+        if self._cached_state(dev, 'known'):
+            return True
+        return self._is_device_available(dev)
+
+    def _device_connected(self, dev):
+        connected = self._cached_state(dev, 'connected')
+        if connected is None:
+            return self._is_device_connected(dev)
+        return connected
+
+    def _device_paired(self, dev):
+        paired = self._cached_state(dev, 'paired')
+        if paired is None:
+            return self._is_device_paired(dev)
+        return paired
+
     def _is_device_available(self, dev):
         self._start_scan()
         devices = self._tout(self._get_devices,
                              self.timeout,
-                             lambda devs: any(dev in d.Path for d in devs))
+                             lambda devs: self._find_dev(dev, devs))
         devices = devices()
-        filtered = list(filter(lambda device: dev in device.Path, devices))
+        filtered = self._find_dev(dev, devices)
         self._stop_scan()
         return bool(filtered)
 
     def _is_device_paired(self, dev):
-
-        def _dev_is_paired(devs):
-            for _dev in devs:
-                if dev in _dev.Path and _dev.Paired:
-                    return True
-            return False
-
-        devices = self._tout(self._get_devices,
-                             self.timeout,
-                             _dev_is_paired)()
-        filtered = list(filter(lambda device: dev in device.Path, devices))
+        # One look is enough, the tree follows the Paired signal, polling
+        # would only wait out the timeout for devices that aren't paired.
+        filtered = self._find_dev(dev, self._get_devices())
         filtered = list(filter(lambda device: device.Paired, filtered))
         return bool(filtered)
 
-    def _is_device_paired_timeout(self, dev):
-        paired = self._is_device_paired(dev)
-        return paired
-
     def _is_device_connected(self, dev):
         devices = self._tout(self._get_devices,
                              self.timeout,
-                             lambda devs: any(dev in d.Path for d in devs))
+                             lambda devs: self._find_dev(dev, devs))
         devices = devices()
-        filtered = list(filter(lambda device: dev in device.Path, devices))
+        filtered = self._find_dev(dev, devices)
         filtered = list(filter(lambda device: device.Connected, filtered))
         return bool(filtered)
 
-    def _get_attr_path(self, uuid, dev):
+    def _get_attr_path(self, uuid, dev, kind='chrcs'):
+        if kind != 'chrcs':
+            dev_path = self._dev_path(dev)
+            objects = BluezObjectInterface(self._bus,
+                                           self._tree).get_subtree(dev_path)
+            rel = gatt_layout(dev_path, objects)[kind].get(uuid)
+            return self._dev_path(dev) + '/' + rel if rel else ''
         chrcs = self.get_chrcs(dev)
         try:
             chrc = list(filter(lambda chrc_: uuid == chrc_.UUID, chrcs))[0]
             path = getattr(chrc, 'Path')  # just silencing pycharm.
         except IndexError:
             path = ''
+        if path:
+            self.value_cache.learn(path, uuid)
         return path
 
-    def _uuid_to_path(self, uuid, dev):
-        path = self._timeout(self._get_attr_path, self.timeout)(uuid, dev)
+    def _wait_for_services(self, dev, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        resolved = self._state.wait_for(
+            self._dev_path(dev), lambda state: state.services_resolved,
+            timeout)
+        took = time.monotonic() - start
+        if not resolved:
+            reason = 'Service discovery did not finish in {} seconds.'
+            raise DeviceNotAvailable(reason.format(timeout),
+                                     self.name, self.version)
+        self.logger.debug('Services of %s resolved in %.3fs', dev, took)
+        return took
+
+    def _uuid_to_path(self, uuid, dev, cached=True, kind='chrcs'):
+        if cached:
+            path = self._cached_attr_path(uuid, dev, kind)
+            if path is not None:
+                return path
+        path = self._get_attr_path(uuid, dev, kind)
+        if not path:
+            # Characteristics show up as bluez discovers them, and all of
+            # them are there once ServicesResolved is set. Wait for that
+            # signal instead of polling the object tree.
+            resolved = self._state.wait_for(
+                self._dev_path(dev), lambda state: state.services_resolved,
+                self.timeout)
+            if resolved:
+                path = self._get_attr_path(uuid, dev, kind)
         if not path:
             raise DeviceNotAvailable(self.name, self.version)
         return path
 
+    @staticmethod
+    def _dev_address(dev):
+        return dev[len('/dev_'):]
+
+    def _cached_attr_path(self, uuid, dev, kind='chrcs'):
+        if self._gatt_cache is None or not self._gatt_hash_matches(dev):
+            return None
+        address = self._dev_address(dev)
+        rel = self._gatt_cache.lookup(address, uuid, kind)
+        if rel is None:
+            return None
+        path = self._dev_path(dev) + '/' + rel
+        exported = (self._tree.get(path) or {}).get(IFACES[kind])
+        if exported is not None and \
+                not exported_as(uuid, exported.get('UUID')):
+            # bluez exports another attribute there, the device's database
+            # changed since its layout was cached.
+            self._gatt_cache.invalidate(address)
+            return None
+        if kind == 'chrcs':
+            self.value_cache.learn(path, uuid)
+        return path
+
+    def _gatt_hash_matches(self, dev):
+        # A layout cached along with a GATT database hash is only used once
+        # the device's hash matches it, which is checked once a connection.
+        address = self._dev_address(dev)
+        if dev in self._gatt_hashed or \
+                self._gatt_cache.db_hash(address) is None:
+            return True
+        rel = self._gatt_cache.lookup(address, GATT_DB_HASH_UUID)
+        if rel is None:
+            return False
+        try:
+            iface = BluezGattCharInterface(self._bus,
+                                           self._dev_path(dev) + '/' + rel)
+            db_hash = b''.join(dbus_object_parser(iface.read_value()))
+        except (dbus.DBusException, IfaceError) as exp:
+            self.logger.debug('Could not read GATT hash: %s', exp)
+            return False
+        if not self._gatt_cache.verify(address, db_hash):
+            return False
+        with self._gatt_lock:
+            self._gatt_hashed.add(dev)
+        return True
+
+    def _gatt_call(self, dev, uuid, call, kind='chrcs'):
+        """
+        Run call with the interface of the characteristic uuid, or with the
+        descriptor desc_key() uuid when kind is 'descs'.
+        """
+
+        def _iface(path):
+            if kind == 'descs':
+                return BluezGattDescInterface(self._bus, path)
+            return BluezGattCharInterface(self._bus, path, self._signals)
+
+        self._when_ready()
+        path = self._uuid_to_path(uuid, dev, kind=kind)
+        run = self._scheduler.run
+        try:
+            result = run(GATT, call, _iface(path))
+        except dbus.DBusException as exp:
+            if exp.get_dbus_name() != DBUS_UNKNOWN_OBJ_ERR or \
+                    path != self._cached_attr_path(uuid, dev, kind):
+                raise
+            # A cached path bluez doesn't know. It may just not be exported
+            # yet, so only drop the cache if the path was in fact wrong.
+            fresh = self._uuid_to_path(uuid, dev, cached=False, kind=kind)
+            if fresh != path:
+                self._gatt_cache.invalidate(self._dev_address(dev))
+            result = run(GATT, call, _iface(fresh))
+        self._validate_gatt_cache(dev)
+        return result
+
+    def _validate_gatt_cache(self, dev):
+        # Once per connection, after discovery is done, store the layout
+        # bluez found if it's any different from the cached one.
+        if self._gatt_cache is None or dev in self._gatt_validated:
+            return
+        if not self._state.services_resolved(self._dev_path(dev)):
+            return
+        with self._gatt_lock:
+            if dev in self._gatt_validated:
+                return
+            self._gatt_validated.add(dev)
+        dev_path = self._dev_path(dev)
+        boiface = BluezObjectInterface(self._bus, self._tree)
+        layout = gatt_layout(dev_path, boiface.get_subtree(dev_path))
+        db_hash = None
+        hash_path = layout['chrcs'].get(GATT_DB_HASH_UUID)
+        if hash_path is not None:
+            try:
+                iface = BluezGattCharInterface(self._bus,
+                                               dev_path + '/' + hash_path)
+                db_hash = b''.join(dbus_object_parser(iface.read_value()))
+            except (dbus.DBusException, IfaceError) as exp:
+                self.logger.debug('Could not read GATT hash: %s', exp)
+        self._gatt_cache.store(self._dev_address(dev), layout, db_hash)
+        if db_hash is not None:
+            with self._gatt_lock:
+                self._gatt_hashed.add(dev)
+
     @staticmethod
     def _handle_notification(func):
         def _wrapper(*args):
@@ -532,18 +1289,6 @@ class DBusted(EngineBluew):
                 pass
         return _wrapper
 
-    @staticmethod
-    def _timeout(func, timeout):
-        def _wrapper(*args, **kwargs):
-            result = False
-            start_time = time.time()
-            current_time = time.time()
-            while (current_time < start_time + timeout) and not result:
-                result = func(*args, **kwargs)
-                current_time = time.time()
-            return result
-        return _wrapper
-
     @staticmethod
     def _tout(func, timeout, case):
         def _wrapper(*args, **kwargs):
@@ -11,7 +11,7 @@ This module contains some helper decorators for the dbusted engine.
 
 
 from functools import wraps
-from bluew.errors import DeviceNotAvailable
+from bluew.errors import BluewError, DeviceNotAvailable
 from bluew.dbusted.interfaces import BluezInterfaceError as IfaceError
 
 
@@ -26,11 +26,15 @@ def mac_to_dev(func):
 
 
 def check_if_available(func):
-    """Check if bluetooth device is available before performing action."""
+    """
+    Check if bluetooth device is available before performing action. This
+    is answered from the engine's device state cache when possible, and only
+    scans when the device is unknown.
+    """
     @wraps(func)
     def _wrapper(self, dev, *args, **kwargs):
         # pylint: disable=W0212
-        available = self._is_device_available(dev)
+        available = self._device_known(dev)
         if available:
             return func(self, dev, *args, **kwargs)
         raise DeviceNotAvailable(name=self.name, version=self.version)
@@ -42,7 +46,7 @@ def check_if_not_paired(func):
     @wraps(func)
     def _wrapper(self, dev, *args, **kwargs):
         # pylint: disable=W0212
-        paired = self._is_device_paired_timeout(dev)
+        paired = self._device_paired(dev)
         if not paired:
             return func(self, dev, *args, **kwargs)
         return
@@ -54,20 +58,45 @@ def check_if_connected(func):
     @wraps(func)
     def _wrapper(self, dev, *args, **kwargs):
         # pylint: disable=W0212
-        connected = self._is_device_connected(dev)
+        connected = self._device_connected(dev)
         if connected:
             return func(self, dev, *args, **kwargs)
         return
     return _wrapper
 
 
+def queued(func):
+    """
+    Queue calls on the (controller, device, attribute) they're for, see
+    bluew.queues. Put it below @mac_to_dev.
+    """
+    @wraps(func)
+    def _wrapper(self, dev, attribute, *args, **kwargs):
+        # pylint: disable=W0212
+        key = (self.cntrl, dev, attribute)
+        return self._ops.run(key, func, self, dev, attribute, *args, **kwargs)
+    return _wrapper
+
+
 def handle_errors(func):
-    """Handle errors of interface calls."""
+    """
+    Handle errors of interface calls. If the handler dealt with the cause,
+    like a controller that was off until now, or a link that dropped, the
+    call is made once more. Otherwise it raises, the call never just
+    returns None.
+    """
     @wraps(func)
     def _wrapper(self, *args, **kwargs):
-        try:
-            return func(self, *args, **kwargs)
-        except IfaceError as exp:
-            # pylint: disable=W0212
-            self._handle_errors(exp, *args, **kwargs)
+        for retry in (True, False):
+            try:
+                return func(self, *args, **kwargs)
+            except IfaceError as exp:
+                # pylint: disable=W0212
+                if not self._handle_errors(exp, *args, retry=retry,
+                                           **kwargs):
+                    raise BluewError(BluewError.UNEXPECTED_ERROR,
+                                     exp.error_name, self.name,
+                                     self.version)
+        raise BluewError(BluewError.UNEXPECTED_ERROR, name=self.name,
+                         version=self.version)
     return _wrapper
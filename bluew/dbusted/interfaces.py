@@ -9,16 +9,20 @@ This module provides D-Bus interfaces provided by the bluez API.
 :license: MIT, see LICENSE for more details.
 """
 import logging
+import threading
 
-from typing import Tuple, List, Callable  # pylint: disable=W0611
+from typing import (Tuple, List, Callable, Dict,  # pylint: disable=W0611
+                    Optional)
 from dbus.connection import SignalMatch  # pylint: disable=W0611
 
 import dbus
 
 from bluew.characteristics import BLECharacteristic
 from bluew.controller import Controller
+from bluew.descriptors import BLEDescriptor
 from bluew.dbusted.utils import dbus_object_parser
 from bluew.device import Device
+from bluew.objtree import ObjectTree, ROOT
 from bluew.services import BLEService
 
 
@@ -30,6 +34,7 @@ DBUS_PROP_IFACE = 'org.freedesktop.DBus.Properties'
 
 GATT_MANAGER_IFACE = 'org.bluez.GattManager1'
 GATT_SERVICE_IFACE = 'org.bluez.GattService1'
+GATT_CHRC_IFACE = 'org.bluez.GattCharacteristic1'
 GATT_DESC_IFACE = 'org.bluez.GattDescriptor1'
 
 ADAPTER_IFACE = 'org.bluez.Adapter1'
@@ -47,6 +52,7 @@ BLUEZ_IN_PROGRESS_ERROR_OAIP = 'Operation already in progress'
 
 DBUS_NO_REPLY_ERR = 'org.freedesktop.DBus.Error.NoReply'
 DBUS_UNKNOWN_OBJ_ERR = 'org.freedesktop.DBus.Error.UnknownObject'
+DBUS_INVALID_ARGS_ERR = 'org.freedesktop.DBus.Error.InvalidArgs'
 
 
 def get_exp_name_msg(exp: dbus.DBusException) -> Tuple[str, str]:
@@ -85,6 +91,70 @@ class BluezAdapterInterface(object):
         bluez_obj = bus.get_object(BLUEZ_SERVICE_NAME,
                                    BLUEZ_SERVICE_PATH + self.cntrl)
         self.manager = dbus.Interface(bluez_obj, ADAPTER_IFACE)
+        self.prop_manager = dbus.Interface(bluez_obj, DBUS_PROP_IFACE)
+
+    def set_property(self, prop: str, value) -> None:
+        """Set() a property of the org.bluez.Adapter1 Interface."""
+
+        try:
+            self.prop_manager.Set(ADAPTER_IFACE, prop, value)
+        except dbus.DBusException as exp:
+            self._handle_set_property_error(exp)
+
+    @staticmethod
+    def _handle_set_property_error(exp: dbus.DBusException) -> None:
+        bzerr = BluezInterfaceError
+        if error_is(exp, bzerr.BLUEZ_NOT_READY_ERR):
+            # ERROR: org.bluez.Error.NotReady
+            # Only Powered can be set while the adapter is turned off.
+            raise bzerr(bzerr.BLUEZ_NOT_READY_ERR)
+
+        elif error_is(exp, bzerr.BLUEZ_INVALID_ARGUMENTS_ERR):
+            # ERROR: org.bluez.Error.InvalidArguments
+            # Wrong type for the property, or a timeout out of range.
+            raise bzerr(bzerr.BLUEZ_INVALID_ARGUMENTS_ERR)
+
+        else:
+            raise exp
+
+    def set_discovery_filter(self, uuids: Optional[List[str]] = None,
+                             rssi: Optional[int] = None) -> None:
+        """
+        SetDiscoveryFilter() method on org.bluez.Adapter1 Interface. Without
+        uuids or rssi the filter is cleared.
+        """
+
+        discovery_filter = dbus.Dictionary({}, signature='sv')
+        if uuids:
+            discovery_filter['UUIDs'] = dbus.Array(uuids, signature='s')
+        if rssi is not None:
+            discovery_filter['RSSI'] = dbus.Int16(rssi)
+        try:
+            self.manager.SetDiscoveryFilter(discovery_filter)
+        except dbus.DBusException as exp:
+            self._handle_set_discovery_filter_error(exp)
+
+    @staticmethod
+    def _handle_set_discovery_filter_error(exp: dbus.DBusException) -> None:
+        bzerr = BluezInterfaceError
+        if error_is(exp, bzerr.BLUEZ_NOT_READY_ERR):
+            # ERROR: org.bluez.Error.NotReady
+            # The adapter/controller is off.
+            raise bzerr(bzerr.BLUEZ_NOT_READY_ERR)
+
+        elif error_is(exp, bzerr.BLUEZ_NOT_SUPPORTED_ERR):
+            # ERROR: org.bluez.Error.NotSupported
+            # Older bluez versions, or controllers that can't filter. The
+            # scan goes on unfiltered, the query filters what it finds.
+            return
+
+        elif error_is(exp, bzerr.BLUEZ_INVALID_ARGUMENTS_ERR):
+            # ERROR: org.bluez.Error.InvalidArguments
+            # A UUID that isn't one, or an RSSI out of range.
+            raise bzerr(bzerr.BLUEZ_INVALID_ARGUMENTS_ERR)
+
+        else:
+            raise exp
 
     def start_discovery(self) -> None:
         """StartDiscovery() method on org.bluez.Adapter1 Interface."""
@@ -204,15 +274,17 @@ class BluezDeviceInterface(object):
         if error_is(exp, bzerr.BLUEZ_ERR_MSG_OAIP):
             # ERROR: org.bluez.Error.Failed
             # Here we only handle Error.Failed when the message
-            # says the the operation is already in progress.
-            self._err_connect_retry()
+            # says the the operation is already in progress. Someone else
+            # is connecting, let the caller wait for the outcome instead
+            # of tearing that attempt down.
+            raise bzerr(bzerr.BLUEZ_IN_PROGRESS_ERR)
 
         elif error_is(exp, bzerr.BLUEZ_IN_PROGRESS_ERR):
             # ERROR: org.bluez.Error.InProgress
             # This is another OAIP error, but it get's thrown from
             # a different function in bluez, and this time as a real
             # Error.InProgress and not masked as Error.Failed.
-            self._err_connect_retry()
+            raise bzerr(bzerr.BLUEZ_IN_PROGRESS_ERR)
 
         elif error_is(exp, bzerr.BLUEZ_ALREADY_CONNECTED_ERR):
             # ERROR: org.bluez.Error.AlreadyConnected
@@ -236,10 +308,6 @@ class BluezDeviceInterface(object):
         else:
             raise exp
 
-    def _err_connect_retry(self) -> None:
-        self.disconnect_device()
-        self.connect_device()
-
     def disconnect_device(self) -> None:
         """Disconnect() method on org.bluez.Device1 Interface."""
 
@@ -265,15 +333,22 @@ class BluezDeviceInterface(object):
         else:
             raise exp
 
-    def pair_device(self) -> None:
-        """Pair() method on org.bluez.Device1 Interface."""
+    def pair_device(self, timeout: float = 25) -> None:
+        """
+        Pair() method on org.bluez.Device1 Interface. Blocks until bluez
+        replies, or timeout seconds pass, the agent registered on the same
+        bus connection gets asked for anything the pairing needs meanwhile.
+        """
 
-        self.manager.Pair(reply_handler=lambda *args, **kwargs: None,
-                          error_handler=lambda *args: None)
+        try:
+            self.manager.Pair(timeout=timeout)
+        except dbus.DBusException as exp:
+            self._handle_pair_error(exp)
 
     @staticmethod
     def _handle_pair_error(exp: dbus.DBusException) -> None:
         bzerr = BluezInterfaceError
+        log_iface_error(DEVICE_IFACE, exp)
         if error_is(exp, bzerr.BLUEZ_AUTH_CANCELLED_ERR):
             # ERROR: org.bluez.Error.AuthenticationCanceled
             # Since we haven't implemented CancelPairing, the only logical
@@ -289,9 +364,8 @@ class BluezDeviceInterface(object):
 
         elif error_is(exp, bzerr.BLUEZ_INVALID_ARGUMENTS_ERR):
             # ERROR: org.bluez.Error.InvalidArguments
-            # This should never happen as long as nobody passes
-            # manager.Pair() an argument other than reply_handler &
-            # error_handler.
+            # This should never happen, manager.Pair() takes no arguments
+            # other than the D-Bus timeout.
             raise bzerr(bzerr.BLUEZ_INVALID_ARGUMENTS_ERR)
 
         elif error_is(exp, bzerr.BLUEZ_FAILED_ERR):
@@ -330,7 +404,8 @@ class BluezDeviceInterface(object):
             # ERROR: org.freedesktop.DBus.Error.NoReply
             # D-Bus times out some times before bluez sends a reply
             # and sometimes even though the pairing has already suceeded
-            # before the timeout, this error still get's raised.
+            # before the timeout, this error still get's raised. The caller
+            # waits for the Paired signal instead.
             return
 
         else:
@@ -345,24 +420,92 @@ class BluezDeviceInterface(object):
         self.prop_manager.Set(DEVICE_IFACE, 'Trusted', False)
 
 
+class SignalRegistry(object):
+    """
+    The PropertiesChanged receivers of notifying characteristics, one per
+    object path. Safe to use from many threads at once.
+    """
+
+    def __init__(self):
+        self._signals = {}  # type: Dict[str, SignalMatch]
+        self._lock = threading.Lock()
+
+    def add(self, path: str, connect: Callable[[], SignalMatch]) -> bool:
+        """
+        Add the receiver connect() returns for path, unless there's one.
+        :return: False if path already had a receiver.
+        """
+
+        with self._lock:
+            if path in self._signals:
+                return False
+            self._signals[path] = connect()
+            return True
+
+    def remove(self, path: str) -> None:
+        """Remove the receiver of path, if there's one."""
+        with self._lock:
+            signal = self._signals.pop(path, None)
+        if signal is not None:
+            signal.remove()
+
+    def clear(self) -> None:
+        """Remove every receiver."""
+        with self._lock:
+            signals, self._signals = self._signals, {}
+        for signal in signals.values():
+            signal.remove()
+
+    def __contains__(self, path: str) -> bool:
+        with self._lock:
+            return path in self._signals
+
+
 class BluezGattCharInterface(object):
-    """Bluez D-Bus GattCharacteristic Interface"""
+    """
+    Bluez D-Bus GattCharacteristic Interface. Notification receivers are
+    kept in signals, a SignalRegistry shared by the interfaces of one bus.
+    """
 
-    __SIGNALS = []  # type: List[Tuple[SignalMatch, str]]
+    __SIGNALS = SignalRegistry()
     __IFACE = 'org.bluez.GattCharacteristic1'
 
-    def __init__(self, bus, path):
+    def __init__(self, bus, path, signals: Optional[SignalRegistry] = None):
+        self.signals = self.__SIGNALS if signals is None else signals
         self.bus = bus
         bluez_obj = self.bus.get_object(BLUEZ_SERVICE_NAME, path)
         self.manager = dbus.Interface(bluez_obj, self.__IFACE)
+        self.prop_manager = dbus.Interface(bluez_obj, DBUS_PROP_IFACE)
         self.path = path
         self.logger = logging.getLogger(__name__)
 
-    def read_value(self) -> dbus.Array:
+    @staticmethod
+    def _options(offset: int, response: bool = False) -> dict:
+        options = {}  # type: dict
+        if offset:
+            options['offset'] = dbus.UInt16(offset)
+        if response:
+            options['type'] = 'request'
+        return options
+
+    def get_mtu(self) -> Optional[int]:
+        """MTU property on org.bluez.GattCharacteristic1 Interface."""
+
+        try:
+            return int(self.prop_manager.Get(self.__IFACE, 'MTU'))
+        except dbus.DBusException as exp:
+            log_iface_error(self.__IFACE, exp)
+            if error_is(exp, DBUS_INVALID_ARGS_ERR):
+                # ERROR: org.freedesktop.DBus.Error.InvalidArgs
+                # No such property, bluez only has it since 5.62.
+                return None
+            raise exp
+
+    def read_value(self, offset: int = 0) -> dbus.Array:
         """ReadValue() method on org.bluez.GattCharacteristic1 Interface."""
 
         try:
-            return self.manager.ReadValue({})
+            return self.manager.ReadValue(self._options(offset))
         except dbus.DBusException as exp:
             self._handle_read_value_error(exp)
 
@@ -419,14 +562,32 @@ class BluezGattCharInterface(object):
         else:
             raise exp
 
-    def write_value(self, data: List[int]) -> None:
+    def write_value(self, data: List[int], offset: int = 0,
+                    response: bool = False) -> None:
         """WriteValue() method on org.bluez.GattCharacteristic1 Interface."""
 
         try:
-            self.manager.WriteValue(data, {})
+            self.manager.WriteValue(data, self._options(offset, response))
         except dbus.DBusException as exp:
             self._handle_write_value_error(exp)
 
+    def write_command(self, data: List[int], done: Callable) -> None:
+        """
+        WriteValue() method on org.bluez.GattCharacteristic1 Interface,
+        without response, and without waiting for bluez. done(error) gets
+        called from the main loop thread once bluez replies.
+        """
+
+        def _error(exp):
+            try:
+                self._handle_write_value_error(exp)
+            except Exception as err:  # pylint: disable=broad-except
+                done(err)
+
+        self.manager.WriteValue(data, {'type': 'command'},
+                                reply_handler=lambda: done(None),
+                                error_handler=_error)
+
     def _handle_write_value_error(self, exp: dbus.DBusException) -> None:
         bzerr = BluezInterfaceError
         log_iface_error(self.__IFACE, exp)
@@ -500,15 +661,11 @@ class BluezGattCharInterface(object):
             self._add_signal(handler)
 
     def _add_signal(self, handler: Callable) -> None:
-        if not self._sig_already_registered():
-            sig = self.bus.add_signal_receiver(handler, path=self.path)
-            self.__SIGNALS.append((sig, self.path))
+        self.signals.add(self.path, lambda: self.bus.add_signal_receiver(
+            handler, path=self.path))
 
     def _sig_already_registered(self) -> bool:
-        for _, path in self.__SIGNALS:
-            if path == self.path:
-                return True
-        return False
+        return self.path in self.signals
 
     def _handle_start_notify_error(self, exp: dbus.DBusException) -> None:
         bzerr = BluezInterfaceError
@@ -564,13 +721,7 @@ class BluezGattCharInterface(object):
             self._remove_signal()
 
     def _remove_signal(self) -> None:
-        signals = []
-        for signal, path in BluezGattCharInterface.__SIGNALS:
-            if path == self.path:
-                signal.remove()
-            else:
-                signals.append((signal, path))
-        BluezGattCharInterface.__SIGNALS = signals
+        self.signals.remove(self.path)
 
     def _handle_stop_notify_error(self, exp: dbus.DBusException) -> None:
         bzerr = BluezInterfaceError
@@ -582,26 +733,85 @@ class BluezGattCharInterface(object):
             return
 
 
+class BluezGattDescInterface(object):
+    """Bluez D-Bus GattDescriptor Interface"""
+
+    __IFACE = 'org.bluez.GattDescriptor1'
+
+    def __init__(self, bus, path):
+        self.bus = bus
+        bluez_obj = self.bus.get_object(BLUEZ_SERVICE_NAME, path)
+        self.manager = dbus.Interface(bluez_obj, self.__IFACE)
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+
+    def read_value(self) -> dbus.Array:
+        """ReadValue() method on org.bluez.GattDescriptor1 Interface."""
+
+        try:
+            return self.manager.ReadValue({})
+        except dbus.DBusException as exp:
+            self._handle_value_error(exp)
+
+    def write_value(self, data: List[int]) -> None:
+        """WriteValue() method on org.bluez.GattDescriptor1 Interface."""
+
+        try:
+            self.manager.WriteValue(data, {})
+        except dbus.DBusException as exp:
+            self._handle_value_error(exp)
+
+    def _handle_value_error(self, exp: dbus.DBusException) -> None:
+        bzerr = BluezInterfaceError
+        log_iface_error(self.__IFACE, exp)
+        if error_is(exp, bzerr.BLUEZ_ERR_MSG_NOT_CONNECTED) or \
+                error_is(exp, bzerr.BLUEZ_ERR_MSG_NO_ATT):
+            # ERROR: org.bluez.Error.Failed
+            # Same as for characteristics, the device is gone.
+            raise bzerr(bzerr.BLUEZ_NOT_CONNECTED_ERR)
+
+        elif error_is(exp, bzerr.BLUEZ_ERR_MSG_NOT_PAIRED):
+            # ERROR: org.bluez.Error.NotPermitted
+            # With the message 'Not paired', the descriptor needs
+            # authentication.
+            raise bzerr(bzerr.NOT_PAIRED)
+
+        for name in (bzerr.BLUEZ_IN_PROGRESS_ERR,
+                     bzerr.BLUEZ_NOT_PERMITTED_ERR,
+                     bzerr.BLUEZ_NOT_AUTHORIZED_ERR,
+                     bzerr.BLUEZ_NOT_SUPPORTED_ERR,
+                     bzerr.BLUEZ_INVALID_VAL_LEN):
+            # ERROR: org.bluez.Error.*
+            # These mean the same as they do for characteristics, see
+            # BluezGattCharInterface.
+            if error_is(exp, name):
+                raise bzerr(name)
+
+        raise exp
+
+
 class BluezObjectInterface(object):
-    """Bluez D-Bus objects Interface"""
+    """
+    Bluez D-Bus objects Interface. Queries are answered from the ObjectTree
+    given, when it's loaded, and from a tree built of GetManagedObjects()
+    otherwise. Device queries take the device's full object path.
+    """
 
-    def __init__(self, bus):
+    def __init__(self, bus, tree: Optional[ObjectTree] = None):
         self.bus = bus
+        self.tree = tree
         bluez_obj = self.bus.get_object(BLUEZ_SERVICE_NAME, "/")
         self.manager = dbus.Interface(bluez_obj, DBUS_OM_IFACE)
 
-    def _get_objects(self, iface):
-        objects = self.manager.GetManagedObjects().items()
-        objects = list(map(lambda x: (x[0], x[1].get(iface, None)), objects))
-        objects = list(filter(lambda x: x[1] is not None, objects))
-        objects = list(map(lambda x: self._parse(x[1], x[0]), objects))
-        return objects
+    def _object_tree(self) -> ObjectTree:
+        if self.tree is not None and self.tree.loaded:
+            return self.tree
+        tree = ObjectTree()
+        tree.load(self.get_objects())
+        return tree
 
-    @staticmethod
-    def _parse(obj, path):
-        parsed_object = dbus_object_parser(obj)
-        parsed_object['Path'] = dbus_object_parser(path)
-        return parsed_object
+    def _get_objects(self, iface, path=ROOT):
+        return self._object_tree().objects(iface, path)
 
     def get_controllers(self):
         """THIS IS NOT AT THE CORRECT LEVEL OF ABSTRACTION."""
@@ -611,37 +821,130 @@ class BluezObjectInterface(object):
 
     def get_devices(self):
         """THIS IS NOT AT THE CORRECT LEVEL OF ABSTRACTION."""
-        objects = self._get_objects('org.bluez.Device1')
+        objects = self.get_device_objects()
         devices = tuple(map(lambda obj: Device(**obj), objects))
         return devices
 
-    def get_services(self, dev):
+    def get_device_objects(self):
+        """Get the parsed Device1 properties of every device, with Path."""
+        return self._get_objects('org.bluez.Device1')
+
+    def get_objects(self):
+        """
+        Get every bluez object from bluez, as {path: {iface: parsed
+        properties}}. Interfaces with properties that can't be parsed are
+        left out.
+        """
+        objects = {}
+        for path, ifaces in self.manager.GetManagedObjects().items():
+            parsed = objects.setdefault(str(path), {})
+            for iface, props in ifaces.items():
+                try:
+                    parsed[str(iface)] = dbus_object_parser(props)
+                except ValueError:
+                    continue
+        return objects
+
+    def get_subtree(self, path):
+        """Get the object at path, and every object below it."""
+        return self._object_tree().subtree(path)
+
+    def get_services(self, dev_path):
         """THIS IS NOT AT THE CORRECT LEVEL OF ABSTRACTION."""
-        objects = self._get_objects('org.bluez.GattService1')
-        objects = list(filter(lambda x: dev in x.get('Path', None), objects))
+        objects = self._get_objects('org.bluez.GattService1', dev_path)
         services = tuple(map(lambda obj: BLEService(**obj), objects))
         return services
 
-    def get_characteristics(self, dev):
+    def get_characteristics(self, dev_path):
         """THIS IS NOT AT THE CORRECT LEVEL OF ABSTRACTION."""
-        objects = self._get_objects('org.bluez.GattCharacteristic1')
-        objects = list(filter(lambda x: dev in x.get('Path', None), objects))
+        objects = self._get_objects('org.bluez.GattCharacteristic1', dev_path)
         characteristics = tuple(
             map(lambda obj: BLECharacteristic(**obj), objects))
         return characteristics
 
+    def get_descriptors(self, dev_path):
+        """THIS IS NOT AT THE CORRECT LEVEL OF ABSTRACTION."""
+        objects = self._get_objects(GATT_DESC_IFACE, dev_path)
+        return tuple(map(lambda obj: BLEDescriptor(**obj), objects))
+
+
+class BluezSignalInterface(object):
+    """
+    Bluez D-Bus signals: InterfacesAdded & InterfacesRemoved from the
+    object manager, and PropertiesChanged from every bluez object.
+    Callbacks get called from the main loop thread with parsed values.
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.signals = []  # type: List[SignalMatch]
+        self.logger = logging.getLogger(__name__)
+
+    def watch_objects(self, on_added: Callable, on_removed: Callable) -> None:
+        """
+        Call on_added(path, {iface: props}) and on_removed(path, [iface])
+        when bluez adds or removes interfaces.
+        """
+
+        def _added(path, ifaces):
+            try:
+                on_added(str(path), dbus_object_parser(ifaces))
+            except ValueError as exp:
+                self.logger.debug('DBusted::Signal:InterfacesAdded:%s', exp)
+
+        def _removed(path, ifaces):
+            on_removed(str(path), [str(iface) for iface in ifaces])
+
+        self._add(_added, 'InterfacesAdded', DBUS_OM_IFACE)
+        self._add(_removed, 'InterfacesRemoved', DBUS_OM_IFACE)
+
+    def watch_properties(self, on_changed: Callable, ifaces) -> None:
+        """
+        Call on_changed(path, iface, props) when properties change on one of
+        the interfaces given. Other interfaces are filtered out before
+        parsing, since GATT values change at notification rate.
+        """
+
+        ifaces = frozenset(ifaces)
+
+        def _changed(iface, changed, invalidated, path=None):
+            # pylint: disable=unused-argument
+            if str(iface) not in ifaces:
+                return
+            try:
+                on_changed(str(path), str(iface), dbus_object_parser(changed))
+            except ValueError as exp:
+                self.logger.debug('DBusted::Signal:PropertiesChanged:%s', exp)
+
+        self._add(_changed, 'PropertiesChanged', DBUS_PROP_IFACE,
+                  path_keyword='path')
+
+    def _add(self, handler, signal_name, iface, **kwargs):
+        sig = self.bus.add_signal_receiver(handler, signal_name=signal_name,
+                                           dbus_interface=iface,
+                                           bus_name=BLUEZ_SERVICE_NAME,
+                                           **kwargs)
+        self.signals.append(sig)
+
+    def remove(self) -> None:
+        """Stop watching."""
+        signals, self.signals = self.signals, []
+        for sig in signals:
+            sig.remove()
+
 
 class BluezAgentManagerInterface(object):
     """Bluez AgentManager interface."""
 
     __IFACE = 'org.bluez.AgentManager1'
 
-    def __init__(self, bus):
+    def __init__(self, bus, agent_path: str = '/org/bluez/bluew',
+                 agent_cap: str = 'NoInputNoOutput'):
         self.bus = bus
         bluez_obj = self.bus.get_object(BLUEZ_SERVICE_NAME, "/org/bluez")
         self.manager = dbus.Interface(bluez_obj, self.__IFACE)
-        self.agent_path = '/org/bluez/bluew'
-        self.agent_cap = ''
+        self.agent_path = agent_path
+        self.agent_cap = agent_cap
 
     def register_agent(self) -> None:
         """RegisterAgent() method on interface org.bluez.AgentManager1"""
@@ -665,10 +968,9 @@ class BluezAgentManagerInterface(object):
 
         elif error_is(exp, bzerr.BLUEZ_ALREADY_EXISTS_ERR):
             # ERROR: org.bluez.Error.AlreadyExists"
-            # DBusted should take care of not trying to register more than one
-            # agent at a time, as soon as we want it to run from different
-            # interpreter instances at the same time, we should make the path
-            # dynamic. Once again raise to see it while refactoring.
+            # DBusted registers one agent per bus connection, see
+            # bluew.dbusted.agent.register(), so this would mean it got
+            # registered twice. Once again raise to see it while refactoring.
             raise exp
 
         else:
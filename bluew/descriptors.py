@@ -0,0 +1,149 @@
+"""
+bluew.descriptors
+~~~~~~~~~~~~~~~~~
+
+This module provides a ble descriptor object, that should be returned
+by any EngineBluew when queried for available descriptors of a device, and
+a parser for Characteristic Presentation Format descriptors, which tell how
+to decode the value of their characteristic:
+
+    >>> fmt = parse_presentation_format(
+    ...     connection.read_descriptor(uuid, PRESENTATION_FORMAT_UUID))
+    >>> decode = decoder(fmt)
+    >>> decode(connection.read_long_attribute(uuid))
+    21.5
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import math
+import struct
+
+from collections import namedtuple
+from typing import Any, Callable  # noqa: F401
+
+from bluew.ppobj import PPObj
+
+
+EXTENDED_PROPERTIES_UUID = '00002900-0000-1000-8000-00805f9b34fb'
+USER_DESCRIPTION_UUID = '00002901-0000-1000-8000-00805f9b34fb'
+CCCD_UUID = '00002902-0000-1000-8000-00805f9b34fb'
+PRESENTATION_FORMAT_UUID = '00002904-0000-1000-8000-00805f9b34fb'
+
+
+class BLEDescriptor(PPObj):
+    """BLE Descriptor."""
+
+    def __init__(self, **kwargs):
+        attrs = {'Value', 'Flags', 'Characteristic', 'UUID', 'Path'}
+        super().__init__(attrs, **kwargs)
+        self.value = kwargs.get('Value')
+        self.flags = kwargs.get('Flags')
+        self.characteristic = kwargs.get('Characteristic')
+        self.UUID = kwargs.get('UUID')  # pylint: disable=invalid-name
+        self.path = kwargs.get('Path')
+
+
+PresentationFormat = namedtuple(
+    'PresentationFormat',
+    ['format', 'exponent', 'unit', 'namespace', 'description'])
+
+# Format types of the Bluetooth assigned numbers.
+FORMAT_BOOLEAN = 0x01
+FORMAT_2BIT = 0x02
+FORMAT_NIBBLE = 0x03
+FORMAT_UINT12 = 0x05
+FORMAT_SINT12 = 0x0d
+FORMAT_FLOAT32 = 0x14
+FORMAT_FLOAT64 = 0x15
+FORMAT_SFLOAT = 0x16
+FORMAT_FLOAT = 0x17
+FORMAT_DUINT16 = 0x18
+FORMAT_UTF8S = 0x19
+FORMAT_UTF16S = 0x1a
+FORMAT_STRUCT = 0x1b
+
+# Format type: (bytes, signed), for the integer types.
+_INTEGERS = {0x04: (1, False), 0x06: (2, False), 0x07: (3, False),
+             0x08: (4, False), 0x09: (6, False), 0x0a: (8, False),
+             0x0b: (16, False), 0x0c: (1, True), 0x0e: (2, True),
+             0x0f: (3, True), 0x10: (4, True), 0x11: (6, True),
+             0x12: (8, True), 0x13: (16, True)}
+
+
+def parse_presentation_format(value: bytes) -> PresentationFormat:
+    """Parse the value of a Characteristic Presentation Format descriptor."""
+    if len(value) < 7:
+        raise ValueError('presentation format is 7 bytes long')
+    return PresentationFormat(*struct.unpack('<BbHBH', bytes(value[:7])))
+
+
+def _signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value & (1 << (bits - 1)) else value
+
+
+def _medfloat(value: bytes, mantissa_bits: int) -> float:
+    # IEEE 11073 SFLOAT/FLOAT: a signed base 10 exponent above a signed
+    # mantissa. The largest mantissas are reserved for special values.
+    bits = len(value) * 8
+    raw = int.from_bytes(value, 'little')
+    mantissa = raw & ((1 << mantissa_bits) - 1)
+    exponent = _signed(raw >> mantissa_bits, bits - mantissa_bits)
+    nan = (1 << (mantissa_bits - 1)) - 1
+    if not exponent and nan - 1 <= mantissa <= nan + 3:
+        if mantissa == nan - 1:
+            return math.inf
+        if mantissa == nan + 3:
+            return -math.inf
+        return math.nan
+    return _signed(mantissa, mantissa_bits) * 10.0 ** exponent
+
+
+def decoder(fmt: PresentationFormat) -> Callable[[bytes], Any]:
+    """
+    Get a function decoding values of the format given. Numbers are scaled
+    by the format's exponent, strings are decoded, and formats without a
+    decoding, like structs, are returned as bytes.
+    """
+    # pylint: disable=too-many-return-statements
+
+    kind, exponent = fmt.format, fmt.exponent
+
+    def _scaled(number):
+        return number * 10 ** exponent if exponent else number
+
+    if kind in _INTEGERS:
+        size, signed = _INTEGERS[kind]
+        return lambda value: _scaled(int.from_bytes(
+            bytes(value[:size]), 'little', signed=signed))
+    if kind == FORMAT_BOOLEAN:
+        return lambda value: bool(value[0] & 0x01)
+    if kind == FORMAT_2BIT:
+        return lambda value: value[0] & 0x03
+    if kind == FORMAT_NIBBLE:
+        return lambda value: value[0] & 0x0f
+    if kind in (FORMAT_UINT12, FORMAT_SINT12):
+        def _int12(value):
+            number = int.from_bytes(bytes(value[:2]), 'little') & 0x0fff
+            if kind == FORMAT_SINT12:
+                number = _signed(number, 12)
+            return _scaled(number)
+        return _int12
+    if kind == FORMAT_FLOAT32:
+        return lambda value: _scaled(struct.unpack('<f', bytes(value[:4]))[0])
+    if kind == FORMAT_FLOAT64:
+        return lambda value: _scaled(struct.unpack('<d', bytes(value[:8]))[0])
+    if kind == FORMAT_SFLOAT:
+        return lambda value: _scaled(_medfloat(bytes(value[:2]), 12))
+    if kind == FORMAT_FLOAT:
+        return lambda value: _scaled(_medfloat(bytes(value[:4]), 24))
+    if kind == FORMAT_DUINT16:
+        return lambda value: struct.unpack('<HH', bytes(value[:4]))
+    if kind == FORMAT_UTF8S:
+        return lambda value: bytes(value).decode('utf-8')
+    if kind == FORMAT_UTF16S:
+        return lambda value: bytes(value).decode('utf-16-le')
+    return bytes
@@ -11,7 +11,6 @@ by any EngineBluew when queried for devices.
 """
 
 
-import bluew
 import logging
 from bluew.ppobj import PPObj
 
@@ -56,8 +55,9 @@ class Device(PPObj):  # pylint: disable=too-many-instance-attributes
         # SERIOUSLY: `self.attr` is just gonna call this method again.
         if item not in Device.attrs:
             try:
+                from bluew.api import info
                 mac = super().__getattribute__('address')
-                self = bluew.info(mac)  # noqa: F841
+                self = info(mac)  # noqa: F841
             except AttributeError as error:
                 logger = logging.getLogger(__name__)
                 logger.debug("Invalid device")
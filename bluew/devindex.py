@@ -0,0 +1,335 @@
+"""
+bluew.devindex
+~~~~~~~~~~~~~~
+
+This module provides an index of the devices bluez knows about, kept
+current from the same signals as the rest of an engine's caches, so that
+looking for devices is a lookup instead of a scan and a loop over every
+device:
+
+    >>> index.query(uuid='180f', min_rssi=-70, top=3)
+
+Devices are indexed by service UUID, manufacturer ID, address type and
+adapter, and kept in name and RSSI order, for name prefixes, RSSI
+thresholds and the top devices by RSSI. A query looks up every criterion
+given, and intersects the matches starting with the smallest.
+
+The engines' find_devices() go through a Search, which also keeps track
+of the scan they run when there aren't enough matches yet:
+
+    >>> search = index.search(adapter, uuid='180f', top=3)
+    >>> if search.wants_scan(10):
+    ...     with search.scanning(10, wake):
+    ...         remaining = search.remaining()
+    ...         while remaining:
+    ...             # wait for wake(), up to remaining seconds
+    ...             remaining = search.remaining()
+    >>> search.found
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import bisect
+import heapq
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import (Callable, Dict, Iterable, List, Optional,  # noqa: F401
+                    Set, Tuple)
+
+
+DEVICE_IFACE = 'org.bluez.Device1'
+BASE_UUID = '-0000-1000-8000-00805f9b34fb'
+
+_EMPTY = frozenset()  # type: frozenset
+
+
+def full_uuid(uuid: str) -> str:
+    """The 128 bit form of a UUID, that might be given in 16 or 32 bits."""
+    uuid = uuid.lower()
+    if len(uuid) in (4, 8):
+        return uuid.rjust(8, '0') + BASE_UUID
+    return uuid
+
+
+def _keys(prop: str, value) -> Set:
+    # The keys a property's value is indexed under.
+    if value is None:
+        return set()
+    if prop == 'UUIDs':
+        return {full_uuid(str(uuid)) for uuid in value}
+    if prop == 'ManufacturerData':
+        return {int(key) for key in value}
+    return {str(value)}
+
+
+class DeviceIndex(object):
+    """
+    Device1 properties, keyed by object path, with secondary indexes.
+    Listeners added with add_listener() are called with the path of every
+    device added, changed or removed.
+    """
+
+    # Properties with a lookup table of their own.
+    TABLES = ('UUIDs', 'ManufacturerData', 'AddressType', 'Adapter')
+
+    def __init__(self) -> None:
+        self.loaded = False
+        self._devices = {}  # type: Dict[str, dict]
+        self._tables = {prop: {} for prop in self.TABLES}  # type: dict
+        self._names = []  # type: List[tuple]
+        self._rssi = []  # type: List[tuple]
+        self._listeners = []  # type: List[Callable]
+        self._lock = threading.RLock()
+
+    def load(self, objects: Dict[str, Dict[str, dict]]) -> None:
+        """
+        Replace the index with the devices of objects, as GetManagedObjects
+        returns.
+        """
+        with self._lock:
+            self._reset()
+            for path, ifaces in objects.items():
+                if DEVICE_IFACE in ifaces:
+                    self._add(path, ifaces[DEVICE_IFACE])
+            self.loaded = True
+
+    def clear(self) -> None:
+        """Forget every device."""
+        with self._lock:
+            self._reset()
+            self.loaded = False
+
+    def _reset(self) -> None:
+        self._devices = {}
+        self._tables = {prop: {} for prop in self.TABLES}
+        self._names = []
+        self._rssi = []
+
+    def add(self, path: str, props: dict) -> None:
+        """Add a device, or replace its properties."""
+        with self._lock:
+            self._add(path, props)
+        self._changed(path)
+
+    def _add(self, path: str, props: dict) -> None:
+        if path in self._devices:
+            self._remove(path)
+        self._devices[path] = {}
+        self._apply(path, dict(props), ())
+
+    def update(self, path: str, props: dict,
+               invalidated: Iterable[str] = ()) -> bool:
+        """
+        Apply changed properties of a device.
+        :return: False if the index doesn't know about the device.
+        """
+        with self._lock:
+            if path not in self._devices:
+                return False
+            self._apply(path, props, invalidated)
+        self._changed(path)
+        return True
+
+    def remove(self, path: str) -> None:
+        """Forget a device, bluez removed it."""
+        with self._lock:
+            if path not in self._devices:
+                return
+            self._remove(path)
+        self._changed(path)
+
+    def _remove(self, path: str) -> None:
+        props = list(self._devices[path])
+        self._apply(path, {}, props)
+        del self._devices[path]
+
+    def _apply(self, path: str, changed: dict,
+               invalidated: Iterable[str]) -> None:
+        device = self._devices[path]
+        updates = dict(changed)
+        updates.update((prop, None) for prop in invalidated)
+        for prop, value in updates.items():
+            old = device.get(prop)
+            if value is None:
+                device.pop(prop, None)
+            else:
+                device[prop] = value
+            if prop in self.TABLES:
+                table = self._tables[prop]
+                for key in _keys(prop, old) - _keys(prop, value):
+                    paths = table[key]
+                    paths.discard(path)
+                    if not paths:
+                        del table[key]
+                for key in _keys(prop, value) - _keys(prop, old):
+                    table.setdefault(key, set()).add(path)
+            elif prop == 'Name':
+                self._move(self._names, path, old, value,
+                           lambda name: str(name).lower())
+            elif prop == 'RSSI':
+                self._move(self._rssi, path, old, value, int)
+
+    @staticmethod
+    def _move(entries: List[tuple], path: str, old, new,
+              key: Callable) -> None:
+        # Keep a sorted list of (key, path) current.
+        if old is not None:
+            entry = (key(old), path)
+            at = bisect.bisect_left(entries, entry)
+            if at < len(entries) and entries[at] == entry:
+                del entries[at]
+        if new is not None:
+            bisect.insort(entries, (key(new), path))
+
+    def add_listener(self, callback: Callable[[str], None]) -> None:
+        """Call callback(path) with every device that changes."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str], None]) -> None:
+        """Stop calling a callback added with add_listener()."""
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _changed(self, path: str) -> None:
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(path)
+            except Exception:  # pylint: disable=broad-except
+                logger = logging.getLogger(__name__)
+                logger.exception('Device index listener failed')
+
+    def _named(self, prefix: str) -> Set[str]:
+        prefix = prefix.lower()
+        at = bisect.bisect_left(self._names, (prefix,))
+        paths = set()
+        while at < len(self._names) and \
+                self._names[at][0].startswith(prefix):
+            paths.add(self._names[at][1])
+            at += 1
+        return paths
+
+    def _stronger(self, min_rssi: int) -> Set[str]:
+        at = bisect.bisect_left(self._rssi, (min_rssi,))
+        return {path for _, path in self._rssi[at:]}
+
+    def query(self, uuid: Optional[str] = None, name: Optional[str] = None,
+              manufacturer: Optional[int] = None,
+              address_type: Optional[str] = None,
+              min_rssi: Optional[int] = None, top: Optional[int] = None,
+              adapter: Optional[str] = None) -> List[dict]:
+        """
+        The properties of the devices matching every criterion given, with
+        the device's path under 'Path'.
+        :param uuid: A service UUID the device advertises.
+        :param name: A prefix of the device's name, in any case.
+        :param manufacturer: A manufacturer ID of its ManufacturerData.
+        :param address_type: 'public' or 'random'.
+        :param min_rssi: The weakest RSSI, in dBm, accepted.
+        :param top: Only the top devices by RSSI, strongest first.
+        :param adapter: Object path of the adapter the device is under.
+        :return: In path order, unless top is given.
+        """
+        # pylint: disable=too-many-arguments
+        lookups = {'UUIDs': None if uuid is None else full_uuid(uuid),
+                   'ManufacturerData': manufacturer,
+                   'AddressType': address_type, 'Adapter': adapter}
+        with self._lock:
+            matches = [self._tables[prop].get(key, _EMPTY)
+                       for prop, key in lookups.items() if key is not None]
+            if name is not None:
+                matches.append(self._named(name))
+            if min_rssi is not None:
+                matches.append(self._stronger(min_rssi))
+            if matches:
+                matches.sort(key=len)
+                paths = set(matches[0]).intersection(*matches[1:])
+            else:
+                paths = set(self._devices)
+            if top is None:
+                ordered = sorted(paths)
+            else:
+                ordered = heapq.nlargest(
+                    top, sorted(paths),
+                    key=lambda path: self._devices[path].get('RSSI',
+                                                             -1000))
+            return [dict(self._devices[path], Path=path) for path in ordered]
+
+    def search(self, adapter: str, uuid: Optional[str] = None,
+               name: Optional[str] = None,
+               manufacturer: Optional[int] = None,
+               address_type: Optional[str] = None,
+               min_rssi: Optional[int] = None,
+               top: Optional[int] = None) -> 'Search':
+        """Start a Search of the devices under adapter, see query()."""
+        # pylint: disable=too-many-arguments
+        return Search(self, {'adapter': adapter, 'uuid': uuid, 'name': name,
+                             'manufacturer': manufacturer,
+                             'address_type': address_type,
+                             'min_rssi': min_rssi, 'top': top})
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._devices)
+
+
+class Search(object):
+    """
+    A lookup of devices in an index, and the scan for more matches that
+    engines run if asked to. found holds the matches, as query() returns
+    them.
+    """
+
+    def __init__(self, index: DeviceIndex, criteria: dict) -> None:
+        self.index = index
+        self.criteria = criteria
+        self.found = index.query(**criteria)
+        self._deadline = None  # type: Optional[float]
+
+    @property
+    def enough(self) -> bool:
+        """True once there are top matches."""
+        top = self.criteria['top']
+        return top is not None and len(self.found) >= top
+
+    def wants_scan(self, scan: float) -> bool:
+        """Whether a scan of scan seconds is worth running."""
+        return bool(scan) and not self.enough
+
+    @property
+    def scan_filter(self) -> Tuple[Optional[List[str]], Optional[int]]:
+        """The UUIDs and RSSI bluez can filter the scan by."""
+        uuid = self.criteria['uuid']
+        return [full_uuid(uuid)] if uuid else None, self.criteria['min_rssi']
+
+    @contextmanager
+    def scanning(self, duration: float, wake: Callable[[str], None]):
+        """
+        The block is the scan, up to duration seconds long. wake(path) is
+        called with every device that changes meanwhile.
+        """
+        self._deadline = time.monotonic() + duration
+        self.index.add_listener(wake)
+        try:
+            yield
+        finally:
+            self.index.remove_listener(wake)
+
+    def remaining(self) -> float:
+        """
+        Look the matches up again, and get the seconds the scan has left,
+        0 once there are enough matches or it's out of time.
+        """
+        self.found = self.index.query(**self.criteria)
+        if self.enough or self._deadline is None:
+            return 0
+        return max(self._deadline - time.monotonic(), 0)
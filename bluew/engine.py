@@ -11,13 +11,22 @@ that should be inherited by functioning engines.
 """
 
 
-from typing import Callable, List
+from typing import Callable, List, Optional
 
 from bluew.device import Device
 from bluew.controller import Controller
 from bluew.services import BLEService
 from bluew.characteristics import BLECharacteristic
+from bluew.descriptors import BLEDescriptor
 from bluew.errors import BluewError
+from bluew.bulk import BulkStats, CHECKPOINT, WINDOW
+from bluew.state import ValueCache  # pylint: disable=unused-import
+
+
+# Capability flags an engine can advertise through `capabilities`.
+CAP_ASYNC = 'async'
+CAP_FD_TRANSPORT = 'fd-transport'
+CAP_MULTI_ADAPTER = 'multi-adapter'
 
 
 class EngineBluew(object):
@@ -30,8 +39,17 @@ class EngineBluew(object):
     The engine must also provide these attributes:
     :param self.name: str: Name for the engine.
     :param self.version: str: Version of engine.
+
+    Engines can advertise optional features by overriding `capabilities`
+    with a set of the CAP_* flags defined in this module.
+
+    Engines that cache characteristic values expose the cache, and its hit
+    and miss counts, as `value_cache`.
     """
 
+    capabilities = frozenset()  # type: frozenset
+    value_cache = None  # type: Optional[ValueCache]
+
     def __init__(self, *args, **kwargs):
         # pylint: disable=W0612,W0613
 
@@ -72,11 +90,16 @@ class EngineBluew(object):
 
         self._raise_not_implemented()
 
-    def connect(self, mac: str) -> None:
+    def connect(self, mac: str, wait_for_services: bool = False,
+                services_timeout: Optional[float] = None) -> Optional[float]:
         """
         This function get's called by Bluew API to connect to device.
         :param mac: MAC address of device.
-        :return: True if succeeded, False otherwise.
+        :param wait_for_services: Only return once bluez is done with
+        service discovery, and the device's GATT attributes are usable.
+        :param services_timeout: How long to wait for service discovery,
+        defaults to the engine's timeout.
+        :return: Seconds spent waiting for service discovery, if waiting.
         """
         # pylint: disable=W0612,W0613
 
@@ -137,18 +160,88 @@ class EngineBluew(object):
 
         self._raise_not_implemented()
 
-    def read_attribute(self, mac: str, attribute: str) -> List[bytes]:
+    def read_attribute(self, mac: str, attribute: str,
+                       max_age: Optional[float] = None) -> List[bytes]:
         """
         This function get's called by Bluew API to read an attribute
         from a device.
         :param mac: MAC address of device.
         :param attribute: UUID of attribute.
+        :param max_age: If given, a value known to the engine that is at
+        most this many seconds old is returned instead of reading it again.
         :return: list of values if succeeded, None otherwise.
         """
         # pylint: disable=W0612,W0613
 
         self._raise_not_implemented()
 
+    def get_mtu(self, mac: str, attribute: str) -> int:
+        """
+        This function get's called by Bluew API to get the ATT MTU
+        negotiated with a device.
+        :param mac: MAC address of device.
+        :param attribute: UUID of an attribute of the device.
+        :return: The MTU, or the default MTU of 23 if bluez doesn't tell.
+        """
+        # pylint: disable=W0612,W0613
+
+        self._raise_not_implemented()
+
+    def write_long_attribute(self, mac: str, attribute: str, data: bytes,
+                             chunk_size: Optional[int] = None) -> None:
+        """
+        This function get's called by Bluew API to write a value longer
+        than the MTU, in chunks written at their offsets.
+        :param mac: MAC address of device.
+        :param attribute: UUID of attribute.
+        :param data: The bytes to be written.
+        :param chunk_size: Bytes per chunk, picked from the MTU if None.
+        """
+        # pylint: disable=W0612,W0613
+
+        self._raise_not_implemented()
+
+    def read_long_attribute(self, mac: str, attribute: str,
+                            length: Optional[int] = None,
+                            chunk_size: Optional[int] = None) -> bytearray:
+        """
+        This function get's called by Bluew API to read a value longer
+        than the MTU, in chunks read from their offsets.
+        :param mac: MAC address of device.
+        :param attribute: UUID of attribute.
+        :param length: Expected length of the value, if known.
+        :param chunk_size: Bytes per chunk, picked from the MTU if None.
+        :return: The value.
+        """
+        # pylint: disable=W0612,W0613
+
+        self._raise_not_implemented()
+
+    def bulk_write(self, mac: str, attribute: str, source,
+                   chunk_size: Optional[int] = None, window: int = WINDOW,
+                   response: bool = False, checkpoint: int = CHECKPOINT,
+                   offset: int = 0,
+                   progress: Optional[Callable] = None) -> BulkStats:
+        """
+        This function get's called by Bluew API to push a large binary to
+        an attribute, one chunk after the other, see bluew.bulk. Unless a
+        priority was picked, transfers run with PRIORITY_BULK.
+        :param mac: MAC address of device.
+        :param attribute: UUID of attribute.
+        :param source: bytes-like, a binary file, or an iterable of bytes.
+        :param chunk_size: Bytes per write, picked from the MTU if None.
+        :param window: Most writes without response in flight.
+        :param response: Write every chunk with response.
+        :param checkpoint: Write with response every this many bytes.
+        :param offset: Skip this many bytes of source, to resume.
+        :param progress: Called with the BulkStats after every chunk.
+        :return: The BulkStats of the transfer, BulkWriteError is raised if
+        it fails.
+        """
+        # pylint: disable=W0612,W0613,too-many-arguments
+
+        self._raise_not_implemented()
+
     def info(self, mac: str) -> Device:
         """
         This function get's called by Bluew API to get information about
@@ -169,6 +262,24 @@ class EngineBluew(object):
 
         self._raise_not_implemented()
 
+    def find_devices(self, uuid: Optional[str] = None,
+                     name: Optional[str] = None,
+                     manufacturer: Optional[int] = None,
+                     address_type: Optional[str] = None,
+                     min_rssi: Optional[int] = None,
+                     top: Optional[int] = None,
+                     scan: float = 0) -> List[Device]:
+        """
+        This function get's called by Bluew API to look devices up by their
+        properties, see bluew.devindex.DeviceIndex.query() for the criteria.
+        :param scan: Seconds to scan for more matches, stopping early once
+        there's top of them. Scans are filtered by uuid and min_rssi.
+        :return: list of Device objects.
+        """
+        # pylint: disable=W0612,W0613,too-many-arguments
+
+        self._raise_not_implemented()
+
     def get_controllers(self) -> List[Controller]:
         """
         This function get's called by Bluew API to get available controllers.
@@ -178,6 +289,56 @@ class EngineBluew(object):
 
         self._raise_not_implemented()
 
+    def power(self, on: bool = True) -> None:
+        """
+        This function get's called by Bluew API to power the controller on
+        or off. Powering on returns once the controller is powered.
+        :param on: Power on if True, off otherwise.
+        :return: None.
+        """
+        # pylint: disable=W0612,W0613,invalid-name
+
+        self._raise_not_implemented()
+
+    def set_discoverable(self, on: bool = True,
+                         timeout: Optional[int] = None) -> None:
+        """
+        This function get's called by Bluew API to make the controller
+        discoverable by other devices, or not.
+        :param on: Discoverable if True, not otherwise.
+        :param timeout: Seconds it stays discoverable for, 0 for good.
+        :return: None.
+        """
+        # pylint: disable=W0612,W0613,invalid-name
+
+        self._raise_not_implemented()
+
+    def set_pairable(self, on: bool = True,
+                     timeout: Optional[int] = None) -> None:
+        """
+        This function get's called by Bluew API to let devices pair with
+        the controller, or not.
+        :param on: Pairable if True, not otherwise.
+        :param timeout: Seconds it stays pairable for, 0 for good.
+        :return: None.
+        """
+        # pylint: disable=W0612,W0613,invalid-name
+
+        self._raise_not_implemented()
+
+    def wait_until_powered(self, timeout: Optional[float] = None) -> bool:
+        """
+        This function get's called by Bluew API to wait for the controller
+        to be powered, after it was off or reset. Engines wait for the
+        controller's own signals instead of polling it, and operations made
+        while it's down wait for it the same way.
+        :param timeout: Defaults to the engine's timeout.
+        :return: False if the timeout expired first.
+        """
+        # pylint: disable=W0612,W0613
+
+        self._raise_not_implemented()
+
     def get_services(self, mac: str) -> List[BLEService]:
         """
         This function get's called by Bluew API to get available services
@@ -198,6 +359,44 @@ class EngineBluew(object):
 
         self._raise_not_implemented()
 
+    def get_descriptors(self, mac: str) -> List[BLEDescriptor]:
+        """
+        This function get's called by Bluew API to get available descriptors
+        of a BLE device.
+        :return: list of BLEDescriptor objects.
+        """
+        # pylint: disable=W0612,W0613
+
+        self._raise_not_implemented()
+
+    def read_descriptor(self, mac: str, attribute: str,
+                        descriptor: str) -> bytes:
+        """
+        This function get's called by Bluew API to read a descriptor of
+        an attribute.
+        :param mac: MAC address of device.
+        :param attribute: UUID of attribute.
+        :param descriptor: UUID of the descriptor of that attribute.
+        :return: The value of the descriptor.
+        """
+        # pylint: disable=W0612,W0613
+
+        self._raise_not_implemented()
+
+    def write_descriptor(self, mac: str, attribute: str, descriptor: str,
+                         data: List[int]) -> None:
+        """
+        This function get's called by Bluew API to write a descriptor of
+        an attribute.
+        :param mac: MAC address of device.
+        :param attribute: UUID of attribute.
+        :param descriptor: UUID of the descriptor of that attribute.
+        :param data: List of int values to be written.
+        """
+        # pylint: disable=W0612,W0613
+
+        self._raise_not_implemented()
+
     def notify(self, mac: str, attribute: str, handler: Callable) -> None:
         """
         This function get's called by Bluew API to stop notifying on a
@@ -224,6 +423,31 @@ class EngineBluew(object):
 
         self._raise_not_implemented()
 
+    def add_device_listener(self, mac: str, handler: Callable) -> None:
+        """
+        This function get's called by Bluew API to be told about property
+        changes on a device, like it connecting or disconnecting.
+        :param mac: MAC address of device.
+        :param handler: This function get's passed a dict with the Device1
+        properties that changed.
+        :return: None.
+        """
+        # pylint: disable=W0612,W0613
+
+        self._raise_not_implemented()
+
+    def remove_device_listener(self, mac: str, handler: Callable) -> None:
+        """
+        This function get's called by Bluew API to stop calling a handler
+        passed to add_device_listener.
+        :param mac: MAC address of device.
+        :param handler: The handler passed to add_device_listener.
+        :return: None.
+        """
+        # pylint: disable=W0612,W0613
+
+        self._raise_not_implemented()
+
     def _raise_not_implemented(self):
         raise EngineError(
             EngineError.NOT_IMPLEMENTED,
@@ -238,3 +462,5 @@ class EngineError(BluewError):
     NAME_NOT_SET = 'BluewEngine interface does not provice valid name'
     VERSION_NOT_SET = 'BluewEngine interface does not provicd valid version'
     INIT_ERROR = 'Engine was not properly initialized.'
+    NOT_FOUND = 'No engine is registered under this name.'
+    NOT_AN_ENGINE = 'Registered engine does not inherit EngineBluew.'
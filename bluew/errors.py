@@ -19,6 +19,7 @@ class BluewError(Exception):
     CONTROLLER_NOT_READY = 'The controller might be blocked/disabled.'
     COULD_NOT_PAIR = 'Bluew could not pair with device.'
     READ_WRITE_FAILED = 'Bluew could not read/write this attribute.'
+    VERIFY_FAILED = 'The value read back is not the one expected.'
     INVALID_ARGS = 'Invalid args.'
     UNEXPECTED_ERROR = 'An unexpected error happened.'
 
@@ -113,3 +114,26 @@ class ControllerNotReady(BluewError):
 
     def __init__(self, *args, **kwargs):
         super().__init__(BluewError.CONTROLLER_NOT_READY, *args, **kwargs)
+
+
+class BulkWriteError(BluewError):
+    """
+    This error is raised when a bulk write fails part way. Everything
+    before `offset` is known to be written, resume the transfer from there.
+    `stats` holds the BulkStats of the transfer.
+    """
+
+    def __init__(self, *args, offset=0, stats=None, **kwargs):
+        super().__init__(BluewError.READ_WRITE_FAILED, *args, **kwargs)
+        self.offset = offset
+        self.stats = stats
+
+
+class VerifyError(BluewError):
+    """
+    This error is raised when a value read back to verify a write, isn't the
+    one that was expected.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(BluewError.VERIFY_FAILED, *args, **kwargs)
@@ -0,0 +1,113 @@
+"""
+bluew.flight
+~~~~~~~~~~~~
+
+This module provides single-flight call coalescing: concurrent calls made
+with the same key share one execution, and all of them get its result, or
+its exception. Engines use it for reads, since bluez answers a read of an
+attribute that already has one in flight with InProgress.
+
+Basic usage:
+
+    >>> reads = SingleFlight()
+    >>> reads.do(('hci0', mac, uuid), read_value, mac, uuid)
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import asyncio
+import threading
+
+from typing import Any, Callable, Dict, Hashable, Optional  # noqa: F401
+
+
+class _Call(object):
+    """One call in flight."""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None  # type: Any
+        self.error = None  # type: Optional[BaseException]
+
+
+class SingleFlight(object):
+    """
+    Coalesce concurrent calls from different threads. The result is shared
+    between the callers as is, so callers shouldn't mutate it.
+    """
+
+    def __init__(self) -> None:
+        self._calls = {}  # type: Dict[Hashable, _Call]
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        """
+        Call func(*args, **kwargs), unless a call with the same key is
+        already in flight, in which case wait for that one instead.
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as exp:
+            call.error = exp
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        """Number of calls in flight."""
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight(object):
+    """
+    Coalesce concurrent calls from coroutines running on the same event
+    loop. The result is shared between the callers as is.
+    """
+
+    def __init__(self) -> None:
+        self._calls = {}  # type: Dict[Hashable, asyncio.Future]
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable, *args,
+                 **kwargs) -> Any:
+        """
+        Await func(*args, **kwargs), unless a call with the same key is
+        already in flight, in which case await that one instead.
+        """
+
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # A caller giving up mustn't cancel the call for the others.
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        """Number of calls in flight."""
+        return len(self._calls)
@@ -0,0 +1,241 @@
+"""
+bluew.gattcache
+~~~~~~~~~~~~~~~
+
+This module provides an on-disk cache of the GATT database layout of
+devices, so that engines can resolve attribute UUIDs to object paths right
+after connecting, instead of waiting for bluez to finish service discovery.
+
+A layout maps the UUIDs of a device's services, characteristics and
+descriptors to their object paths, relative to the device's path. The same
+descriptor UUID shows up under many characteristics, so descriptors are
+keyed by desc_key(), their UUID under their characteristic's. Entries
+are keyed by device address, and carry the device's GATT database hash
+(characteristic 0x2B2A) when it has one.
+
+A device can keep its address and get another database, after a firmware
+update, and bluez then exports attributes with other UUIDs at the cached
+paths. So an entry with a hash is only used once the hash the device has
+now matches it, see verify(), and a cached path is only used if what bluez
+exports there, if anything yet, has the UUID looked up, see exported_as().
+Engines also invalidate an entry when bluez answers UnknownObject for a
+cached path, or when the layout found after discovery differs.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from typing import Dict, Optional  # noqa: F401
+
+
+GATT_DB_HASH_UUID = '00002b2a-0000-1000-8000-00805f9b34fb'
+
+SERVICE_IFACE = 'org.bluez.GattService1'
+CHRC_IFACE = 'org.bluez.GattCharacteristic1'
+DESC_IFACE = 'org.bluez.GattDescriptor1'
+
+KINDS = {SERVICE_IFACE: 'services', CHRC_IFACE: 'chrcs', DESC_IFACE: 'descs'}
+IFACES = {kind: iface for iface, kind in KINDS.items()}
+
+
+def default_cache_dir() -> str:
+    """$BLUEW_GATT_CACHE, or bluew/gatt under the user's cache directory."""
+    directory = os.environ.get('BLUEW_GATT_CACHE')
+    if directory:
+        return directory
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'bluew', 'gatt')
+
+
+def desc_key(chrc_uuid: str, desc_uuid: str) -> str:
+    """The layout key of a descriptor of a characteristic."""
+    return chrc_uuid + '/' + desc_uuid
+
+
+def exported_as(key: str, uuid: Optional[str]) -> bool:
+    """
+    Check the UUID bluez exports at a cached path against the layout key
+    the path was cached under.
+    :param uuid: The UUID property of the object at the path, None if
+    there's no attribute of the key's kind there.
+    """
+    return uuid is not None and \
+        str(uuid).lower() == key.rsplit('/', 1)[-1].lower()
+
+
+def _parent_uuid(objects: dict, path: str) -> Optional[str]:
+    props = objects.get(path.rsplit('/', 1)[0], {}).get(CHRC_IFACE)
+    if props is None or 'UUID' not in props:
+        return None
+    return str(props['UUID'])
+
+
+def gatt_layout(dev_path: str, objects: dict) -> Dict[str, Dict[str, str]]:
+    """
+    Build the layout of a device from bluez managed objects.
+    :param dev_path: The device's object path.
+    :param objects: {path: {iface: props}}, as GetManagedObjects returns.
+    :return: {'services'|'chrcs'|'descs': {key: relative path}}, keyed by
+    UUID, and by desc_key() for descriptors.
+    """
+
+    layout = {kind: {} for kind in KINDS.values()}  # type: dict
+    prefix = dev_path + '/'
+    for path in sorted(objects):
+        if not path.startswith(prefix):
+            continue
+        for iface, kind in KINDS.items():
+            props = objects[path].get(iface)
+            if props is None or 'UUID' not in props:
+                continue
+            key = str(props['UUID'])
+            if kind == 'descs':
+                chrc_uuid = _parent_uuid(objects, path)
+                if chrc_uuid is None:
+                    continue
+                key = desc_key(chrc_uuid, key)
+            # The first object wins for keys used more than once, like
+            # engines do when resolving them.
+            layout[kind].setdefault(key, path[len(prefix):])
+    return layout
+
+
+class GattCache(object):
+    """
+    Device GATT layouts, kept in memory and stored as one JSON file per
+    device in `directory`.
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = directory or default_cache_dir()
+        self._entries = {}  # type: Dict[str, Optional[dict]]
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def _key(address: str) -> str:
+        return address.upper().replace('_', ':')
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.directory,
+                            key.replace(':', '_') + '.json')
+
+    def get(self, address: str) -> Optional[dict]:
+        """The cached entry of a device, or None."""
+        key = self._key(address)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = self._load(key)
+            return self._entries[key]
+
+    def _load(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._file(key)) as cache_file:
+                entry = json.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exp:
+            self.logger.warning('Ignoring GATT cache of %s: %s', key, exp)
+            return None
+        if not isinstance(entry, dict) or entry.get('address') != key:
+            return None
+        return entry
+
+    def lookup(self, address: str, uuid: str,
+               kind: str = 'chrcs') -> Optional[str]:
+        """The cached path of an attribute, relative to the device."""
+        entry = self.get(address)
+        if entry is None:
+            return None
+        return entry['layout'].get(kind, {}).get(uuid)
+
+    def db_hash(self, address: str) -> Optional[bytes]:
+        """The GATT database hash the cached layout belongs to."""
+        entry = self.get(address)
+        if entry is None or entry.get('hash') is None:
+            return None
+        return bytes.fromhex(entry['hash'])
+
+    def verify(self, address: str, db_hash: bytes) -> bool:
+        """
+        Check the cached layout of a device against the GATT database hash
+        the device has now, and forget the layout if they differ.
+        :return: True if the layout belongs to that database.
+        """
+        if self.db_hash(address) == bytes(db_hash):
+            return True
+        self.logger.info('GATT database of %s changed, dropping its layout',
+                         address)
+        self.invalidate(address)
+        return False
+
+    def store(self, address: str, layout: dict,
+              db_hash: Optional[bytes] = None) -> bool:
+        """
+        Cache the layout of a device, replacing what was cached before.
+        :return: False if the same layout was already cached.
+        """
+
+        key = self._key(address)
+        entry = {'address': key, 'layout': layout,
+                 'hash': None if db_hash is None else bytes(db_hash).hex()}
+        if self.get(address) == entry:
+            return False
+        with self._lock:
+            self._entries[key] = entry
+            try:
+                self._write(key, entry)
+            except OSError as exp:
+                self.logger.warning('Could not store GATT cache of %s: %s',
+                                    key, exp)
+        return True
+
+    def _write(self, key: str, entry: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # Write and rename, readers never see half a file.
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as cache_file:
+                json.dump(entry, cache_file, sort_keys=True)
+            os.replace(tmp, self._file(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def invalidate(self, address: str) -> None:
+        """Forget the layout of a device."""
+        key = self._key(address)
+        with self._lock:
+            self._entries[key] = None
+            try:
+                os.unlink(self._file(key))
+            except FileNotFoundError:
+                pass
+            except OSError as exp:
+                self.logger.warning('Could not remove GATT cache of %s: %s',
+                                    key, exp)
+
+
+def open_gatt_cache(option) -> Optional[GattCache]:
+    """
+    Turn an engine's gatt_cache keyword argument into a GattCache.
+    :param option: A GattCache, a directory, True for the default directory,
+    or None/False for no cache.
+    """
+
+    if not option:
+        return None
+    if isinstance(option, GattCache):
+        return option
+    if option is True:
+        return GattCache()
+    return GattCache(option)
@@ -0,0 +1,121 @@
+"""
+bluew.longvalue
+~~~~~~~~~~~~~~~
+
+This module provides chunked reads and writes of characteristic values
+longer than the ATT MTU. Values are split in chunks that fit one ATT
+request, and each chunk is read or written at its offset, using the
+`offset` option of ReadValue() and WriteValue().
+
+Reads stream into a buffer allocated up front, when the length of the
+value is known, and grown as needed otherwise.
+
+Basic usage:
+
+    >>> size = read_chunk_size(mtu)
+    >>> value = read_long(lambda offset: read_value(offset), size, 4096)
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+from typing import Callable, Iterator, Optional, Tuple  # noqa: F401
+
+
+# The ATT MTU every link starts with, and what's assumed when bluez doesn't
+# tell (the MTU property of GattCharacteristic1 needs bluez 5.62).
+DEFAULT_MTU = 23
+
+# Read Blob responses carry an opcode, prepared writes an opcode, a handle
+# and an offset, and plain writes an opcode and a handle.
+READ_OVERHEAD = 1
+WRITE_OVERHEAD = 5
+PACKET_OVERHEAD = 3
+
+
+def read_chunk_size(mtu: int) -> int:
+    """Most bytes of a value one read at an offset returns."""
+    return max(mtu, DEFAULT_MTU) - READ_OVERHEAD
+
+
+def write_chunk_size(mtu: int) -> int:
+    """Most bytes of a value one write at an offset can carry."""
+    return max(mtu, DEFAULT_MTU) - WRITE_OVERHEAD
+
+
+def packet_size(mtu: int) -> int:
+    """Most bytes of a value one write, with or without response, carries."""
+    return max(mtu, DEFAULT_MTU) - PACKET_OVERHEAD
+
+
+def chunks(data: bytes, size: int) -> Iterator[Tuple[int, bytes]]:
+    """Split data in (offset, chunk) pairs of at most size bytes."""
+    if size <= 0:
+        raise ValueError('chunk size must be positive')
+    view = memoryview(data)
+    for offset in range(0, len(view), size):
+        yield offset, bytes(view[offset:offset + size])
+
+
+class ValueBuffer(object):
+    """
+    A value being read in chunks. Chunks are copied in place into a buffer
+    of the expected length, which doubles if the value turns out longer.
+    """
+
+    def __init__(self, length: Optional[int] = None) -> None:
+        self._buf = bytearray(length or 0)
+        self.length = 0
+
+    def write(self, offset: int, data: bytes) -> None:
+        """Copy a chunk in at offset."""
+        end = offset + len(data)
+        if end > len(self._buf):
+            grown = max(end, 2 * len(self._buf))
+            self._buf.extend(bytes(grown - len(self._buf)))
+        memoryview(self._buf)[offset:end] = data
+        self.length = max(self.length, end)
+
+    def getvalue(self) -> bytearray:
+        """The value read so far."""
+        del self._buf[self.length:]
+        return self._buf
+
+
+def _done(reply: bytes, size: int, buf: ValueBuffer,
+          length: Optional[int]) -> bool:
+    # A short reply is the end of the value. A longer one means bluez read
+    # the rest of it with a long read of its own.
+    if len(reply) != size:
+        return True
+    return length is not None and buf.length >= length
+
+
+def read_long(read_at: Callable[[int], bytes], size: int,
+              length: Optional[int] = None) -> bytearray:
+    """
+    Read a value in chunks.
+    :param read_at: Reads the value from an offset.
+    :param size: The most bytes one read returns.
+    :param length: Expected length of the value, if known.
+    """
+
+    buf = ValueBuffer(length)
+    while True:
+        reply = read_at(buf.length)
+        buf.write(buf.length, reply)
+        if _done(reply, size, buf, length):
+            return buf.getvalue()
+
+
+async def async_read_long(read_at: Callable, size: int,
+                          length: Optional[int] = None) -> bytearray:
+    """read_long(), with read_at a coroutine function."""
+    buf = ValueBuffer(length)
+    while True:
+        reply = await read_at(buf.length)
+        buf.write(buf.length, reply)
+        if _done(reply, size, buf, length):
+            return buf.getvalue()
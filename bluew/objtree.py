@@ -0,0 +1,179 @@
+"""
+bluew.objtree
+~~~~~~~~~~~~~
+
+This module provides an index of bluez objects, kept as the tree their
+object paths make: adapters, their devices, and the services,
+characteristics and descriptors of every device. Nodes are found by their
+exact path, so asking for the objects of one device walks that device's
+subtree only, instead of every object bluez knows about, and never mixes
+up devices whose paths share a prefix.
+
+Engines load the tree from GetManagedObjects(), and keep it current from
+the InterfacesAdded, InterfacesRemoved and PropertiesChanged signals. The
+tree keeps its devices in a bluew.devindex.DeviceIndex as well, for
+queries by their properties.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import threading
+
+from typing import Dict, Iterator, List, Optional  # noqa: F401
+
+from bluew.devindex import DEVICE_IFACE, DeviceIndex
+
+
+ROOT = '/'
+
+
+def parent_path(path: str) -> str:
+    """The object path a path hangs off."""
+    parent = path.rsplit('/', 1)[0]
+    return parent or ROOT
+
+
+class _Node(object):
+    """An object path, the interfaces exported at it, and its children."""
+
+    __slots__ = ('path', 'ifaces', 'children')
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.ifaces = {}  # type: Dict[str, dict]
+        self.children = {}  # type: Dict[str, _Node]
+
+
+class ObjectTree(object):
+    """
+    bluez objects, indexed by path. Paths in between objects, like
+    /org/bluez, get nodes without interfaces, which are dropped again once
+    nothing hangs off them.
+    """
+
+    def __init__(self) -> None:
+        self.loaded = False
+        self.devices = DeviceIndex()
+        self._nodes = {ROOT: _Node(ROOT)}  # type: Dict[str, _Node]
+        self._lock = threading.RLock()
+
+    def load(self, objects: Dict[str, Dict[str, dict]]) -> None:
+        """Replace the tree with objects, as GetManagedObjects returns."""
+        with self._lock:
+            self._nodes = {ROOT: _Node(ROOT)}
+            self.devices.clear()
+            for path, ifaces in objects.items():
+                self.add(path, ifaces)
+            self.devices.loaded = True
+            self.loaded = True
+
+    def clear(self) -> None:
+        """Forget every object."""
+        with self._lock:
+            self._nodes = {ROOT: _Node(ROOT)}
+            self.devices.clear()
+            self.loaded = False
+
+    def _node(self, path: str) -> _Node:
+        node = self._nodes.get(path)
+        if node is None:
+            node = self._nodes[path] = _Node(path)
+            self._node(parent_path(path)).children[path] = node
+        return node
+
+    def add(self, path: str, ifaces: Dict[str, dict]) -> None:
+        """Add interfaces, and their properties, to the object at path."""
+        with self._lock:
+            node = self._node(path)
+            for iface, props in ifaces.items():
+                node.ifaces[iface] = dict(props)
+            if DEVICE_IFACE in ifaces:
+                self.devices.add(path, node.ifaces[DEVICE_IFACE])
+
+    def remove(self, path: str, ifaces: List[str]) -> None:
+        """Remove interfaces from the object at path."""
+        with self._lock:
+            node = self._nodes.get(path)
+            if node is None:
+                return
+            for iface in ifaces:
+                node.ifaces.pop(iface, None)
+            if DEVICE_IFACE in ifaces:
+                self.devices.remove(path)
+            self._prune(node)
+
+    def _prune(self, node: _Node) -> None:
+        while node.path != ROOT and not node.ifaces and not node.children:
+            del self._nodes[node.path]
+            parent = self._nodes[parent_path(node.path)]
+            del parent.children[node.path]
+            node = parent
+
+    def update(self, path: str, iface: str, props: dict) -> bool:
+        """
+        Apply changed properties of an interface of the object at path.
+        :return: False if the tree doesn't know about that interface.
+        """
+        with self._lock:
+            node = self._nodes.get(path)
+            if node is None or iface not in node.ifaces:
+                return False
+            node.ifaces[iface].update(props)
+            if iface == DEVICE_IFACE:
+                self.devices.update(path, props)
+            return True
+
+    def get(self, path: str) -> Optional[Dict[str, dict]]:
+        """The interfaces of the object at path, None if there's none."""
+        with self._lock:
+            node = self._nodes.get(path)
+            if node is None or not node.ifaces:
+                return None
+            return {iface: dict(props) for iface, props in node.ifaces.items()}
+
+    def _walk(self, path: str) -> Iterator[_Node]:
+        node = self._nodes.get(path)
+        stack = [node] if node is not None else []
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.children[child]
+                         for child in sorted(node.children, reverse=True))
+
+    def children(self, path: str) -> List[str]:
+        """Paths of the nodes right below path."""
+        with self._lock:
+            node = self._nodes.get(path)
+            return sorted(node.children) if node is not None else []
+
+    def subtree(self, path: str) -> Dict[str, Dict[str, dict]]:
+        """
+        The object at path and every object below it, in the format of
+        GetManagedObjects().
+        """
+        with self._lock:
+            return {node.path: {iface: dict(props)
+                                for iface, props in node.ifaces.items()}
+                    for node in self._walk(path) if node.ifaces}
+
+    def objects(self, iface: str, path: str = ROOT) -> List[dict]:
+        """
+        The properties of every object at or below path exporting iface,
+        with the object's path under 'Path', in path order.
+        """
+        with self._lock:
+            objects = []
+            for node in self._walk(path):
+                props = node.ifaces.get(iface)
+                if props is not None:
+                    obj = dict(props)
+                    obj['Path'] = node.path
+                    objects.append(obj)
+            return objects
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(1 for node in self._nodes.values() if node.ifaces)
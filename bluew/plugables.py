@@ -1,8 +1,24 @@
 """
-bluew.findengine
-~~~~~~~~~~~~~~~~
+bluew.plugables
+~~~~~~~~~~~~~~~
 
-This module is gonna later handle plugable engines.
+This module handles plugable engines. Engines are kept in a registry, and
+can be added to it either by calling register_engine(), or by installing a
+package that advertises them under the `bluew.engines` entry point group:
+
+    entry_points={
+        'bluew.engines': ['myengine = mypackage.engine:MyEngine'],
+    }
+
+Bluew ships two engines: dbusted (dbus-python and a GLib main loop), and
+wired (a pure asyncio D-Bus client).
+
+The engine used is picked, in this order, from the `engine` argument passed
+to a bluew call or Connection, the BLUEW_ENGINE environment variable, or the
+default engine (dbusted).
+
+Engines are imported on first use, so that `import bluew` stays cheap for
+code that never talks to a bluetooth controller.
 
 
 :copyright: (c) 2017 by Ahmed Alsharif.
@@ -10,6 +26,203 @@ This module is gonna later handle plugable engines.
 """
 
 
-from bluew.dbusted import DBusted
+import importlib
+import logging
+import os
+import threading
+
+from typing import Any, Dict, Iterable, List, Optional, Union  # noqa: F401
+
+from bluew.engine import (EngineBluew, EngineError, CAP_ASYNC,
+                          CAP_MULTI_ADAPTER)
+
+
+ENTRY_POINT_GROUP = 'bluew.engines'
+ENGINE_ENV_VAR = 'BLUEW_ENGINE'
+DEFAULT_ENGINE = 'dbusted'
+
+
+class EngineSpec(object):
+    """
+    A registered engine. The target is either an EngineBluew subclass, or a
+    'module:attribute' string that get's imported when the engine is first
+    loaded.
+    """
+
+    def __init__(self, name, target, capabilities=None):
+        self.name = name
+        self.target = target
+        self._capabilities = capabilities
+        self._engine = None if isinstance(target, str) else target
+
+    def load(self):
+        """Import (if needed) and return the engine class."""
+        if self._engine is None:
+            module_name, _, attr = self.target.partition(':')
+            module = importlib.import_module(module_name)
+            self._engine = getattr(module, attr) if attr else module
+        if not isinstance(self._engine, type) or \
+                not issubclass(self._engine, EngineBluew):
+            raise EngineError(EngineError.NOT_AN_ENGINE, '{}: {}'.format(
+                EngineError.NOT_AN_ENGINE, self.name))
+        return self._engine
+
+    @property
+    def capabilities(self):
+        """
+        Capabilities passed at registration, or the ones advertised by the
+        engine class itself, which imports the engine.
+        """
+        if self._capabilities is None:
+            return frozenset(self.load().capabilities)
+        return frozenset(self._capabilities)
+
+
+_REGISTRY = {}  # type: Dict[str, EngineSpec]
+_LOCK = threading.Lock()
+_discovered = False  # pylint: disable=invalid-name
+
+
+def register_engine(name: str, engine: Union[str, type],
+                    capabilities: Optional[Iterable[str]] = None) -> None:
+    """
+    Register an engine with bluew.
+    :param name: Name used to select the engine.
+    :param engine: EngineBluew subclass, or 'module:attribute' string to
+    import it lazily.
+    :param capabilities: CAP_* flags of the engine, if not given they're
+    read from the engine's `capabilities` attribute when needed.
+    """
+
+    if capabilities is not None:
+        capabilities = frozenset(capabilities)
+    with _LOCK:
+        _REGISTRY[name] = EngineSpec(name, engine, capabilities)
+
+
+def unregister_engine(name: str) -> None:
+    """Remove an engine from the registry."""
+    with _LOCK:
+        _REGISTRY.pop(name, None)
+
+
+def _entry_points() -> List[tuple]:
+    # (name, 'module:attribute') of the engines advertised by installed
+    # packages, through importlib.metadata, or pkg_resources before 3.8.
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            from pkg_resources import iter_entry_points
+        except ImportError:
+            return []
+        return [(ep.name, '{}:{}'.format(ep.module_name, '.'.join(ep.attrs)))
+                for ep in iter_entry_points(ENTRY_POINT_GROUP)]
+    eps = entry_points()  # type: Any
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, ())
+    return [(ep.name, ep.value) for ep in eps]
+
+
+def _discover() -> None:
+    # Entry points are only scanned once, and never override engines that
+    # were registered explicitly.
+    global _discovered  # pylint: disable=global-statement,invalid-name
+    if _discovered:
+        return
+    with _LOCK:
+        if _discovered:
+            return
+        for name, target in _entry_points():
+            if name not in _REGISTRY:
+                _REGISTRY[name] = EngineSpec(name, target)
+        _discovered = True
+    logger = logging.getLogger(__name__)
+    logger.debug('Engines available: %s', ', '.join(sorted(_REGISTRY)))
+
+
+def available_engines() -> List[str]:
+    """Get the names of all the engines known to bluew."""
+    _discover()
+    return sorted(_REGISTRY)
+
+
+def _get_spec(name: str) -> EngineSpec:
+    _discover()
+    try:
+        return _REGISTRY[name]
+    except KeyError:
+        raise EngineError(EngineError.NOT_FOUND, '{}: {}'.format(
+            EngineError.NOT_FOUND, name))
+
+
+def engine_capabilities(name: Optional[str] = None) -> frozenset:
+    """Get the capability flags of an engine, or of the default engine."""
+    return _get_spec(name or _default_name()).capabilities
+
+
+def find_engine(*capabilities: str) -> str:
+    """
+    Get the name of an engine that has all the capabilities passed. The
+    engine that would be used by default is preferred if it qualifies.
+    :return: Name of engine.
+    """
+
+    wanted = frozenset(capabilities)
+    default = _default_name()
+    names = [default] + [n for n in available_engines() if n != default]
+    for name in names:
+        try:
+            if wanted <= _get_spec(name).capabilities:
+                return name
+        except (EngineError, ImportError) as exp:
+            logger = logging.getLogger(__name__)
+            logger.debug('Skipping engine %s: %s', name, exp)
+    raise EngineError(EngineError.NOT_FOUND, '{}: {}'.format(
+        EngineError.NOT_FOUND, ', '.join(sorted(wanted))))
+
+
+def _default_name() -> str:
+    return os.environ.get(ENGINE_ENV_VAR) or DEFAULT_ENGINE
+
+
+def get_engine(engine: Union[str, type, None] = None) -> type:
+    """
+    Get the engine class used by bluew.
+    :param engine: Name of a registered engine, or an EngineBluew subclass.
+    If None the BLUEW_ENGINE environment variable or the default engine
+    is used.
+    :return: EngineBluew subclass.
+    """
+
+    if isinstance(engine, type):
+        return engine
+    return _get_spec(engine or _default_name()).load()
+
+
+class _UsedEngine(object):
+    """
+    Stands in for the default engine class, which is only looked up, and
+    imported, once it's called or one of its attributes is used.
+    """
+
+    def __call__(self, *args, **kwargs):
+        return get_engine()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(get_engine(), name)
+
+    def __repr__(self):
+        return '<default bluew engine>'
+
+
+# Kept for code that still instantiates bluew.plugables.UsedEngine.
+UsedEngine = _UsedEngine()  # pylint: disable=invalid-name
+
 
-UsedEngine = DBusted
+register_engine(DEFAULT_ENGINE, 'bluew.dbusted:DBusted',
+                capabilities=(CAP_MULTI_ADAPTER,))
+register_engine('wired', 'bluew.wired:Wired',
+                capabilities=(CAP_ASYNC, CAP_MULTI_ADAPTER))
@@ -0,0 +1,352 @@
+"""
+bluew.provision
+~~~~~~~~~~~~~~~
+
+This module provides a runner for commissioning many devices at once, by
+taking each of them through the same list of steps: pairing, trusting,
+writing configuration, and reading values back to verify them.
+
+    >>> steps = [pair(), trust(), write(MODE, [2]),
+    ...          read(MODE, expect=[2])]
+    >>> runner = Provisioner(macs, steps, journal='fleet.journal',
+    ...                      adapters=['hci0', 'hci1'], per_adapter=2)
+    >>> results = runner.run()
+    >>> for timings in runner.report().values():
+    ...     print(timings.summary())
+
+Every adapter gets one engine, shared by the connections of its workers,
+so devices aren't paying for an engine, and a scan, each. Devices can be
+pinned to an adapter by passing (mac, adapter) pairs, the others go to
+whichever adapter is free first.
+
+Steps done are appended to the journal as they finish, a run made with the
+same journal and steps skips them, picking every device up where it
+stopped. A device that fails a step is left there, for the next run.
+Pairing is recorded as a daemon init step, see bluew.daemon, so that it's
+replayed if the link drops and comes back part way through a device.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterable, List, Optional, Set  # noqa: F401
+
+from bluew.connections import Connection
+from bluew.errors import BluewError, VerifyError
+from bluew.plugables import get_engine
+from bluew.stats import Timings
+
+
+PAIR = 'pair'
+TRUST = 'trust'
+WRITE = 'write'
+READ = 'read'
+CONNECT = 'connect'
+
+ACTIONS = (PAIR, TRUST, WRITE, READ)
+
+Step = namedtuple('Step', ['action', 'attribute', 'value'])
+StepResult = namedtuple('StepResult', ['mac', 'index', 'label', 'seconds',
+                                       'error'])
+
+
+def pair() -> Step:
+    """A step pairing the device."""
+    return Step(PAIR, None, None)
+
+
+def trust() -> Step:
+    """A step trusting the device."""
+    return Step(TRUST, None, None)
+
+
+def write(attribute: str, value) -> Step:
+    """A step writing value, bytes or a list of ints, to attribute."""
+    return Step(WRITE, attribute, _as_bytes(value))
+
+
+def read(attribute: str, expect=None) -> Step:
+    """
+    A step reading attribute, failing with VerifyError unless its value is
+    expect, if given.
+    """
+    return Step(READ, attribute, None if expect is None else
+                _as_bytes(expect))
+
+
+def _as_bytes(value) -> bytes:
+    # Values come as bytes, lists of ints, or hex strings out of JSON.
+    if isinstance(value, str):
+        return bytes.fromhex(value)
+    return bytes(value)
+
+
+def load_steps(items: Iterable) -> List[Step]:
+    """
+    Steps out of Steps, or of dicts with an action, and an attribute and a
+    value where the action needs them, like the ones of a JSON file.
+    """
+    steps = []
+    for item in items:
+        if not isinstance(item, Step):
+            item = dict(item)
+            action = item.get('action')
+            if action not in ACTIONS:
+                raise ValueError('unknown step action: {!r}'.format(action))
+            if action in (PAIR, TRUST):
+                item = Step(action, None, None)
+            elif action == WRITE:
+                item = write(item['attribute'], item['value'])
+            else:
+                item = read(item['attribute'], item.get('value'))
+        steps.append(item)
+    return steps
+
+
+def label(step: Step) -> str:
+    """The name a step is journaled and reported under."""
+    if step.attribute is None:
+        return step.action
+    return '{} {}'.format(step.action, step.attribute)
+
+
+class Journal(object):
+    """
+    An append only log of the steps every device finished, one JSON object
+    per line. A line cut short, by a run that was killed, is ignored.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self._done = {}  # type: Dict[str, Set[tuple]]
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self._load(path)
+
+    def _load(self, path: str) -> None:
+        with open(path) as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('error') is None:
+                    self._done.setdefault(entry['mac'], set()).add(
+                        (entry['step'], entry['label']))
+
+    def done(self, mac: str, index: int, step: Step) -> bool:
+        """True if step, the index-th one, was done for mac already."""
+        with self._lock:
+            return (index, label(step)) in self._done.get(mac, ())
+
+    def record(self, result: StepResult) -> None:
+        """Append result, it's on disk once this returns."""
+        with self._lock:
+            if result.error is None:
+                self._done.setdefault(result.mac, set()).add(
+                    (result.index, result.label))
+            if self.path is None:
+                return
+            line = json.dumps({'mac': result.mac, 'step': result.index,
+                               'label': result.label,
+                               'seconds': round(result.seconds, 6),
+                               'error': result.error, 'time': time.time()})
+            with open(self.path, 'a') as journal:
+                journal.write(line + '\n')
+                journal.flush()
+                os.fsync(journal.fileno())
+
+
+class Provisioner(object):
+    """
+    Takes devices through steps, with per_adapter devices at a time on
+    every adapter.
+    :param devices: MAC addresses, or (mac, adapter) pairs.
+    :param steps: Steps, see load_steps().
+    :param journal: Path of the journal, None to keep progress in memory.
+    :param adapters: Controller names, None for the engine's default.
+    :param engine: The engine used, see bluew.plugables.get_engine().
+    The other keyword arguments are passed on to the engines and
+    connections, like timeout or wait_for_services.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(self, devices: Iterable, steps: Iterable,
+                 journal: Optional[str] = None,
+                 adapters: Optional[List[str]] = None,
+                 per_adapter: int = 1, engine=None, **kwargs) -> None:
+        if per_adapter < 1:
+            raise ValueError('per_adapter must be at least 1')
+        self.devices = [(dev, None) if isinstance(dev, str) else tuple(dev)
+                        for dev in devices]
+        self.steps = load_steps(steps)
+        self.journal = Journal(journal)
+        self.adapters = [None]  # type: List[Optional[str]]
+        if adapters:
+            self.adapters = list(adapters)
+        self.per_adapter = per_adapter
+        self.engine = engine
+        self.kwargs = kwargs
+        self.kwargs.setdefault('reconnect_attempts', 3)
+        self.results = []  # type: List[StepResult]
+        self.logger = logging.getLogger(__name__)
+        self._pending = []  # type: List[tuple]
+        self._lock = threading.Lock()
+
+    def pending(self, mac: str) -> List[int]:
+        """Indexes of the steps left for mac."""
+        return [index for index, step in enumerate(self.steps)
+                if not self.journal.done(mac, index, step)]
+
+    def run(self) -> List[StepResult]:
+        """
+        Provision every device with steps left, and return the results of
+        this run. Errors of a device are in its results, not raised.
+        """
+        unknown = {adapter for _, adapter in self.devices
+                   if adapter is not None} - set(self.adapters)
+        if unknown:
+            raise ValueError('devices pinned to adapters not given: {}'
+                             .format(', '.join(sorted(unknown))))
+        self._pending = [(mac, adapter) for mac, adapter in self.devices
+                         if self.pending(mac)]
+        self.results = []
+        engines = []
+        try:
+            for adapter in self.adapters:
+                engines.append(self._engine(adapter))
+            workers = [threading.Thread(target=self._work,
+                                        args=(adapter, engine_),
+                                        name='bluew-provision')
+                       for adapter, engine_ in zip(self.adapters, engines)
+                       for _ in range(self.per_adapter)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            for engine_ in engines:
+                engine_.stop_engine()
+        return list(self.results)
+
+    def _engine(self, adapter: Optional[str]):
+        kwargs = dict(self.kwargs)
+        if adapter is not None:
+            kwargs['cntrl'] = adapter
+        engine_ = get_engine(self.engine)(**kwargs)
+        engine_.start_engine()
+        return engine_
+
+    def _next(self, adapter: Optional[str]) -> Optional[str]:
+        # Devices pinned to this adapter first, then unpinned ones.
+        with self._lock:
+            for wanted in (adapter, None):
+                for item in self._pending:
+                    if item[1] == wanted:
+                        self._pending.remove(item)
+                        return item[0]
+        return None
+
+    def _work(self, adapter: Optional[str], engine_) -> None:
+        mac = self._next(adapter)
+        while mac is not None:
+            self._provision(mac, engine_)
+            mac = self._next(adapter)
+
+    def _provision(self, mac: str, engine_) -> None:
+        start = time.monotonic()
+        try:
+            connection = Connection(mac, engine=engine_, **self.kwargs)
+        except Exception as exp:  # pylint: disable=broad-except
+            self._finish(StepResult(mac, None, CONNECT,
+                                    time.monotonic() - start,
+                                    self._error(exp)))
+            return
+        self._finish(StepResult(mac, None, CONNECT, time.monotonic() - start,
+                                None))
+        try:
+            for index in self.pending(mac):
+                step = self.steps[index]
+                start = time.monotonic()
+                error = None
+                try:
+                    self._run_step(connection, step)
+                except Exception as exp:  # pylint: disable=broad-except
+                    # Whatever a device fails with, the worker moves on to
+                    # the next one.
+                    error = self._error(exp)
+                result = StepResult(mac, index, label(step),
+                                    time.monotonic() - start, error)
+                self.journal.record(result)
+                self._finish(result)
+                if error is not None:
+                    break
+        finally:
+            # Devices done with shouldn't hold on to a connection slot of
+            # the adapter.
+            try:
+                connection.disconnect()
+            except Exception:  # pylint: disable=broad-except
+                pass
+            try:
+                connection.close()
+            except Exception:  # pylint: disable=broad-except
+                # Raising here would end the worker, and leave the devices
+                # after this one unprovisioned.
+                self.logger.warning('Could not close the connection to %s',
+                                    mac, exc_info=True)
+
+    def _error(self, exp: Exception) -> str:
+        # Errors bluew doesn't map are unexpected, keep their traceback.
+        if isinstance(exp, BluewError):
+            return str(exp)
+        self.logger.error('Unexpected error provisioning', exc_info=exp)
+        return '{}: {}'.format(type(exp).__name__, exp)
+
+    @staticmethod
+    def _run_step(connection: Connection, step: Step) -> None:
+        if step.action == PAIR:
+            connection.pair(d_init=True)
+        elif step.action == TRUST:
+            connection.trust()
+        elif step.action == WRITE:
+            connection.write_attribute(step.attribute, list(step.value))
+        else:
+            value = b''.join(connection.read_attribute(step.attribute))
+            if step.value is not None and value != step.value:
+                engine_ = connection.engine
+                raise VerifyError(
+                    '{} read {}, expected {}.'.format(
+                        step.attribute, value.hex(), step.value.hex()),
+                    engine_.name, engine_.version)
+
+    def _finish(self, result: StepResult) -> None:
+        if result.error is not None:
+            self.logger.warning('Provisioning %s failed at %s: %s',
+                                result.mac, result.label, result.error)
+        with self._lock:
+            self.results.append(result)
+
+    def report(self) -> Dict[str, Timings]:
+        """Timings of every step of the last run, in step order."""
+        report = OrderedDict()  # type: Dict[str, Timings]
+        report[CONNECT] = Timings(CONNECT)
+        for step in self.steps:
+            report.setdefault(label(step), Timings(label(step)))
+        for result in self.results:
+            timings = report[result.label]
+            if result.error is None:
+                timings.samples.append(result.seconds)
+            else:
+                timings.errors += 1
+        return report
@@ -0,0 +1,137 @@
+"""
+bluew.queues
+~~~~~~~~~~~~
+
+This module provides per-key FIFO operation queues. bluez rejects an
+operation on a characteristic while another one is in flight with
+InProgress, so engines queue the operations on each characteristic, and run
+them one at a time, in order. Operations on different characteristics run
+concurrently.
+
+Basic usage:
+
+    >>> queues = OpQueues()
+    >>> future = queues.submit(('hci0', mac, uuid), write_value, data)
+    >>> future.result()
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import asyncio
+import contextvars
+import threading
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Hashable  # noqa: F401
+
+
+class OpQueues(object):
+    """
+    FIFO queues of operations, one per key, run on a thread pool. A key
+    only holds a pool thread for one operation at a time, then goes back in
+    line behind the other keys, so a busy key can't starve the others of
+    threads, even with a pool shared by many engines.
+    """
+
+    def __init__(self, max_workers: int = 8) -> None:
+        self._queues = {}  # type: Dict[Hashable, Deque[tuple]]
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers,
+                                        thread_name_prefix='bluew-op')
+
+    def submit(self, key: Hashable, func: Callable, *args,
+               **kwargs) -> Future:
+        """
+        Queue func(*args, **kwargs) after the operations already queued
+        under key.
+        :return: A Future for the result.
+        """
+
+        future = Future()  # type: Future
+        # Operations run with the context they were queued from, so that
+        # context variables like their priority go along.
+        context = contextvars.copy_context()
+        with self._lock:
+            queue = self._queues.get(key)
+            idle = queue is None
+            if queue is None:
+                queue = self._queues[key] = deque()
+            queue.append((future, context, func, args, kwargs))
+        if idle:
+            self._pool.submit(self._drain, key, queue)
+        return future
+
+    def run(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        """Queue an operation, and block until it's done."""
+        return self.submit(key, func, *args, **kwargs).result()
+
+    def _drain(self, key: Hashable, queue: Deque[tuple]) -> None:
+        # Runs the next operation of key, and resubmits the key for the one
+        # after it. The queue is never empty here.
+        while True:
+            with self._lock:
+                future, context, func, args, kwargs = queue.popleft()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(context.run(func, *args, **kwargs))
+                except BaseException as exp:  # pylint: disable=broad-except
+                    future.set_exception(exp)
+            with self._lock:
+                if not queue:
+                    del self._queues[key]
+                    return
+            try:
+                self._pool.submit(self._drain, key, queue)
+                return
+            except RuntimeError:
+                # The pool is shutting down, run the rest of the queue here.
+                continue
+
+    def pending(self, key: Hashable) -> int:
+        """Number of operations queued under key, not counting one running."""
+        with self._lock:
+            queue = self._queues.get(key)
+            return 0 if queue is None else len(queue)
+
+    def shutdown(self) -> None:
+        """Run what's queued, and stop the pool threads."""
+        self._pool.shutdown(wait=True)
+
+
+class AsyncOpQueues(object):
+    """
+    FIFO queues of operations, one per key, for coroutines running on the
+    same event loop. Waiters are woken in the order they came in.
+    """
+
+    def __init__(self) -> None:
+        self._locks = {}  # type: Dict[Hashable, asyncio.Lock]
+        self._waiting = {}  # type: Dict[Hashable, int]
+
+    async def run(self, key: Hashable, func: Callable, *args,
+                  **kwargs) -> Any:
+        """
+        Await func(*args, **kwargs), once the operations queued before it
+        under key are done.
+        """
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._waiting[key] = self._waiting.get(key, 0) + 1
+        try:
+            async with lock:
+                return await func(*args, **kwargs)
+        finally:
+            self._waiting[key] -= 1
+            if not self._waiting[key]:
+                del self._waiting[key]
+                del self._locks[key]
+
+    def pending(self, key: Hashable) -> int:
+        """Number of operations queued or running under key."""
+        return self._waiting.get(key, 0)
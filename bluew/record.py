@@ -0,0 +1,240 @@
+"""
+bluew.record
+~~~~~~~~~~~~
+
+This module provides recording of notification streams to a compact
+binary log, and replaying them offline, through the same handlers they
+were recorded for, at their original pace, scaled, or as fast as they can
+be read. Replays make runs of a decoding pipeline repeatable, and let it
+be benchmarked at many times real time.
+
+Recording, by wrapping the handler passed to notify():
+
+    >>> with Recorder('session.blog') as recorder:
+    ...     connection.notify(uuid, recorder.handler(mac, uuid, decode))
+
+Replaying:
+
+    >>> replayer = Replayer('session.blog', speed=10)
+    >>> replayer.notify(mac, uuid, decode)
+    >>> replayer.run()
+
+The log starts with a header, followed by entries of a 2 byte length and a
+body of that length. Bodies start with their kind: keys assign a 2 byte id
+to a (device, characteristic) pair the first time it's seen, and values
+carry a key id, a timestamp in nanoseconds since the recording started, and
+the payload. Logs are memory-mapped for reading, and an entry cut short,
+by a recorder that was killed, ends the log.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import mmap
+import struct
+import threading
+import time
+
+from collections import namedtuple
+from typing import (Callable, Dict, Iterator, List, Optional,  # noqa: F401
+                    Tuple)
+
+
+MAGIC = b'BLWR'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sB3xd')
+_LENGTH = struct.Struct('<H')
+_KEY = struct.Struct('<BH')
+_VALUE = struct.Struct('<BHQ')
+
+_KIND_KEY = 1
+_KIND_VALUE = 2
+
+Record = namedtuple('Record', ['timestamp', 'mac', 'attribute', 'value'])
+
+
+class Recorder(object):
+    """
+    Appends notifications to a new log at path. It's safe to record from
+    the threads engines call handlers from.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.count = 0
+        self._keys = {}  # type: Dict[Tuple[str, str], int]
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._file = open(path, 'wb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, time.time()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _entry(self, body: bytes) -> None:
+        if len(body) > 0xffff:
+            raise ValueError('entries are at most 65535 bytes long')
+        self._file.write(_LENGTH.pack(len(body)) + body)
+
+    def _key(self, mac: str, attribute: str) -> int:
+        key = self._keys.get((mac, attribute))
+        if key is None:
+            key = len(self._keys)
+            if key > 0xffff:
+                raise ValueError('too many characteristics in one log')
+            name = '{}\0{}'.format(mac, attribute).encode()
+            self._entry(_KEY.pack(_KIND_KEY, key) + name)
+            self._keys[(mac, attribute)] = key
+        return key
+
+    def record(self, mac: str, attribute: str, value: bytes,
+               timestamp: Optional[float] = None) -> None:
+        """
+        Append a notification.
+        :param timestamp: time.monotonic() it arrived at, defaults to now.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        since = max(int((timestamp - self._started) * 1e9), 0)
+        with self._lock:
+            key = self._key(mac, attribute)
+            self._entry(_VALUE.pack(_KIND_VALUE, key, since) + bytes(value))
+            self.count += 1
+
+    def handler(self, mac: str, attribute: str,
+                handler: Optional[Callable] = None) -> Callable:
+        """
+        Get a notification handler, that records values before passing them
+        on to handler.
+        """
+
+        def _handler(value):
+            self.record(mac, attribute, value)
+            if handler is not None:
+                handler(value)
+
+        return _handler
+
+    def flush(self) -> None:
+        """Write what's buffered to the log."""
+        with self._lock:
+            self._file.flush()
+
+    def close(self) -> None:
+        """Finish the log."""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+class LogReader(object):
+    """The records of a log, read through a memory map of it."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size:
+            self.close()
+            raise ValueError('not a bluew log: ' + path)
+        magic, version, self.started = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(
+                'not a bluew log, or an unknown version: {}'.format(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """Unmap the log."""
+        self._map.close()
+
+    def __iter__(self) -> Iterator[Record]:
+        keys = {}  # type: Dict[int, Tuple[str, str]]
+        view = memoryview(self._map)
+        try:
+            pos, end = _HEADER.size, len(view)
+            while pos + _LENGTH.size <= end:
+                length, = _LENGTH.unpack_from(view, pos)
+                pos += _LENGTH.size
+                if pos + length > end:
+                    return
+                kind = view[pos]
+                if kind == _KIND_VALUE:
+                    _, key, since = _VALUE.unpack_from(view, pos)
+                    mac, attribute = keys[key]
+                    yield Record(since / 1e9, mac, attribute,
+                                 bytes(view[pos + _VALUE.size:pos + length]))
+                elif kind == _KIND_KEY:
+                    _, key = _KEY.unpack_from(view, pos)
+                    name = bytes(view[pos + _KEY.size:pos + length])
+                    mac, attribute = name.decode().split('\0')
+                    keys[key] = (mac, attribute)
+                pos += length
+        finally:
+            view.release()
+
+
+class Replayer(object):
+    """
+    Replays a log, starting with its first record. speed scales the time
+    between records, 1 keeps their original pace, 10 replays ten times as
+    fast, and None doesn't wait at all.
+    """
+
+    def __init__(self, path: str, speed: Optional[float] = 1.0) -> None:
+        if speed is not None and speed <= 0:
+            raise ValueError('speed must be positive, or None')
+        self.path = path
+        self.speed = speed
+        self._handlers = {}  # type: Dict[Tuple[str, str], List[Callable]]
+
+    def notify(self, mac: str, attribute: str, handler: Callable) -> None:
+        """Call handler with the values of attribute, like notify() does."""
+        self._handlers.setdefault((mac, attribute), []).append(handler)
+
+    def stop_notify(self, mac: str, attribute: str) -> None:
+        """Stop calling the handlers of attribute."""
+        self._handlers.pop((mac, attribute), None)
+
+    def __iter__(self) -> Iterator[Record]:
+        with LogReader(self.path) as reader:
+            records = iter(reader)
+            try:
+                started, first = time.monotonic(), None
+                for record in records:
+                    if first is None:
+                        first = record.timestamp
+                    if self.speed is not None:
+                        delay = started + (record.timestamp - first) / \
+                            self.speed - time.monotonic()
+                        if delay > 0:
+                            time.sleep(delay)
+                    yield record
+            finally:
+                # The memory map can't be closed while records holds a
+                # view of it.
+                records.close()
+
+    def run(self) -> int:
+        """
+        Replay the log through the handlers registered.
+        :return: The number of records replayed.
+        """
+        count = 0
+        for record in self:
+            for handler in self._handlers.get((record.mac,
+                                               record.attribute), ()):
+                handler(record.value)
+            count += 1
+        return count
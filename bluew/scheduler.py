@@ -0,0 +1,223 @@
+"""
+bluew.scheduler
+~~~~~~~~~~~~~~~
+
+This module provides a per-adapter operation scheduler with priorities.
+
+Operations go through one of two lanes. Operations bluez can't overlap on
+one adapter, like connecting, pairing and toggling discovery, go through
+the EXCLUSIVE lane, one at a time. GATT operations go through the GATT
+lane, where a few of them can be in flight at once; they're already queued
+per characteristic, see bluew.queues.
+
+When a lane is busy, waiting operations are let through by priority, and
+in the order they came in within one priority. The priority of operations
+is picked with the priority() context manager:
+
+    >>> from bluew.scheduler import priority, PRIORITY_BACKGROUND
+    >>> with priority(PRIORITY_BACKGROUND):
+    ...     connection.read_attribute(uuid)
+
+Long operations like bulk transfers don't hold a slot throughout, they
+take one with slot() for every stretch of their work, so that more urgent
+operations get in between. Unless a priority was picked, they run with
+PRIORITY_BULK.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional  # noqa: F401
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 10
+PRIORITY_BACKGROUND = 20
+PRIORITY_BULK = 30
+
+EXCLUSIVE = 'exclusive'
+GATT = 'gatt'
+
+GATT_SLOTS = 4
+
+_PRIORITY = contextvars.ContextVar('bluew_priority',
+                                   default=PRIORITY_NORMAL)
+
+
+@contextmanager
+def priority(level: int):
+    """Run the bluew operations issued in this block with this priority."""
+    token = _PRIORITY.set(level)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+def current_priority(default: Optional[int] = None) -> int:
+    """
+    The priority operations issued now get, default if none was picked
+    with priority().
+    """
+    if default is None:
+        return _PRIORITY.get()
+    return _PRIORITY.get(default)
+
+
+class PrioritySemaphore(object):
+    """A semaphore that wakes its waiters by priority, then FIFO."""
+
+    def __init__(self, slots: int = 1) -> None:
+        self._free = slots
+        self._waiters = []  # type: List[list]
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, level: int = PRIORITY_NORMAL) -> None:
+        """Take a slot, waiting behind more urgent and earlier callers."""
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            event = threading.Event()
+            heapq.heappush(self._waiters, [level, next(self._seq), event])
+        event.wait()
+
+    def release(self) -> None:
+        """Give a slot back, to the most urgent waiter if any."""
+        with self._lock:
+            if self._waiters:
+                heapq.heappop(self._waiters)[2].set()
+            else:
+                self._free += 1
+
+    def waiting(self) -> int:
+        """Number of callers waiting for a slot."""
+        with self._lock:
+            return len(self._waiters)
+
+
+class AdapterScheduler(object):
+    """
+    The lanes of one adapter, for engines running operations from many
+    threads. Get the one of an adapter with scheduler_for().
+    """
+
+    def __init__(self, gatt_slots: int = GATT_SLOTS) -> None:
+        self.lanes = {EXCLUSIVE: PrioritySemaphore(1),
+                      GATT: PrioritySemaphore(gatt_slots)}
+
+    def run(self, lane: str, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) once the lane lets it through."""
+        with self.slot(lane):
+            return func(*args, **kwargs)
+
+    @contextmanager
+    def slot(self, lane: str, default: Optional[int] = None):
+        """
+        Hold a slot of the lane for the block, taken with the current
+        priority, or default if none was picked.
+        """
+        semaphore = self.lanes[lane]
+        semaphore.acquire(current_priority(default))
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+_SCHEDULERS = {}  # type: Dict[str, AdapterScheduler]
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+def scheduler_for(adapter: str) -> AdapterScheduler:
+    """The scheduler shared by everything in this process using adapter."""
+    with _SCHEDULERS_LOCK:
+        scheduler = _SCHEDULERS.get(adapter)
+        if scheduler is None:
+            scheduler = _SCHEDULERS[adapter] = AdapterScheduler()
+        return scheduler
+
+
+class AsyncPrioritySemaphore(object):
+    """PrioritySemaphore, for coroutines running on one event loop."""
+
+    def __init__(self, slots: int = 1) -> None:
+        self._free = slots
+        self._waiters = []  # type: List[list]
+        self._seq = itertools.count()
+
+    async def acquire(self, level: int = PRIORITY_NORMAL) -> None:
+        """Take a slot, waiting behind more urgent and earlier callers."""
+        if self._free and not self._waiters:
+            self._free -= 1
+            return
+        future = asyncio.get_event_loop().create_future()
+        waiter = [level, next(self._seq), future]
+        heapq.heappush(self._waiters, waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                # release() skips it, just don't count it as waiting.
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+            else:
+                # Got the slot just as we were cancelled, pass it on.
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Give a slot back, to the most urgent waiter if any."""
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+    def waiting(self) -> int:
+        """Number of callers waiting for a slot."""
+        return len(self._waiters)
+
+
+class AsyncAdapterScheduler(object):
+    """The lanes of one adapter, for an asyncio engine."""
+
+    def __init__(self, gatt_slots: int = GATT_SLOTS) -> None:
+        self.lanes = {EXCLUSIVE: AsyncPrioritySemaphore(1),
+                      GATT: AsyncPrioritySemaphore(gatt_slots)}
+
+    async def run(self, lane: str, func: Callable, *args, **kwargs) -> Any:
+        """Await func(*args, **kwargs) once the lane lets it through."""
+        async with self.slot(lane):
+            return await func(*args, **kwargs)
+
+    def slot(self, lane: str, default: Optional[int] = None) -> '_AsyncSlot':
+        """AdapterScheduler.slot(), as an async context manager."""
+        return _AsyncSlot(self.lanes[lane], default)
+
+
+class _AsyncSlot(object):
+    """A slot of a lane, held for an async with block."""
+
+    def __init__(self, semaphore: AsyncPrioritySemaphore,
+                 default: Optional[int]) -> None:
+        self._semaphore = semaphore
+        self._default = default
+
+    async def __aenter__(self):
+        await self._semaphore.acquire(current_priority(self._default))
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._semaphore.release()
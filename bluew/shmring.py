@@ -0,0 +1,326 @@
+"""
+bluew.shmring
+~~~~~~~~~~~~~
+
+This module provides a ring buffer in named shared memory, for handing
+notification payloads to other processes without pickling or copying them
+through a pipe. One process writes, any number of processes read, and
+neither side takes a lock the other one waits on.
+
+The producer, usually by passing the ring to Connection.notify():
+
+    >>> ring = RingWriter('bluew-imu', capacity=1 << 20)
+    >>> connection.notify(uuid, ring=ring)
+
+A consumer, in another process:
+
+    >>> reader = RingReader('bluew-imu')
+    >>> for entry in reader.entries():
+    ...     samples = reader.as_array(entry, 'int16')  # needs numpy
+
+The ring is a header followed by `capacity` bytes of data. Entries are a 16
+byte header (payload length, key, timestamp) and the payload, padded to 8
+bytes, and never wrap: when one doesn't fit before the end, the rest is
+marked as padding and it starts over at the front. The header has two
+counters of bytes written since the ring was created. `reserve` is moved
+before an entry is written, and `head` once it's complete. Readers read up
+to `head`, and trust what they read only if `reserve` hasn't moved more
+than `capacity` past it since. A reader that fell that far behind has been
+lapped: it skips to `head`, and counts an overrun.
+
+Entries carry a key, which is attribute_key() of the characteristic's UUID
+when written by Connection.notify(), so one ring can carry several
+characteristics.
+
+Payload views handed out by the reader point into the shared memory, and
+stay valid until the writer laps them, see RingReader.intact().
+
+The ring is built on multiprocessing.shared_memory, which needs Python 3.8
+or newer. Importing this module on 3.7 raises ImportError.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from collections import namedtuple
+from typing import Callable, Iterator, Optional  # noqa: F401
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # pragma: no cover
+    raise ImportError('bluew.shmring needs Python 3.8 or newer') from None
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+MAGIC = b'BLWS'
+VERSION = 1
+
+# magic, version, capacity, head, reserve, entries written.
+_HEADER = struct.Struct('<4sIQQQQ')
+_HEADER_SIZE = 64
+_HEAD = 16
+_RESERVE = 24
+_COUNT = 32
+_COUNTER = struct.Struct('<Q')
+
+# payload length, key, timestamp.
+_ENTRY = struct.Struct('<IId')
+_PADDING = 0xffffffff
+
+RingEntry = namedtuple('RingEntry', ['pos', 'key', 'timestamp', 'data'])
+
+
+def attribute_key(uuid: str) -> int:
+    """The key entries of a characteristic are written with."""
+    return zlib.crc32(uuid.lower().encode())
+
+
+def _aligned(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _open(buf: Optional[memoryview], name: str) -> memoryview:
+    # The memory of a closed ring is gone, say so instead of failing on None.
+    if buf is None:
+        raise ValueError('ring {} is closed'.format(name))
+    return buf
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Only the creator of the segment should unlink it, but before python
+    # 3.13 every process attaching to it has it unlinked when it exits.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(  # pylint: disable=E1123
+            name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix':
+        # It's tracked under the name with its leading slash.
+        resource_tracker.unregister('/' + shm.name, 'shared_memory')
+    return shm
+
+
+class RingWriter(object):
+    """
+    The producing side of a ring, creating it under name. capacity is
+    rounded up to a multiple of 8 bytes, and entries can be up to half of
+    it. Writes from threads of this process are serialized.
+    """
+
+    def __init__(self, name: Optional[str] = None,
+                 capacity: int = 1 << 20) -> None:
+        self.capacity = _aligned(capacity)
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=True, size=_HEADER_SIZE + self.capacity)
+        self.name = self._shm.name
+        self._buf = self._shm.buf
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        _HEADER.pack_into(_open(self._buf, self.name), 0, MAGIC, VERSION,
+                          self.capacity, 0, 0, 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, payload: bytes, key: int = 0,
+              timestamp: Optional[float] = None) -> None:
+        """
+        Append an entry.
+        :param timestamp: time.monotonic() the payload arrived at, defaults
+        to now.
+        """
+        size = _aligned(_ENTRY.size + len(payload))
+        if size > self.capacity // 2:
+            raise ValueError('entry too large for this ring')
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self._lock:
+            buf = _open(self._buf, self.name)
+            head = self._head
+            offset = head % self.capacity
+            if offset + size > self.capacity:
+                skip = self.capacity - offset
+                _COUNTER.pack_into(buf, _RESERVE, head + skip + size)
+                struct.pack_into('<I', buf, _HEADER_SIZE + offset, _PADDING)
+                head, offset = head + skip, 0
+            else:
+                _COUNTER.pack_into(buf, _RESERVE, head + size)
+            start = _HEADER_SIZE + offset
+            _ENTRY.pack_into(buf, start, len(payload), key, timestamp)
+            buf[start + _ENTRY.size:
+                start + _ENTRY.size + len(payload)] = payload
+            self._head = head + size
+            self._count += 1
+            _COUNTER.pack_into(buf, _COUNT, self._count)
+            _COUNTER.pack_into(buf, _HEAD, self._head)
+
+    @staticmethod
+    def key_for(uuid: str) -> int:
+        """attribute_key() of uuid."""
+        return attribute_key(uuid)
+
+    def handler(self, key: int = 0,
+                handler: Optional[Callable] = None) -> Callable:
+        """
+        Get a notification handler, that writes values to the ring before
+        passing them on to handler.
+        """
+
+        def _handler(value):
+            self.write(value, key)
+            if handler is not None:
+                handler(value)
+
+        return _handler
+
+    def close(self, unlink: bool = True) -> None:
+        """Stop writing, and remove the ring once every reader detached."""
+        with self._lock:
+            if self._buf is None:
+                return
+            self._buf = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+class RingReader(object):
+    """
+    A consumer of a ring. Reading starts at the entries written from now
+    on, or with from_start=True, at the first entry if the ring hasn't
+    wrapped yet.
+    """
+
+    def __init__(self, name: str, from_start: bool = False) -> None:
+        self.name = name
+        self._shm = _attach(name)
+        self._buf = self._shm.buf
+        magic, version, self.capacity, head, _, _ = \
+            _HEADER.unpack_from(_open(self._buf, name))
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('not a bluew ring: ' + name)
+        # Once the ring wrapped, where the oldest entry starts isn't known.
+        self.pos = 0 if from_start and head <= self.capacity else head
+        self.overruns = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _counter(self, offset: int) -> int:
+        return _COUNTER.unpack_from(_open(self._buf, self.name), offset)[0]
+
+    @property
+    def written(self) -> int:
+        """Entries written to the ring since it was created."""
+        return self._counter(_COUNT)
+
+    @property
+    def pending(self) -> int:
+        """Bytes written that weren't read yet."""
+        return self._counter(_HEAD) - self.pos
+
+    def intact(self, entry: RingEntry) -> bool:
+        """Whether the writer has yet to overwrite an entry read."""
+        return self._counter(_RESERVE) - entry.pos <= self.capacity
+
+    def _lapped(self) -> None:
+        self.overruns += 1
+        self.pos = self._counter(_HEAD)
+
+    def read_view(self) -> Optional[RingEntry]:
+        """
+        Get the next entry, with data a view into the ring, or None if
+        there's none yet.
+        """
+        buf = _open(self._buf, self.name)
+        while True:
+            head = self._counter(_HEAD)
+            if self.pos >= head:
+                return None
+            if self._counter(_RESERVE) - self.pos > self.capacity:
+                self._lapped()
+                continue
+            offset = self.pos % self.capacity
+            start = _HEADER_SIZE + offset
+            if self.capacity - offset < _ENTRY.size:
+                length, key, timestamp = _PADDING, 0, 0.0
+            else:
+                length, key, timestamp = _ENTRY.unpack_from(buf, start)
+            if length == _PADDING:
+                entry_pos, self.pos = self.pos, self.pos + \
+                    self.capacity - offset
+                if self._counter(_RESERVE) - entry_pos > self.capacity:
+                    self._lapped()
+                continue
+            entry = RingEntry(self.pos, key, timestamp,
+                              buf[start + _ENTRY.size:
+                                  start + _ENTRY.size + length])
+            if not self.intact(entry):
+                entry.data.release()
+                self._lapped()
+                continue
+            self.pos += _aligned(_ENTRY.size + length)
+            return entry
+
+    def read(self) -> Optional[RingEntry]:
+        """Get the next entry, with data copied out of the ring."""
+        while True:
+            entry = self.read_view()
+            if entry is None:
+                return None
+            data = bytes(entry.data)
+            entry.data.release()
+            if self.intact(entry):
+                return entry._replace(data=data)
+            self._lapped()
+
+    def entries(self, timeout: Optional[float] = None,
+                interval: float = 0.001) -> Iterator[RingEntry]:
+        """
+        Iterate over entries as they come, copied out of the ring, polling
+        every interval seconds. Stops once none came for timeout seconds.
+        """
+        idle = time.monotonic()
+        while True:
+            entry = self.read()
+            if entry is not None:
+                idle = time.monotonic()
+                yield entry
+                continue
+            if timeout is not None and time.monotonic() - idle >= timeout:
+                return
+            time.sleep(interval)
+
+    @staticmethod
+    def as_array(entry: RingEntry, dtype='uint8'):
+        """The data of an entry as a numpy array, without copying it."""
+        if numpy is None:
+            raise ImportError('numpy is needed for RingReader.as_array()')
+        return numpy.frombuffer(entry.data, dtype=dtype)
+
+    def close(self) -> None:
+        """Detach from the ring. Views of it must be released first."""
+        if self._buf is None:
+            return
+        self._buf = None
+        self._shm.close()
@@ -0,0 +1,243 @@
+"""
+bluew.state
+~~~~~~~~~~~
+
+This module provides a per-device state cache, that engines keep current
+from bluez signals. It lets engines answer questions like "is this device
+connected?" without asking bluez, and falling back to an active check only
+when the state is unknown or stale. It also provides a cache of the last
+known values of characteristics, for reads that accept a recent value.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import logging
+import threading
+import time
+
+from typing import Callable, Dict, List, Optional  # noqa: F401
+
+
+class DeviceState(object):
+    """The last known state of one device."""
+
+    __slots__ = ('path', 'connected', 'paired', 'services_resolved',
+                 'props', 'updated')
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.connected = None  # type: Optional[bool]
+        self.paired = None  # type: Optional[bool]
+        self.services_resolved = None  # type: Optional[bool]
+        self.props = {}  # type: Dict[str, object]
+        self.updated = time.monotonic()
+
+    def update(self, props: dict) -> None:
+        """Apply changed Device1 properties."""
+        self.props.update(props)
+        if 'Connected' in props:
+            self.connected = bool(props['Connected'])
+            if not self.connected:
+                self.services_resolved = False
+        if 'Paired' in props:
+            self.paired = bool(props['Paired'])
+        if 'ServicesResolved' in props:
+            self.services_resolved = bool(props['ServicesResolved'])
+        self.updated = time.monotonic()
+
+    def __repr__(self):
+        return ('DeviceState({!r}, connected={}, paired={}, '
+                'services_resolved={})'.format(self.path, self.connected,
+                                               self.paired,
+                                               self.services_resolved))
+
+
+class DeviceStateCache(object):
+    """
+    Known devices and their state, keyed by object path.
+
+    Entries older than max_age seconds are considered stale, and queries
+    about them return None, meaning "unknown, go ask bluez". Engines that
+    get every signal can use a large max_age, since updates are pushed.
+    """
+
+    def __init__(self, max_age: float = 30) -> None:
+        self.max_age = max_age
+        self._states = {}  # type: Dict[str, DeviceState]
+        self._listeners = {}  # type: Dict[str, List[Callable]]
+        self._cond = threading.Condition()
+
+    def update(self, path: str, props: dict) -> DeviceState:
+        """Record a device as known, and apply changed properties."""
+        with self._cond:
+            state = self._states.get(path)
+            if state is None:
+                state = self._states[path] = DeviceState(path)
+            state.update(props)
+            self._cond.notify_all()
+            listeners = list(self._listeners.get(path, ()))
+        self._call_listeners(listeners, props)
+        return state
+
+    def remove(self, path: str) -> None:
+        """Forget a device, bluez removed it."""
+        with self._cond:
+            state = self._states.pop(path, None)
+            self._cond.notify_all()
+            listeners = list(self._listeners.get(path, ()))
+        if state is not None and state.connected:
+            self._call_listeners(listeners, {'Connected': False})
+
+    def add_listener(self, path: str, callback: Callable) -> None:
+        """Call callback(props) with the properties changed on a device."""
+        with self._cond:
+            self._listeners.setdefault(path, []).append(callback)
+
+    def remove_listener(self, path: str, callback: Callable) -> None:
+        """Stop calling a callback added with add_listener()."""
+        with self._cond:
+            listeners = self._listeners.get(path, [])
+            if callback in listeners:
+                listeners.remove(callback)
+            if not listeners:
+                self._listeners.pop(path, None)
+
+    @staticmethod
+    def _call_listeners(listeners: List[Callable], props: dict) -> None:
+        for callback in listeners:
+            try:
+                callback(dict(props))
+            except Exception:  # pylint: disable=broad-except
+                logger = logging.getLogger(__name__)
+                logger.exception('Device state listener failed')
+
+    def clear(self) -> None:
+        """Forget all devices."""
+        with self._cond:
+            self._states.clear()
+            self._cond.notify_all()
+
+    def get(self, path: str) -> Optional[DeviceState]:
+        """Get the state of a device, or None if unknown or stale."""
+        with self._cond:
+            return self._fresh(path)
+
+    def _fresh(self, path: str) -> Optional[DeviceState]:
+        state = self._states.get(path)
+        if state is None:
+            return None
+        if time.monotonic() - state.updated > self.max_age:
+            return None
+        return state
+
+    def known(self, path: str) -> Optional[bool]:
+        """True if bluez knows the device, None if we can't tell."""
+        return True if self.get(path) is not None else None
+
+    def connected(self, path: str) -> Optional[bool]:
+        """Connected state of a device, None if unknown."""
+        state = self.get(path)
+        return None if state is None else state.connected
+
+    def paired(self, path: str) -> Optional[bool]:
+        """Paired state of a device, None if unknown."""
+        state = self.get(path)
+        return None if state is None else state.paired
+
+    def services_resolved(self, path: str) -> Optional[bool]:
+        """ServicesResolved state of a device, None if unknown."""
+        state = self.get(path)
+        return None if state is None else state.services_resolved
+
+    def wait_for(self, path: str, check: Callable[[DeviceState], bool],
+                 timeout: float) -> bool:
+        """
+        Block until check(state) is true for a device, woken up by updates
+        instead of polling.
+        :return: False if the timeout expired first.
+        """
+
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                state = self._states.get(path)
+                if state is not None and check(state):
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+
+
+class ValueCache(object):
+    """
+    Last known values of characteristics, keyed by device path and UUID.
+
+    Engines update it from their reads, and from the Value property changes
+    bluez signals after reads and notifications. Since those signals only
+    carry the characteristic's object path, engines teach the cache which
+    UUID a path belongs to with learn().
+    """
+
+    def __init__(self) -> None:
+        self._values = {}  # type: Dict[tuple, tuple]
+        self._keys = {}  # type: Dict[str, tuple]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _dev_path(path: str) -> str:
+        return path.split('/service', 1)[0]
+
+    def learn(self, path: str, uuid: str) -> None:
+        """Record the UUID of the characteristic at path."""
+        with self._lock:
+            self._keys[path] = (self._dev_path(path), uuid)
+
+    def forget(self, path: str) -> None:
+        """Forget a characteristic, bluez removed it."""
+        with self._lock:
+            key = self._keys.pop(path, None)
+            if key is not None:
+                self._values.pop(key, None)
+
+    def update(self, dev_path: str, uuid: str, value: bytes) -> None:
+        """Record the value of a characteristic."""
+        with self._lock:
+            self._values[(dev_path, uuid)] = (bytes(value), time.monotonic())
+
+    def update_path(self, path: str, value: bytes) -> bool:
+        """
+        Record the value of the characteristic at path.
+        :return: False if the path's UUID isn't known.
+        """
+        with self._lock:
+            key = self._keys.get(path)
+            if key is None:
+                return False
+            self._values[key] = (bytes(value), time.monotonic())
+            return True
+
+    def get(self, dev_path: str, uuid: str,
+            max_age: float) -> Optional[bytes]:
+        """
+        The value of a characteristic, if it's at most max_age seconds old.
+        Counts as a hit or a miss.
+        """
+        with self._lock:
+            entry = self._values.get((dev_path, uuid))
+            if entry is not None and time.monotonic() - entry[1] <= max_age:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def stats(self) -> Dict[str, int]:
+        """Hits, misses, and number of values cached."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._values)}
@@ -0,0 +1,71 @@
+"""
+bluew.stats
+~~~~~~~~~~~
+
+This module provides latency bookkeeping shared by the `bluew` command and
+the provisioning runner:
+
+    >>> timings = Timings('read')
+    >>> timings.time(connection.read_attribute, attribute)
+    >>> print(timings.summary())
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import time
+
+from typing import Callable, List  # noqa: F401
+
+from bluew.errors import BluewError
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """The pct percentile of samples, interpolated between ranks."""
+    if not samples:
+        raise ValueError('no samples')
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class Timings(object):
+    """Latencies, and bytes moved, of one kind of operation."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.samples = []  # type: List[float]
+        self.nbytes = 0
+        self.errors = 0
+
+    def time(self, func: Callable, *args, size: int = 0):
+        """Call func(*args), and record how long it took, and its size."""
+        start = time.monotonic()
+        try:
+            result = func(*args)
+        except BluewError:
+            self.errors += 1
+            raise
+        self.samples.append(time.monotonic() - start)
+        self.nbytes += size
+        return result
+
+    def summary(self) -> str:
+        """One line: count, latency percentiles and throughput."""
+        line = '{:<8} n={:<5} errors={:<3}'.format(self.name,
+                                                   len(self.samples),
+                                                   self.errors)
+        if not self.samples:
+            return line
+        busy = sum(self.samples)
+        line += ' p50={:.1f}ms p90={:.1f}ms p99={:.1f}ms max={:.1f}ms'.format(
+            *(1000 * percentile(self.samples, pct)
+              for pct in (50, 90, 99, 100)))
+        line += ' {:.1f} ops/s'.format(len(self.samples) / busy if busy else 0)
+        if self.nbytes:
+            line += ' {:.0f} B/s'.format(self.nbytes / busy if busy else 0)
+        return line
@@ -8,21 +8,17 @@ for certain situations.
 
 
 import typing as typ
-import bluew
 from .device import Device
 
 
-def devs_with_uuid(uuid: str) -> typ.List[Device]:
+def devs_with_uuid(uuid: str, *args, **kwargs) -> typ.List[Device]:
     """
     Get a list of devices with a specific UUID.
     This function can be useful when you wanna connect to any device with a
-    certain model, but don't care which one it is.
+    certain model, but don't care which one it is. It's a lookup in the
+    engine's device index, pass `scan` to look around for more of them
+    first, see bluew.find_devices().
     """
 
-    devices = bluew.devices()
-    devices_ = []
-    for dev in devices:
-        for uuid_ in getattr(dev, 'UUIDs'):
-            if uuid_ == uuid:
-                devices_.append(dev)
-    return devices_
+    from bluew.api import find_devices
+    return find_devices(*args, uuid=uuid, **kwargs)
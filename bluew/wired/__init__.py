@@ -0,0 +1,17 @@
+"""
+Wired: An EngineBluew implementation for bluew.
+
+Wired talks to bluez by speaking the D-Bus wire protocol directly over the
+system bus socket from an asyncio event loop, without libdbus or GLib.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+from .wired import Wired
+from .client import AsyncBluez
+
+
+__all__ = ['Wired', 'AsyncBluez']
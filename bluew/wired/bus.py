@@ -0,0 +1,433 @@
+"""
+bluew.wired.bus
+~~~~~~~~~~~~~~~
+
+This module provides an asyncio connection to a D-Bus message bus, speaking
+the wire protocol directly over the bus' UNIX socket. It handles
+authentication, method calls and their replies, match rules and signal
+dispatching, and exporting objects so that method calls can be answered.
+
+Everything runs in the event loop the connection was opened from, so
+replies and signals are delivered without a hop to another thread.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import asyncio
+import binascii
+import inspect
+import itertools
+import logging
+import os
+import struct
+
+from typing import Callable, Dict, List, Optional  # noqa: F401
+from urllib.parse import unquote
+
+from bluew.wired.marshal import (Message, MarshalError, METHOD_CALL,
+                                 METHOD_RETURN, ERROR, SIGNAL,
+                                 FLAG_NO_REPLY_EXPECTED)
+
+
+SYSTEM_BUS_DEFAULT = 'unix:path=/var/run/dbus/system_bus_socket'
+
+DBUS_NAME = 'org.freedesktop.DBus'
+DBUS_PATH = '/org/freedesktop/DBus'
+DBUS_IFACE = 'org.freedesktop.DBus'
+
+ERR_DISCONNECTED = 'org.freedesktop.DBus.Error.Disconnected'
+ERR_NO_REPLY = 'org.freedesktop.DBus.Error.NoReply'
+ERR_UNKNOWN_METHOD = 'org.freedesktop.DBus.Error.UnknownMethod'
+ERR_UNKNOWN_OBJECT = 'org.freedesktop.DBus.Error.UnknownObject'
+ERR_FAILED = 'org.freedesktop.DBus.Error.Failed'
+
+
+class DBusError(Exception):
+    """An error reply received from, or to be sent on, the bus."""
+
+    def __init__(self, name: str, message: str = '') -> None:
+        super().__init__(name, message)
+        self.name = name
+        self.message = message
+
+    def __str__(self):
+        if self.message:
+            return '{}: {}'.format(self.name, self.message)
+        return self.name
+
+
+class AuthenticationError(DBusError):
+    """Raised when the bus rejects our credentials."""
+
+    def __init__(self, message: str = '') -> None:
+        super().__init__('org.freedesktop.DBus.Error.AuthFailed', message)
+
+
+def bus_address(bus: str = 'system') -> str:
+    """
+    Get the address of the system or session bus, honoring the
+    DBUS_SYSTEM_BUS_ADDRESS and DBUS_SESSION_BUS_ADDRESS variables.
+    """
+
+    if bus == 'session':
+        address = os.environ.get('DBUS_SESSION_BUS_ADDRESS')
+        if not address:
+            raise DBusError(ERR_DISCONNECTED, 'No session bus address set.')
+        return address
+    return os.environ.get('DBUS_SYSTEM_BUS_ADDRESS', SYSTEM_BUS_DEFAULT)
+
+
+def parse_address(address: str) -> List[str]:
+    """
+    Get the socket paths of a D-Bus address. Abstract sockets are returned
+    with a leading NUL byte, as expected by the socket module.
+    """
+
+    paths = []
+    for entry in address.split(';'):
+        transport, _, params = entry.partition(':')
+        if transport != 'unix':
+            continue
+        options = dict(param.split('=', 1)
+                       for param in params.split(',') if '=' in param)
+        if 'path' in options:
+            paths.append(unquote(options['path']))
+        elif 'abstract' in options:
+            paths.append('\0' + unquote(options['abstract']))
+    return paths
+
+
+class _Match(object):
+    """A match rule, and the handler to call with the matching signals."""
+
+    KEYS = ('interface', 'member', 'path', 'path_namespace', 'arg0')
+
+    def __init__(self, handler: Callable, sender: Optional[str] = None,
+                 **rule) -> None:
+        unknown = set(rule) - set(self.KEYS)
+        if unknown:
+            raise ValueError('Unsupported match keys: ' + ', '.join(unknown))
+        self.handler = handler
+        self.sender = sender
+        self.rule = rule
+
+    def rule_string(self) -> str:
+        """The match rule, as passed to AddMatch."""
+        rule = {'type': 'signal'}
+        if self.sender:
+            rule['sender'] = self.sender
+        rule.update(self.rule)
+        return ','.join("{}='{}'".format(key, val)
+                        for key, val in sorted(rule.items()))
+
+    def matches(self, msg: Message) -> bool:
+        """
+        Check if a signal matches this rule. The sender isn't checked here,
+        since signals carry the unique name of their sender, and the bus
+        already did the filtering for us.
+        """
+        # pylint: disable=too-many-return-statements
+        rule = self.rule
+        if 'interface' in rule and msg.interface != rule['interface']:
+            return False
+        if 'member' in rule and msg.member != rule['member']:
+            return False
+        if 'path' in rule and msg.path != rule['path']:
+            return False
+        if 'path_namespace' in rule:
+            namespace = rule['path_namespace']
+            if msg.path != namespace and \
+                    not (msg.path or '').startswith(namespace + '/'):
+                return False
+        if 'arg0' in rule:
+            if not msg.body or msg.body[0] != rule['arg0']:
+                return False
+        return True
+
+
+class BusConnection(object):
+    """
+    An asyncio D-Bus connection.
+
+    Basic usage:
+
+        >>> bus = BusConnection()
+        >>> await bus.open(bus_address('system'))
+        >>> await bus.call('org.bluez', '/', OM_IFACE, 'GetManagedObjects')
+
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self) -> None:
+        self.unique_name = None  # type: Optional[str]
+        self._reader = None  # type: Optional[asyncio.StreamReader]
+        self._writer = None  # type: Optional[asyncio.StreamWriter]
+        self._serials = itertools.count(1)
+        self._calls = {}  # type: Dict[int, asyncio.Future]
+        self._matches = []  # type: List[_Match]
+        self._exports = {}  # type: Dict[str, Callable]
+        self._read_task = None  # type: Optional[asyncio.Task]
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def connected(self) -> bool:
+        """True while the connection to the bus is open."""
+        return self._writer is not None
+
+    async def open(self, address: Optional[str] = None) -> None:
+        """
+        Connect to and authenticate with the bus, then say Hello.
+        :param address: D-Bus address, defaults to the system bus.
+        """
+
+        address = address or bus_address('system')
+        error = None  # type: Optional[Exception]
+        for path in parse_address(address):
+            try:
+                reader, writer = await asyncio.open_unix_connection(path)
+                break
+            except OSError as exp:
+                error = exp
+        else:
+            raise DBusError(ERR_DISCONNECTED,
+                            'Could not connect to {}: {}'.format(address,
+                                                                 error))
+        self._reader, self._writer = reader, writer
+        try:
+            await self._authenticate(reader, writer)
+        except (AuthenticationError, OSError, asyncio.IncompleteReadError):
+            self.close()
+            raise
+        self._read_task = asyncio.ensure_future(self._read_loop())
+        reply = await self.call(DBUS_NAME, DBUS_PATH, DBUS_IFACE, 'Hello')
+        self.unique_name = reply[0]
+
+    @staticmethod
+    async def _authenticate(reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> None:
+        uid = str(os.getuid()).encode('ascii')
+        writer.write(b''.join((b'\0AUTH EXTERNAL ',
+                               binascii.hexlify(uid), b'\r\n')))
+        line = await reader.readline()
+        if not line.startswith(b'OK '):
+            raise AuthenticationError(line.decode('ascii', 'replace').strip())
+        writer.write(b'BEGIN\r\n')
+
+    def close(self) -> None:
+        """Close the connection, failing any call still waiting a reply."""
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        self._reader = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._fail_pending(DBusError(ERR_DISCONNECTED, 'Connection closed.'))
+
+    async def aclose(self) -> None:
+        """Close the connection, and wait for the reader to wind down."""
+        task = self._read_task
+        self.close()
+        if task is not None:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def _fail_pending(self, exp: Exception) -> None:
+        calls, self._calls = self._calls, {}
+        for future in calls.values():
+            if not future.done():
+                future.set_exception(exp)
+
+    def send(self, msg: Message) -> int:
+        """Send a message, and return the serial it was sent with."""
+        if self._writer is None:
+            raise DBusError(ERR_DISCONNECTED, 'Not connected to the bus.')
+        msg.serial = next(self._serials)
+        self._writer.write(msg.marshal())
+        return msg.serial
+
+    async def call(self, destination: str, path: str, interface: str,
+                   member: str, signature: str = '', body=(),
+                   timeout: Optional[float] = None) -> list:
+        """
+        Call a method, and wait for its reply.
+        :return: The body of the reply.
+        :raises DBusError: If an error is returned.
+        """
+        # pylint: disable=too-many-arguments
+
+        msg = Message(METHOD_CALL, path=path, interface=interface,
+                      member=member, destination=destination,
+                      signature=signature, body=body)
+        future = asyncio.get_event_loop().create_future()
+        serial = self.send(msg)
+        self._calls[serial] = future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise DBusError(ERR_NO_REPLY, 'No reply to {}.{}'.format(
+                interface, member))
+        finally:
+            self._calls.pop(serial, None)
+
+    def call_no_reply(self, destination: str, path: str, interface: str,
+                      member: str, signature: str = '', body=()) -> None:
+        """Call a method without asking for a reply."""
+        # pylint: disable=too-many-arguments
+        msg = Message(METHOD_CALL, path=path, interface=interface,
+                      member=member, destination=destination,
+                      signature=signature, body=body,
+                      flags=FLAG_NO_REPLY_EXPECTED)
+        self.send(msg)
+
+    async def add_match(self, handler: Callable,
+                        sender: Optional[str] = None, **rule) -> _Match:
+        """
+        Add a match rule, and call handler with every signal matching it.
+        Handlers are called from the event loop with the Message, and can be
+        coroutine functions.
+        :return: Token to pass to remove_match().
+        """
+
+        match = _Match(handler, sender, **rule)
+        self._matches.append(match)
+        try:
+            await self.call(DBUS_NAME, DBUS_PATH, DBUS_IFACE, 'AddMatch',
+                            's', (match.rule_string(),))
+        except DBusError:
+            self._matches.remove(match)
+            raise
+        return match
+
+    async def remove_match(self, match: _Match) -> None:
+        """Remove a match rule added with add_match()."""
+        if match not in self._matches:
+            return
+        self._matches.remove(match)
+        if self.connected:
+            await self.call(DBUS_NAME, DBUS_PATH, DBUS_IFACE, 'RemoveMatch',
+                            's', (match.rule_string(),))
+
+    async def request_name(self, name: str, flags: int = 0) -> int:
+        """Request a well-known name on the bus."""
+        reply = await self.call(DBUS_NAME, DBUS_PATH, DBUS_IFACE,
+                                'RequestName', 'su', (name, flags))
+        return reply[0]
+
+    def export(self, path: str, handler: Callable) -> None:
+        """
+        Answer method calls on path. handler gets called with the Message,
+        and should return a tuple of (signature, body), or None for an empty
+        reply, or raise DBusError. Coroutine functions are supported.
+        """
+        self._exports[path] = handler
+
+    def unexport(self, path: str) -> None:
+        """Stop answering method calls on path."""
+        self._exports.pop(path, None)
+
+    def emit(self, path: str, interface: str, member: str,
+             signature: str = '', body=()) -> None:
+        """Emit a signal."""
+        # pylint: disable=too-many-arguments
+        self.send(Message(SIGNAL, path=path, interface=interface,
+                          member=member, signature=signature, body=body))
+
+    async def _read_loop(self) -> None:
+        reader = self._reader
+        if reader is None:
+            return
+        try:
+            while True:
+                head = await reader.readexactly(16)
+                rest = await reader.readexactly(Message.length(head) - 16)
+                try:
+                    msg = Message.unmarshal(head + rest)
+                except (MarshalError, struct.error, LookupError,
+                        ValueError) as exp:
+                    # Messages are framed by their length, so the ones
+                    # after a message we can't read are still fine.
+                    self.logger.warning('Wired::bus: dropped a message: %s',
+                                        exp)
+                    continue
+                self._dispatch(msg)
+        except asyncio.CancelledError:
+            # On 3.7 this is an Exception, keep it from the handler below.
+            self.logger.debug('Wired::bus: reader stopped')
+            raise
+        except (asyncio.IncompleteReadError, OSError) as exp:
+            self.logger.debug('Wired::bus: connection lost: %s', exp)
+        except Exception:  # pylint: disable=broad-except
+            self.logger.exception('Wired::bus: reader failed')
+        finally:
+            if self._reader is reader:
+                self._lost()
+
+    def _lost(self) -> None:
+        # Nothing reads replies any more, so calls made from here on have
+        # to fail right away instead of waiting for them.
+        self._read_task = None
+        self._reader = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._fail_pending(DBusError(ERR_DISCONNECTED,
+                                     'Connection to the bus lost.'))
+
+    def _dispatch(self, msg: Message) -> None:
+        if msg.type in (METHOD_RETURN, ERROR):
+            future = self._calls.pop(msg.reply_serial or 0, None)
+            if future is None or future.done():
+                return
+            if msg.type == ERROR:
+                text = msg.body[0] if msg.body else ''
+                future.set_exception(DBusError(msg.error_name or ERR_FAILED,
+                                               text))
+            else:
+                future.set_result(msg.body)
+        elif msg.type == SIGNAL:
+            for match in list(self._matches):
+                if match.matches(msg):
+                    self._run_handler(match.handler, msg)
+        elif msg.type == METHOD_CALL:
+            asyncio.ensure_future(self._answer(msg))
+
+    def _run_handler(self, handler: Callable, msg: Message) -> None:
+        try:
+            result = handler(msg)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result)
+        except Exception:  # pylint: disable=broad-except
+            self.logger.exception('Wired::bus: signal handler failed')
+
+    async def _answer(self, msg: Message) -> None:
+        handler = self._exports.get(msg.path or '')
+        try:
+            if handler is None:
+                raise DBusError(ERR_UNKNOWN_OBJECT,
+                                'No object at ' + str(msg.path))
+            result = handler(msg)
+            if inspect.isawaitable(result):
+                result = await result
+            signature, body = result or ('', ())
+            reply = Message(METHOD_RETURN, reply_serial=msg.serial,
+                            destination=msg.sender, signature=signature,
+                            body=body)
+        except DBusError as exp:
+            reply = Message(ERROR, error_name=exp.name,
+                            reply_serial=msg.serial, destination=msg.sender,
+                            signature='s', body=(exp.message,))
+        except Exception as exp:  # pylint: disable=broad-except
+            self.logger.exception('Wired::bus: method handler failed')
+            reply = Message(ERROR, error_name=ERR_FAILED,
+                            reply_serial=msg.serial, destination=msg.sender,
+                            signature='s', body=(str(exp),))
+        if msg.flags & FLAG_NO_REPLY_EXPECTED or not self.connected:
+            return
+        self.send(reply)
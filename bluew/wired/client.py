@@ -0,0 +1,1145 @@
+"""
+bluew.wired.client
+~~~~~~~~~~~~~~~~~~
+
+This module provides AsyncBluez, an asyncio client for the bluez D-Bus API
+built on top of bluew.wired.bus. It can be used directly from an event loop,
+and is what the Wired engine runs.
+
+Basic usage:
+
+    >>> client = AsyncBluez()
+    >>> await client.open()
+    >>> await client.read_attribute('xx:xx:xx:xx:xx', 'attrrr')
+    [b'0', b'0']
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import asyncio
+import logging
+
+from typing import Any, Callable, Dict, List, Optional, Set  # noqa: F401
+
+from bluew.bulk import BulkStats, CHECKPOINT, WINDOW, async_bulk_write
+from bluew.characteristics import BLECharacteristic
+from bluew.controller import Controller
+from bluew.descriptors import BLEDescriptor
+from bluew.device import Device
+from bluew.devindex import DeviceIndex, Search
+from bluew.errors import (BluewError,
+                          NoControllerAvailable,
+                          ControllerSpecifiedNotFound,
+                          PairError,
+                          DeviceNotAvailable,
+                          ControllerNotReady,
+                          ReadWriteNotifyError,
+                          InvalidArgumentsError)
+from bluew.flight import AsyncSingleFlight
+from bluew.gattcache import (GattCache,  # pylint: disable=unused-import
+                             GATT_DB_HASH_UUID,
+                             IFACES,
+                             desc_key,
+                             exported_as,
+                             gatt_layout,
+                             open_gatt_cache)
+from bluew.longvalue import (DEFAULT_MTU, async_read_long, chunks,
+                             packet_size, read_chunk_size, write_chunk_size)
+from bluew.queues import AsyncOpQueues
+from bluew.scheduler import (AsyncAdapterScheduler, EXCLUSIVE, GATT,
+                             PRIORITY_BACKGROUND, PRIORITY_BULK, priority)
+from bluew.services import BLEService
+from bluew.state import ValueCache
+from bluew.wired.bus import BusConnection, DBusError
+from bluew.wired.marshal import ObjectPath, Variant
+
+
+BLUEZ_SERVICE_NAME = 'org.bluez'
+BLUEZ_SERVICE_PATH = '/org/bluez/'
+
+DBUS_OM_IFACE = 'org.freedesktop.DBus.ObjectManager'
+DBUS_PROP_IFACE = 'org.freedesktop.DBus.Properties'
+
+ADAPTER_IFACE = 'org.bluez.Adapter1'
+DEVICE_IFACE = 'org.bluez.Device1'
+GATT_SERVICE_IFACE = 'org.bluez.GattService1'
+GATT_CHRC_IFACE = 'org.bluez.GattCharacteristic1'
+GATT_DESC_IFACE = 'org.bluez.GattDescriptor1'
+
+BLUEZ_ERR = 'org.bluez.Error.'
+ERR_FAILED = BLUEZ_ERR + 'Failed'
+ERR_IN_PROGRESS = BLUEZ_ERR + 'InProgress'
+ERR_NOT_READY = BLUEZ_ERR + 'NotReady'
+ERR_NOT_PERMITTED = BLUEZ_ERR + 'NotPermitted'
+ERR_NOT_AUTHORIZED = BLUEZ_ERR + 'NotAuthorized'
+ERR_NOT_CONNECTED = BLUEZ_ERR + 'NotConnected'
+ERR_NOT_SUPPORTED = BLUEZ_ERR + 'NotSupported'
+ERR_ALREADY_CONNECTED = BLUEZ_ERR + 'AlreadyConnected'
+ERR_ALREADY_EXISTS = BLUEZ_ERR + 'AlreadyExists'
+ERR_DOES_NOT_EXIST = BLUEZ_ERR + 'DoesNotExist'
+ERR_INVALID_ARGUMENTS = BLUEZ_ERR + 'InvalidArguments'
+ERR_INVALID_VAL_LEN = BLUEZ_ERR + 'InvalidValueLength'
+ERR_AUTH_FAILED = BLUEZ_ERR + 'AuthenticationFailed'
+ERR_AUTH_REJECTED = BLUEZ_ERR + 'AuthenticationRejected'
+ERR_AUTH_TIMEOUT = BLUEZ_ERR + 'AuthenticationTimeout'
+ERR_AUTH_CANCELED = BLUEZ_ERR + 'AuthenticationCanceled'
+ERR_CONN_ATTEMPT_FAILED = BLUEZ_ERR + 'ConnectionAttemptFailed'
+ERR_UNKNOWN_OBJECT = 'org.freedesktop.DBus.Error.UnknownObject'
+ERR_NO_REPLY = 'org.freedesktop.DBus.Error.NoReply'
+ERR_DBUS_INVALID_ARGS = 'org.freedesktop.DBus.Error.InvalidArgs'
+
+MSG_OAIP = 'Operation already in progress'
+MSG_NOT_CONNECTED = 'Not connected'
+MSG_NO_ATT = 'No ATT transport'
+MSG_NOT_PAIRED = 'Not paired'
+MSG_ALREADY_NOTIFYING = 'Already notifying'
+MSG_NO_NOTIFY = 'No notify session started'
+MSG_NO_DISCOVERY = 'No discovery started'
+
+PAIR_TIMEOUT = 30
+
+# Seconds bus calls wait for their reply unless told otherwise, libdbus'
+# default. Bluez replies, or fails, well within it.
+CALL_TIMEOUT = 25
+
+
+def error_is(exp: DBusError, *strings: str) -> bool:
+    """Check if error name or message is one of strings."""
+    return exp.name in strings or exp.message in strings
+
+
+def _link_lost(exp: DBusError) -> bool:
+    return error_is(exp, ERR_NOT_CONNECTED, MSG_NOT_CONNECTED, MSG_NO_ATT,
+                    ERR_CONN_ATTEMPT_FAILED)
+
+
+def _not_paired(exp: DBusError) -> bool:
+    return exp.name == ERR_NOT_PERMITTED and exp.message == MSG_NOT_PAIRED
+
+
+def to_bluew_error(exp: DBusError, name: str = '',
+                   version: str = '') -> BluewError:
+    """Map a bluez D-Bus error to the bluew error that should be raised."""
+    # pylint: disable=too-many-return-statements
+    kwargs = {'name': name, 'version': version}
+    if exp.name == ERR_NOT_READY:
+        return ControllerNotReady(**kwargs)
+    if exp.name in (ERR_UNKNOWN_OBJECT, ERR_DOES_NOT_EXIST) or \
+            _link_lost(exp):
+        return DeviceNotAvailable(**kwargs)
+    if exp.name == ERR_NOT_SUPPORTED:
+        return ReadWriteNotifyError(
+            long_reason=ReadWriteNotifyError.NOT_SUPPORTED, **kwargs)
+    if exp.name == ERR_NOT_PERMITTED:
+        return ReadWriteNotifyError(
+            long_reason=ReadWriteNotifyError.NOT_PERMITTED, **kwargs)
+    if exp.name == ERR_NOT_AUTHORIZED:
+        return ReadWriteNotifyError(
+            long_reason=ReadWriteNotifyError.NOT_AUTHORIZED, **kwargs)
+    if exp.name == ERR_IN_PROGRESS:
+        return ReadWriteNotifyError(
+            long_reason=ReadWriteNotifyError.IN_PROGRESS, **kwargs)
+    if exp.name == ERR_INVALID_VAL_LEN:
+        return InvalidArgumentsError(
+            long_reason=InvalidArgumentsError.INVALID_LEN, **kwargs)
+    if exp.name == ERR_INVALID_ARGUMENTS:
+        return InvalidArgumentsError(
+            long_reason=InvalidArgumentsError.INVALID_ARGS, **kwargs)
+    if exp.name in (ERR_AUTH_FAILED, ERR_AUTH_REJECTED, ERR_AUTH_TIMEOUT,
+                    ERR_AUTH_CANCELED):
+        return PairError(long_reason=PairError.AUTHENTICATION_ERROR, **kwargs)
+    return BluewError(BluewError.UNEXPECTED_ERROR, str(exp), **kwargs)
+
+
+def mac_to_dev(mac: str) -> str:
+    """Convert a mac address to the device part of its object path."""
+    if '/dev_' in mac:
+        return mac
+    return '/dev_' + mac.replace(':', '_').upper()
+
+
+class AsyncBluez(object):
+    """An asyncio client for the bluez D-Bus API."""
+
+    # pylint: disable=too-many-public-methods
+
+    name = 'Wired'
+    version = '0.1.0'
+
+    def __init__(self, cntrl: Optional[str] = None, timeout: float = 5,
+                 bus: Optional[BusConnection] = None,
+                 gatt_cache=None,
+                 recovery_timeout: Optional[float] = None) -> None:
+        # pylint: disable=too-many-arguments
+        self.cntrl = cntrl
+        self.timeout = timeout
+        self.recovery_timeout = timeout if recovery_timeout is None else \
+            recovery_timeout
+        self.bus = bus or BusConnection()
+        self.gatt_cache = open_gatt_cache(
+            gatt_cache)  # type: Optional[GattCache]
+        self._gatt_hashed = set()  # type: Set[str]
+        self._gatt_checked = set()  # type: Set[str]
+        self._tasks = set()  # type: set
+        self._reads = AsyncSingleFlight()
+        self._ops = AsyncOpQueues()
+        self.scheduler = AsyncAdapterScheduler()
+        self.value_cache = ValueCache()
+        self._notify_matches = {}  # type: Dict[str, Any]
+        self._device_matches = {}  # type: Dict[tuple, Any]
+        self._powered = None  # type: Optional[asyncio.Event]
+        self._adapters = None  # type: Optional[Dict[str, dict]]
+        self._devices = None  # type: Optional[DeviceIndex]
+        self.logger = logging.getLogger(__name__)
+
+    async def open(self, address: Optional[str] = None) -> None:
+        """Connect to the bus, and pick the controller to use."""
+        if not self.bus.connected:
+            await self.bus.open(address)
+        # Follow the controllers before looking at them, so that no change
+        # falls in between. Their list is kept from the signals from then
+        # on, and get_controllers() doesn't go to bluez again.
+        self._powered = asyncio.Event()
+        await self.bus.add_match(self._on_adapter_changed, BLUEZ_SERVICE_NAME,
+                                 interface=DBUS_PROP_IFACE,
+                                 member='PropertiesChanged',
+                                 arg0=ADAPTER_IFACE)
+        await self.bus.add_match(self._on_device_changed, BLUEZ_SERVICE_NAME,
+                                 interface=DBUS_PROP_IFACE,
+                                 member='PropertiesChanged',
+                                 arg0=DEVICE_IFACE)
+        await self.bus.add_match(self._on_ifaces_added, BLUEZ_SERVICE_NAME,
+                                 interface=DBUS_OM_IFACE,
+                                 member='InterfacesAdded')
+        await self.bus.add_match(self._on_ifaces_removed, BLUEZ_SERVICE_NAME,
+                                 interface=DBUS_OM_IFACE,
+                                 member='InterfacesRemoved')
+        await self._init_cntrl()
+        await self.bus.add_match(self._on_value_changed, BLUEZ_SERVICE_NAME,
+                                 interface=DBUS_PROP_IFACE,
+                                 member='PropertiesChanged',
+                                 arg0=GATT_CHRC_IFACE)
+
+    def _on_value_changed(self, msg) -> None:
+        changed = msg.body[1]
+        if 'Value' in changed:
+            self.value_cache.update_path(msg.path, bytes(changed['Value']))
+
+    def _is_adapter(self, path: str) -> bool:
+        return self.cntrl is not None and path == self._adapter_path
+
+    @property
+    def _adapter_path(self) -> str:
+        if self.cntrl is None:
+            raise NoControllerAvailable(name=self.name, version=self.version)
+        return BLUEZ_SERVICE_PATH + self.cntrl
+
+    @property
+    def _powered_event(self) -> asyncio.Event:
+        # open() makes it on the loop, Events bind to one before 3.10.
+        if self._powered is None:
+            self._powered = asyncio.Event()
+        return self._powered
+
+    def _set_powered(self, powered: bool) -> None:
+        if powered:
+            self._powered_event.set()
+        else:
+            self._powered_event.clear()
+
+    def _on_adapter_changed(self, msg) -> None:
+        changed, invalidated = msg.body[1], msg.body[2]
+        if self._adapters is not None and msg.path in self._adapters:
+            props = self._adapters[msg.path]
+            props.update(changed)
+            for prop in invalidated:
+                props.pop(prop, None)
+        if self._is_adapter(msg.path) and 'Powered' in changed:
+            self._set_powered(changed['Powered'])
+
+    def _on_device_changed(self, msg) -> None:
+        if self._devices is not None:
+            self._devices.update(msg.path, msg.body[1], msg.body[2])
+
+    def _on_ifaces_added(self, msg) -> None:
+        path, ifaces = msg.body
+        if DEVICE_IFACE in ifaces and self._devices is not None:
+            self._devices.add(path, ifaces[DEVICE_IFACE])
+        if ADAPTER_IFACE not in ifaces:
+            return
+        if self._adapters is not None:
+            self._adapters[path] = dict(ifaces[ADAPTER_IFACE])
+        if self._is_adapter(path):
+            self._set_powered(ifaces[ADAPTER_IFACE].get('Powered', False))
+
+    def _on_ifaces_removed(self, msg) -> None:
+        # A controller that's reset, or replugged, goes away for a moment.
+        path, ifaces = msg.body
+        if DEVICE_IFACE in ifaces and self._devices is not None:
+            self._devices.remove(path)
+        if ADAPTER_IFACE not in ifaces:
+            return
+        if self._adapters is not None:
+            self._adapters.pop(path, None)
+        if self._is_adapter(path):
+            self._powered_event.clear()
+
+    async def close(self) -> None:
+        """Close the connection to the bus."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.bus.aclose()
+        self._adapters = None
+        self._devices = None
+
+    async def _init_cntrl(self) -> None:
+        controllers = await self.get_controllers()
+        paths = [self._strip_cntrl_path(cntrl) for cntrl in controllers]
+        if self.cntrl is None:
+            if not paths:
+                raise NoControllerAvailable(name=self.name,
+                                            version=self.version)
+            self.cntrl = paths[0]
+        elif self.cntrl not in paths:
+            raise ControllerSpecifiedNotFound(name=self.name,
+                                              version=self.version)
+        cntrl = controllers[paths.index(self.cntrl)]
+        self._set_powered(getattr(cntrl, 'Powered'))
+
+    @staticmethod
+    def _strip_cntrl_path(cntrl: Controller) -> str:
+        return getattr(cntrl, 'Path').replace(BLUEZ_SERVICE_PATH, '')
+
+    def _error(self, exp: DBusError) -> BluewError:
+        return to_bluew_error(exp, self.name, self.version)
+
+    def dev_path(self, mac: str) -> str:
+        """Get the object path of a device."""
+        return self._adapter_path + mac_to_dev(mac)
+
+    async def _call(self, path: str, interface: str, member: str,
+                    signature: str = '', body=(),
+                    timeout: Optional[float] = None) -> list:
+        # pylint: disable=too-many-arguments
+        if timeout is None:
+            timeout = max(self.timeout, CALL_TIMEOUT)
+        return await self.bus.call(BLUEZ_SERVICE_NAME, path, interface,
+                                   member, signature, body, timeout)
+
+    async def _attr_call(self, path: str, member: str, signature: str = '',
+                         body=(), iface: str = GATT_CHRC_IFACE) -> list:
+        # pylint: disable=too-many-arguments
+        await self.when_ready()
+        return await self.scheduler.run(GATT, self._call, path, iface,
+                                        member, signature, body)
+
+    async def managed_objects(self) -> Dict[str, Dict[str, dict]]:
+        """GetManagedObjects() on the bluez object manager."""
+        reply = await self._call('/', DBUS_OM_IFACE, 'GetManagedObjects')
+        return reply[0]
+
+    async def _objects(self, iface: str, prefix: str = '') -> List[dict]:
+        objects = await self.managed_objects()
+        parsed = []
+        for path, ifaces in sorted(objects.items()):
+            if iface not in ifaces:
+                continue
+            if prefix and not path.startswith(prefix + '/'):
+                continue
+            props = dict(ifaces[iface])
+            props['Path'] = path
+            parsed.append(props)
+        return parsed
+
+    async def get_controllers(self) -> List[Controller]:
+        """
+        Get the controllers available. Once the client is open, they're
+        listed from the signals it follows, without asking bluez.
+        """
+        if self._adapters is None:
+            objects = await self._objects(ADAPTER_IFACE)
+            if self._powered is not None:
+                self._adapters = {obj.pop('Path'): obj for obj in objects}
+            else:
+                return [Controller(**obj) for obj in objects]
+        return [Controller(Path=path, **props)
+                for path, props in sorted(self._adapters.items())]
+
+    async def get_devices(self) -> List[Device]:
+        """Get the devices known to the controller."""
+        prefix = self._adapter_path
+        objects = await self._objects(DEVICE_IFACE, prefix)
+        return [Device(**obj) for obj in objects]
+
+    async def device_index(self) -> DeviceIndex:
+        """
+        The index of the devices bluez knows about. It's loaded the first
+        time it's asked for, and kept current from the signals from then on.
+        """
+        if self._devices is None:
+            index = DeviceIndex()
+            index.load(await self.managed_objects())
+            self._devices = index
+        return self._devices
+
+    async def find_devices(self, uuid: Optional[str] = None,
+                           name: Optional[str] = None,
+                           manufacturer: Optional[int] = None,
+                           address_type: Optional[str] = None,
+                           min_rssi: Optional[int] = None,
+                           top: Optional[int] = None,
+                           scan: float = 0) -> List[Device]:
+        """
+        Look devices up in the device index, see DeviceIndex.query(). With
+        scan, a scan filtered by uuid and min_rssi runs for up to that many
+        seconds, unless there's top matches already, or until there are.
+        """
+        # pylint: disable=too-many-arguments
+        index = await self.device_index()
+        search = index.search(self._adapter_path, uuid, name,
+                              manufacturer, address_type, min_rssi, top)
+        if search.wants_scan(scan):
+            await self._scan_for(search, scan)
+        return [Device(**obj) for obj in search.found]
+
+    async def _scan_for(self, search: Search, duration: float) -> None:
+        changed = asyncio.Event()
+
+        def _wake(_path):
+            changed.set()
+
+        await self.when_ready()
+        with search.scanning(duration, _wake):
+            try:
+                await self.set_discovery_filter(*search.scan_filter)
+                await self.start_scan()
+                remaining = search.remaining()
+                while remaining:
+                    try:
+                        await asyncio.wait_for(changed.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    changed.clear()
+                    remaining = search.remaining()
+            finally:
+                await self.stop_scan()
+                await self.set_discovery_filter()
+
+    async def get_services(self, mac: str) -> List[BLEService]:
+        """Get the GATT services of a device."""
+        objects = await self._objects(GATT_SERVICE_IFACE, self.dev_path(mac))
+        return [BLEService(**obj) for obj in objects]
+
+    async def get_chrcs(self, mac: str) -> List[BLECharacteristic]:
+        """Get the GATT characteristics of a device."""
+        objects = await self._objects(GATT_CHRC_IFACE, self.dev_path(mac))
+        return [BLECharacteristic(**obj) for obj in objects]
+
+    async def get_descriptors(self, mac: str) -> List[BLEDescriptor]:
+        """Get the GATT descriptors of a device."""
+        objects = await self._objects(GATT_DESC_IFACE, self.dev_path(mac))
+        return [BLEDescriptor(**obj) for obj in objects]
+
+    async def _device_props(self, path: str) -> Optional[dict]:
+        objects = await self.managed_objects()
+        return objects.get(path, {}).get(DEVICE_IFACE)
+
+    @property
+    def powered(self) -> bool:
+        """Whether the controller is powered, as far as signals tell."""
+        return self._powered is not None and self._powered.is_set()
+
+    async def wait_until_powered(self,
+                                 timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the controller to be powered, driven by its Powered
+        property changing, or by it coming back after a reset.
+        :return: False if the timeout expired first.
+        """
+        if self._powered_event.is_set():
+            return True
+        objects = await self.managed_objects()
+        props = objects.get(self._adapter_path, {})
+        if props.get(ADAPTER_IFACE, {}).get('Powered'):
+            self._powered_event.set()
+            return True
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            await asyncio.wait_for(self._powered_event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def when_ready(self) -> None:
+        """
+        Return once the controller is powered. While it's off, or being
+        reset, operations wait here for up to recovery_timeout seconds,
+        and go out as soon as it's back.
+        """
+        if self._powered_event.is_set():
+            return
+        if not await self.wait_until_powered(self.recovery_timeout):
+            raise ControllerNotReady(name=self.name, version=self.version)
+
+    async def _recover(self, exp: DBusError) -> None:
+        # bluez said the controller isn't ready before we heard it went
+        # away, don't trust the flag until bluez says it's powered.
+        self._powered_event.clear()
+        if not await self.wait_until_powered(self.recovery_timeout):
+            raise self._error(exp)
+
+    async def _set_adapter_prop(self, prop: str, value: Variant) -> None:
+        try:
+            await self._call(self._adapter_path,
+                             DBUS_PROP_IFACE, 'Set', 'ssv',
+                             (ADAPTER_IFACE, prop, value))
+        except DBusError as exp:
+            raise self._error(exp)
+
+    async def power(self, on: bool = True) -> None:
+        """
+        Set Powered on the controller. Powering on returns once the
+        controller says it's powered.
+        """
+        # pylint: disable=invalid-name
+        await self._set_adapter_prop('Powered', Variant('b', on))
+        if on and not await self.wait_until_powered():
+            raise ControllerNotReady(name=self.name, version=self.version)
+
+    async def set_discoverable(self, on: bool = True,
+                               timeout: Optional[int] = None) -> None:
+        """
+        Set Discoverable on the controller.
+        :param timeout: Seconds it stays discoverable for, 0 for good.
+        """
+        # pylint: disable=invalid-name
+        if timeout is not None:
+            await self._set_adapter_prop('DiscoverableTimeout',
+                                         Variant('u', timeout))
+        await self._set_adapter_prop('Discoverable', Variant('b', on))
+
+    async def set_pairable(self, on: bool = True,
+                           timeout: Optional[int] = None) -> None:
+        """
+        Set Pairable on the controller.
+        :param timeout: Seconds it stays pairable for, 0 for good.
+        """
+        # pylint: disable=invalid-name
+        if timeout is not None:
+            await self._set_adapter_prop('PairableTimeout',
+                                         Variant('u', timeout))
+        await self._set_adapter_prop('Pairable', Variant('b', on))
+
+    async def set_discovery_filter(self, uuids: Optional[List[str]] = None,
+                                   rssi: Optional[int] = None) -> None:
+        """
+        SetDiscoveryFilter() on the controller, so that scans only report
+        devices advertising one of uuids, at rssi or stronger. Without
+        either, the filter is cleared.
+        """
+        discovery_filter = {}
+        if uuids:
+            discovery_filter['UUIDs'] = Variant('as', list(uuids))
+        if rssi is not None:
+            discovery_filter['RSSI'] = Variant('n', rssi)
+        try:
+            await self.scheduler.run(EXCLUSIVE, self._call,
+                                     self._adapter_path,
+                                     ADAPTER_IFACE, 'SetDiscoveryFilter',
+                                     'a{sv}', (discovery_filter,))
+        except DBusError as exp:
+            # Controllers that can't filter scan unfiltered, the index
+            # query filters what comes in.
+            if not error_is(exp, ERR_NOT_SUPPORTED):
+                raise self._error(exp)
+
+    async def start_scan(self) -> None:
+        """StartDiscovery() on the controller."""
+        await self.when_ready()
+        try:
+            await self.scheduler.run(EXCLUSIVE, self._call,
+                                     self._adapter_path,
+                                     ADAPTER_IFACE, 'StartDiscovery')
+        except DBusError as exp:
+            if not error_is(exp, MSG_OAIP, ERR_IN_PROGRESS):
+                raise self._error(exp)
+
+    async def stop_scan(self) -> None:
+        """StopDiscovery() on the controller."""
+        try:
+            await self.scheduler.run(EXCLUSIVE, self._call,
+                                     self._adapter_path,
+                                     ADAPTER_IFACE, 'StopDiscovery')
+        except DBusError as exp:
+            if not error_is(exp, MSG_NO_DISCOVERY):
+                raise self._error(exp)
+
+    async def wait_for_property(self, path: str, iface: str, prop: str,
+                                check: Callable,
+                                timeout: Optional[float] = None) -> bool:
+        """
+        Wait until check(value) is true for a property, driven by the
+        PropertiesChanged signal.
+        :return: False if the timeout expired first.
+        """
+        # pylint: disable=too-many-arguments
+
+        future = asyncio.get_event_loop().create_future()
+
+        def _on_change(msg):
+            changed_iface, changed = msg.body[0], msg.body[1]
+            if changed_iface == iface and prop in changed and \
+                    check(changed[prop]) and not future.done():
+                future.set_result(True)
+
+        match = await self.bus.add_match(_on_change, BLUEZ_SERVICE_NAME,
+                                         interface=DBUS_PROP_IFACE,
+                                         member='PropertiesChanged',
+                                         path=path)
+        try:
+            objects = await self.managed_objects()
+            props = objects.get(path, {}).get(iface, {})
+            if prop in props and check(props[prop]):
+                return True
+            timeout = self.timeout if timeout is None else timeout
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            await self.bus.remove_match(match)
+
+    async def wait_for_device(self, mac: str) -> bool:
+        """
+        Check that a device is available, scanning for it if it's not known
+        yet. Unlike polling, this returns as soon as bluez adds the device.
+        """
+
+        path = self.dev_path(mac)
+        if await self._device_props(path) is not None:
+            return True
+        found = asyncio.get_event_loop().create_future()
+
+        def _on_added(msg):
+            if msg.body[0] == path and not found.done():
+                found.set_result(True)
+
+        match = await self.bus.add_match(_on_added, BLUEZ_SERVICE_NAME,
+                                         interface=DBUS_OM_IFACE,
+                                         member='InterfacesAdded')
+        try:
+            # Check again, the device might've been added before the match.
+            if await self._device_props(path) is not None:
+                return True
+            await self.start_scan()
+            try:
+                await asyncio.wait_for(found, self.timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                await self.stop_scan()
+        finally:
+            await self.bus.remove_match(match)
+
+    async def _check_available(self, mac: str) -> str:
+        if not await self.wait_for_device(mac):
+            raise DeviceNotAvailable(name=self.name, version=self.version)
+        return self.dev_path(mac)
+
+    async def connect(self, mac: str, wait_for_services: bool = False,
+                      services_timeout: Optional[float] = None
+                      ) -> Optional[float]:
+        """
+        Connect() on the device, and if asked, wait for ServicesResolved.
+        :return: Seconds spent waiting for service discovery, if waiting.
+        """
+        path = await self._check_available(mac)
+        await self.when_ready()
+        try:
+            await self.scheduler.run(EXCLUSIVE, self._call, path,
+                                     DEVICE_IFACE, 'Connect')
+        except DBusError as exp:
+            connected = error_is(exp, ERR_ALREADY_CONNECTED)
+            if not connected and error_is(exp, MSG_OAIP, ERR_IN_PROGRESS):
+                # Someone else is connecting, just wait for the outcome
+                # instead of tearing that connection attempt down.
+                connected = await self.wait_for_property(
+                    path, DEVICE_IFACE, 'Connected', bool)
+            if not connected:
+                raise self._error(exp)
+        if self.gatt_cache is not None:
+            # A new connection, cached paths are checked again.
+            self._gatt_hashed.discard(mac)
+            self._gatt_checked = {checked for checked in self._gatt_checked
+                                  if not checked.startswith(path + '/')}
+            task = asyncio.ensure_future(self._refresh_gatt_cache(mac))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if not wait_for_services:
+            return None
+        start = asyncio.get_event_loop().time()
+        resolved = await self.wait_for_property(
+            path, DEVICE_IFACE, 'ServicesResolved', bool, services_timeout)
+        if not resolved:
+            reason = 'Service discovery did not finish in {} seconds.'
+            raise DeviceNotAvailable(
+                reason.format(services_timeout or self.timeout),
+                self.name, self.version)
+        took = asyncio.get_event_loop().time() - start
+        self.logger.debug('Services of %s resolved in %.3fs', mac, took)
+        return took
+
+    async def disconnect(self, mac: str) -> None:
+        """Disconnect() on the device."""
+        path = self.dev_path(mac)
+        props = await self._device_props(path)
+        if not props or not props.get('Connected'):
+            return
+        try:
+            await self._call(path, DEVICE_IFACE, 'Disconnect')
+        except DBusError as exp:
+            if not error_is(exp, ERR_NOT_CONNECTED, MSG_NOT_CONNECTED):
+                raise self._error(exp)
+
+    async def pair(self, mac: str) -> None:
+        """Pair() on the device, returning when bluez replies."""
+        path = await self._check_available(mac)
+        props = await self._device_props(path)
+        if props and props.get('Paired'):
+            return
+        await self.when_ready()
+        try:
+            await self.scheduler.run(EXCLUSIVE, self._call, path,
+                                     DEVICE_IFACE, 'Pair',
+                                     timeout=max(self.timeout, PAIR_TIMEOUT))
+        except DBusError as exp:
+            if error_is(exp, ERR_FAILED, ERR_CONN_ATTEMPT_FAILED):
+                raise PairError(name=self.name, version=self.version)
+            if not error_is(exp, ERR_ALREADY_EXISTS, ERR_NO_REPLY):
+                raise self._error(exp)
+        # Paired is set before bluez replies, so this only waits after a
+        # reply that D-Bus gave up on.
+        paired = await self.wait_for_property(path, DEVICE_IFACE, 'Paired',
+                                              bool)
+        if not paired:
+            raise PairError(name=self.name, version=self.version)
+
+    async def _set_device_prop(self, mac: str, prop: str, value) -> None:
+        path = await self._check_available(mac)
+        try:
+            await self._call(path, DBUS_PROP_IFACE, 'Set', 'ssv',
+                             (DEVICE_IFACE, prop, value))
+        except DBusError as exp:
+            raise self._error(exp)
+
+    async def trust(self, mac: str) -> None:
+        """Set Trusted to True on the device."""
+        await self._set_device_prop(mac, 'Trusted', Variant('b', True))
+
+    async def distrust(self, mac: str) -> None:
+        """Set Trusted to False on the device."""
+        await self._set_device_prop(mac, 'Trusted', Variant('b', False))
+
+    async def remove(self, mac: str) -> None:
+        """RemoveDevice() on the controller."""
+        try:
+            await self._call(self._adapter_path, ADAPTER_IFACE,
+                             'RemoveDevice', 'o',
+                             (ObjectPath(self.dev_path(mac)),))
+        except DBusError as exp:
+            if not error_is(exp, ERR_DOES_NOT_EXIST):
+                raise self._error(exp)
+
+    async def info(self, mac: str) -> Device:
+        """Get the Device object of a device."""
+        path = await self._check_available(mac)
+        props = dict(await self._device_props(path) or {})
+        props['Path'] = path
+        return Device(**props)
+
+    async def _find_chrc(self, dev_path: str, uuid: str) -> Optional[str]:
+        objects = await self.managed_objects()
+        for path, ifaces in objects.items():
+            chrc = ifaces.get(GATT_CHRC_IFACE)
+            if chrc is not None and chrc.get('UUID') == uuid and \
+                    path.startswith(dev_path + '/'):
+                self.value_cache.learn(path, uuid)
+                return path
+        return None
+
+    async def _refresh_gatt_cache(self, mac: str) -> None:
+        # Validate the cached layout once bluez is done with discovery, and
+        # store the one it found if it's any different.
+        cache = self.gatt_cache
+        if cache is None:
+            return
+        dev_path = self.dev_path(mac)
+        resolved = await self.wait_for_property(
+            dev_path, DEVICE_IFACE, 'ServicesResolved', bool)
+        if not resolved:
+            return
+        layout = gatt_layout(dev_path, await self.managed_objects())
+        db_hash = None
+        hash_path = layout['chrcs'].get(GATT_DB_HASH_UUID)
+        if hash_path is not None:
+            try:
+                with priority(PRIORITY_BACKGROUND):
+                    reply = await self._attr_call(
+                        dev_path + '/' + hash_path, 'ReadValue', 'a{sv}',
+                        ({},))
+                db_hash = bytes(reply[0])
+            except DBusError as exp:
+                self.logger.debug('Could not read GATT hash of %s: %s',
+                                  mac, exp)
+        if cache.store(mac, layout, db_hash):
+            self.logger.debug('Stored GATT layout of %s', mac)
+        if db_hash is not None:
+            self._gatt_hashed.add(mac)
+
+    async def _find_desc(self, dev_path: str, key: str) -> Optional[str]:
+        layout = gatt_layout(dev_path, await self.managed_objects())
+        rel = layout['descs'].get(key)
+        return None if rel is None else dev_path + '/' + rel
+
+    def _cached_path(self, mac: str, uuid: str,
+                     kind: str = 'chrcs') -> Optional[str]:
+        if self.gatt_cache is None:
+            return None
+        rel = self.gatt_cache.lookup(mac, uuid, kind)
+        if rel is None:
+            return None
+        path = self.dev_path(mac) + '/' + rel
+        if kind == 'chrcs':
+            self.value_cache.learn(path, uuid)
+        return path
+
+    async def _trusted_path(self, mac: str, uuid: str,
+                            kind: str = 'chrcs') -> Optional[str]:
+        # A cached path is used once the device's GATT database hash
+        # matches the one its layout was cached with, or without one, once
+        # bluez exports an attribute with the UUID looked up there. Both
+        # are checked once a connection.
+        cache = self.gatt_cache
+        path = self._cached_path(mac, uuid, kind)
+        if cache is None or path is None or path in self._gatt_checked:
+            return path
+        matches = await self._gatt_hash_matches(mac, cache)
+        if matches is False:
+            return None
+        if matches is None:
+            try:
+                reply = await self._call(path, DBUS_PROP_IFACE, 'Get', 'ss',
+                                         (IFACES[kind], 'UUID'))
+            except DBusError:
+                # Not exported yet, the call would fail just the same.
+                return None
+            if not exported_as(uuid, reply[0]):
+                cache.invalidate(mac)
+                return None
+        self._gatt_checked.add(path)
+        return path
+
+    async def _gatt_hash_matches(self, mac: str,
+                                 cache: GattCache) -> Optional[bool]:
+        """Check the device's GATT database hash, None if none is cached."""
+        if mac in self._gatt_hashed:
+            return True
+        if cache.db_hash(mac) is None:
+            return None
+        path = self._cached_path(mac, GATT_DB_HASH_UUID)
+        if path is None:
+            return False
+        try:
+            reply = await self._attr_call(path, 'ReadValue', 'a{sv}', ({},))
+        except DBusError as exp:
+            self.logger.debug('Could not read GATT hash of %s: %s', mac, exp)
+            return False
+        if not cache.verify(mac, bytes(reply[0])):
+            return False
+        self._gatt_hashed.add(mac)
+        return True
+
+    async def _cache_miss(self, mac: str, uuid: str, path: str,
+                          kind: str = 'chrcs') -> str:
+        # A cached path bluez doesn't know. It may just not be exported
+        # yet, so resolve the UUID the slow way, and only drop the cache
+        # if the path was in fact wrong.
+        fresh = await self._uuid_to_path(mac, uuid, cached=False, kind=kind)
+        if fresh != path and self.gatt_cache is not None:
+            self.gatt_cache.invalidate(mac)
+        return fresh
+
+    async def _uuid_to_path(self, mac: str, uuid: str, cached: bool = True,
+                            kind: str = 'chrcs') -> str:
+        """
+        Resolve a characteristic UUID, or a descriptor's desc_key() when
+        kind is 'descs', to its object path.
+        """
+        if cached:
+            path = await self._trusted_path(mac, uuid, kind)
+            if path is not None:
+                return path
+        find = self._find_chrc if kind == 'chrcs' else self._find_desc
+        dev_path = self.dev_path(mac)
+        path = await find(dev_path, uuid)
+        if path is not None:
+            return path
+        await self._check_available(mac)
+        for _ in range(2):
+            path = await find(dev_path, uuid)
+            if path is not None:
+                return path
+            # The characteristic may only show up once bluez is done with
+            # service discovery, wait for that instead of polling.
+            resolved = await self.wait_for_property(
+                dev_path, DEVICE_IFACE, 'ServicesResolved', bool)
+            if not resolved:
+                break
+        raise DeviceNotAvailable(name=self.name, version=self.version)
+
+    async def _gatt(self, mac: str, uuid: str, member: str,
+                    signature: str = '', body=(),
+                    kind: str = 'chrcs') -> list:
+        # pylint: disable=too-many-arguments
+        iface = GATT_CHRC_IFACE if kind == 'chrcs' else GATT_DESC_IFACE
+        path = await self._uuid_to_path(mac, uuid, kind=kind)
+        try:
+            return await self._attr_call(path, member, signature, body,
+                                         iface)
+        except DBusError as exp:
+            if error_is(exp, ERR_UNKNOWN_OBJECT) and \
+                    path == self._cached_path(mac, uuid, kind):
+                path = await self._cache_miss(mac, uuid, path, kind)
+            elif _link_lost(exp):
+                await self.connect(mac)
+            elif _not_paired(exp):
+                await self.pair(mac)
+            elif error_is(exp, ERR_NOT_READY):
+                await self._recover(exp)
+            else:
+                raise self._error(exp)
+        try:
+            return await self._attr_call(path, member, signature, body,
+                                         iface)
+        except DBusError as exp:
+            raise self._error(exp)
+
+    async def read_attribute(self, mac: str, attribute: str,
+                             max_age: Optional[float] = None
+                             ) -> List[bytes]:
+        """
+        ReadValue() on the characteristic. Concurrent reads of the same
+        characteristic share one call. With max_age, the last value read or
+        notified is returned instead, if it's at most that old.
+        """
+        dev_path = self.dev_path(mac)
+        value = None
+        if max_age is not None:
+            value = self.value_cache.get(dev_path, attribute, max_age)
+        if value is None:
+            key = (mac.upper(), attribute)
+            reply = await self._reads.do(
+                key, self._ops.run, key, self._gatt, mac, attribute,
+                'ReadValue', 'a{sv}', ({},))
+            value = bytes(reply[0])
+            self.value_cache.update(dev_path, attribute, value)
+        return [bytes([val]) for val in value]
+
+    async def write_attribute(self, mac: str, attribute: str,
+                              data: List[int]) -> None:
+        """WriteValue() on the characteristic."""
+        await self._ops.run((mac.upper(), attribute), self._gatt, mac,
+                            attribute, 'WriteValue', 'aya{sv}',
+                            (bytes(data), {}))
+
+    async def read_descriptor(self, mac: str, attribute: str,
+                              descriptor: str) -> bytes:
+        """ReadValue() on a descriptor of the characteristic."""
+        reply = await self._ops.run(
+            (mac.upper(), attribute), self._gatt, mac,
+            desc_key(attribute, descriptor), 'ReadValue', 'a{sv}', ({},),
+            'descs')
+        return bytes(reply[0])
+
+    async def write_descriptor(self, mac: str, attribute: str,
+                               descriptor: str, data: List[int]) -> None:
+        """WriteValue() on a descriptor of the characteristic."""
+        await self._ops.run(
+            (mac.upper(), attribute), self._gatt, mac,
+            desc_key(attribute, descriptor), 'WriteValue', 'aya{sv}',
+            (bytes(data), {}), 'descs')
+
+    async def get_mtu(self, mac: str, attribute: str) -> int:
+        """
+        The MTU property of the characteristic, the ATT MTU negotiated with
+        the device. bluez older than 5.62 doesn't have it, DEFAULT_MTU is
+        assumed then.
+        """
+        path = await self._uuid_to_path(mac, attribute)
+        try:
+            reply = await self._call(path, DBUS_PROP_IFACE, 'Get', 'ss',
+                                     (GATT_CHRC_IFACE, 'MTU'))
+        except DBusError as exp:
+            if error_is(exp, ERR_DBUS_INVALID_ARGS):
+                return DEFAULT_MTU
+            raise self._error(exp)
+        return int(reply[0])
+
+    @staticmethod
+    def _offset(offset: int) -> Dict[str, Variant]:
+        if not offset:
+            return {}
+        return {'offset': Variant('q', offset)}
+
+    async def write_long_attribute(self, mac: str, attribute: str,
+                                   data: bytes,
+                                   chunk_size: Optional[int] = None) -> None:
+        """
+        WriteValue() on the characteristic in chunks, each at its offset.
+        Without chunk_size, chunks are as big as the MTU lets them be.
+        """
+        if chunk_size is None:
+            chunk_size = write_chunk_size(await self.get_mtu(mac, attribute))
+        await self._ops.run((mac.upper(), attribute), self._write_long, mac,
+                            attribute, bytes(data), chunk_size)
+
+    async def _write_long(self, mac: str, attribute: str, data: bytes,
+                          chunk_size: int) -> None:
+        for offset, chunk in chunks(data, chunk_size):
+            await self._gatt(mac, attribute, 'WriteValue', 'aya{sv}',
+                             (chunk, self._offset(offset)))
+
+    async def bulk_write(self, mac: str, attribute: str, source,
+                         chunk_size: Optional[int] = None,
+                         window: int = WINDOW, response: bool = False,
+                         checkpoint: int = CHECKPOINT, offset: int = 0,
+                         progress: Optional[Callable] = None) -> BulkStats:
+        """
+        Push source to the characteristic one chunk after the other, see
+        bluew.bulk. The characteristic is looked up once, and up to window
+        writes without response are in flight at a time.
+        """
+        # pylint: disable=too-many-arguments
+        if chunk_size is None:
+            chunk_size = packet_size(await self.get_mtu(mac, attribute))
+        path = await self._uuid_to_path(mac, attribute)
+
+        async def _write(chunk, kind='request'):
+            options = {'type': Variant('s', kind)}
+            try:
+                await self._call(path, GATT_CHRC_IFACE, 'WriteValue',
+                                 'aya{sv}', (chunk, options))
+            except DBusError as exp:
+                raise self._error(exp)
+
+        async def _write_command(chunk):
+            await _write(chunk, 'command')
+
+        def _lane():
+            return self.scheduler.slot(GATT, PRIORITY_BULK)
+
+        return await self._ops.run(
+            (mac.upper(), attribute), async_bulk_write, _write,
+            _write_command, source, chunk_size, window, response,
+            checkpoint, offset, progress, _lane)
+
+    async def read_long_attribute(self, mac: str, attribute: str,
+                                  length: Optional[int] = None,
+                                  chunk_size: Optional[int] = None
+                                  ) -> bytearray:
+        """
+        ReadValue() on the characteristic from increasing offsets, until
+        the value is read. With length, the buffer the value is read into
+        is allocated up front.
+        """
+        if chunk_size is None:
+            chunk_size = read_chunk_size(await self.get_mtu(mac, attribute))
+
+        async def _read_at(offset):
+            reply = await self._gatt(mac, attribute, 'ReadValue', 'a{sv}',
+                                     (self._offset(offset),))
+            return bytes(reply[0])
+
+        value = await self._ops.run((mac.upper(), attribute),
+                                    async_read_long, _read_at, chunk_size,
+                                    length)
+        self.value_cache.update(self.dev_path(mac), attribute, value)
+        return value
+
+    async def notify(self, mac: str, attribute: str,
+                     handler: Callable) -> None:
+        """
+        StartNotify() on the characteristic, and call handler with the
+        bytes of every value notified.
+        """
+        await self._ops.run((mac.upper(), attribute), self._notify, mac,
+                            attribute, handler)
+
+    async def _notify(self, mac: str, attribute: str,
+                      handler: Callable) -> None:
+        path = await self._uuid_to_path(mac, attribute)
+
+        def _on_change(msg):
+            changed = msg.body[1]
+            if msg.body[0] == GATT_CHRC_IFACE and 'Value' in changed:
+                handler(bytes(changed['Value']))
+
+        await self._stop_notify(mac, attribute)
+        match = await self.bus.add_match(_on_change, BLUEZ_SERVICE_NAME,
+                                         interface=DBUS_PROP_IFACE,
+                                         member='PropertiesChanged',
+                                         path=path)
+        try:
+            await self._attr_call(path, 'StartNotify')
+        except DBusError as exp:
+            if not error_is(exp, MSG_ALREADY_NOTIFYING):
+                await self.bus.remove_match(match)
+                if error_is(exp, ERR_UNKNOWN_OBJECT) and \
+                        path == self._cached_path(mac, attribute):
+                    await self._cache_miss(mac, attribute, path)
+                    return await self._notify(mac, attribute, handler)
+                raise self._error(exp)
+        self._notify_matches[path] = match
+
+    async def add_device_listener(self, mac: str, handler: Callable) -> None:
+        """Call handler with the Device1 properties that change."""
+        path = self.dev_path(mac)
+
+        def _on_change(msg):
+            if msg.body[0] == DEVICE_IFACE:
+                handler(dict(msg.body[1]))
+
+        match = await self.bus.add_match(_on_change, BLUEZ_SERVICE_NAME,
+                                         interface=DBUS_PROP_IFACE,
+                                         member='PropertiesChanged',
+                                         path=path)
+        self._device_matches[(path, handler)] = match
+
+    async def remove_device_listener(self, mac: str,
+                                     handler: Callable) -> None:
+        """Stop calling a handler passed to add_device_listener()."""
+        match = self._device_matches.pop((self.dev_path(mac), handler), None)
+        if match is not None:
+            await self.bus.remove_match(match)
+
+    async def stop_notify(self, mac: str, attribute: str) -> None:
+        """StopNotify() on the characteristic."""
+        await self._ops.run((mac.upper(), attribute), self._stop_notify, mac,
+                            attribute)
+
+    async def _stop_notify(self, mac: str, attribute: str) -> None:
+        path = await self._uuid_to_path(mac, attribute)
+        match = self._notify_matches.pop(path, None)
+        if match is None:
+            return
+        await self.bus.remove_match(match)
+        try:
+            await self._attr_call(path, 'StopNotify')
+        except DBusError as exp:
+            if not error_is(exp, MSG_NO_NOTIFY):
+                raise self._error(exp)
@@ -0,0 +1,437 @@
+"""
+bluew.wired.marshal
+~~~~~~~~~~~~~~~~~~~
+
+This module implements the D-Bus wire format: marshalling and unmarshalling
+of values by signature, and of whole messages.
+
+Values are represented with native python objects; integers, floats, bools
+and strings map to themselves, `ay` maps to bytes, arrays to lists, dicts to
+dicts and structs to tuples. Variants are unwrapped when unmarshalling, and
+can be passed either as Variant objects or as plain values whose signature
+is then guessed.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import struct
+
+from typing import Any, List, Optional, Tuple  # noqa: F401
+
+
+PROTOCOL_VERSION = 1
+
+METHOD_CALL = 1
+METHOD_RETURN = 2
+ERROR = 3
+SIGNAL = 4
+
+FLAG_NO_REPLY_EXPECTED = 0x1
+FLAG_NO_AUTO_START = 0x2
+
+HEADER_PATH = 1
+HEADER_INTERFACE = 2
+HEADER_MEMBER = 3
+HEADER_ERROR_NAME = 4
+HEADER_REPLY_SERIAL = 5
+HEADER_DESTINATION = 6
+HEADER_SENDER = 7
+HEADER_SIGNATURE = 8
+HEADER_UNIX_FDS = 9
+
+_HEADER_SIGNATURES = {
+    HEADER_PATH: 'o',
+    HEADER_INTERFACE: 's',
+    HEADER_MEMBER: 's',
+    HEADER_ERROR_NAME: 's',
+    HEADER_REPLY_SERIAL: 'u',
+    HEADER_DESTINATION: 's',
+    HEADER_SENDER: 's',
+    HEADER_SIGNATURE: 'g',
+    HEADER_UNIX_FDS: 'u',
+}
+
+_FIXED = {
+    'y': ('B', 1),
+    'b': ('I', 4),
+    'n': ('h', 2),
+    'q': ('H', 2),
+    'i': ('i', 4),
+    'u': ('I', 4),
+    'x': ('q', 8),
+    't': ('Q', 8),
+    'd': ('d', 8),
+    'h': ('I', 4),
+}
+
+_ALIGNMENT = {
+    's': 4, 'o': 4, 'g': 1, 'a': 4, '(': 8, '{': 8, 'v': 1,
+}
+_ALIGNMENT.update({code: size for code, (_, size) in _FIXED.items()})
+
+
+class MarshalError(Exception):
+    """Raised when a value or a message can't be (un)marshalled."""
+    pass
+
+
+class ObjectPath(str):
+    """A str that marshals as a D-Bus object path when in a variant."""
+    pass
+
+
+class Signature(str):
+    """A str that marshals as a D-Bus signature when in a variant."""
+    pass
+
+
+class Variant(object):
+    """A value along with the signature it should be marshalled with."""
+
+    __slots__ = ('signature', 'value')
+
+    def __init__(self, signature: str, value: Any) -> None:
+        self.signature = signature
+        self.value = value
+
+    def __eq__(self, other):
+        if not isinstance(other, Variant):
+            return False
+        return (self.signature, self.value) == (other.signature, other.value)
+
+    def __repr__(self):
+        return 'Variant({!r}, {!r})'.format(self.signature, self.value)
+
+
+def _type_end(signature: str, start: int) -> int:
+    """Get the index right after the complete type starting at start."""
+    try:
+        code = signature[start]
+    except IndexError:
+        raise MarshalError('Incomplete signature: ' + signature)
+    if code == 'a':
+        return _type_end(signature, start + 1)
+    if code in '({':
+        close = ')' if code == '(' else '}'
+        pos = start + 1
+        while signature[pos] != close:
+            pos = _type_end(signature, pos)
+            if pos >= len(signature):
+                raise MarshalError('Unbalanced signature: ' + signature)
+        return pos + 1
+    if code in _ALIGNMENT:
+        return start + 1
+    raise MarshalError('Unknown type code {!r} in {!r}'.format(
+        code, signature))
+
+
+def split_signature(signature: str) -> List[str]:
+    """Split a signature into its complete types."""
+    types = []
+    pos = 0
+    while pos < len(signature):
+        end = _type_end(signature, pos)
+        types.append(signature[pos:end])
+        pos = end
+    return types
+
+
+def guess_signature(value: Any) -> str:
+    """Guess the signature of a plain python value put in a variant."""
+    # pylint: disable=too-many-return-statements
+    if isinstance(value, Variant):
+        return 'v'
+    if isinstance(value, bool):
+        return 'b'
+    if isinstance(value, int):
+        return 'i'
+    if isinstance(value, float):
+        return 'd'
+    if isinstance(value, ObjectPath):
+        return 'o'
+    if isinstance(value, Signature):
+        return 'g'
+    if isinstance(value, str):
+        return 's'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return 'ay'
+    if isinstance(value, tuple):
+        return '(' + ''.join(guess_signature(val) for val in value) + ')'
+    if isinstance(value, list):
+        if not value:
+            return 'av'
+        return 'a' + guess_signature(value[0])
+    if isinstance(value, dict):
+        if not value:
+            return 'a{sv}'
+        key = next(iter(value))
+        return 'a{' + guess_signature(key) + 'v}'
+    raise MarshalError('Can not guess signature of ' + repr(value))
+
+
+class Marshaller(object):
+    """Serializes values into a buffer, keeping track of alignment."""
+
+    def __init__(self, endian: str = '<') -> None:
+        self.endian = endian
+        self.buf = bytearray()
+
+    def align(self, alignment: int) -> None:
+        """Pad the buffer with zeros up to the alignment given."""
+        padding = -len(self.buf) % alignment
+        if padding:
+            self.buf.extend(b'\0' * padding)
+
+    def write_all(self, signature: str, values) -> None:
+        """Write a sequence of values, one per complete type."""
+        types = split_signature(signature)
+        if len(types) != len(values):
+            raise MarshalError('Signature {!r} does not match {} values'
+                               .format(signature, len(values)))
+        for sig, value in zip(types, values):
+            self.write(sig, value)
+
+    def write(self, signature: str, value: Any) -> None:
+        """Write one value of a single complete type."""
+        # pylint: disable=too-many-branches
+        code = signature[0]
+        fixed = _FIXED.get(code)
+        if fixed is not None:
+            fmt, size = fixed
+            self.align(size)
+            if code == 'b':
+                value = 1 if value else 0
+            self.buf.extend(struct.pack(self.endian + fmt, value))
+        elif code in 'so':
+            data = value.encode('utf-8')
+            self.align(4)
+            self.buf.extend(struct.pack(self.endian + 'I', len(data)))
+            self.buf.extend(data)
+            self.buf.append(0)
+        elif code == 'g':
+            data = value.encode('ascii')
+            self.buf.append(len(data))
+            self.buf.extend(data)
+            self.buf.append(0)
+        elif code == 'v':
+            if isinstance(value, Variant):
+                sig, inner = value.signature, value.value
+            else:
+                sig, inner = guess_signature(value), value
+            self.write('g', sig)
+            self.write(sig, inner)
+        elif code == '(':
+            self.align(8)
+            self.write_all(signature[1:-1], tuple(value))
+        elif code == 'a':
+            self._write_array(signature[1:], value)
+        else:
+            raise MarshalError('Can not marshal signature ' + signature)
+
+    def _write_array(self, elem: str, value: Any) -> None:
+        self.align(4)
+        len_pos = len(self.buf)
+        self.buf.extend(b'\0\0\0\0')
+        self.align(_ALIGNMENT[elem[0]])
+        start = len(self.buf)
+        if elem == 'y':
+            self.buf.extend(bytes(value))
+        elif elem[0] == '{':
+            key_sig, val_sig = split_signature(elem[1:-1])
+            items = value.items() if isinstance(value, dict) else value
+            for key, val in items:
+                self.align(8)
+                self.write(key_sig, key)
+                self.write(val_sig, val)
+        else:
+            for val in value:
+                self.write(elem, val)
+        length = len(self.buf) - start
+        struct.pack_into(self.endian + 'I', self.buf, len_pos, length)
+
+
+class Unmarshaller(object):
+    """Deserializes values from a buffer, keeping track of alignment."""
+
+    def __init__(self, data, endian: str = '<', offset: int = 0) -> None:
+        self.data = data
+        self.endian = endian
+        self.pos = offset
+
+    def align(self, alignment: int) -> None:
+        """Skip the padding up to the alignment given."""
+        self.pos += -self.pos % alignment
+
+    def read_all(self, signature: str) -> list:
+        """Read one value per complete type of the signature."""
+        return [self.read(sig) for sig in split_signature(signature)]
+
+    def read(self, signature: str) -> Any:
+        """Read one value of a single complete type."""
+        # pylint: disable=too-many-return-statements
+        code = signature[0]
+        fixed = _FIXED.get(code)
+        if fixed is not None:
+            fmt, size = fixed
+            self.align(size)
+            value = struct.unpack_from(self.endian + fmt, self.data,
+                                       self.pos)[0]
+            self.pos += size
+            return bool(value) if code == 'b' else value
+        if code in 'so':
+            self.align(4)
+            length = struct.unpack_from(self.endian + 'I', self.data,
+                                        self.pos)[0]
+            start = self.pos + 4
+            self.pos = start + length + 1
+            return bytes(self.data[start:start + length]).decode('utf-8')
+        if code == 'g':
+            length = self.data[self.pos]
+            start = self.pos + 1
+            self.pos = start + length + 1
+            return bytes(self.data[start:start + length]).decode('ascii')
+        if code == 'v':
+            return self.read(self.read('g'))
+        if code == '(':
+            self.align(8)
+            return tuple(self.read_all(signature[1:-1]))
+        if code == 'a':
+            return self._read_array(signature[1:])
+        raise MarshalError('Can not unmarshal signature ' + signature)
+
+    def _read_array(self, elem: str) -> Any:
+        self.align(4)
+        length = struct.unpack_from(self.endian + 'I', self.data, self.pos)[0]
+        self.pos += 4
+        self.align(_ALIGNMENT[elem[0]])
+        end = self.pos + length
+        if elem == 'y':
+            value = bytes(self.data[self.pos:end])
+            self.pos = end
+            return value
+        if elem[0] == '{':
+            key_sig, val_sig = split_signature(elem[1:-1])
+            result = {}
+            while self.pos < end:
+                self.align(8)
+                key = self.read(key_sig)
+                result[key] = self.read(val_sig)
+            return result
+        items = []
+        while self.pos < end:
+            items.append(self.read(elem))
+        return items
+
+
+class Message(object):
+    """A D-Bus message."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, msg_type: int, path: Optional[str] = None,
+                 interface: Optional[str] = None,
+                 member: Optional[str] = None,
+                 error_name: Optional[str] = None,
+                 reply_serial: Optional[int] = None,
+                 destination: Optional[str] = None,
+                 sender: Optional[str] = None,
+                 signature: str = '', body=(), flags: int = 0,
+                 serial: int = 0) -> None:
+        # pylint: disable=too-many-arguments
+        self.type = msg_type
+        self.path = path
+        self.interface = interface
+        self.member = member
+        self.error_name = error_name
+        self.reply_serial = reply_serial
+        self.destination = destination
+        self.sender = sender
+        self.signature = signature
+        self.body = list(body)
+        self.flags = flags
+        self.serial = serial
+
+    def __repr__(self):
+        return ('Message(type={}, path={!r}, interface={!r}, member={!r}, '
+                'error_name={!r}, serial={}, reply_serial={})'
+                .format(self.type, self.path, self.interface, self.member,
+                        self.error_name, self.serial, self.reply_serial))
+
+    def _header_fields(self) -> List[Tuple[int, Variant]]:
+        fields = [
+            (HEADER_PATH, self.path),
+            (HEADER_INTERFACE, self.interface),
+            (HEADER_MEMBER, self.member),
+            (HEADER_ERROR_NAME, self.error_name),
+            (HEADER_REPLY_SERIAL, self.reply_serial),
+            (HEADER_DESTINATION, self.destination),
+            (HEADER_SENDER, self.sender),
+            (HEADER_SIGNATURE, self.signature or None),
+        ]
+        return [(code, Variant(_HEADER_SIGNATURES[code], value))
+                for code, value in fields if value is not None]
+
+    def marshal(self, endian: str = '<') -> bytes:
+        """Serialize the message, ready to be sent on the wire."""
+        body = Marshaller(endian)
+        body.write_all(self.signature, self.body)
+        header = Marshaller(endian)
+        header.buf.extend(struct.pack(
+            endian + 'BBBBII', ord('l') if endian == '<' else ord('B'),
+            self.type, self.flags, PROTOCOL_VERSION, len(body.buf),
+            self.serial))
+        header.write('a(yv)', self._header_fields())
+        header.align(8)
+        return bytes(header.buf + body.buf)
+
+    @staticmethod
+    def endian_of(data) -> str:
+        """Get the struct endianness of a marshalled message."""
+        if data[0] == ord('l'):
+            return '<'
+        if data[0] == ord('B'):
+            return '>'
+        raise MarshalError('Invalid endianness flag: {!r}'.format(data[0]))
+
+    @staticmethod
+    def length(data) -> int:
+        """
+        Get the full length of a message from its first 16 bytes.
+        :param data: At least the first 16 bytes of a message.
+        """
+        endian = Message.endian_of(data)
+        body_len, _, fields_len = struct.unpack_from(endian + 'III', data, 4)
+        header_len = 16 + fields_len
+        return header_len + (-header_len % 8) + body_len
+
+    @classmethod
+    def unmarshal(cls, data) -> 'Message':
+        """Deserialize a complete message."""
+        endian = cls.endian_of(data)
+        msg_type, flags, version, body_len, serial = struct.unpack_from(
+            endian + 'BBBII', data, 1)
+        if version != PROTOCOL_VERSION:
+            raise MarshalError('Unsupported protocol version: {}'
+                               .format(version))
+        reader = Unmarshaller(data, endian, 12)
+        fields = dict(reader.read('a(yv)'))
+        reader.align(8)
+        body_start = reader.pos
+        signature = fields.get(HEADER_SIGNATURE, '')
+        body = []
+        if signature:
+            view = memoryview(data)[body_start:body_start + body_len]
+            body = Unmarshaller(view, endian).read_all(signature)
+        return cls(msg_type,
+                   path=fields.get(HEADER_PATH),
+                   interface=fields.get(HEADER_INTERFACE),
+                   member=fields.get(HEADER_MEMBER),
+                   error_name=fields.get(HEADER_ERROR_NAME),
+                   reply_serial=fields.get(HEADER_REPLY_SERIAL),
+                   destination=fields.get(HEADER_DESTINATION),
+                   sender=fields.get(HEADER_SENDER),
+                   signature=signature, body=body, flags=flags,
+                   serial=serial)
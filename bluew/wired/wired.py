@@ -0,0 +1,300 @@
+"""
+bluew.wired.wired
+~~~~~~~~~~~~~~~~~
+
+This modlule contains an implementation of an EngineBluew class, that runs
+AsyncBluez on an asyncio event loop.
+
+The blocking EngineBluew methods hand the call over to the loop, which is
+the only thread that touches the bus; replies and signals are handled right
+where they're read. Code that already runs an event loop can skip the hop
+by using bluew.wired.AsyncBluez directly.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import asyncio
+import threading
+
+from typing import Callable, List, Optional  # noqa: F401
+
+from bluew.bulk import BulkStats, CHECKPOINT, WINDOW
+from bluew.characteristics import BLECharacteristic
+from bluew.controller import Controller
+from bluew.descriptors import BLEDescriptor
+from bluew.device import Device
+from bluew.engine import EngineBluew, CAP_ASYNC, CAP_MULTI_ADAPTER
+from bluew.errors import BluewError
+from bluew.services import BLEService
+from bluew.wired.bus import DBusError
+from bluew.wired.client import AsyncBluez, to_bluew_error
+
+
+class Wired(EngineBluew):
+    """
+    Wired is an EngineBluew implementation, Using the Bluez D-Bus API
+    through bluew's own asyncio D-Bus connection.
+
+    Besides the usual `cntrl` and `timeout`, it accepts a `bus_address`
+    keyword argument to talk to a bus other than the system bus,
+    `gatt_cache` to keep device GATT layouts on disk, see bluew.gattcache,
+    and `recovery_timeout`, how long operations wait for a controller
+    that's off or being reset, defaults to `timeout`.
+    """
+
+    capabilities = frozenset({CAP_ASYNC, CAP_MULTI_ADAPTER})
+
+    def __init__(self, *args, **kwargs):
+        kwargs['name'] = AsyncBluez.name
+        kwargs['version'] = AsyncBluez.version
+        super().__init__(*args, **kwargs)
+        self.timeout = kwargs.get('timeout', 5)
+        self.client = AsyncBluez(
+            kwargs.get('cntrl', None), self.timeout,
+            gatt_cache=kwargs.get('gatt_cache', None),
+            recovery_timeout=kwargs.get('recovery_timeout', None))
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name='bluew-wired', daemon=True)
+        self._thread.start()
+        try:
+            self._run(self.client.open(kwargs.get('bus_address', None)))
+        except Exception:
+            self.stop_engine()
+            raise
+        self.cntrl = self.client.cntrl
+        self.value_cache = self.client.value_cache
+
+    def __enter__(self):
+        self.start_engine()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop_engine()
+
+    def _run(self, coro):
+        if self._loop is None:
+            raise BluewError(BluewError.UNEXPECTED_ERROR,
+                             'Wired engine was already stopped.',
+                             self.name, self.version)
+        if threading.current_thread() is self._thread:
+            # Waiting here would block the loop the call has to run on.
+            raise BluewError(BluewError.UNEXPECTED_ERROR,
+                             'Wired engine called from its own event loop, '
+                             'hand the call to another thread.',
+                             self.name, self.version)
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result()
+        except DBusError as exp:
+            raise to_bluew_error(exp, self.name, self.version)
+
+    @property
+    def _stopped(self) -> bool:
+        return self._loop is None
+
+    def start_engine(self) -> None:
+        """
+        Overriding EngineBluew's start_engine method. The bus connection is
+        opened with the engine, so there's nothing left to do here.
+        :return: None.
+        """
+        pass
+
+    def stop_engine(self) -> None:
+        """
+        Overriding EngineBluew's stop_engine method. Closes the bus
+        connection and stops the event loop. Safe to call more than once.
+        :return: None.
+        """
+
+        loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        closed = asyncio.run_coroutine_threadsafe(self.client.close(), loop)
+        closed.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(loop.stop))
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+            loop.close()
+
+    @property
+    def devices(self):
+        """A property to get devices nearby."""
+        return self.get_devices()
+
+    @property
+    def controllers(self):
+        """A property to get controllers available."""
+        return self.get_controllers()
+
+    def connect(self, mac: str, wait_for_services: bool = False,
+                services_timeout: Optional[float] = None) -> Optional[float]:
+        """Overriding EngineBluew's connect method."""
+        return self._run(self.client.connect(mac, wait_for_services,
+                                             services_timeout))
+
+    def disconnect(self, mac: str) -> None:
+        """Overriding EngineBluew's disconnect method."""
+        return self._run(self.client.disconnect(mac))
+
+    def pair(self, mac: str) -> None:
+        """Overriding EngineBluew's pair method."""
+        return self._run(self.client.pair(mac))
+
+    def trust(self, mac: str) -> None:
+        """Overriding EngineBluew's trust method."""
+        return self._run(self.client.trust(mac))
+
+    def distrust(self, mac: str) -> None:
+        """Overriding EngineBluew's distrust method."""
+        return self._run(self.client.distrust(mac))
+
+    def remove(self, mac: str) -> None:
+        """Remove a device from the controller."""
+        return self._run(self.client.remove(mac))
+
+    def info(self, mac: str) -> Device:
+        """Overriding EngineBluew's info method."""
+        return self._run(self.client.info(mac))
+
+    def get_devices(self) -> List[Device]:
+        """
+        Overriding EngineBluew's get_devices method. Scans for the timeout
+        set on the engine.
+        :return: List of devices available.
+        """
+
+        async def _scan():
+            await self.client.start_scan()
+            await asyncio.sleep(self.timeout)
+            await self.client.stop_scan()
+            return await self.client.get_devices()
+
+        return self._run(_scan())
+
+    def find_devices(self, uuid: Optional[str] = None,
+                     name: Optional[str] = None,
+                     manufacturer: Optional[int] = None,
+                     address_type: Optional[str] = None,
+                     min_rssi: Optional[int] = None,
+                     top: Optional[int] = None,
+                     scan: float = 0) -> List[Device]:
+        """Overriding EngineBluew's find_devices method."""
+        # pylint: disable=too-many-arguments
+        return self._run(self.client.find_devices(
+            uuid, name, manufacturer, address_type, min_rssi, top, scan))
+
+    def get_controllers(self) -> List[Controller]:
+        """Overriding EngineBluew's get_controllers method."""
+        return self._run(self.client.get_controllers())
+
+    def power(self, on: bool = True) -> None:
+        """Overriding EngineBluew's power method."""
+        # pylint: disable=invalid-name
+        return self._run(self.client.power(on))
+
+    def set_discoverable(self, on: bool = True,
+                         timeout: Optional[int] = None) -> None:
+        """Overriding EngineBluew's set_discoverable method."""
+        # pylint: disable=invalid-name
+        return self._run(self.client.set_discoverable(on, timeout))
+
+    def set_pairable(self, on: bool = True,
+                     timeout: Optional[int] = None) -> None:
+        """Overriding EngineBluew's set_pairable method."""
+        # pylint: disable=invalid-name
+        return self._run(self.client.set_pairable(on, timeout))
+
+    def wait_until_powered(self, timeout: Optional[float] = None) -> bool:
+        """Overriding EngineBluew's wait_until_powered method."""
+        return self._run(self.client.wait_until_powered(timeout))
+
+    def get_services(self, mac: str) -> List[BLEService]:
+        """Overriding EngineBluew's get_services method."""
+        return self._run(self.client.get_services(mac))
+
+    def get_chrcs(self, mac: str) -> List[BLECharacteristic]:
+        """Overriding EngineBluew's get_chrcs method."""
+        return self._run(self.client.get_chrcs(mac))
+
+    def read_attribute(self, mac: str, attribute: str,
+                       max_age: Optional[float] = None) -> List[bytes]:
+        """Overriding EngineBluew's read_attribute method."""
+        return self._run(self.client.read_attribute(mac, attribute, max_age))
+
+    def write_attribute(self, mac: str, attribute: str,
+                        data: List[int]) -> None:
+        """Overriding EngineBluew's write_attribute method."""
+        return self._run(self.client.write_attribute(mac, attribute, data))
+
+    def get_descriptors(self, mac: str) -> List[BLEDescriptor]:
+        """Overriding EngineBluew's get_descriptors method."""
+        return self._run(self.client.get_descriptors(mac))
+
+    def read_descriptor(self, mac: str, attribute: str,
+                        descriptor: str) -> bytes:
+        """Overriding EngineBluew's read_descriptor method."""
+        return self._run(self.client.read_descriptor(mac, attribute,
+                                                     descriptor))
+
+    def write_descriptor(self, mac: str, attribute: str, descriptor: str,
+                         data: List[int]) -> None:
+        """Overriding EngineBluew's write_descriptor method."""
+        return self._run(self.client.write_descriptor(mac, attribute,
+                                                      descriptor, data))
+
+    def get_mtu(self, mac: str, attribute: str) -> int:
+        """Overriding EngineBluew's get_mtu method."""
+        return self._run(self.client.get_mtu(mac, attribute))
+
+    def write_long_attribute(self, mac: str, attribute: str, data: bytes,
+                             chunk_size: Optional[int] = None) -> None:
+        """Overriding EngineBluew's write_long_attribute method."""
+        return self._run(self.client.write_long_attribute(
+            mac, attribute, data, chunk_size))
+
+    def bulk_write(self, mac: str, attribute: str, source,
+                   chunk_size: Optional[int] = None, window: int = WINDOW,
+                   response: bool = False, checkpoint: int = CHECKPOINT,
+                   offset: int = 0,
+                   progress: Optional[Callable] = None) -> BulkStats:
+        """Overriding EngineBluew's bulk_write method."""
+        # pylint: disable=too-many-arguments
+        return self._run(self.client.bulk_write(
+            mac, attribute, source, chunk_size, window, response, checkpoint,
+            offset, progress))
+
+    def read_long_attribute(self, mac: str, attribute: str,
+                            length: Optional[int] = None,
+                            chunk_size: Optional[int] = None) -> bytearray:
+        """Overriding EngineBluew's read_long_attribute method."""
+        return self._run(self.client.read_long_attribute(
+            mac, attribute, length, chunk_size))
+
+    def notify(self, mac: str, attribute: str, handler: Callable) -> None:
+        """
+        Overriding EngineBluew's notify method. The handler is called from
+        the engine's event loop thread, and can't call back into the engine
+        from there.
+        """
+        return self._run(self.client.notify(mac, attribute, handler))
+
+    def stop_notify(self, mac: str, attribute: str) -> None:
+        """Overriding EngineBluew's stop_notify method."""
+        return self._run(self.client.stop_notify(mac, attribute))
+
+    def add_device_listener(self, mac: str, handler: Callable) -> None:
+        """
+        Overriding EngineBluew's add_device_listener method. The handler is
+        called from the engine's event loop thread, and can't call back into
+        the engine from there.
+        """
+        return self._run(self.client.add_device_listener(mac, handler))
+
+    def remove_device_listener(self, mac: str, handler: Callable) -> None:
+        """Overriding EngineBluew's remove_device_listener method."""
+        return self._run(self.client.remove_device_listener(mac, handler))
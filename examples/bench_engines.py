@@ -0,0 +1,79 @@
+"""
+Benchmark the latency of bluew engines, per call.
+
+Against a real device:
+
+    python3 examples/bench_engines.py --mac xx:xx:xx:xx:xx --uuid UUID
+
+Against a fake bluez service on a private bus (needs dbus-daemon, and to be
+run from a source checkout):
+
+    python3 examples/bench_engines.py --fake
+"""
+
+
+import argparse
+import statistics
+import time
+
+from bluew.plugables import get_engine
+
+
+FAKE_MAC = 'AA:BB:CC:DD:EE:FF'
+FAKE_SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+FAKE_UUID = '00002a19-0000-1000-8000-00805f9b34fb'
+
+
+def bench(engine_name, mac, uuid, count, **kwargs):
+    engine = get_engine(engine_name)(**kwargs)
+    try:
+        engine.connect(mac)
+        engine.read_attribute(mac, uuid)
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            engine.read_attribute(mac, uuid)
+            timings.append(time.perf_counter() - start)
+    finally:
+        engine.stop_engine()
+    timings.sort()
+    print('{:8} read_attribute x{}: median {:.3f} ms, p95 {:.3f} ms'.format(
+        engine_name, count, statistics.median(timings) * 1000,
+        timings[int(len(timings) * 0.95) - 1] * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mac', default=FAKE_MAC)
+    parser.add_argument('--uuid', default=FAKE_UUID)
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--engines', default='dbusted,wired')
+    parser.add_argument('--fake', action='store_true')
+    args = parser.parse_args()
+
+    fake = bus = None
+    kwargs = {}
+    if args.fake:
+        import os
+        from tests.fakebluez import FakeBluez, PrivateBus
+        bus = PrivateBus()
+        fake = FakeBluez(bus.address)
+        fake.add_adapter()
+        fake.add_device(FAKE_MAC, services={FAKE_SERVICE: {FAKE_UUID: b'd'}})
+        # dbusted talks to dbus.SystemBus(), which honors this variable.
+        os.environ['DBUS_SYSTEM_BUS_ADDRESS'] = bus.address
+        kwargs['bus_address'] = bus.address
+    try:
+        for name in args.engines.split(','):
+            try:
+                bench(name, args.mac, args.uuid, args.count, **kwargs)
+            except ImportError as exp:
+                print('{:8} skipped: {}'.format(name, exp))
+    finally:
+        if fake is not None:
+            fake.close()
+            bus.close()
+
+
+if __name__ == '__main__':
+    main()
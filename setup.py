@@ -15,21 +15,24 @@ setup(
     author='Ahmed Alsharif (nullp0tr)',
     author_email='ahmeds2000x@gmail.com',
     license='MIT',
-    packages=['bluew', 'bluew/dbusted'],
+    packages=['bluew', 'bluew/dbusted', 'bluew/wired'],
+    entry_points={
+        'console_scripts': ['bluew = bluew.cli:main'],
+    },
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Developers',
         'Topic :: Software Development :: Build Tools',
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.2',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
 
     keywords='bluetooth bluez BLE',
+    python_requires='>=3.7',
     install_requires=[]
 )
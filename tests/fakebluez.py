@@ -0,0 +1,491 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides a private dbus-daemon and a fake bluez service running
+on it, so that engines can be tested without a bluetooth controller.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from bluew.wired.bus import BusConnection, DBusError
+from bluew.wired.marshal import Variant
+
+
+BUS_CONFIG = '''<!DOCTYPE busconfig PUBLIC
+ "-//freedesktop//DTD D-Bus Bus Configuration 1.0//EN"
+ "http://www.freedesktop.org/standards/dbus/1.0/busconfig.dtd">
+<busconfig>
+  <type>session</type>
+  <listen>unix:path={path}</listen>
+  <auth>EXTERNAL</auth>
+  <policy context="default">
+    <allow send_destination="*" eavesdrop="true"/>
+    <allow eavesdrop="true"/>
+    <allow own="*"/>
+  </policy>
+</busconfig>
+'''
+
+OM_IFACE = 'org.freedesktop.DBus.ObjectManager'
+PROP_IFACE = 'org.freedesktop.DBus.Properties'
+ADAPTER_IFACE = 'org.bluez.Adapter1'
+DEVICE_IFACE = 'org.bluez.Device1'
+AGENT_MANAGER_IFACE = 'org.bluez.AgentManager1'
+SERVICE_IFACE = 'org.bluez.GattService1'
+CHRC_IFACE = 'org.bluez.GattCharacteristic1'
+DESC_IFACE = 'org.bluez.GattDescriptor1'
+
+ERR = 'org.bluez.Error.'
+
+
+def have_dbus_daemon():
+    """True if a dbus-daemon binary is available."""
+    return shutil.which('dbus-daemon') is not None
+
+
+class PrivateBus(object):
+    """A dbus-daemon running for the duration of a test."""
+
+    def __init__(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='bluew-bus-')
+        socket_path = os.path.join(self.tmpdir, 'bus')
+        config = os.path.join(self.tmpdir, 'bus.conf')
+        with open(config, 'w') as file:
+            file.write(BUS_CONFIG.format(path=socket_path))
+        self.process = subprocess.Popen(
+            ['dbus-daemon', '--config-file=' + config, '--nofork'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.address = 'unix:path=' + socket_path
+        deadline = time.time() + 5
+        while not os.path.exists(socket_path):
+            if time.time() > deadline:
+                self.close()
+                raise RuntimeError('dbus-daemon did not start')
+            time.sleep(0.01)
+
+    def close(self):
+        """Stop the daemon and clean up."""
+        self.process.terminate()
+        self.process.wait()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+def _variants(props):
+    return {key: val if isinstance(val, Variant) else Variant(
+        _signature(val), val) for key, val in props.items()}
+
+
+def _signature(value):
+    if isinstance(value, bool):
+        return 'b'
+    if isinstance(value, int):
+        return 'n' if -0x8000 <= value < 0x8000 else 'i'
+    if isinstance(value, (bytes, bytearray)):
+        return 'ay'
+    if isinstance(value, list):
+        return 'as'
+    if isinstance(value, dict):
+        return 'a{qv}'
+    return 's'
+
+
+def _passes(device, discovery_filter):
+    # Like bluez, a discovery filter holds back devices that advertise none
+    # of its UUIDs, or that are weaker than its RSSI.
+    uuids = discovery_filter.get('UUIDs')
+    if uuids and not set(uuids) & set(device['UUIDs']):
+        return False
+    rssi = discovery_filter.get('RSSI')
+    return rssi is None or device['RSSI'] >= rssi
+
+
+class FakeBluez(object):
+    """
+    A fake org.bluez service. Devices added with visible=False only appear
+    once discovery is started, if they pass the discovery filter.
+    Connecting to a device resolves its services after `resolve_delay`
+    seconds. Like bluez, overlapping reads or writes of one characteristic
+    fail with InProgress. Reads and writes can be limited to `read_limit`
+    and `write_limit` bytes, like ATT requests. Characteristics get the
+    descriptors given to add_device(). Calls on an adapter that's off or
+    gone, or anything under it, fail with NotReady. Agents registered with
+    the AgentManager1 of /org/bluez are kept in `agents`, but never asked
+    anything.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, address, resolve_delay=0.02):
+        self.address = address
+        self.resolve_delay = resolve_delay
+        self.objects = {}
+        self.hidden = {}
+        self.gatt = {}
+        self.descs = {}
+        self.calls = []
+        self.read_delay = 0
+        self.write_delay = 0
+        self.read_limit = None
+        self.write_limit = None
+        self.busy = set()
+        self.written = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.fail_next = {}
+        self.agents = {}
+        self.loop = asyncio.new_event_loop()
+        self.bus = BusConnection()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       daemon=True)
+        self.thread.start()
+        self._run(self._start())
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(5)
+
+    def call_soon(self, func, *args):
+        """Run func in the service's loop, and wait for it."""
+        async def _call():
+            return func(*args)
+        return self._run(_call())
+
+    async def _start(self):
+        await self.bus.open(self.address)
+        await self.bus.request_name('org.bluez')
+        self.bus.export('/', self._handle)
+
+    def close(self):
+        """Stop the fake service."""
+        self._run(self.bus.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    # ~~ Object tree ~~ #
+
+    def _add(self, path, iface, props, emit=True):
+        self.objects.setdefault(path, {})[iface] = dict(props)
+        self.bus.export(path, self._handle)
+        if emit:
+            self.bus.emit('/', OM_IFACE, 'InterfacesAdded', 'oa{sa{sv}}',
+                          (path, {iface: _variants(props)}))
+
+    def _remove(self, path):
+        ifaces = self.objects.pop(path, {})
+        self.bus.unexport(path)
+        self.bus.emit('/', OM_IFACE, 'InterfacesRemoved', 'oas',
+                      (path, list(ifaces)))
+
+    def set_prop(self, path, iface, prop, value):
+        """Change a property, emitting PropertiesChanged."""
+        self.objects[path][iface][prop] = value
+        self.bus.emit(path, PROP_IFACE, 'PropertiesChanged', 'sa{sv}as',
+                      (iface, _variants({prop: value}), []))
+
+    def add_adapter(self, name='hci0', powered=True):
+        """Add an adapter."""
+        path = '/org/bluez/' + name
+        self.call_soon(self._add, path, ADAPTER_IFACE, {
+            'Address': '00:11:22:33:44:55', 'Name': name, 'Alias': name,
+            'Powered': powered, 'Discovering': False, 'Pairable': True,
+            'Discoverable': False, 'UUIDs': []})
+        return path
+
+    def reset_adapter(self, name='hci0', downtime=0.1):
+        """
+        Take an adapter away, and bring it back powered downtime seconds
+        later, like a controller that's reset.
+        """
+        path = '/org/bluez/' + name
+
+        def _reset():
+            props = dict(self.objects[path][ADAPTER_IFACE], Powered=True)
+            self._remove(path)
+            self.loop.call_later(downtime, self._add, path, ADAPTER_IFACE,
+                                 props)
+        self.call_soon(_reset)
+
+    def _powered(self, path):
+        adapter = '/'.join(path.split('/')[:4])
+        props = self.objects.get(adapter, {}).get(ADAPTER_IFACE)
+        return props is not None and props['Powered']
+
+    def add_device(self, mac, adapter='hci0', visible=True, services=None,
+                   descriptors=None, **props):
+        """
+        Add a device. services maps service UUIDs to dicts of
+        characteristic UUID to initial value, and descriptors maps
+        characteristic UUIDs to dicts of descriptor UUID to value.
+        """
+        # pylint: disable=too-many-arguments
+        path = '/org/bluez/{}/dev_{}'.format(adapter, mac.replace(':', '_'))
+        device = {'Address': mac, 'Name': props.pop('Name', 'fake'),
+                  'Alias': 'fake', 'Adapter': '/org/bluez/' + adapter,
+                  'Connected': False, 'Paired': False, 'Trusted': False,
+                  'Blocked': False, 'ServicesResolved': False,
+                  'UUIDs': list(services or {}), 'RSSI': -50}
+        device.update(props)
+        self.gatt[path] = services or {}
+        self.descs[path] = descriptors or {}
+        if visible:
+            self.call_soon(self._add, path, DEVICE_IFACE, device, False)
+        else:
+            self.hidden[path] = device
+        return path
+
+    def chrc_path(self, dev_path, uuid):
+        """Get the path a characteristic is (or will be) exported at."""
+        index = 0
+        for srv_index, chrcs in enumerate(self.gatt[dev_path].values()):
+            for chrc_uuid in chrcs:
+                index += 1
+                if chrc_uuid == uuid:
+                    return '{}/service{:04x}/char{:04x}'.format(
+                        dev_path, srv_index, index)
+        raise KeyError(uuid)
+
+    def _resolve(self, dev_path):
+        index = 0
+        for srv_index, (srv_uuid, chrcs) in enumerate(
+                self.gatt[dev_path].items()):
+            srv_path = '{}/service{:04x}'.format(dev_path, srv_index)
+            self._add(srv_path, SERVICE_IFACE, {
+                'UUID': srv_uuid, 'Primary': True, 'Device': dev_path})
+            for chrc_uuid, value in chrcs.items():
+                index += 1
+                chrc_path = '{}/char{:04x}'.format(srv_path, index)
+                self._add(chrc_path, CHRC_IFACE, {
+                    'UUID': chrc_uuid, 'Service': srv_path,
+                    'Value': bytes(value), 'Notifying': False,
+                    'Flags': ['read', 'write', 'notify'], 'MTU': 23})
+                descs = self.descs[dev_path].get(chrc_uuid, {})
+                for desc_index, (desc_uuid, desc_value) in enumerate(
+                        descs.items()):
+                    self._add('{}/desc{:04x}'.format(chrc_path, desc_index),
+                              DESC_IFACE, {
+                                  'UUID': desc_uuid,
+                                  'Characteristic': chrc_path,
+                                  'Value': bytes(desc_value),
+                                  'Flags': ['read', 'write']})
+        self.set_prop(dev_path, DEVICE_IFACE, 'ServicesResolved', True)
+
+    def _unresolve(self, dev_path):
+        for path in sorted(self.objects, reverse=True):
+            if path.startswith(dev_path + '/'):
+                self._remove(path)
+
+    def notify(self, chrc_path, value):
+        """Send a notification from a characteristic."""
+        self.call_soon(self.set_prop, chrc_path, CHRC_IFACE, 'Value',
+                       bytes(value))
+
+    def disconnect(self, dev_path):
+        """Drop the link to a device, as if it went out of range."""
+        def _drop():
+            self.set_prop(dev_path, DEVICE_IFACE, 'Connected', False)
+            self.set_prop(dev_path, DEVICE_IFACE, 'ServicesResolved', False)
+            self._unresolve(dev_path)
+        self.call_soon(_drop)
+
+    # ~~ Method calls ~~ #
+
+    async def _handle(self, msg):
+        self.calls.append((msg.path, msg.member))
+        failure = self.fail_next.pop(msg.member, None)
+        if failure is not None:
+            raise DBusError(*failure)
+        if msg.interface == OM_IFACE and msg.member == 'GetManagedObjects':
+            objects = {path: {iface: _variants(props)
+                              for iface, props in ifaces.items()}
+                       for path, ifaces in self.objects.items()}
+            return 'a{oa{sa{sv}}}', (objects,)
+        if msg.interface == PROP_IFACE:
+            return self._properties(msg)
+        if msg.interface == AGENT_MANAGER_IFACE:
+            return self._agent_manager(msg)
+        ifaces = self.objects.get(msg.path)
+        if ifaces is None or msg.interface not in ifaces:
+            raise DBusError('org.freedesktop.DBus.Error.UnknownObject',
+                            msg.path)
+        if not self._powered(msg.path):
+            raise DBusError(ERR + 'NotReady', 'Resource Not Ready')
+        handler = getattr(self, '_{}_{}'.format(
+            msg.interface.rsplit('.', 1)[1], msg.member), None)
+        if handler is None:
+            raise DBusError('org.freedesktop.DBus.Error.UnknownMethod',
+                            msg.member)
+        result = handler(msg)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    def _properties(self, msg):
+        iface = msg.body[0]
+        props = self.objects.get(msg.path, {}).get(iface)
+        if props is None:
+            raise DBusError('org.freedesktop.DBus.Error.UnknownObject',
+                            msg.path)
+        if msg.member == 'GetAll':
+            return 'a{sv}', (_variants(props),)
+        if msg.member == 'Get':
+            if msg.body[1] not in props:
+                raise DBusError('org.freedesktop.DBus.Error.InvalidArgs',
+                                'No such property ' + msg.body[1])
+            value = props[msg.body[1]]
+            return 'v', (Variant(_signature(value), value),)
+        if msg.member == 'Set':
+            self.set_prop(msg.path, iface, msg.body[1], msg.body[2])
+            return None
+        raise DBusError('org.freedesktop.DBus.Error.UnknownMethod',
+                        msg.member)
+
+    def _agent_manager(self, msg):
+        if msg.path != '/org/bluez':
+            raise DBusError('org.freedesktop.DBus.Error.UnknownObject',
+                            msg.path)
+        if msg.member == 'RegisterAgent':
+            self.agents[msg.sender] = msg.body[0]
+        elif msg.member == 'UnregisterAgent':
+            self.agents.pop(msg.sender, None)
+        elif msg.member != 'RequestDefaultAgent':
+            raise DBusError('org.freedesktop.DBus.Error.UnknownMethod',
+                            msg.member)
+
+    def _Adapter1_StartDiscovery(self, msg):
+        # pylint: disable=invalid-name
+        self.set_prop(msg.path, ADAPTER_IFACE, 'Discovering', True)
+        discovery_filter = self.objects[msg.path][ADAPTER_IFACE].get(
+            'Filter', {})
+        for path, device in list(self.hidden.items()):
+            if path.startswith(msg.path + '/') and \
+                    _passes(device, discovery_filter):
+                del self.hidden[path]
+                self.loop.call_later(0.01, self._add, path, DEVICE_IFACE,
+                                     device)
+
+    def _Adapter1_StopDiscovery(self, msg):
+        # pylint: disable=invalid-name
+        if not self.objects[msg.path][ADAPTER_IFACE]['Discovering']:
+            raise DBusError(ERR + 'Failed', 'No discovery started')
+        self.set_prop(msg.path, ADAPTER_IFACE, 'Discovering', False)
+
+    def _Adapter1_SetDiscoveryFilter(self, msg):
+        # pylint: disable=invalid-name
+        self.objects[msg.path][ADAPTER_IFACE]['Filter'] = msg.body[0]
+
+    def _Adapter1_RemoveDevice(self, msg):
+        # pylint: disable=invalid-name
+        path = msg.body[0]
+        if path not in self.objects:
+            raise DBusError(ERR + 'DoesNotExist', 'Does Not Exist')
+        self._unresolve(path)
+        self._remove(path)
+
+    def _Device1_Connect(self, msg):
+        # pylint: disable=invalid-name
+        device = self.objects[msg.path][DEVICE_IFACE]
+        if device['Connected']:
+            raise DBusError(ERR + 'AlreadyConnected', 'Already Connected')
+        self.set_prop(msg.path, DEVICE_IFACE, 'Connected', True)
+        self.loop.call_later(self.resolve_delay, self._resolve, msg.path)
+
+    def _Device1_Disconnect(self, msg):
+        # pylint: disable=invalid-name
+        device = self.objects[msg.path][DEVICE_IFACE]
+        if not device['Connected']:
+            raise DBusError(ERR + 'NotConnected', 'Not Connected')
+        self.set_prop(msg.path, DEVICE_IFACE, 'Connected', False)
+        self.set_prop(msg.path, DEVICE_IFACE, 'ServicesResolved', False)
+        self._unresolve(msg.path)
+
+    def _Device1_Pair(self, msg):
+        # pylint: disable=invalid-name
+        device = self.objects[msg.path][DEVICE_IFACE]
+        if device['Paired']:
+            raise DBusError(ERR + 'AlreadyExists', 'Already Exists')
+        self.set_prop(msg.path, DEVICE_IFACE, 'Paired', True)
+
+    def _check_connected(self, chrc_path):
+        dev_path = chrc_path.split('/service')[0]
+        if not self.objects[dev_path][DEVICE_IFACE]['Connected']:
+            raise DBusError(ERR + 'Failed', 'Not connected')
+
+    async def _GattCharacteristic1_ReadValue(self, msg):
+        # pylint: disable=invalid-name
+        self._check_connected(msg.path)
+        await self._hold(msg.path, self.read_delay)
+        value = self.objects[msg.path][CHRC_IFACE]['Value']
+        offset = msg.body[0].get('offset', 0)
+        end = None if self.read_limit is None else offset + self.read_limit
+        return 'ay', (value[offset:end],)
+
+    async def _hold(self, path, delay):
+        if path in self.busy:
+            raise DBusError(ERR + 'InProgress', 'In Progress')
+        self.busy.add(path)
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+        finally:
+            self.busy.discard(path)
+
+    async def _GattCharacteristic1_WriteValue(self, msg):
+        # pylint: disable=invalid-name
+        self._check_connected(msg.path)
+        data, options = msg.body
+        if self.write_limit is not None and len(data) > self.write_limit:
+            raise DBusError(ERR + 'InvalidValueLength', 'Invalid Length')
+        if options.get('type') == 'command':
+            # bluez sends these in order, without waiting for the device, so
+            # any number can be in flight.
+            self.written.append(bytes(data))
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                await asyncio.sleep(self.write_delay)
+            finally:
+                self.in_flight -= 1
+        else:
+            await self._hold(msg.path, self.write_delay)
+            self.written.append(bytes(data))
+        value = bytearray(self.objects[msg.path][CHRC_IFACE]['Value'])
+        offset = options.get('offset', 0)
+        value[offset:offset + len(data)] = data
+        self.objects[msg.path][CHRC_IFACE]['Value'] = bytes(value)
+
+    def _GattDescriptor1_ReadValue(self, msg):
+        # pylint: disable=invalid-name
+        self._check_connected(msg.path)
+        return 'ay', (self.objects[msg.path][DESC_IFACE]['Value'],)
+
+    def _GattDescriptor1_WriteValue(self, msg):
+        # pylint: disable=invalid-name
+        self._check_connected(msg.path)
+        self.objects[msg.path][DESC_IFACE]['Value'] = bytes(msg.body[0])
+
+    def _GattCharacteristic1_StartNotify(self, msg):
+        # pylint: disable=invalid-name
+        self._check_connected(msg.path)
+        props = self.objects[msg.path][CHRC_IFACE]
+        if props['Notifying']:
+            raise DBusError(ERR + 'Failed', 'Already notifying')
+        self.set_prop(msg.path, CHRC_IFACE, 'Notifying', True)
+
+    def _GattCharacteristic1_StopNotify(self, msg):
+        # pylint: disable=invalid-name
+        props = self.objects[msg.path][CHRC_IFACE]
+        if not props['Notifying']:
+            raise DBusError(ERR + 'Failed', 'No notify session started')
+        self.set_prop(msg.path, CHRC_IFACE, 'Notifying', False)
@@ -0,0 +1,120 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for the pairing agent of DBusted, and pairing
+through it against a fake bluez service. They're skipped if dbus-python
+isn't installed.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import os
+from unittest import TestCase, mock, skipUnless
+
+from bluew.errors import PairError
+from tests.fakebluez import (DEVICE_IFACE, ERR, FakeBluez, PrivateBus,
+                             have_dbus_daemon)
+
+try:
+    from bluew.dbusted import DBusted, agent
+except ImportError:  # pragma: no cover
+    DBusted = agent = None
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+DEVICE = '/org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF'
+OTHER = '/org/bluez/hci0/dev_AA_BB_CC_DD_EE_00'
+
+
+@skipUnless(agent is not None, 'dbus-python not installed')
+class AgentTest(TestCase):
+    """Tests for bluew.dbusted.agent."""
+
+    def test_expected_answers(self):
+        """Test answering with the passkey and pincode of the device."""
+
+        pairing = agent.Agent()
+        with pairing.expect(DEVICE, 123456, '0000'), \
+                pairing.expect(OTHER, 111111):
+            self.assertEqual(pairing.RequestPasskey(DEVICE), 123456)
+            self.assertEqual(pairing.RequestPinCode(DEVICE), '0000')
+            pairing.RequestConfirmation(DEVICE, 123456)
+            self.assertRaises(agent.Rejected, pairing.RequestConfirmation,
+                              DEVICE, 111111)
+            self.assertEqual(pairing.RequestPasskey(OTHER), 111111)
+            self.assertRaises(agent.Rejected, pairing.RequestPinCode, OTHER)
+        pairing.RequestAuthorization(DEVICE)
+        pairing.AuthorizeService(DEVICE,
+                                 '0000180f-0000-1000-8000-00805f9b34fb')
+
+    def test_no_answers(self):
+        """Test rejecting requests there's nothing to answer with."""
+
+        blank = agent.Agent()
+        with blank.expect(OTHER, 123456):
+            pass
+        self.assertRaises(agent.Rejected, blank.RequestPasskey, DEVICE)
+        self.assertRaises(agent.Rejected, blank.RequestPasskey, OTHER)
+        self.assertRaises(agent.Rejected, blank.RequestPinCode, DEVICE)
+        blank.RequestConfirmation(DEVICE, 123456)
+
+    def test_register_once(self):
+        """Test that a bus connection gets one agent."""
+
+        bus = mock.Mock()
+        bus.get_unique_name.return_value = ':1.42'
+        target = 'bluew.dbusted.agent.BluezAgentManagerInterface'
+        with mock.patch(target) as manager, \
+                mock.patch.object(agent, 'Agent') as factory, \
+                mock.patch.dict(agent._AGENTS):  # pylint: disable=W0212
+            first = agent.register(bus)
+            second = agent.register(bus)
+        self.assertIs(first, second)
+        factory.assert_called_once_with(bus, agent.AGENT_PATH)
+        manager.assert_called_once_with(bus, agent.AGENT_PATH,
+                                        'NoInputNoOutput')
+
+
+@skipUnless(agent is not None, 'dbus-python not installed')
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class PairTest(TestCase):
+    """Tests for DBusted.pair() against a fake bluez service."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.dev_path = self.fake.add_device(MAC)
+        self.env = mock.patch.dict(
+            os.environ, {'DBUS_SYSTEM_BUS_ADDRESS': self.bus.address})
+        self.env.start()
+        self.engine = DBusted(timeout=2)
+
+    def tearDown(self):
+        self.engine.stop_engine()
+        self.env.stop()
+        self.fake.close()
+        self.bus.close()
+
+    def _paired(self):
+        return self.fake.objects[self.dev_path][DEVICE_IFACE]['Paired']
+
+    def test_pair(self):
+        """Test pairing, with the agent registered."""
+
+        self.engine.pair(MAC)
+        self.assertTrue(self._paired())
+        self.assertEqual(list(self.fake.agents.values()), [agent.AGENT_PATH])
+
+    def test_pair_failed(self):
+        """Test that a Pair() bluez fails raises PairError, unpaired."""
+
+        for error in ('AuthenticationCanceled', 'ConnectionAttemptFailed',
+                      'Failed'):
+            self.fake.fail_next['Pair'] = (ERR + error, error)
+            self.assertRaises(PairError, self.engine.pair, MAC)
+            self.assertFalse(self._paired())
@@ -0,0 +1,138 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for windowed aggregation of notifications.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import struct
+import time
+from unittest import TestCase, skipUnless
+
+from bluew.aggregate import TIME, Aggregate, Pipeline
+from bluew.connections import Connection
+from tests.fakebluez import FakeBluez, PrivateBus, have_dbus_daemon
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000181a-0000-1000-8000-00805f9b34fb'
+TEMPERATURE = '00002a6e-0000-1000-8000-00805f9b34fb'
+
+
+class AggregateTest(TestCase):
+    """Tests for bluew.aggregate.Aggregate."""
+
+    def test_tumbling_count(self):
+        """Test windows of a number of samples, one after the other."""
+
+        windows = []
+        stage = Aggregate(windows.append, size=4)
+        stage(bytes([1, 2, 3]))
+        self.assertEqual(windows, [])
+        stage(bytes([4, 5, 6, 7, 8, 9]))
+        self.assertEqual([(w.count, w.min, w.max, w.mean) for w in windows],
+                         [(4, 1, 4, 2.5), (4, 5, 8, 6.5)])
+        self.assertEqual(stage.flush().mean, 9)
+        self.assertIsNone(stage.flush())
+        stage(bytes([10] * 4))
+        self.assertEqual(windows[-1].mean, 10)
+
+    def test_sliding_count(self):
+        """Test windows starting every step samples."""
+
+        windows = []
+        stage = Aggregate(windows.append, size=4, step=2)
+        stage.add(list(range(8)))
+        self.assertEqual([w.mean for w in windows], [1.5, 3.5, 5.5])
+
+    def test_hopping_count(self):
+        """Test windows with samples left out in between."""
+
+        windows = []
+        stage = Aggregate(windows.append, size=2, step=3)
+        for value in range(9):
+            stage.add([value])
+        self.assertEqual([w.mean for w in windows], [0.5, 3.5, 6.5])
+
+    def test_time(self):
+        """Test timed windows, including gaps without samples."""
+
+        windows = []
+        stage = Aggregate(windows.append, size=1.0, by=TIME)
+        stage.add([1, 3], timestamp=10.0)
+        stage.add([5], timestamp=10.5)
+        stage.add([7], timestamp=11.2)
+        self.assertEqual(windows[0][:3], (10.0, 11.0, 3))
+        self.assertEqual(windows[0].mean, 3)
+        stage.add([9], timestamp=15.5)
+        self.assertEqual(len(windows), 2)
+        self.assertEqual(windows[1][:3], (11.0, 12.0, 1))
+        window = stage.flush()
+        self.assertEqual((window.start, window.count, window.min),
+                         (15.0, 1, 9))
+
+    def test_sliding_time(self):
+        """Test timed windows starting every step seconds."""
+
+        windows = []
+        stage = Aggregate(windows.append, size=1.0, step=0.5, by=TIME)
+        for index in range(5):
+            stage.add([index], timestamp=index * 0.5)
+        self.assertEqual([(w.start, w.count) for w in windows],
+                         [(0.0, 2), (0.5, 2), (1.0, 2)])
+
+    def test_decode(self):
+        """Test decoding values into samples."""
+
+        windows = []
+        stage = Aggregate(windows.append, size=3,
+                          decode=lambda value: struct.unpack('<h', value)[0])
+        for sample in (-100, 50, 200):
+            stage(struct.pack('<h', sample))
+        self.assertEqual((windows[0].min, windows[0].max), (-100, 200))
+        self.assertRaises(ValueError, Aggregate, print, 2.5)
+        self.assertRaises(ValueError, Aggregate, print, 2, by='bytes')
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class PipelineTest(TestCase):
+    """Tests for aggregating notifications of a connection."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.dev_path = self.fake.add_device(
+            MAC, services={SERVICE: {TEMPERATURE: b'\x00\x00'}})
+        self.connection = Connection(MAC, engine='wired',
+                                     bus_address=self.bus.address,
+                                     wait_for_services=True, reconnect=False)
+
+    def tearDown(self):
+        self.connection.close()
+        self.fake.close()
+        self.bus.close()
+
+    def test_subscribe(self):
+        """Test that only aggregates are delivered."""
+
+        windows = []
+        chrc = self.fake.chrc_path(self.dev_path, TEMPERATURE)
+        with Pipeline(self.connection) as pipeline:
+            pipeline.subscribe(
+                TEMPERATURE, windows.append, size=10,
+                decode=lambda value: struct.unpack('<h', value)[0] / 100)
+            for sample in range(25):
+                self.fake.notify(chrc, struct.pack('<h', 2000 + sample))
+            deadline = time.monotonic() + 2
+            while len(windows) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.05)
+        self.assertEqual(len(windows), 3)
+        self.assertAlmostEqual(windows[0].mean, 20.045)
+        self.assertEqual(windows[2].count, 5)
@@ -0,0 +1,298 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for bulk transfers.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import asyncio
+import io
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from unittest import TestCase, skipUnless
+
+from bluew.bulk import (async_bulk_write, bulk_write, read_chunks,
+                        resumable, source_size)
+from bluew.errors import BulkWriteError
+from bluew.scheduler import AsyncAdapterScheduler, GATT, PRIORITY_BULK
+from bluew.wired import Wired
+from tests.fakebluez import FakeBluez, PrivateBus, have_dbus_daemon
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+OTA = '00002a19-0000-1000-8000-00805f9b34fb'
+IMAGE = bytes(range(256)) * 40
+
+
+class _Device(object):
+    """
+    Records writes, completing writes without response in order on another
+    thread, like the main loop thread of an engine.
+    """
+
+    def __init__(self, fail_at=None):
+        self.written = []
+        self.kinds = []
+        self.in_flight = 0
+        self.peak = 0
+        self.fail_at = fail_at
+        self.lock = threading.Lock()
+        self.commands = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            chunk, done = self.commands.get()
+            time.sleep(0.0005)
+            with self.lock:
+                self.in_flight -= 1
+            try:
+                self._record(chunk, 'command')
+            except IOError as exp:
+                done(exp)
+            else:
+                done(None)
+
+    def _record(self, chunk, kind):
+        with self.lock:
+            if self.fail_at is not None and len(self.written) == self.fail_at:
+                raise IOError('link lost')
+            self.written.append(chunk)
+            self.kinds.append(kind)
+
+    def write(self, chunk):
+        self._record(chunk, 'request')
+
+    def write_command(self, chunk, done):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        self.commands.put((chunk, done))
+
+
+class SourceTest(TestCase):
+    """Tests for reading bulk transfer sources."""
+
+    def test_bytes(self):
+        """Test chunking bytes-like sources from an offset."""
+
+        self.assertEqual(list(read_chunks(b'abcdefg', 3)),
+                         [b'abc', b'def', b'g'])
+        self.assertEqual(list(read_chunks(bytearray(b'abcdefg'), 3, 4)),
+                         [b'efg'])
+        self.assertEqual(source_size(memoryview(b'abc')), 3)
+        self.assertRaises(ValueError, read_chunks, b'abc', 0)
+
+    def test_file(self):
+        """Test chunking files, seeking to the offset."""
+
+        image = io.BytesIO(b'abcdefg')
+        self.assertEqual(source_size(image), 7)
+        self.assertEqual(list(read_chunks(image, 3, 2)), [b'cde', b'fg'])
+        self.assertTrue(resumable(image))
+
+    def test_iterable(self):
+        """Test re-chunking iterables of bytes."""
+
+        pieces = iter([b'ab', b'cdefg', b'', b'h'])
+        self.assertEqual(list(read_chunks(pieces, 3, 1)),
+                         [b'bcd', b'efg', b'h'])
+        self.assertIsNone(source_size(pieces))
+        self.assertFalse(resumable(pieces))
+
+
+class BulkWriteTest(TestCase):
+    """Tests for bluew.bulk.bulk_write."""
+
+    def test_window(self):
+        """Test that writes go in order, in a window, with checkpoints."""
+
+        device = _Device()
+        seen = []
+        stats = bulk_write(device.write, device.write_command, IMAGE, 100,
+                           window=4, checkpoint=1000,
+                           progress=lambda stats: seen.append(stats.sent))
+        self.assertEqual(b''.join(device.written), IMAGE)
+        self.assertLessEqual(device.peak, 4)
+        self.assertEqual(device.kinds[-1], 'request')
+        self.assertEqual(stats.checkpoints, device.kinds.count('request'))
+        self.assertEqual(stats.checkpoints, len(IMAGE) // 1000 + 1)
+        self.assertEqual(stats.acked, len(IMAGE))
+        self.assertEqual(stats.chunks, len(seen))
+        self.assertEqual(seen[-1], len(IMAGE))
+        self.assertGreater(stats.throughput, 0)
+
+    def test_response(self):
+        """Test writing every chunk with response."""
+
+        device = _Device()
+        bulk_write(device.write, device.write_command, IMAGE[:500], 100,
+                   response=True)
+        self.assertEqual(device.kinds, ['request'] * 5)
+
+    def test_failure_offset(self):
+        """Test that a failed transfer resumes from its last checkpoint."""
+
+        device = _Device(fail_at=25)
+        with self.assertRaises(BulkWriteError) as context:
+            bulk_write(device.write, device.write_command, IMAGE, 100,
+                       checkpoint=1000)
+        offset = context.exception.offset
+        self.assertEqual(offset % 1000, 0)
+        self.assertLessEqual(offset, 2500)
+        self.assertTrue(IMAGE.startswith(b''.join(device.written)[:offset]))
+        device = _Device()
+        stats = bulk_write(device.write, device.write_command, IMAGE, 100,
+                           offset=offset)
+        self.assertEqual(b''.join(device.written), IMAGE[offset:])
+        self.assertEqual(stats.start_offset, offset)
+
+    def test_lane(self):
+        """Test that the lane is given back between stretches."""
+
+        device = _Device()
+        stretches = []
+
+        @contextmanager
+        def _lane():
+            start = len(device.written) + device.in_flight
+            yield
+            # Nothing is left in flight when the slot is given back.
+            self.assertEqual(device.in_flight, 0)
+            stretches.append(len(device.written) - start)
+
+        bulk_write(device.write, device.write_command, IMAGE, 100, window=4,
+                   checkpoint=1000, lane=_lane)
+        self.assertEqual(b''.join(device.written), IMAGE)
+        self.assertEqual(sum(stretches), len(device.written))
+        self.assertLessEqual(max(stretches), 4)
+        self.assertLessEqual(device.peak, 4)
+
+    def test_lane_released_on_failure(self):
+        """Test that a failed transfer gives its slot back."""
+
+        device = _Device(fail_at=10)
+        held = []
+
+        @contextmanager
+        def _lane():
+            held.append(True)
+            try:
+                yield
+            finally:
+                held.pop()
+
+        self.assertRaises(BulkWriteError, bulk_write, device.write,
+                          device.write_command, IMAGE, 100, lane=_lane)
+        self.assertEqual(held, [])
+
+    def test_async(self):
+        """Test the asyncio transfer."""
+
+        written = []
+        in_flight = [0, 0]
+
+        async def _write(chunk):
+            written.append(chunk)
+
+        async def _write_command(chunk):
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+            await asyncio.sleep(0.001)
+            in_flight[0] -= 1
+            written.append(chunk)
+
+        stats = asyncio.run(async_bulk_write(
+            _write, _write_command, io.BytesIO(IMAGE), 100, window=3))
+        self.assertEqual(b''.join(written), IMAGE)
+        self.assertEqual(in_flight[1], 3)
+        self.assertEqual(stats.sent, len(IMAGE))
+
+    def test_async_lane(self):
+        """Test the asyncio transfer, in stretches of the window."""
+
+        scheduler = AsyncAdapterScheduler(gatt_slots=1)
+        order = []
+
+        async def _write(chunk):
+            order.append('bulk')
+
+        async def _read():
+            order.append('read')
+
+        async def _transfer():
+            def _lane():
+                return scheduler.slot(GATT, PRIORITY_BULK)
+
+            transfer = asyncio.ensure_future(async_bulk_write(
+                _write, _write, IMAGE[:1200], 100, window=3, lane=_lane))
+            await asyncio.sleep(0)
+            # Gets in at the end of the first stretch, not the transfer.
+            await scheduler.run(GATT, _read)
+            await transfer
+
+        asyncio.run(_transfer())
+        self.assertEqual(order.index('read'), 3)
+        self.assertEqual(order.count('bulk'), 12)
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class WiredBulkTest(TestCase):
+    """Tests for bulk transfers in the Wired engine."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.fake.add_device(MAC, services={SERVICE: {OTA: b'\x00'}})
+        self.engine = Wired(bus_address=self.bus.address, timeout=1)
+        self.engine.connect(MAC, wait_for_services=True)
+
+    def tearDown(self):
+        self.engine.stop_engine()
+        self.fake.close()
+        self.bus.close()
+
+    def test_bulk_write(self):
+        """Test that chunks fit the MTU, and go in a window."""
+
+        self.fake.write_delay = 0.002
+        del self.fake.calls[:]
+        stats = self.engine.bulk_write(MAC, OTA, IMAGE, window=4)
+        self.assertEqual(b''.join(self.fake.written), IMAGE)
+        self.assertEqual(max(map(len, self.fake.written)), 20)
+        self.assertEqual(self.fake.peak_in_flight, 4)
+        self.assertEqual(stats.acked, len(IMAGE))
+        # The characteristic is looked up once, not per chunk.
+        self.assertLess(len(self.fake.calls), stats.chunks + 5)
+
+    def test_resume(self):
+        """Test resuming a failed transfer from its offset."""
+
+        def _progress(stats):
+            if stats.chunks == 300:
+                self.fake.fail_next['WriteValue'] = (
+                    'org.bluez.Error.Failed', 'Not connected')
+
+        with self.assertRaises(BulkWriteError) as context:
+            self.engine.bulk_write(MAC, OTA, IMAGE, progress=_progress)
+        offset = context.exception.offset
+        self.assertGreater(offset, 0)
+        # Commands sent before the failure still reach bluez, ahead of
+        # this read.
+        self.engine.read_attribute(MAC, OTA)
+        deadline = time.monotonic() + 2
+        while self.fake.in_flight:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        del self.fake.written[:]
+        self.engine.bulk_write(MAC, OTA, IMAGE, offset=offset)
+        self.assertEqual(b''.join(self.fake.written), IMAGE[offset:])
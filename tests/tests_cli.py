@@ -0,0 +1,192 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for the bluew command.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import contextlib
+import io
+import os
+import tempfile
+import threading
+from unittest import TestCase, mock, skipUnless
+
+from bluew.cli import RateMeter, main
+from bluew.record import LogReader
+from bluew.stats import Timings, percentile
+from tests.fakebluez import (DEVICE_IFACE, FakeBluez, PrivateBus,
+                             have_dbus_daemon)
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+
+
+class StatsTest(TestCase):
+    """Tests for the stats the bluew command prints."""
+
+    def test_percentile(self):
+        """Test percentiles, interpolated between ranks."""
+
+        samples = [4, 1, 3, 2, 5]
+        self.assertEqual(percentile(samples, 0), 1)
+        self.assertEqual(percentile(samples, 50), 3)
+        self.assertEqual(percentile(samples, 100), 5)
+        self.assertEqual(percentile(samples, 90), 4.6)
+        self.assertRaises(ValueError, percentile, [], 50)
+
+    def test_timings(self):
+        """Test that latencies and sizes are recorded."""
+
+        timings = Timings('read')
+        self.assertEqual(timings.time(len, b'abc', size=3), 3)
+        self.assertEqual(timings.nbytes, 3)
+        self.assertEqual(len(timings.samples), 1)
+        self.assertIn('p99=', timings.summary())
+
+    def test_rate(self):
+        """Test notification rates, and arrival intervals."""
+
+        meter = RateMeter()
+        start = meter._started  # pylint: disable=protected-access
+        for index in range(11):
+            meter.record(2, start + index * 0.1)
+        summary = meter.summary(start + 1)
+        self.assertIn('notifications=11 rate=11.0/s 22 B/s', summary)
+        self.assertIn('interval p50=100.0ms', summary)
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class CommandTest(TestCase):
+    """Tests for the bluew command, run against the Wired engine."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.dev_path = self.fake.add_device(
+            MAC, services={SERVICE: {BATTERY: b'\x64'}})
+        self.environ = os.environ.get('DBUS_SYSTEM_BUS_ADDRESS')
+        os.environ['DBUS_SYSTEM_BUS_ADDRESS'] = self.bus.address
+
+    def tearDown(self):
+        if self.environ is None:
+            del os.environ['DBUS_SYSTEM_BUS_ADDRESS']
+        else:
+            os.environ['DBUS_SYSTEM_BUS_ADDRESS'] = self.environ
+        self.fake.close()
+        self.bus.close()
+
+    def _run(self, *argv):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            code = main(list(argv))
+        return code, out.getvalue()
+
+    def test_read_write(self):
+        """Test reading and writing a characteristic."""
+
+        self.assertEqual(self._run('read', '--engine', 'wired', MAC,
+                                   BATTERY), (0, '64\n'))
+        self.assertEqual(self._run('write', '--engine', 'wired', MAC,
+                                   BATTERY, '3132')[0], 0)
+        self.assertEqual(self._run('read', '--engine', 'wired', '--format',
+                                   'text', MAC, BATTERY), (0, '12\n'))
+
+    def test_scan(self):
+        """Test that devices are printed once, and again when they change."""
+
+        path = self.fake.add_device('AA:BB:CC:DD:EE:01', Name='Thermo',
+                                    RSSI=-60)
+        self.fake.add_device('AA:BB:CC:DD:EE:02', visible=False,
+                             Name='Hidden', RSSI=-70)
+        closer = threading.Timer(0.25, self.fake.call_soon, (
+            self.fake.set_prop, path, DEVICE_IFACE, 'RSSI', -50))
+        closer.start()
+        self.addCleanup(closer.join)
+        code, out = self._run('scan', '--engine', 'wired', '--duration',
+                              '0.5', '--interval', '0.1')
+        self.assertEqual(code, 0)
+        lines = [line.split(None, 1)[1] for line in out.splitlines()]
+        self.assertEqual(sorted(lines), [
+            'AA:BB:CC:DD:EE:01   -50  Thermo',
+            'AA:BB:CC:DD:EE:01   -60  Thermo',
+            'AA:BB:CC:DD:EE:02   -70  Hidden',
+            MAC + '   -50  fake'])
+        # Every round scans for --interval, and known devices stay.
+        members = [member for _, member in self.fake.calls]
+        self.assertIn(members.count('StartDiscovery'), range(3, 7))
+        self.assertNotIn('RemoveDevice', members)
+
+    def test_no_value(self):
+        """Test that a read that comes back empty handed is an error."""
+
+        target = 'bluew.connections.Connection.read_attribute'
+        with mock.patch(target, return_value=None), \
+                contextlib.redirect_stderr(io.StringIO()) as err:
+            code, out = self._run('read', '--engine', 'wired', MAC, BATTERY)
+        self.assertEqual((code, out), (1, ''))
+        self.assertIn('No value was read.', err.getvalue())
+
+    def test_bad_value(self):
+        """Test that a value that isn't hex is refused."""
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            code, _ = self._run('write', '--engine', 'wired', MAC, BATTERY,
+                                'xyz')
+        self.assertEqual(code, 2)
+
+    def test_monitor(self):
+        """Test streaming notifications, with stats, and recording them."""
+
+        chrc = self.fake.chrc_path(self.dev_path, BATTERY)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        log = os.path.join(tmp.name, 'battery.blog')
+        stop = threading.Event()
+
+        def _notify():
+            value = 0
+            while not stop.wait(0.02):
+                if chrc in self.fake.objects:
+                    value += 1
+                    self.fake.notify(chrc, [value % 256])
+
+        thread = threading.Thread(target=_notify)
+        thread.start()
+        try:
+            code, out = self._run('monitor', '--engine', 'wired',
+                                  '--duration', '0.4', '--interval', '0.2',
+                                  '--record', log, MAC, BATTERY)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(code, 0)
+        lines = out.splitlines()
+        self.assertTrue(any(not line.startswith('#') for line in lines))
+        self.assertIn('interval p50=', lines[-1])
+        with LogReader(log) as reader:
+            self.assertEqual(len(list(reader)),
+                             sum(not line.startswith('#') for line in lines))
+
+    def test_bench(self):
+        """Test that every operation benchmarked gets a summary."""
+
+        code, out = self._run('bench', '--engine', 'wired', '--cycles', '2',
+                              '--ops', '3', '--write', '01', '--notify',
+                              MAC, BATTERY)
+        self.assertEqual(code, 0)
+        lines = {line.split()[0]: line for line in out.splitlines()
+                 if not line.startswith('#')}
+        self.assertEqual(set(lines), {'connect', 'read', 'write', 'notify',
+                                      'disconnect'})
+        self.assertIn('n=6 ', lines['read'])
+        self.assertIn('n=2 ', lines['connect'])
+        self.assertIn('B/s', lines['write'])
@@ -0,0 +1,212 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for the reconnection daemon.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import threading
+import time
+from unittest import TestCase, skipUnless
+
+from bluew.connections import Connection
+from bluew.daemon import Daemon, LINKED, FAILED
+from bluew.device import Device
+from bluew.engine import EngineBluew
+from bluew.errors import DeviceNotAvailable
+from tests.fakebluez import FakeBluez, PrivateBus, have_dbus_daemon
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+
+
+class FlakyEngine(EngineBluew):
+    """An engine whose link drops when told to."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs['name'] = 'Flaky'
+        kwargs['version'] = '0.0.1'
+        super().__init__(*args, **kwargs)
+        self.connected = False
+        self.fail_connects = 0
+        self.fail_pairs = 0
+        self.calls = []
+        self.listeners = []
+
+    def start_engine(self):
+        pass
+
+    def stop_engine(self):
+        pass
+
+    def connect(self, mac):
+        self.calls.append('connect')
+        if self.fail_connects:
+            self.fail_connects -= 1
+            raise DeviceNotAvailable()
+        self.connected = True
+
+    def drop(self):
+        """Drop the link, and tell the listeners."""
+        self.connected = False
+        for listener in self.listeners:
+            listener({'Connected': False})
+
+    def info(self, mac):
+        return Device(Address=mac, Connected=self.connected)
+
+    def pair(self, mac):
+        self.calls.append('pair')
+        if self.fail_pairs:
+            self.fail_pairs -= 1
+            raise ValueError('boom')
+
+    def read_attribute(self, mac, attribute):
+        if not self.connected:
+            raise DeviceNotAvailable()
+        return [b'\x01']
+
+    def notify(self, mac, attribute, handler):
+        self.calls.append(('notify', attribute))
+
+    def stop_notify(self, mac, attribute):
+        pass
+
+    def add_device_listener(self, mac, handler):
+        self.listeners.append(handler)
+
+    def remove_device_listener(self, mac, handler):
+        if handler in self.listeners:
+            self.listeners.remove(handler)
+
+
+class DaemonTest(TestCase):
+    """Tests for bluew.daemon.Daemon, with a fake engine."""
+
+    def setUp(self):
+        self.con = Connection(MAC, engine=FlakyEngine, op_timeout=2)
+        self.engine = self.con.engine
+        self.con.daemon.backoff = 0.01
+
+    def tearDown(self):
+        self.con.close()
+
+    def test_reconnect_replays(self):
+        """Test that init steps and notifications are replayed."""
+
+        self.con.pair(d_init=True)
+        self.con.notify(BATTERY, lambda data: None)
+        self.engine.calls.clear()
+        self.engine.fail_connects = 2
+        self.engine.drop()
+        self.assertEqual(self.con.read_attribute(BATTERY), [b'\x01'])
+        self.assertEqual(self.engine.calls, ['connect', 'connect', 'connect',
+                                             'pair', ('notify', BATTERY)])
+        self.assertEqual(self.con.daemon.reconnects, 1)
+        self.assertEqual(self.con.daemon.status, LINKED)
+
+    def test_failed_op_retried(self):
+        """Test that an op failing on a silent drop is run again."""
+
+        self.engine.listeners.clear()
+        self.engine.connected = False
+        self.assertEqual(self.con.read_attribute(BATTERY), [b'\x01'])
+        self.assertEqual(self.con.daemon.reconnects, 1)
+
+    def test_step_bug(self):
+        """Test that a step raising anything counts as a failed attempt."""
+
+        self.con.pair(d_init=True)
+        self.engine.calls.clear()
+        self.engine.fail_pairs = 1
+        with self.assertLogs('bluew.daemon', 'ERROR'):
+            self.engine.drop()
+            self.assertEqual(self.con.read_attribute(BATTERY), [b'\x01'])
+        self.assertEqual(self.engine.calls, ['connect', 'pair', 'connect',
+                                             'pair'])
+        self.assertEqual(self.con.daemon.status, LINKED)
+
+    def test_gives_up(self):
+        """Test that pending ops fail once the daemon gives up."""
+
+        self.con.daemon.max_attempts = 3
+        self.engine.fail_connects = 10
+        self.engine.drop()
+        self.assertRaises(DeviceNotAvailable, self.con.daemon.wait_linked)
+        self.assertEqual(self.con.daemon.status, FAILED)
+        self.assertEqual(self.engine.calls.count('connect'), 4)
+
+    def test_op_timeout(self):
+        """Test that pending ops fail after their deadline."""
+
+        self.con.daemon.backoff = 10
+        self.engine.fail_connects = 1
+        self.engine.drop()
+        start = time.monotonic()
+        self.assertRaises(DeviceNotAvailable,
+                          self.con.daemon.wait_linked, 0.05)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_backoff(self):
+        """Test that the backoff doubles, is capped, and jittered."""
+
+        daemon = Daemon(backoff=1, max_backoff=5)
+        for attempt, upper in ((1, 1), (2, 2), (3, 4), (4, 5), (10, 5)):
+            delay = daemon.backoff_delay(attempt)
+            self.assertGreaterEqual(delay, upper / 2)
+            self.assertLessEqual(delay, upper)
+
+    def test_close_stops(self):
+        """Test that closing the connection stops the supervisor."""
+
+        thread = self.con.daemon._thread  # pylint: disable=protected-access
+        self.con.close()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.engine.listeners, [])
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class WiredDaemonTest(TestCase):
+    """Tests for the daemon with the Wired engine and a fake bluez."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.dev_path = self.fake.add_device(
+            MAC, services={SERVICE: {BATTERY: b'\x64'}})
+        self.con = Connection(MAC, engine='wired',
+                              bus_address=self.bus.address, timeout=1)
+
+    def tearDown(self):
+        self.con.close()
+        self.fake.close()
+        self.bus.close()
+
+    def test_notify_survives_drop(self):
+        """Test that notifications are turned on again after a drop."""
+
+        received = []
+        got = threading.Event()
+
+        def _handler(data):
+            received.append(data)
+            got.set()
+
+        self.con.notify(BATTERY, _handler)
+        self.fake.disconnect(self.dev_path)
+        deadline = time.monotonic() + 2
+        while self.con.daemon.reconnects < 1:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.fake.notify(self.fake.chrc_path(self.dev_path, BATTERY), b'\x07')
+        self.assertTrue(got.wait(2))
+        self.assertEqual(received, [b'\x07'])
@@ -0,0 +1,75 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for DBusted against a fake bluez service on a
+private bus. They're skipped if dbus-python or GLib aren't installed.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import os
+from unittest import TestCase, mock, skipUnless
+
+from bluew.errors import DeviceNotAvailable
+from tests.fakebluez import ERR, FakeBluez, PrivateBus, have_dbus_daemon
+
+try:
+    from bluew.dbusted import DBusted
+except ImportError:  # pragma: no cover
+    DBusted = None
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+LEVEL = '00002a1a-0000-1000-8000-00805f9b34fb'
+
+
+@skipUnless(DBusted is not None, 'dbus-python or GLib not installed')
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class DBustedTest(TestCase):
+    """Tests for DBusted against a fake bluez service."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.dev_path = self.fake.add_device(MAC, services={
+            SERVICE: {BATTERY: b'\x64', LEVEL: b'\x00'}})
+        self.env = mock.patch.dict(
+            os.environ, {'DBUS_SYSTEM_BUS_ADDRESS': self.bus.address})
+        self.env.start()
+        self.engine = DBusted(timeout=2)
+        self.engine.connect(MAC, wait_for_services=True)
+
+    def tearDown(self):
+        self.engine.stop_engine()
+        self.env.stop()
+        self.fake.close()
+        self.bus.close()
+
+    def test_write_after_drop(self):
+        """Test that a write the link dropped under is made again."""
+
+        self.fake.fail_next['WriteValue'] = (ERR + 'Failed', 'Not connected')
+        self.engine.write_attribute(MAC, LEVEL, [7])
+        self.assertEqual(self.fake.written, [b'\x07'])
+
+    def test_bulk_write_while_reset(self):
+        """Test that a bulk write waits for a controller being reset."""
+
+        self.fake.reset_adapter(downtime=0.2)
+        self.engine.bulk_write(MAC, LEVEL, b'\x01\x02', chunk_size=1,
+                               response=True)
+        self.assertEqual(b''.join(self.fake.written), b'\x01\x02')
+
+    def test_info(self):
+        """Test that info() finds the device, or raises if it's gone."""
+
+        self.assertEqual(getattr(self.engine.info(MAC), 'Address'), MAC)
+        with mock.patch.object(DBusted, '_get_devices', return_value=[]):
+            self.assertRaises(DeviceNotAvailable, self.engine.info, MAC)
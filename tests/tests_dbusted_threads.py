@@ -0,0 +1,122 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides stress tests for using DBusted from many threads, on a
+private bus with a fake bluez service. They're skipped if dbus-python or
+GLib aren't installed.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock, skipUnless
+
+from bluew.errors import BluewError
+from tests.fakebluez import FakeBluez, PrivateBus, have_dbus_daemon
+
+try:
+    from bluew.dbusted import DBusted
+    from bluew.dbusted.interfaces import SignalRegistry
+except ImportError:  # pragma: no cover
+    DBusted = None
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+LEVEL = '00002a1a-0000-1000-8000-00805f9b34fb'
+
+WORKERS = 8
+ROUNDS = 25
+
+
+def _count():
+    return DBusted._DBusted__count  # pylint: disable=protected-access
+
+
+@skipUnless(DBusted is not None, 'dbus-python or GLib not installed')
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class ThreadsTest(TestCase):
+    """Tests for concurrent use of DBusted."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.fake.add_device(MAC, services={
+            SERVICE: {BATTERY: b'\x64', LEVEL: b'\x00'}})
+        self.env = mock.patch.dict(
+            os.environ, {'DBUS_SYSTEM_BUS_ADDRESS': self.bus.address})
+        self.env.start()
+        with DBusted(timeout=2) as engine:
+            engine.connect(MAC, wait_for_services=True)
+
+    def tearDown(self):
+        self.env.stop()
+        self.fake.close()
+        self.bus.close()
+
+    def test_instances(self):
+        """Test instances made, used and stopped by many threads."""
+
+        def _work(_):
+            values = []
+            for _ in range(ROUNDS):
+                with DBusted(timeout=2) as engine:
+                    values.append(engine.read_attribute(MAC, BATTERY))
+            return values
+
+        with ThreadPoolExecutor(WORKERS) as pool:
+            results = list(pool.map(_work, range(WORKERS)))
+        self.assertEqual(results, [[[b'\x64']] * ROUNDS] * WORKERS)
+        self.assertEqual(_count(), 0)
+
+    def test_shared_instance(self):
+        """Test one instance used by many threads."""
+
+        def _work(index):
+            engine.write_attribute(MAC, LEVEL, [index])
+            return engine.read_attribute(MAC, BATTERY)
+
+        with DBusted(timeout=2) as engine:
+            with ThreadPoolExecutor(WORKERS) as pool:
+                values = list(pool.map(_work, range(WORKERS * ROUNDS)))
+        self.assertEqual(values, [[b'\x64']] * (WORKERS * ROUNDS))
+        self.assertEqual(_count(), 0)
+
+    def test_stop_twice(self):
+        """Test that stopping an instance twice doesn't stop another."""
+
+        first = DBusted(timeout=2)
+        second = DBusted(timeout=2)
+        first.stop_engine()
+        first.stop_engine()
+        self.assertEqual(second.read_attribute(MAC, BATTERY), [b'\x64'])
+        second.stop_engine()
+        self.assertEqual(_count(), 0)
+        self.assertRaises(BluewError, second.wait_until_powered)
+
+    def test_signal_registry(self):
+        """Test that racing threads add one receiver per path."""
+
+        registry = SignalRegistry()
+        added = []
+        barrier = threading.Barrier(WORKERS)
+
+        def _add(_):
+            barrier.wait()
+            return registry.add('/path', lambda: added.append(1) or
+                                mock.Mock())
+
+        with ThreadPoolExecutor(WORKERS) as pool:
+            results = list(pool.map(_add, range(WORKERS)))
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(len(added), 1)
+        registry.clear()
+        self.assertNotIn('/path', registry)
@@ -0,0 +1,119 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for GATT descriptors.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import math
+from unittest import TestCase, skipUnless
+
+from bluew.descriptors import (CCCD_UUID, FORMAT_SFLOAT, FORMAT_UTF8S,
+                               PRESENTATION_FORMAT_UUID,
+                               USER_DESCRIPTION_UUID, decoder,
+                               parse_presentation_format)
+from bluew.wired import Wired
+from tests.fakebluez import FakeBluez, PrivateBus, have_dbus_daemon
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000181a-0000-1000-8000-00805f9b34fb'
+TEMPERATURE = '00002a6e-0000-1000-8000-00805f9b34fb'
+HUMIDITY = '00002a6f-0000-1000-8000-00805f9b34fb'
+# sint16, exponent -2, degrees Celsius.
+TEMPERATURE_FORMAT = bytes([0x0e, 0xfe, 0x2f, 0x27, 0x01, 0x00, 0x00])
+
+
+class PresentationFormatTest(TestCase):
+    """Tests for Characteristic Presentation Format parsing."""
+
+    def test_parse(self):
+        """Test parsing the fields of the descriptor."""
+
+        fmt = parse_presentation_format(TEMPERATURE_FORMAT)
+        self.assertEqual(fmt.format, 0x0e)
+        self.assertEqual(fmt.exponent, -2)
+        self.assertEqual(fmt.unit, 0x272f)
+        self.assertEqual(fmt.namespace, 1)
+        self.assertRaises(ValueError, parse_presentation_format, b'\x0e')
+
+    def test_decode(self):
+        """Test decoding values, scaled by the exponent."""
+
+        decode = decoder(parse_presentation_format(TEMPERATURE_FORMAT))
+        self.assertAlmostEqual(decode((-1234).to_bytes(2, 'little',
+                                                       signed=True)),
+                               -12.34)
+        utf8 = parse_presentation_format(bytes([FORMAT_UTF8S, 0, 0, 0, 0,
+                                                0, 0]))
+        self.assertEqual(decoder(utf8)('hé'.encode()), 'hé')
+
+    def test_sfloat(self):
+        """Test decoding IEEE 11073 SFLOATs, and their special values."""
+
+        decode = decoder(parse_presentation_format(
+            bytes([FORMAT_SFLOAT, 0, 0, 0, 0, 0, 0])))
+        # Mantissa 365, exponent -1.
+        self.assertAlmostEqual(decode(bytes([0x6d, 0xf1])), 36.5)
+        self.assertEqual(decode(bytes([0xfe, 0x07])), math.inf)
+        self.assertEqual(decode(bytes([0x02, 0x08])), -math.inf)
+        self.assertTrue(math.isnan(decode(bytes([0xff, 0x07]))))
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class WiredDescriptorTest(TestCase):
+    """Tests for descriptors in the Wired engine."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.fake.add_device(
+            MAC, services={SERVICE: {TEMPERATURE: b'\x00\x00',
+                                     HUMIDITY: b'\x00\x00'}},
+            descriptors={
+                TEMPERATURE: {CCCD_UUID: b'\x00\x00',
+                              USER_DESCRIPTION_UUID: b'Temperature',
+                              PRESENTATION_FORMAT_UUID: TEMPERATURE_FORMAT},
+                HUMIDITY: {CCCD_UUID: b'\x00\x00',
+                           USER_DESCRIPTION_UUID: b'Humidity'}})
+        self.engine = Wired(bus_address=self.bus.address, timeout=1)
+        self.engine.connect(MAC, wait_for_services=True)
+
+    def tearDown(self):
+        self.engine.stop_engine()
+        self.fake.close()
+        self.bus.close()
+
+    def test_get_descriptors(self):
+        """Test listing descriptors with their characteristic."""
+
+        descs = self.engine.get_descriptors(MAC)
+        self.assertEqual(len(descs), 5)
+        chrc_path = self.fake.chrc_path(self.engine.client.dev_path(MAC),
+                                        HUMIDITY)
+        self.assertEqual(
+            {desc.UUID for desc in descs
+             if desc.characteristic == chrc_path},
+            {CCCD_UUID, USER_DESCRIPTION_UUID})
+
+    def test_read_write(self):
+        """Test that descriptors are told apart by their characteristic."""
+
+        self.assertEqual(self.engine.read_descriptor(
+            MAC, TEMPERATURE, USER_DESCRIPTION_UUID), b'Temperature')
+        self.assertEqual(self.engine.read_descriptor(
+            MAC, HUMIDITY, USER_DESCRIPTION_UUID), b'Humidity')
+        self.engine.write_descriptor(MAC, HUMIDITY, CCCD_UUID, [1, 0])
+        self.assertEqual(self.engine.read_descriptor(
+            MAC, HUMIDITY, CCCD_UUID), b'\x01\x00')
+        self.assertEqual(self.engine.read_descriptor(
+            MAC, TEMPERATURE, CCCD_UUID), b'\x00\x00')
+        fmt = parse_presentation_format(self.engine.read_descriptor(
+            MAC, TEMPERATURE, PRESENTATION_FORMAT_UUID))
+        self.assertEqual(fmt.exponent, -2)
@@ -0,0 +1,210 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for looking devices up by their properties.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+from unittest import TestCase, skipUnless
+
+import bluew
+from bluew.devindex import DEVICE_IFACE, DeviceIndex, full_uuid
+from bluew.objtree import ObjectTree
+from bluew.utils import devs_with_uuid
+from tests.fakebluez import (ADAPTER_IFACE, FakeBluez, PrivateBus,
+                             have_dbus_daemon)
+
+
+BATTERY = '0000180f-0000-1000-8000-00805f9b34fb'
+HEART_RATE = '0000180d-0000-1000-8000-00805f9b34fb'
+CHRC = '00002a19-0000-1000-8000-00805f9b34fb'
+
+
+def _path(index, adapter='hci0'):
+    return '/org/bluez/{}/dev_AA_BB_CC_DD_EE_{:02X}'.format(adapter, index)
+
+
+def _props(name, rssi, uuids=(), manufacturer=None, address_type='random',
+           adapter='hci0'):
+    # pylint: disable=too-many-arguments
+    props = {'Name': name, 'RSSI': rssi, 'UUIDs': list(uuids),
+             'AddressType': address_type, 'Adapter': '/org/bluez/' + adapter}
+    if manufacturer is not None:
+        props['ManufacturerData'] = {manufacturer: b'\x01'}
+    return props
+
+
+def _paths(devices):
+    return [device['Path'] for device in devices]
+
+
+class DeviceIndexTest(TestCase):
+    """Tests for bluew.devindex.DeviceIndex."""
+
+    def setUp(self):
+        self.index = DeviceIndex()
+        self.index.load({
+            _path(1): {DEVICE_IFACE: _props('Thermo-1', -60, [BATTERY],
+                                            manufacturer=0x004c)},
+            _path(2): {DEVICE_IFACE: _props('thermo-2', -80, [BATTERY],
+                                            address_type='public')},
+            _path(3): {DEVICE_IFACE: _props('Pulse', -40, [HEART_RATE,
+                                                           BATTERY])},
+            _path(4, 'hci1'): {DEVICE_IFACE: _props('Thermo-4', -30,
+                                                    adapter='hci1')},
+            '/org/bluez/hci0': {ADAPTER_IFACE: {'Powered': True}},
+        })
+
+    def test_lookups(self):
+        """Test every criterion, alone and together."""
+
+        query = self.index.query
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(_paths(query(uuid='180F')),
+                         [_path(1), _path(2), _path(3)])
+        self.assertEqual(_paths(query(uuid=HEART_RATE)), [_path(3)])
+        self.assertEqual(_paths(query(name='thermo')),
+                         [_path(1), _path(2), _path(4, 'hci1')])
+        self.assertEqual(_paths(query(manufacturer=0x004c)), [_path(1)])
+        self.assertEqual(_paths(query(address_type='public')), [_path(2)])
+        self.assertEqual(_paths(query(min_rssi=-60)),
+                         [_path(1), _path(3), _path(4, 'hci1')])
+        self.assertEqual(_paths(query(name='Thermo', min_rssi=-70,
+                                      adapter='/org/bluez/hci0')),
+                         [_path(1)])
+        self.assertEqual(_paths(query(uuid=BATTERY, top=2)),
+                         [_path(3), _path(1)])
+        self.assertEqual(query(uuid=CHRC), [])
+        self.assertEqual(query(name='Thermo-1')[0]['RSSI'], -60)
+        self.assertEqual(full_uuid('2a19'), CHRC)
+
+    def test_updates(self):
+        """Test that changes move devices between the index entries."""
+
+        query = self.index.query
+        changed = []
+        self.index.add_listener(changed.append)
+        self.index.update(_path(2), {'RSSI': -20, 'Name': 'Pulse-2',
+                                     'UUIDs': [HEART_RATE]})
+        self.assertEqual(_paths(query(top=1)), [_path(2)])
+        self.assertEqual(_paths(query(name='thermo')),
+                         [_path(1), _path(4, 'hci1')])
+        self.assertEqual(_paths(query(uuid=HEART_RATE)),
+                         [_path(2), _path(3)])
+        self.assertEqual(_paths(query(uuid=BATTERY)), [_path(1), _path(3)])
+        self.index.update(_path(1), {}, ['RSSI'])
+        self.assertNotIn(_path(1), _paths(query(min_rssi=-100)))
+        self.index.remove(_path(3))
+        self.assertEqual(_paths(query(uuid=BATTERY)), [_path(1)])
+        self.assertFalse(self.index.update(_path(3), {'RSSI': -10}))
+        self.assertEqual(changed, [_path(2), _path(1), _path(3)])
+
+    def test_object_tree(self):
+        """Test the index an object tree keeps of its devices."""
+
+        tree = ObjectTree()
+        tree.load({_path(1): {DEVICE_IFACE: _props('Thermo-1', -60)}})
+        tree.add(_path(2), {DEVICE_IFACE: _props('Thermo-2', -50)})
+        tree.update(_path(1), DEVICE_IFACE, {'RSSI': -40})
+        self.assertEqual(_paths(tree.devices.query(top=1)), [_path(1)])
+        tree.remove(_path(1), [DEVICE_IFACE])
+        self.assertEqual(_paths(tree.devices.query()), [_path(2)])
+        tree.clear()
+        self.assertEqual(len(tree.devices), 0)
+
+    def test_search(self):
+        """Test a search, and the scan it keeps track of."""
+
+        search = self.index.search('/org/bluez/hci0', uuid='180f',
+                                   min_rssi=-70, top=2)
+        self.assertEqual(_paths(search.found), [_path(3), _path(1)])
+        self.assertFalse(search.wants_scan(5))
+        search = self.index.search('/org/bluez/hci0', name='thermo', top=2)
+        self.assertEqual(_paths(search.found), [_path(1), _path(2)])
+        search = self.index.search('/org/bluez/hci0', uuid=CHRC, top=1)
+        self.assertEqual(search.found, [])
+        self.assertFalse(search.wants_scan(0))
+        self.assertTrue(search.wants_scan(5))
+        self.assertEqual(search.scan_filter, ([CHRC], None))
+        changed = []
+        with search.scanning(5, changed.append):
+            self.assertGreater(search.remaining(), 4)
+            self.index.update(_path(2), {'UUIDs': [CHRC]})
+            self.assertEqual(search.remaining(), 0)
+        self.assertEqual(_paths(search.found), [_path(2)])
+        self.assertEqual(changed, [_path(2)])
+        self.index.update(_path(1), {'UUIDs': [CHRC]})
+        self.assertEqual(changed, [_path(2)])
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class FindDevicesTest(TestCase):
+    """Tests for bluew.find_devices() on the Wired engine."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.adapter = self.fake.add_adapter()
+        self.kwargs = {'engine': 'wired', 'bus_address': self.bus.address,
+                       'timeout': 2}
+        self.fake.add_device('AA:BB:CC:DD:EE:01', Name='Thermo-1',
+                             services={BATTERY: {}}, RSSI=-60)
+        self.fake.add_device('AA:BB:CC:DD:EE:02', Name='Pulse',
+                             services={HEART_RATE: {}}, RSSI=-40)
+        self.far = self.fake.add_device('AA:BB:CC:DD:EE:03', visible=False,
+                                        Name='Thermo-3',
+                                        services={BATTERY: {}}, RSSI=-90)
+        self.near = self.fake.add_device('AA:BB:CC:DD:EE:04', visible=False,
+                                         Name='Thermo-4',
+                                         services={BATTERY: {}}, RSSI=-30)
+        self.other = self.fake.add_device('AA:BB:CC:DD:EE:05',
+                                          visible=False, Name='Pulse-5',
+                                          services={HEART_RATE: {}})
+        bluew.keep_warm()
+
+    def tearDown(self):
+        bluew.keep_warm(False)
+        self.fake.close()
+        self.bus.close()
+
+    def _scans(self):
+        return self.fake.calls.count((self.adapter, 'StartDiscovery'))
+
+    def test_lookup(self):
+        """Test that known devices are found without scanning."""
+
+        found = bluew.find_devices(uuid='180f', **self.kwargs)
+        self.assertEqual([dev.Name for dev in found], ['Thermo-1'])
+        found = devs_with_uuid(HEART_RATE, **self.kwargs)
+        self.assertEqual([dev.Name for dev in found], ['Pulse'])
+        dumps = self.fake.calls.count(('/', 'GetManagedObjects'))
+        found = bluew.find_devices(min_rssi=-50, **self.kwargs)
+        self.assertEqual([dev.Name for dev in found], ['Pulse'])
+        self.assertEqual(self.fake.calls.count(('/', 'GetManagedObjects')),
+                         dumps)
+        self.assertEqual(self._scans(), 0)
+
+    def test_scan(self):
+        """Test a filtered scan, stopped once enough devices are found."""
+
+        found = bluew.find_devices(uuid=BATTERY, min_rssi=-70, top=2,
+                                   scan=2, **self.kwargs)
+        self.assertEqual([dev.Name for dev in found],
+                         ['Thermo-4', 'Thermo-1'])
+        self.assertEqual(self._scans(), 1)
+        # The filter kept the others from being reported at all.
+        self.assertIn(self.far, self.fake.hidden)
+        self.assertIn(self.other, self.fake.hidden)
+        props = self.fake.objects[self.adapter][ADAPTER_IFACE]
+        self.assertFalse(props['Discovering'])
+        self.assertEqual(props['Filter'], {})
+        # Enough of them are known now, no need to scan again.
+        found = bluew.find_devices(uuid=BATTERY, min_rssi=-70, top=2,
+                                   scan=2, **self.kwargs)
+        self.assertEqual(len(found), 2)
+        self.assertEqual(self._scans(), 1)
@@ -0,0 +1,124 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for single-flight call coalescing.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, skipUnless
+
+from bluew.flight import SingleFlight, AsyncSingleFlight
+from bluew.wired import Wired
+from tests.fakebluez import FakeBluez, PrivateBus, have_dbus_daemon
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+
+
+class SingleFlightTest(TestCase):
+    """Tests for bluew.flight.SingleFlight."""
+
+    def test_coalesce(self):
+        """Test that concurrent calls share one execution."""
+
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def _slow(value):
+            calls.append(value)
+            release.wait(2)
+            return value
+
+        with ThreadPoolExecutor(4) as pool:
+            futures = [pool.submit(flight.do, 'key', _slow, 1)
+                       for _ in range(4)]
+            while flight.coalesced < 3:
+                pass
+            release.set()
+            results = [future.result() for future in futures]
+        self.assertEqual(results, [1, 1, 1, 1])
+        self.assertEqual(calls, [1])
+        self.assertEqual(flight.in_flight(), 0)
+        self.assertEqual(flight.do('key', _slow, 2), 2)
+
+    def test_errors_shared(self):
+        """Test that every caller gets the exception."""
+
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def _fail():
+            release.wait(2)
+            raise ValueError('nope')
+
+        with ThreadPoolExecutor(2) as pool:
+            futures = [pool.submit(flight.do, 'key', _fail)
+                       for _ in range(2)]
+            while flight.coalesced < 1:
+                pass
+            release.set()
+            for future in futures:
+                self.assertRaises(ValueError, future.result)
+
+    def test_async(self):
+        """Test coalescing coroutines."""
+
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def _slow(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value
+
+        async def _main():
+            return await asyncio.gather(
+                *[flight.do('key', _slow, 1) for _ in range(3)],
+                flight.do('other', _slow, 2))
+
+        self.assertEqual(asyncio.run(_main()), [1, 1, 1, 2])
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(flight.coalesced, 2)
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class WiredFlightTest(TestCase):
+    """Tests for coalesced reads in the Wired engine."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.fake.add_device(MAC, services={SERVICE: {BATTERY: b'\x64'}})
+        self.engine = Wired(bus_address=self.bus.address, timeout=1)
+
+    def tearDown(self):
+        self.engine.stop_engine()
+        self.fake.close()
+        self.bus.close()
+
+    def test_concurrent_reads(self):
+        """Test that threads reading together share one ReadValue."""
+
+        self.engine.connect(MAC)
+        self.engine.read_attribute(MAC, BATTERY)
+        self.fake.read_delay = 0.1
+        del self.fake.calls[:]
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(
+                lambda _: self.engine.read_attribute(MAC, BATTERY),
+                range(4)))
+        self.assertEqual(results, [[b'\x64']] * 4)
+        self.assertEqual(
+            [member for _, member in self.fake.calls].count('ReadValue'), 1)
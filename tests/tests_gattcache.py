@@ -0,0 +1,208 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for the on-disk GATT layout cache.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import os
+import tempfile
+import time
+from unittest import TestCase, skipUnless
+
+from bluew.gattcache import (GattCache, GATT_DB_HASH_UUID, desc_key,
+                             exported_as, gatt_layout)
+from bluew.wired import Wired
+from tests.fakebluez import FakeBluez, PrivateBus, have_dbus_daemon
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+DEV = '/org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+LEVEL = '00002a1a-0000-1000-8000-00805f9b34fb'
+CCCD = '00002902-0000-1000-8000-00805f9b34fb'
+GATT = '00001801-0000-1000-8000-00805f9b34fb'
+
+LAYOUT = {'services': {SERVICE: 'service000a'},
+          'chrcs': {BATTERY: 'service000a/char000b'},
+          'descs': {}}
+
+
+class GattCacheTest(TestCase):
+    """Tests for bluew.gattcache.GattCache."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = GattCache(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_layout(self):
+        """Test building a layout from managed objects."""
+
+        objects = {
+            DEV: {'org.bluez.Device1': {'Address': MAC}},
+            DEV + '/service000a': {
+                'org.bluez.GattService1': {'UUID': SERVICE}},
+            DEV + '/service000a/char000b': {
+                'org.bluez.GattCharacteristic1': {'UUID': BATTERY}},
+            DEV + '_00/service000a/char000b': {
+                'org.bluez.GattCharacteristic1': {'UUID': GATT}},
+        }
+        self.assertEqual(gatt_layout(DEV, objects), LAYOUT)
+
+    def test_layout_descriptors(self):
+        """Test that descriptors are keyed under their characteristic."""
+
+        chrc = DEV + '/service000a/char000b'
+        objects = {
+            chrc: {'org.bluez.GattCharacteristic1': {'UUID': BATTERY}},
+            chrc + '/desc000c': {
+                'org.bluez.GattDescriptor1': {'UUID': CCCD,
+                                              'Characteristic': chrc}},
+            DEV + '/service000a/desc000d': {
+                'org.bluez.GattDescriptor1': {'UUID': CCCD}},
+        }
+        layout = gatt_layout(DEV, objects)
+        self.assertEqual(layout['descs'], {
+            desc_key(BATTERY, CCCD): 'service000a/char000b/desc000c'})
+
+    def test_store_lookup(self):
+        """Test that layouts are stored, and read back from disk."""
+
+        self.assertIsNone(self.cache.lookup(MAC, BATTERY))
+        self.assertTrue(self.cache.store(MAC, LAYOUT, b'\x01\x02'))
+        self.assertFalse(self.cache.store(MAC, LAYOUT, b'\x01\x02'))
+        other = GattCache(self.tmp.name)
+        self.assertEqual(other.lookup(MAC.lower(), BATTERY),
+                         'service000a/char000b')
+        self.assertEqual(other.db_hash(MAC), b'\x01\x02')
+        self.assertIsNone(other.lookup(MAC, SERVICE))
+
+    def test_invalidate(self):
+        """Test that invalidated layouts are gone from disk too."""
+
+        self.cache.store(MAC, LAYOUT)
+        self.cache.invalidate(MAC)
+        self.assertIsNone(self.cache.lookup(MAC, BATTERY))
+        self.assertIsNone(GattCache(self.tmp.name).get(MAC))
+
+    def test_verify(self):
+        """Test that a layout of another database is dropped."""
+
+        self.cache.store(MAC, LAYOUT, b'\x01\x02')
+        self.assertTrue(self.cache.verify(MAC, b'\x01\x02'))
+        self.assertFalse(self.cache.verify(MAC, b'\x01\x03'))
+        self.assertIsNone(self.cache.get(MAC))
+        self.assertTrue(exported_as(desc_key(BATTERY, CCCD), CCCD.upper()))
+        self.assertFalse(exported_as(BATTERY, LEVEL))
+        self.assertFalse(exported_as(BATTERY, None))
+
+    def test_corrupt(self):
+        """Test that unreadable files are ignored."""
+
+        with open(os.path.join(self.tmp.name,
+                               MAC.replace(':', '_') + '.json'), 'w') as fd:
+            fd.write('{nope')
+        self.assertIsNone(self.cache.get(MAC))
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class WiredGattCacheTest(TestCase):
+    """Tests for the GATT cache in the Wired engine."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.dev_path = self.fake.add_device(
+            MAC, services={SERVICE: {LEVEL: b'\x01', BATTERY: b'\x64'},
+                           GATT: {GATT_DB_HASH_UUID: b'\xab\xcd'}})
+        self.engines = []
+
+    def tearDown(self):
+        for engine in self.engines:
+            engine.stop_engine()
+        self.fake.close()
+        self.bus.close()
+        self.tmp.cleanup()
+
+    def _engine(self):
+        engine = Wired(bus_address=self.bus.address, timeout=1,
+                       gatt_cache=self.tmp.name)
+        self.engines.append(engine)
+        return engine
+
+    def _wait_stored(self):
+        deadline = time.monotonic() + 2
+        while GattCache(self.tmp.name).get(MAC) is None:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_cached_paths(self):
+        """Test that a second engine resolves UUIDs from the cache."""
+
+        engine = self._engine()
+        engine.connect(MAC)
+        self._wait_stored()
+        self.assertEqual(GattCache(self.tmp.name).db_hash(MAC), b'\xab\xcd')
+        engine.disconnect(MAC)
+
+        engine = self._engine()
+        engine.connect(MAC)
+        deadline = time.monotonic() + 2
+        while engine.client._tasks:  # pylint: disable=protected-access
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        del self.fake.calls[:]
+        self.assertEqual(engine.read_attribute(MAC, BATTERY), [b'\x64'])
+        self.assertEqual([member for _, member in self.fake.calls],
+                         ['ReadValue'])
+
+    def test_wrong_path(self):
+        """Test that a wrong cached path is dropped."""
+
+        chrcs = {BATTERY: 'service00ff/char00ff'}
+        GattCache(self.tmp.name).store(MAC, {'chrcs': chrcs})
+        engine = self._engine()
+        engine.connect(MAC)
+        self.assertEqual(engine.read_attribute(MAC, BATTERY), [b'\x64'])
+        self.assertNotEqual(engine.client.gatt_cache.lookup(MAC, BATTERY),
+                            'service00ff/char00ff')
+
+    def _stale(self, db_hash):
+        # The device is connected and resolved already, and the cached
+        # layout has BATTERY where the device has LEVEL now.
+        engine = Wired(bus_address=self.bus.address, timeout=1)
+        self.engines.append(engine)
+        engine.connect(MAC, wait_for_services=True)
+        rel = self.fake.chrc_path(self.dev_path, LEVEL)[len(DEV) + 1:]
+        hash_rel = self.fake.chrc_path(
+            self.dev_path, GATT_DB_HASH_UUID)[len(DEV) + 1:]
+        GattCache(self.tmp.name).store(
+            MAC, {'chrcs': {BATTERY: rel, GATT_DB_HASH_UUID: hash_rel}},
+            db_hash)
+
+    def test_changed_database(self):
+        """Test that a layout cached with another hash isn't used."""
+
+        self._stale(b'\x00\x01')
+        engine = self._engine()
+        self.assertEqual(engine.read_attribute(MAC, BATTERY), [b'\x64'])
+        self.assertIsNone(GattCache(self.tmp.name).get(MAC))
+
+    def test_changed_uuid(self):
+        """Test that a cached path bluez exports another UUID at is dropped."""
+
+        self._stale(None)
+        engine = self._engine()
+        self.assertEqual(engine.read_attribute(MAC, BATTERY), [b'\x64'])
+        self.assertIsNone(GattCache(self.tmp.name).get(MAC))
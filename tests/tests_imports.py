@@ -0,0 +1,43 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for the import time behaviour of bluew.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import subprocess
+import sys
+from unittest import TestCase
+
+
+def _modules_after(statement):
+    code = ('import sys\n' + statement + '\n'
+            'print("\\n".join(sorted(sys.modules)))')
+    out = subprocess.check_output([sys.executable, '-c', code])
+    return set(out.decode().split())
+
+
+class LazyImportTest(TestCase):
+    """Tests that `import bluew` doesn't pull in the engine."""
+
+    def test_import_bluew_is_lightweight(self):
+        """Test that dbus and GLib aren't imported with bluew."""
+
+        modules = _modules_after('import bluew')
+        self.assertIn('bluew.api', modules)
+        self.assertNotIn('bluew.dbusted', modules)
+        self.assertNotIn('dbus', modules)
+        self.assertNotIn('gi.repository', modules)
+
+    def test_import_bluew_skips_optional_machinery(self):
+        """Test that shared memory rings and asyncio are imported on use."""
+
+        modules = _modules_after('import bluew')
+        self.assertNotIn('bluew.shmring', modules)
+        self.assertNotIn('multiprocessing.shared_memory', modules)
+        self.assertNotIn('asyncio', modules)
@@ -0,0 +1,128 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for chunked reads and writes of long values.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+from unittest import TestCase, skipUnless
+
+from bluew.longvalue import (ValueBuffer, chunks, read_chunk_size, read_long,
+                             write_chunk_size)
+from bluew.wired import Wired
+from tests.fakebluez import FakeBluez, PrivateBus, have_dbus_daemon
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+CONFIG = '00002a19-0000-1000-8000-00805f9b34fb'
+BLOB = bytes(range(256)) * 12
+
+
+class LongValueTest(TestCase):
+    """Tests for bluew.longvalue."""
+
+    def test_chunk_sizes(self):
+        """Test the chunk sizes picked from the MTU."""
+
+        self.assertEqual(read_chunk_size(23), 22)
+        self.assertEqual(write_chunk_size(23), 18)
+        self.assertEqual(write_chunk_size(517), 512)
+        self.assertEqual(write_chunk_size(0), 18)
+
+    def test_chunks(self):
+        """Test splitting data at offsets."""
+
+        self.assertEqual(list(chunks(b'abcdefg', 3)),
+                         [(0, b'abc'), (3, b'def'), (6, b'g')])
+        self.assertEqual(list(chunks(b'', 3)), [])
+        self.assertRaises(ValueError, list, chunks(b'abc', 0))
+
+    def test_buffer(self):
+        """Test that the buffer grows, and is trimmed to the value."""
+
+        buf = ValueBuffer(4)
+        buf.write(0, b'abc')
+        buf.write(3, b'defgh')
+        self.assertEqual(buf.getvalue(), bytearray(b'abcdefgh'))
+        self.assertEqual(ValueBuffer().getvalue(), bytearray())
+
+    def test_read_long(self):
+        """Test reading until a short chunk, or the known length."""
+
+        offsets = []
+
+        def _read_at(offset):
+            offsets.append(offset)
+            return BLOB[offset:offset + 22]
+
+        self.assertEqual(read_long(_read_at, 22), BLOB)
+        self.assertEqual(len(offsets), len(BLOB) // 22 + 1)
+        del offsets[:]
+        self.assertEqual(read_long(_read_at, 22, 44), BLOB[:44])
+        self.assertEqual(offsets, [0, 22])
+
+    def test_read_long_whole(self):
+        """Test that one reply longer than a chunk is the whole value."""
+
+        self.assertEqual(read_long(lambda offset: BLOB[offset:], 22), BLOB)
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class WiredLongValueTest(TestCase):
+    """Tests for chunked reads and writes in the Wired engine."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.dev_path = self.fake.add_device(
+            MAC, services={SERVICE: {CONFIG: b'\x00'}})
+        self.engine = Wired(bus_address=self.bus.address, timeout=1)
+        self.engine.connect(MAC, wait_for_services=True)
+
+    def tearDown(self):
+        self.engine.stop_engine()
+        self.fake.close()
+        self.bus.close()
+
+    def _count(self, member):
+        return [call for _, call in self.fake.calls].count(member)
+
+    def test_mtu(self):
+        """Test that the MTU is read, and defaulted without the property."""
+
+        path = self.fake.chrc_path(self.dev_path, CONFIG)
+        self.fake.call_soon(self.fake.set_prop, path,
+                            'org.bluez.GattCharacteristic1', 'MTU', 185)
+        self.assertEqual(self.engine.get_mtu(MAC, CONFIG), 185)
+        self.fake.call_soon(
+            self.fake.objects[path]['org.bluez.GattCharacteristic1'].pop,
+            'MTU')
+        self.assertEqual(self.engine.get_mtu(MAC, CONFIG), 23)
+
+    def test_write_read_long(self):
+        """Test that long values go in chunks that fit the MTU."""
+
+        self.fake.write_limit = 18
+        self.fake.read_limit = 22
+        del self.fake.calls[:]
+        self.engine.write_long_attribute(MAC, CONFIG, BLOB)
+        self.assertEqual(self._count('WriteValue'), -(-len(BLOB) // 18))
+        value = self.engine.read_long_attribute(MAC, CONFIG, len(BLOB))
+        self.assertEqual(value, BLOB)
+        self.assertEqual(self._count('ReadValue'), -(-len(BLOB) // 22))
+
+    def test_chunk_size(self):
+        """Test writing with a given chunk size."""
+
+        del self.fake.calls[:]
+        self.engine.write_long_attribute(MAC, CONFIG, BLOB[:100], 50)
+        self.assertEqual(self._count('WriteValue'), 2)
+        self.assertEqual(self.engine.read_long_attribute(MAC, CONFIG),
+                         BLOB[:100])
@@ -0,0 +1,91 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for the bluez object tree index.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+from unittest import TestCase
+
+from bluew.objtree import ObjectTree, parent_path
+
+
+ADAPTER = '/org/bluez/hci0'
+DEV = ADAPTER + '/dev_AA_BB_CC_DD_EE_FF'
+# Shares DEV's path as a prefix, and mustn't show up in its queries.
+OTHER = DEV + '_00'
+SERVICE = DEV + '/service000a'
+CHRC = SERVICE + '/char000b'
+DESC = CHRC + '/desc000c'
+
+OBJECTS = {
+    ADAPTER: {'org.bluez.Adapter1': {'Powered': True}},
+    DEV: {'org.bluez.Device1': {'Connected': True}},
+    OTHER: {'org.bluez.Device1': {'Connected': False}},
+    SERVICE: {'org.bluez.GattService1': {'UUID': 'service'}},
+    CHRC: {'org.bluez.GattCharacteristic1': {'UUID': 'chrc'}},
+    DESC: {'org.bluez.GattDescriptor1': {'UUID': 'desc'}},
+    OTHER + '/service000a': {'org.bluez.GattService1': {'UUID': 'other'}},
+}
+
+
+class ObjectTreeTest(TestCase):
+    """Tests for bluew.objtree.ObjectTree."""
+
+    def setUp(self):
+        self.tree = ObjectTree()
+        self.tree.load(OBJECTS)
+
+    def test_parent_path(self):
+        """Test walking up object paths."""
+
+        self.assertEqual(parent_path(DEV), ADAPTER)
+        self.assertEqual(parent_path('/org'), '/')
+
+    def test_device_queries(self):
+        """Test that queries only see the subtree of the exact path."""
+
+        self.assertTrue(self.tree.loaded)
+        self.assertEqual(len(self.tree), len(OBJECTS))
+        services = self.tree.objects('org.bluez.GattService1', DEV)
+        self.assertEqual(services, [{'UUID': 'service', 'Path': SERVICE}])
+        self.assertEqual(set(self.tree.subtree(DEV)),
+                         {DEV, SERVICE, CHRC, DESC})
+        devices = self.tree.objects('org.bluez.Device1', ADAPTER)
+        self.assertEqual([dev['Path'] for dev in devices], [DEV, OTHER])
+        self.assertEqual(self.tree.children(ADAPTER), [DEV, OTHER])
+        self.assertEqual(self.tree.objects('org.bluez.Device1', '/nope'), [])
+
+    def test_signals(self):
+        """Test applying added and removed interfaces, and changes."""
+
+        self.assertTrue(self.tree.update(DEV, 'org.bluez.Device1',
+                                         {'Connected': False}))
+        self.assertFalse(self.tree.update(DEV, 'org.bluez.Battery1', {}))
+        self.assertEqual(self.tree.get(DEV)['org.bluez.Device1'],
+                         {'Connected': False})
+        self.tree.add(DEV, {'org.bluez.Battery1': {'Percentage': 80}})
+        self.assertEqual(set(self.tree.get(DEV)),
+                         {'org.bluez.Device1', 'org.bluez.Battery1'})
+        for path in (DESC, CHRC, SERVICE):
+            self.tree.remove(path, list(OBJECTS[path]))
+        self.assertEqual(self.tree.children(DEV), [])
+        self.assertIsNone(self.tree.get(SERVICE))
+        self.tree.remove(OTHER + '/service000a', ['org.bluez.GattService1'])
+        self.tree.remove(OTHER, ['org.bluez.Device1'])
+        self.assertEqual(self.tree.children(ADAPTER), [DEV])
+
+    def test_prune(self):
+        """Test that paths without objects are dropped with their object."""
+
+        tree = ObjectTree()
+        tree.add(DESC, OBJECTS[DESC])
+        self.assertEqual(tree.children('/org/bluez'), [ADAPTER])
+        tree.remove(DESC, ['org.bluez.GattDescriptor1'])
+        self.assertEqual(tree.children('/'), [])
+        self.assertEqual(len(tree), 0)
@@ -0,0 +1,163 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for the bluew engine registry.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import os
+import sys
+from types import SimpleNamespace
+from unittest import TestCase, mock, skipUnless
+
+from bluew import plugables
+from bluew.engine import EngineBluew, EngineError, CAP_ASYNC
+
+try:
+    from importlib import metadata
+except ImportError:  # Python 3.7
+    metadata = None
+
+
+class FakeEngine(EngineBluew):
+    """Engine that only records how it was constructed."""
+
+    capabilities = frozenset({CAP_ASYNC})
+
+    def __init__(self, *args, **kwargs):
+        kwargs['name'] = 'fake'
+        kwargs['version'] = '0.0.1'
+        super().__init__(*args, **kwargs)
+        self.kwargs = kwargs
+
+
+class RegistryTest(TestCase):
+    """Tests for registering and selecting engines."""
+
+    def setUp(self):
+        plugables.register_engine('fake', FakeEngine)
+        plugables.register_engine('lazy', 'tests.tests_plugables:FakeEngine')
+
+    def tearDown(self):
+        plugables.unregister_engine('fake')
+        plugables.unregister_engine('lazy')
+        os.environ.pop(plugables.ENGINE_ENV_VAR, None)
+
+    def test_get_by_name(self):
+        """Test that engines are returned by name."""
+
+        self.assertIs(plugables.get_engine('fake'), FakeEngine)
+        self.assertIs(plugables.get_engine('lazy'), FakeEngine)
+        self.assertIs(plugables.get_engine(FakeEngine), FakeEngine)
+
+    def test_env_var(self):
+        """Test that the environment variable picks the default engine."""
+
+        os.environ[plugables.ENGINE_ENV_VAR] = 'fake'
+        self.assertIs(plugables.get_engine(), FakeEngine)
+
+    def test_unknown_engine(self):
+        """Test that unknown engines raise EngineError."""
+
+        try:
+            plugables.get_engine('does-not-exist')
+        except EngineError as exp:
+            self.assertEqual(exp.reason, EngineError.NOT_FOUND)
+            self.assertEqual(exp.long_reason,
+                             EngineError.NOT_FOUND + ': does-not-exist')
+        else:
+            self.assertFalse(True)
+
+    def test_not_an_engine(self):
+        """Test that registered targets must be engines."""
+
+        plugables.register_engine('broken', 'os.path:join')
+        self.addCleanup(plugables.unregister_engine, 'broken')
+        self.assertRaises(EngineError, plugables.get_engine, 'broken')
+
+    def test_capabilities(self):
+        """Test capability lookups without importing the default engine."""
+
+        self.assertEqual(plugables.engine_capabilities('lazy'),
+                         frozenset({CAP_ASYNC}))
+        self.assertIn(plugables.find_engine(CAP_ASYNC), ('fake', 'lazy'))
+        self.assertRaises(EngineError, plugables.find_engine, 'teleport')
+
+
+@skipUnless(metadata is not None, 'importlib.metadata needs Python 3.8')
+class DiscoveryTest(TestCase):
+    """Tests for engines advertised by installed packages."""
+
+    def setUp(self):
+        # pylint: disable=protected-access
+        points = [
+            metadata.EntryPoint('plugged', 'tests.tests_plugables:FakeEngine',
+                                plugables.ENTRY_POINT_GROUP),
+            metadata.EntryPoint('wired', 'os.path:join',
+                                plugables.ENTRY_POINT_GROUP),
+        ]
+        if hasattr(metadata, 'EntryPoints'):
+            advertised = metadata.EntryPoints(points)
+        else:
+            # Before 3.10 entry_points() gives a dict of them by group.
+            advertised = {plugables.ENTRY_POINT_GROUP: points}
+        patches = [mock.patch.object(metadata, 'entry_points',
+                                     return_value=advertised),
+                   mock.patch.object(plugables, '_discovered', False),
+                   mock.patch.dict(plugables._REGISTRY),
+                   mock.patch.dict(os.environ)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        os.environ.pop(plugables.ENGINE_ENV_VAR, None)
+
+    def test_discovered(self):
+        """Test that advertised engines are found, but don't override."""
+
+        self.assertIn('plugged', plugables.available_engines())
+        self.assertIs(plugables.get_engine('plugged'), FakeEngine)
+        registry = plugables._REGISTRY  # pylint: disable=protected-access
+        self.assertEqual(registry['wired'].target, 'bluew.wired:Wired')
+
+    def test_env_var(self):
+        """Test picking a discovered engine with the environment variable."""
+
+        os.environ[plugables.ENGINE_ENV_VAR] = 'plugged'
+        self.assertIs(plugables.get_engine(), FakeEngine)
+        self.assertEqual(plugables.find_engine(CAP_ASYNC), 'plugged')
+        self.assertEqual(plugables.UsedEngine.capabilities,
+                         frozenset({CAP_ASYNC}))
+        self.assertIsInstance(plugables.UsedEngine(), FakeEngine)
+
+
+class PkgResourcesTest(TestCase):
+    """Tests for discovery through pkg_resources, used before 3.8."""
+
+    def setUp(self):
+        # pylint: disable=protected-access
+        advertised = [SimpleNamespace(name='plugged',
+                                      module_name='tests.tests_plugables',
+                                      attrs=('FakeEngine',))]
+        pkg_resources = SimpleNamespace(
+            iter_entry_points=mock.Mock(return_value=advertised))
+        modules = {'importlib.metadata': None, 'pkg_resources': pkg_resources}
+        patches = [mock.patch.dict(sys.modules, modules),
+                   mock.patch.object(plugables, '_discovered', False),
+                   mock.patch.dict(plugables._REGISTRY)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.iter_entry_points = pkg_resources.iter_entry_points
+
+    def test_discovered(self):
+        """Test that engines advertised to pkg_resources are found."""
+
+        self.assertIn('plugged', plugables.available_engines())
+        self.assertIs(plugables.get_engine('plugged'), FakeEngine)
+        self.iter_entry_points.assert_called_once_with(
+            plugables.ENTRY_POINT_GROUP)
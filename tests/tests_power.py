@@ -0,0 +1,117 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for managing the power of controllers, and for
+operations made while a controller is down.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import threading
+import time
+from unittest import TestCase, skipUnless
+
+from bluew.errors import ControllerNotReady
+from bluew.wired import Wired
+from tests.fakebluez import (ADAPTER_IFACE, FakeBluez, PrivateBus,
+                             have_dbus_daemon)
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class PowerTest(TestCase):
+    """Tests for controller power management of the Wired engine."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.adapter = self.fake.add_adapter()
+        self.fake.add_device(MAC, services={SERVICE: {BATTERY: b'\x64'}})
+        self.engine = Wired(bus_address=self.bus.address, timeout=2,
+                            recovery_timeout=2)
+        self.engine.connect(MAC, wait_for_services=True)
+
+    def tearDown(self):
+        self.engine.stop_engine()
+        self.fake.close()
+        self.bus.close()
+
+    def _set_powered(self, powered):
+        self.fake.call_soon(self.fake.set_prop, self.adapter, ADAPTER_IFACE,
+                            'Powered', powered)
+
+    def _read_later(self):
+        result = {}
+
+        def _read():
+            try:
+                result['value'] = self.engine.read_attribute(MAC, BATTERY)
+            except ControllerNotReady as exp:
+                result['error'] = exp
+            result['done'] = time.monotonic()
+
+        thread = threading.Thread(target=_read)
+        thread.start()
+        return thread, result
+
+    def test_power(self):
+        """Test powering the controller off and on."""
+
+        self.engine.power(False)
+        props = self.fake.objects[self.adapter][ADAPTER_IFACE]
+        self.assertFalse(props['Powered'])
+        self.assertFalse(self.engine.wait_until_powered(0.05))
+        self.engine.power(True)
+        self.assertTrue(props['Powered'])
+        self.assertTrue(self.engine.wait_until_powered(0))
+
+    def test_discoverable_pairable(self):
+        """Test making the controller discoverable and pairable."""
+
+        self.engine.set_discoverable(True, timeout=60)
+        self.engine.set_pairable(False)
+        props = self.fake.objects[self.adapter][ADAPTER_IFACE]
+        self.assertTrue(props['Discoverable'])
+        self.assertEqual(props['DiscoverableTimeout'], 60)
+        self.assertFalse(props['Pairable'])
+
+    def test_queued_while_off(self):
+        """Test that operations wait for the controller, and then go."""
+
+        self._set_powered(False)
+        time.sleep(0.05)
+        thread, result = self._read_later()
+        time.sleep(0.2)
+        self.assertNotIn('done', result)
+        powered = time.monotonic()
+        self._set_powered(True)
+        thread.join(5)
+        self.assertEqual(result.get('value'), [b'\x64'])
+        self.assertLess(result['done'] - powered, 0.5)
+
+    def test_reset(self):
+        """Test an operation made while the controller is reset."""
+
+        self.fake.reset_adapter(downtime=0.2)
+        self.assertEqual(self.engine.read_attribute(MAC, BATTERY), [b'\x64'])
+
+    def test_not_ready(self):
+        """Test giving up on a controller that stays off."""
+
+        self.engine.client.recovery_timeout = 0.1
+        self._set_powered(False)
+        time.sleep(0.05)
+        self.assertRaises(ControllerNotReady, self.engine.read_attribute,
+                          MAC, BATTERY)
+        # The engine is still up once the controller is back.
+        self._set_powered(True)
+        self.assertTrue(self.engine.wait_until_powered(1))
+        self.assertEqual(self.engine.read_attribute(MAC, BATTERY), [b'\x64'])
@@ -0,0 +1,182 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for provisioning many devices at once.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import os
+import tempfile
+from unittest import TestCase, mock, skipUnless
+
+from bluew.connections import Connection
+from bluew.provision import (CONNECT, Journal, Provisioner, StepResult,
+                             load_steps, pair, read, trust, write)
+from tests.fakebluez import FakeBluez, PrivateBus, have_dbus_daemon
+
+
+MACS = ['AA:BB:CC:DD:EE:0{}'.format(index) for index in range(4)]
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+MODE = '00002a06-0000-1000-8000-00805f9b34fb'
+DEVICE_IFACE = 'org.bluez.Device1'
+
+
+class StepsTest(TestCase):
+    """Tests for steps and the journal."""
+
+    def test_load_steps(self):
+        """Test steps out of dicts, like the ones of a JSON file."""
+
+        steps = load_steps([{'action': 'pair'},
+                            {'action': 'write', 'attribute': MODE,
+                             'value': '0a0b'},
+                            {'action': 'read', 'attribute': MODE,
+                             'value': [10, 11]},
+                            trust()])
+        self.assertEqual(steps, [pair(), write(MODE, b'\x0a\x0b'),
+                                 read(MODE, expect=b'\x0a\x0b'), trust()])
+        self.assertRaises(ValueError, load_steps, [{'action': 'flash'}])
+
+    def test_journal(self):
+        """Test that only finished steps are done, after a reload."""
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'fleet.journal')
+            journal = Journal(path)
+            journal.record(StepResult(MACS[0], 0, 'pair', 0.5, None))
+            journal.record(StepResult(MACS[0], 1, 'trust', 0.1, 'failed'))
+            with open(path, 'a') as log:
+                log.write('{"mac": "' + MACS[0])
+            journal = Journal(path)
+        self.assertTrue(journal.done(MACS[0], 0, pair()))
+        self.assertFalse(journal.done(MACS[0], 1, trust()))
+        self.assertFalse(journal.done(MACS[0], 0, trust()))
+        self.assertFalse(journal.done(MACS[1], 0, pair()))
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class ProvisionerTest(TestCase):
+    """Tests for bluew.provision.Provisioner."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.fake.add_adapter('hci1')
+        self.paths = {}
+        for index, mac in enumerate(MACS):
+            # The last device is only in range of hci1, the others of both.
+            adapters = ['hci1'] if index == 3 else ['hci0', 'hci1']
+            self.paths[mac] = [self.fake.add_device(
+                mac, adapter, services={
+                    SERVICE: {BATTERY: b'\x64', MODE: b'\x00'}})
+                               for adapter in adapters]
+        self.devices = MACS[:3] + [(MACS[3], 'hci1')]
+        self.kwargs = {'engine': 'wired', 'bus_address': self.bus.address,
+                       'timeout': 2, 'wait_for_services': True}
+        self.tmp = tempfile.TemporaryDirectory()
+        self.journal = os.path.join(self.tmp.name, 'fleet.journal')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        self.fake.close()
+        self.bus.close()
+
+    def _props(self, mac, prop):
+        return [self.fake.objects[path][DEVICE_IFACE][prop]
+                for path in self.paths[mac]]
+
+    def _pairs(self):
+        return sum(1 for call in self.fake.calls if call[1] == 'Pair')
+
+    def test_run(self):
+        """Test taking every device through the steps."""
+
+        steps = [pair(), trust(), write(MODE, [2]), read(MODE, expect=[2])]
+        runner = Provisioner(self.devices, steps, journal=self.journal,
+                             adapters=['hci0', 'hci1'], per_adapter=2,
+                             **self.kwargs)
+        results = runner.run()
+        self.assertEqual([result for result in results if result.error],
+                         [])
+        self.assertEqual(len(results), len(MACS) * (len(steps) + 1))
+        for mac in MACS:
+            # Through one adapter or the other.
+            self.assertEqual(self._props(mac, 'Paired').count(True), 1)
+            self.assertEqual(self._props(mac, 'Paired'),
+                             self._props(mac, 'Trusted'))
+            self.assertNotIn(True, self._props(mac, 'Connected'))
+        self.assertEqual(self._props(MACS[3], 'Paired'), [True])
+        report = runner.report()
+        self.assertEqual(list(report), [CONNECT, 'pair', 'trust',
+                                        'write ' + MODE, 'read ' + MODE])
+        self.assertEqual([len(timings.samples) for timings in
+                          report.values()], [len(MACS)] * 5)
+        # Nothing's left for a run resumed from the journal.
+        self.assertEqual(Provisioner(self.devices, steps,
+                                     journal=self.journal,
+                                     adapters=['hci0', 'hci1'],
+                                     **self.kwargs).run(), [])
+
+    def test_resume(self):
+        """Test that a failed verification is picked up where it stopped."""
+
+        steps = [pair(), write(MODE, [2]), read(BATTERY, expect=[0x50])]
+        results = Provisioner(MACS[:2], steps, journal=self.journal,
+                              **self.kwargs).run()
+        failed = [result for result in results if result.error]
+        self.assertEqual({result.mac for result in failed}, set(MACS[:2]))
+        self.assertEqual({result.index for result in failed}, {2})
+        self.assertEqual(self._pairs(), 2)
+        for mac in MACS[:2]:
+            # Devices are disconnected by now, values of the next discovery.
+            self.fake.gatt[self.paths[mac][0]][SERVICE][BATTERY] = b'\x50'
+        runner = Provisioner(MACS[:2], steps, journal=self.journal,
+                             **self.kwargs)
+        self.assertEqual(runner.pending(MACS[0]), [2])
+        results = runner.run()
+        self.assertEqual(sorted((result.mac, result.label) for result in
+                                results if result.error is None),
+                         sorted((mac, label) for mac in MACS[:2] for label in
+                                (CONNECT, 'read ' + BATTERY)))
+        self.assertEqual(self._pairs(), 2)
+
+    def test_unexpected_error(self):
+        """Test that a device failing unexpectedly doesn't stop the rest."""
+
+        failures = [ValueError('boom'), None, None]
+        with mock.patch.object(Connection, 'trust', side_effect=failures):
+            results = Provisioner(MACS[:3], [trust(), pair()],
+                                  **self.kwargs).run()
+        failed = [result for result in results if result.error]
+        self.assertEqual([(result.label, result.error) for result in failed],
+                         [('trust', 'ValueError: boom')])
+        self.assertEqual(sum(1 for result in results if result.label == 'pair'
+                             and result.error is None), 2)
+
+    def test_close_fails(self):
+        """Test that a connection failing to close doesn't stop the rest."""
+
+        close = Connection.close
+
+        def _close(connection):
+            close(connection)
+            raise OSError('already closed')
+
+        with mock.patch.object(Connection, 'close', _close):
+            results = Provisioner(MACS[:3], [trust()], **self.kwargs).run()
+        self.assertEqual(sorted(result.mac for result in results
+                                if result.label == 'trust' and
+                                result.error is None), MACS[:3])
+
+    def test_pinned_to_unknown_adapter(self):
+        """Test that devices can't be pinned to adapters not given."""
+
+        runner = Provisioner(self.devices, [pair()], **self.kwargs)
+        self.assertRaises(ValueError, runner.run)
@@ -0,0 +1,160 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for the per-attribute operation queues.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, skipUnless
+
+from bluew.queues import OpQueues, AsyncOpQueues
+from bluew.wired import Wired
+from tests.fakebluez import FakeBluez, PrivateBus, have_dbus_daemon
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+LEVEL = '00002a1a-0000-1000-8000-00805f9b34fb'
+
+
+class OpQueuesTest(TestCase):
+    """Tests for bluew.queues.OpQueues."""
+
+    def setUp(self):
+        self.queues = OpQueues()
+
+    def tearDown(self):
+        self.queues.shutdown()
+
+    def test_fifo(self):
+        """Test that operations on one key run one at a time, in order."""
+
+        done = []
+        running = []
+
+        def _op(value):
+            running.append(value)
+            self.assertEqual(len(running), 1)
+            time.sleep(0.001)
+            done.append(value)
+            running.remove(value)
+            return value
+
+        futures = [self.queues.submit('key', _op, i) for i in range(20)]
+        self.assertEqual([future.result() for future in futures],
+                         list(range(20)))
+        self.assertEqual(done, list(range(20)))
+        self.assertEqual(self.queues.pending('key'), 0)
+
+    def test_keys_concurrent(self):
+        """Test that operations on different keys run concurrently."""
+
+        barrier = threading.Barrier(2, timeout=2)
+        futures = [self.queues.submit(key, barrier.wait)
+                   for key in ('a', 'b')]
+        for future in futures:
+            future.result()
+
+    def test_keys_take_turns(self):
+        """Test that a busy key doesn't keep the pool from other keys."""
+
+        queues = OpQueues(max_workers=1)
+        self.addCleanup(queues.shutdown)
+        started = threading.Event()
+        release = threading.Event()
+        order = []
+
+        def _op(name):
+            if name == 'a1':
+                started.set()
+                release.wait(2)
+            order.append(name)
+
+        futures = [queues.submit('a', _op, 'a1')]
+        started.wait(2)
+        futures += [queues.submit('a', _op, name) for name in ('a2', 'a3')]
+        futures.append(queues.submit('b', _op, 'b1'))
+        release.set()
+        for future in futures:
+            future.result()
+        self.assertEqual(order, ['a1', 'b1', 'a2', 'a3'])
+
+    def test_shutdown(self):
+        """Test that shutting down runs what's queued."""
+
+        queues = OpQueues(max_workers=1)
+        futures = [queues.submit('key', time.sleep, 0.001)
+                   for _ in range(5)]
+        queues.shutdown()
+        self.assertTrue(all(future.done() for future in futures))
+
+    def test_errors(self):
+        """Test that a failing operation doesn't stall its queue."""
+
+        def _fail():
+            raise ValueError('nope')
+
+        failed = self.queues.submit('key', _fail)
+        self.assertEqual(self.queues.run('key', lambda: 1), 1)
+        self.assertRaises(ValueError, failed.result)
+
+    def test_async(self):
+        """Test that coroutines on one key run in order."""
+
+        queues = AsyncOpQueues()
+        order = []
+
+        async def _op(value):
+            await asyncio.sleep(0.001 * (5 - value))
+            order.append(value)
+
+        async def _main():
+            await asyncio.gather(*[queues.run('key', _op, i)
+                                   for i in range(5)])
+
+        asyncio.run(_main())
+        self.assertEqual(order, list(range(5)))
+        self.assertEqual(queues.pending('key'), 0)
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class WiredQueuesTest(TestCase):
+    """Tests for queued operations in the Wired engine."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.fake.add_device(
+            MAC, services={SERVICE: {BATTERY: b'\x00', LEVEL: b'\x00'}})
+        self.engine = Wired(bus_address=self.bus.address, timeout=1)
+        self.engine.connect(MAC)
+
+    def tearDown(self):
+        self.engine.stop_engine()
+        self.fake.close()
+        self.bus.close()
+
+    def test_no_in_progress(self):
+        """Test that overlapping operations don't fail with InProgress."""
+
+        self.fake.read_delay = self.fake.write_delay = 0.01
+
+        def _op(i):
+            uuid = (BATTERY, LEVEL)[i % 2]
+            self.engine.write_attribute(MAC, uuid, [i])
+            return self.engine.read_attribute(MAC, uuid)
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(_op, range(16)))
+        self.assertEqual(len(results), 16)
@@ -0,0 +1,113 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for recording and replaying notifications.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from bluew.record import LogReader, Recorder, Replayer
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+HEART_RATE = '00002a37-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+
+
+class RecordTest(TestCase):
+    """Tests for bluew.record."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'session.blog')
+        seen = []
+        with Recorder(self.path) as recorder:
+            start = time.monotonic()
+            handler = recorder.handler(MAC, HEART_RATE, seen.append)
+            for index in range(10):
+                handler(bytes([index, 60 + index]))
+            recorder.record(MAC, BATTERY, b'\x64', start + 0.1)
+            for index in range(10):
+                recorder.record(MAC, HEART_RATE, bytes([index]),
+                                start + 0.1 + index * 0.01)
+        self.assertEqual(len(seen), 10)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_read(self):
+        """Test reading back records, in order."""
+
+        with LogReader(self.path) as reader:
+            records = list(reader)
+        self.assertEqual(len(records), 21)
+        self.assertEqual(records[0].value, b'\x00\x3c')
+        self.assertEqual(records[10][1:], (MAC, BATTERY, b'\x64'))
+        timestamps = [record.timestamp for record in records]
+        self.assertEqual(timestamps, sorted(timestamps))
+        # Two keys, and 3 bytes of overhead plus a timestamp per value.
+        self.assertLess(os.path.getsize(self.path), 16 + 21 * 16 + 100)
+
+    def test_truncated(self):
+        """Test that an entry cut short ends the log."""
+
+        with open(self.path, 'r+b') as file:
+            file.truncate(os.path.getsize(self.path) - 1)
+        with LogReader(self.path) as reader:
+            self.assertEqual(len(list(reader)), 20)
+
+    def test_not_a_log(self):
+        """Test that other files are refused."""
+
+        with open(self.path, 'wb') as file:
+            file.write(b'not a log at all')
+        self.assertRaises(ValueError, LogReader, self.path)
+
+    def test_too_many_keys(self):
+        """Test that a full key table refuses new ones, and stays full."""
+
+        with Recorder(os.path.join(self.tmp.name, 'full.blog')) as recorder:
+            # pylint: disable=protected-access
+            recorder._keys.update(((MAC, str(key)), key)
+                                  for key in range(0x10000))
+            for _ in range(2):
+                self.assertRaises(ValueError, recorder.record, MAC,
+                                  BATTERY, b'\x64')
+            self.assertEqual(len(recorder._keys), 0x10000)
+            recorder.record(MAC, '0', b'\x64')
+
+    def test_replay(self):
+        """Test replaying through handlers, as fast as possible."""
+
+        rates, batteries = [], []
+        replayer = Replayer(self.path, speed=None)
+        replayer.notify(MAC, HEART_RATE, rates.append)
+        replayer.notify(MAC, BATTERY, batteries.append)
+        self.assertEqual(replayer.run(), 21)
+        self.assertEqual(len(rates), 20)
+        self.assertEqual(batteries, [b'\x64'])
+        replayer.stop_notify(MAC, BATTERY)
+        replayer.run()
+        self.assertEqual(len(batteries), 1)
+
+    def test_pace(self):
+        """Test that replays keep the pace of the recording, scaled."""
+
+        start = time.monotonic()
+        self.assertEqual(len(list(Replayer(self.path, speed=2))), 21)
+        elapsed = time.monotonic() - start
+        self.assertGreaterEqual(elapsed, 0.095)
+        self.assertLess(elapsed, 0.5)
+        iterator = iter(Replayer(self.path))
+        next(iterator)
+        iterator.close()
+        self.assertRaises(ValueError, Replayer, self.path, 0)
@@ -0,0 +1,179 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for the per-adapter priority scheduler.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import asyncio
+import threading
+import time
+from unittest import TestCase
+
+from bluew.queues import OpQueues
+from bluew.scheduler import (
+    AdapterScheduler,
+    AsyncAdapterScheduler,
+    AsyncPrioritySemaphore,
+    EXCLUSIVE,
+    PRIORITY_BACKGROUND,
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_NORMAL,
+    PrioritySemaphore,
+    current_priority,
+    priority,
+    scheduler_for,
+)
+
+
+class PrioritySemaphoreTest(TestCase):
+    """Tests for bluew.scheduler.PrioritySemaphore."""
+
+    def _wait_waiting(self, semaphore, count):
+        deadline = time.monotonic() + 2
+        while semaphore.waiting() < count:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def test_order(self):
+        """Test that waiters go by priority, then in the order they came."""
+
+        semaphore = PrioritySemaphore()
+        order = []
+        semaphore.acquire()
+
+        def _waiter(name, level):
+            semaphore.acquire(level)
+            order.append(name)
+            semaphore.release()
+
+        threads = []
+        waiters = [('bulk1', PRIORITY_BACKGROUND), ('normal', PRIORITY_NORMAL),
+                   ('bulk2', PRIORITY_BACKGROUND),
+                   ('ui', PRIORITY_INTERACTIVE)]
+        for count, (name, level) in enumerate(waiters, 1):
+            thread = threading.Thread(target=_waiter, args=(name, level))
+            thread.start()
+            threads.append(thread)
+            self._wait_waiting(semaphore, count)
+        semaphore.release()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(order, ['ui', 'normal', 'bulk1', 'bulk2'])
+        self.assertEqual(semaphore.waiting(), 0)
+
+    def test_slots(self):
+        """Test that a semaphore with slots lets that many through."""
+
+        semaphore = PrioritySemaphore(2)
+        semaphore.acquire()
+        semaphore.acquire()
+        thread = threading.Thread(target=semaphore.acquire)
+        thread.start()
+        self._wait_waiting(semaphore, 1)
+        semaphore.release()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(semaphore.waiting(), 0)
+
+    def test_scheduler_for(self):
+        """Test that an adapter has one scheduler per process."""
+
+        self.assertIs(scheduler_for('hci7'), scheduler_for('hci7'))
+        self.assertIsNot(scheduler_for('hci7'), scheduler_for('hci8'))
+
+    def test_run(self):
+        """Test running through a lane with the priority of the context."""
+
+        scheduler = AdapterScheduler()
+        with priority(PRIORITY_BACKGROUND):
+            self.assertEqual(scheduler.run(EXCLUSIVE, current_priority),
+                             PRIORITY_BACKGROUND)
+        self.assertEqual(current_priority(), PRIORITY_NORMAL)
+
+    def test_default_priority(self):
+        """Test that a default priority gives way to one that was picked."""
+
+        self.assertEqual(current_priority(PRIORITY_BULK), PRIORITY_BULK)
+        with priority(PRIORITY_INTERACTIVE):
+            self.assertEqual(current_priority(PRIORITY_BULK),
+                             PRIORITY_INTERACTIVE)
+        self.assertEqual(current_priority(PRIORITY_BULK), PRIORITY_BULK)
+
+    def test_queues_context(self):
+        """Test that queued operations run with the caller's priority."""
+
+        queues = OpQueues(2)
+        try:
+            with priority(PRIORITY_INTERACTIVE):
+                future = queues.submit('key', current_priority)
+            self.assertEqual(future.result(2), PRIORITY_INTERACTIVE)
+            self.assertEqual(queues.run('key', current_priority),
+                             PRIORITY_NORMAL)
+        finally:
+            queues.shutdown()
+
+
+class AsyncPrioritySemaphoreTest(TestCase):
+    """Tests for bluew.scheduler.AsyncPrioritySemaphore."""
+
+    def test_order(self):
+        """Test that waiting coroutines go by priority, then FIFO."""
+
+        order = []
+
+        async def _waiter(semaphore, name, level):
+            await semaphore.acquire(level)
+            order.append(name)
+            semaphore.release()
+
+        async def _main():
+            semaphore = AsyncPrioritySemaphore()
+            await semaphore.acquire()
+            tasks = [
+                asyncio.ensure_future(_waiter(semaphore, name, level))
+                for name, level in [('bulk', PRIORITY_BACKGROUND),
+                                    ('normal1', PRIORITY_NORMAL),
+                                    ('ui', PRIORITY_INTERACTIVE),
+                                    ('normal2', PRIORITY_NORMAL)]]
+            await asyncio.sleep(0)
+            semaphore.release()
+            await asyncio.gather(*tasks)
+
+        asyncio.run(_main())
+        self.assertEqual(order, ['ui', 'normal1', 'normal2', 'bulk'])
+
+    def test_cancel(self):
+        """Test that a cancelled waiter doesn't take a slot."""
+
+        async def _main():
+            semaphore = AsyncPrioritySemaphore()
+            await semaphore.acquire()
+            waiter = asyncio.ensure_future(semaphore.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            self.assertEqual(semaphore.waiting(), 0)
+            semaphore.release()
+            await asyncio.wait_for(semaphore.acquire(), 1)
+
+        asyncio.run(_main())
+
+    def test_run(self):
+        """Test running a coroutine through a lane."""
+
+        async def _level():
+            return current_priority()
+
+        async def _main():
+            scheduler = AsyncAdapterScheduler()
+            with priority(PRIORITY_INTERACTIVE):
+                return await scheduler.run(EXCLUSIVE, _level)
+
+        self.assertEqual(asyncio.run(_main()), PRIORITY_INTERACTIVE)
@@ -0,0 +1,174 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for the shared-memory ring buffer.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import multiprocessing
+import time
+from unittest import TestCase, skipUnless
+
+from bluew.connections import Connection
+from tests.fakebluez import FakeBluez, PrivateBus, have_dbus_daemon
+
+try:
+    from bluew.shmring import RingReader, RingWriter, attribute_key, numpy
+except ImportError:  # Python 3.7
+    RingWriter = None
+    numpy = None
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+
+
+def _consume(name, count, results):
+    with RingReader(name, from_start=True) as reader:
+        entries = []
+        for entry in reader.entries(timeout=5):
+            entries.append(entry.data)
+            if len(entries) == count:
+                break
+    results.put([bytes(data) for data in entries])
+
+
+@skipUnless(RingWriter is not None, 'shared_memory needs Python 3.8')
+class RingTest(TestCase):
+    """Tests for bluew.shmring."""
+
+    def setUp(self):
+        self.writer = RingWriter(capacity=256)
+        self.reader = RingReader(self.writer.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+
+    def test_read_write(self):
+        """Test that entries come out in order, with their key."""
+
+        self.assertIsNone(self.reader.read())
+        self.writer.write(b'abc', key=7, timestamp=1.5)
+        self.writer.write(b'defgh')
+        entry = self.reader.read()
+        self.assertEqual(entry.data, b'abc')
+        self.assertEqual((entry.key, entry.timestamp), (7, 1.5))
+        self.assertEqual(self.reader.read().data, b'defgh')
+        self.assertIsNone(self.reader.read())
+        self.assertEqual(self.reader.written, 2)
+        self.assertRaises(ValueError, self.writer.write, bytes(200))
+
+    def test_wrap(self):
+        """Test entries that don't fit before the end of the ring."""
+
+        for index in range(40):
+            self.writer.write(bytes([index]) * (index % 20))
+            entry = self.reader.read()
+            self.assertEqual(entry.data, bytes([index]) * (index % 20))
+        self.assertEqual(self.reader.overruns, 0)
+        self.assertEqual(self.reader.pending, 0)
+
+    def test_lapped(self):
+        """Test that a reader left behind skips ahead, and says so."""
+
+        self.writer.write(b'old')
+        view = self.reader.read_view()
+        self.assertTrue(self.reader.intact(view))
+        for _ in range(20):
+            self.writer.write(bytes(30))
+        self.assertFalse(self.reader.intact(view))
+        view.data.release()
+        self.assertIsNone(self.reader.read())
+        self.assertEqual(self.reader.overruns, 1)
+        self.writer.write(b'new')
+        self.assertEqual(self.reader.read().data, b'new')
+
+    def test_closed(self):
+        """Test that a closed ring says so."""
+
+        self.writer.close()
+        self.assertRaisesRegex(ValueError, 'closed', self.writer.write, b'a')
+        self.reader.close()
+        self.assertRaisesRegex(ValueError, 'closed', self.reader.read)
+
+    def test_processes(self):
+        """Test reading from another process."""
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        writer = RingWriter(capacity=4096)
+        try:
+            process = context.Process(target=_consume,
+                                      args=(writer.name, 50, results))
+            process.start()
+            for index in range(50):
+                writer.write(index.to_bytes(4, 'little'))
+                time.sleep(0.001)
+            entries = results.get(timeout=30)
+            process.join(10)
+        finally:
+            writer.close()
+        self.assertEqual([int.from_bytes(entry, 'little')
+                          for entry in entries], list(range(50)))
+
+    @skipUnless(numpy is not None, 'numpy not installed')
+    def test_array(self):
+        """Test zero copy numpy views of entries."""
+
+        self.writer.write(bytes([1, 0, 2, 0, 3, 0]))
+        entry = self.reader.read_view()
+        array = self.reader.as_array(entry, 'int16')
+        self.assertEqual(list(array), [1, 2, 3])
+        del array
+        entry.data.release()
+
+
+@skipUnless(RingWriter is not None, 'shared_memory needs Python 3.8')
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class NotifyRingTest(TestCase):
+    """Tests for notifications written to a ring by Connection.notify."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.dev_path = self.fake.add_device(
+            MAC, services={SERVICE: {BATTERY: b'\x64'}})
+
+    def tearDown(self):
+        self.fake.close()
+        self.bus.close()
+
+    def test_notify(self):
+        """Test that values are written to the ring, and handed on."""
+
+        seen = []
+        with RingWriter(capacity=4096) as ring, \
+                RingReader(ring.name) as reader:
+            connection = Connection(MAC, engine='wired',
+                                    bus_address=self.bus.address,
+                                    wait_for_services=True, reconnect=False)
+            try:
+                connection.notify(BATTERY, seen.append, ring=ring)
+                chrc = self.fake.chrc_path(self.dev_path, BATTERY)
+                for value in range(5):
+                    self.fake.notify(chrc, [value])
+                entries = []
+                for entry in reader.entries(timeout=2):
+                    entries.append(entry)
+                    if len(entries) == 5:
+                        break
+            finally:
+                connection.close()
+        self.assertEqual([entry.data for entry in entries],
+                         [bytes([value]) for value in range(5)])
+        self.assertEqual({entry.key for entry in entries},
+                         {attribute_key(BATTERY)})
+        self.assertEqual(len(seen), 5)
@@ -0,0 +1,109 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for the device state cache.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import threading
+import time
+from unittest import TestCase
+
+from bluew.state import DeviceStateCache, ValueCache
+
+
+PATH = '/org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF'
+
+
+class DeviceStateCacheTest(TestCase):
+    """Tests for bluew.state.DeviceStateCache."""
+
+    def test_unknown(self):
+        """Test that unknown devices answer None."""
+
+        cache = DeviceStateCache()
+        self.assertIsNone(cache.known(PATH))
+        self.assertIsNone(cache.connected(PATH))
+        self.assertIsNone(cache.paired(PATH))
+
+    def test_updates(self):
+        """Test that property changes are applied."""
+
+        cache = DeviceStateCache()
+        cache.update(PATH, {'Connected': True, 'Paired': False,
+                            'ServicesResolved': True})
+        self.assertTrue(cache.known(PATH))
+        self.assertTrue(cache.connected(PATH))
+        self.assertFalse(cache.paired(PATH))
+        cache.update(PATH, {'Connected': False})
+        self.assertFalse(cache.connected(PATH))
+        self.assertFalse(cache.services_resolved(PATH))
+        self.assertIsNone(cache.connected(PATH + '_00'))
+        cache.remove(PATH)
+        self.assertIsNone(cache.known(PATH))
+
+    def test_stale(self):
+        """Test that stale entries answer None."""
+
+        cache = DeviceStateCache(max_age=0.01)
+        cache.update(PATH, {'Connected': True})
+        time.sleep(0.02)
+        self.assertIsNone(cache.connected(PATH))
+
+    def test_wait_for(self):
+        """Test that waiters are woken up by updates."""
+
+        cache = DeviceStateCache()
+        timer = threading.Timer(
+            0.01, cache.update, (PATH, {'ServicesResolved': True}))
+        timer.start()
+        self.assertTrue(cache.wait_for(
+            PATH, lambda state: state.services_resolved, 2))
+        self.assertFalse(cache.wait_for(
+            PATH, lambda state: state.paired, 0.01))
+
+    def test_listeners(self):
+        """Test that listeners get changes, and removals of connected."""
+
+        cache = DeviceStateCache()
+        changes = []
+        cache.add_listener(PATH, changes.append)
+        cache.update(PATH, {'Connected': True})
+        cache.update(PATH + '_00', {'Connected': True})
+        cache.remove(PATH)
+        cache.remove_listener(PATH, changes.append)
+        cache.update(PATH, {'Connected': True})
+        self.assertEqual(changes, [{'Connected': True},
+                                   {'Connected': False}])
+
+
+class ValueCacheTest(TestCase):
+    """Tests for bluew.state.ValueCache."""
+
+    def test_values(self):
+        """Test max-age lookups, and hit/miss counts."""
+
+        cache = ValueCache()
+        self.assertIsNone(cache.get(PATH, 'uuid', 10))
+        cache.update(PATH, 'uuid', b'\x01')
+        self.assertEqual(cache.get(PATH, 'uuid', 10), b'\x01')
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(PATH, 'uuid', 0.01))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'size': 1})
+
+    def test_paths(self):
+        """Test updates by object path."""
+
+        cache = ValueCache()
+        chrc = PATH + '/service000a/char000b'
+        self.assertFalse(cache.update_path(chrc, b'\x01'))
+        cache.learn(chrc, 'uuid')
+        self.assertTrue(cache.update_path(chrc, b'\x02'))
+        self.assertEqual(cache.get(PATH, 'uuid', 10), b'\x02')
+        cache.forget(chrc)
+        self.assertIsNone(cache.get(PATH, 'uuid', 10))
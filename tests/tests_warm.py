@@ -0,0 +1,178 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for keeping the engines of the API warm.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import os
+import subprocess
+import sys
+import time
+from unittest import TestCase, skipUnless
+
+import bluew
+from bluew import api
+from bluew.engine import EngineBluew
+from bluew.errors import ReadWriteNotifyError
+from tests.fakebluez import ERR, FakeBluez, PrivateBus, have_dbus_daemon
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+
+# A script leaving an engine warm, whose loop thread isn't a daemon, like
+# dbusted's.
+LOOP_SCRIPT = '''
+import threading
+import bluew
+from bluew.engine import EngineBluew
+
+class LoopEngine(EngineBluew):
+    def __init__(self, *args, **kwargs):
+        kwargs['name'], kwargs['version'] = 'loop', '0.0.1'
+        super().__init__(*args, **kwargs)
+        self.stopped = threading.Event()
+        threading.Thread(target=self.stopped.wait).start()
+    def start_engine(self):
+        pass
+    def stop_engine(self):
+        self.stopped.set()
+    controllers = []
+
+bluew.keep_warm()
+bluew.controllers(engine=LoopEngine)
+'''
+
+
+class RecordingEngine(EngineBluew):
+    """Engine that only records how it was constructed."""
+
+    controllers = []  # type: list
+
+    def __init__(self, *args, **kwargs):
+        kwargs['name'] = 'recording'
+        kwargs['version'] = '0.0.1'
+        super().__init__(*args, **kwargs)
+        self.kwargs = kwargs
+
+    def start_engine(self):
+        pass
+
+    def stop_engine(self):
+        pass
+
+
+class WarmCacheTest(TestCase):
+    """Tests for bluew.keep_warm() that need no bus."""
+
+    def setUp(self):
+        bluew.keep_warm()
+
+    def tearDown(self):
+        bluew.keep_warm(False)
+
+    def test_connection_kwargs(self):
+        """Test that Connection arguments don't reach the engine."""
+
+        bluew.controllers(engine=RecordingEngine, reconnect=False, cntrl='x')
+        engines = list(api._warm.values())  # pylint: disable=W0212
+        self.assertNotIn('reconnect', engines[0].kwargs)
+        self.assertEqual(engines[0].kwargs['cntrl'], 'x')
+
+    def test_stopped_at_exit(self):
+        """Test that warm engines don't keep the process from exiting."""
+
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=root)
+        process = subprocess.run([sys.executable, '-c', LOOP_SCRIPT],
+                                 env=env, timeout=10, check=False)
+        self.assertEqual(process.returncode, 0)
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class WarmTest(TestCase):
+    """Tests for bluew.keep_warm()."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.fake.add_device(MAC, services={SERVICE: {BATTERY: b'\x64'}})
+        self.kwargs = {'engine': 'wired', 'bus_address': self.bus.address}
+        bluew.keep_warm()
+
+    def tearDown(self):
+        bluew.keep_warm(False)
+        self.fake.close()
+        self.bus.close()
+
+    def _dumps(self):
+        return self.fake.calls.count(('/', 'GetManagedObjects'))
+
+    def test_reused(self):
+        """Test that calls share one engine, that's stopped at the end."""
+
+        bluew.controllers(**self.kwargs)
+        dumps = self._dumps()
+        controllers = bluew.controllers(**self.kwargs)
+        self.assertEqual([cntrl.Path for cntrl in controllers],
+                         ['/org/bluez/hci0'])
+        self.assertEqual(self._dumps(), dumps)
+        engines = list(api._warm.values())  # pylint: disable=W0212
+        self.assertEqual(len(engines), 1)
+        value = bluew.read_attribute(MAC, BATTERY, reconnect=False,
+                                     **self.kwargs)
+        self.assertEqual(value, [b'\x64'])
+        self.assertEqual(list(api._warm.values()),  # pylint: disable=W0212
+                         engines)
+        self.assertIsNotNone(engines[0]._loop)  # pylint: disable=W0212
+        bluew.keep_warm(False)
+        self.assertIsNone(engines[0]._loop)  # pylint: disable=W0212
+
+    def test_errors_keep_engine(self):
+        """Test that an operation failing doesn't break later calls."""
+
+        kwargs = dict(self.kwargs, reconnect=False)
+        self.fake.fail_next['ReadValue'] = (ERR + 'NotPermitted',
+                                            'Read not permitted')
+        self.assertRaises(ReadWriteNotifyError, bluew.read_attribute, MAC,
+                          BATTERY, **kwargs)
+        self.assertEqual(bluew.read_attribute(MAC, BATTERY, **kwargs),
+                         [b'\x64'])
+
+    def test_stopped_engine_replaced(self):
+        """Test that a warm engine stopped under the cache is replaced."""
+
+        bluew.controllers(**self.kwargs)
+        engines = list(api._warm.values())  # pylint: disable=W0212
+        engines[0].stop_engine()
+        controllers = bluew.controllers(**self.kwargs)
+        self.assertEqual([cntrl.Path for cntrl in controllers],
+                         ['/org/bluez/hci0'])
+        warm = list(api._warm.values())  # pylint: disable=W0212
+        self.assertEqual(len(warm), 1)
+        self.assertIsNot(warm[0], engines[0])
+
+    def test_controllers_follow_signals(self):
+        """Test that controllers added and removed show up."""
+
+        bluew.controllers(**self.kwargs)
+        dumps = self._dumps()
+        self.fake.add_adapter('hci1')
+        paths = []
+        deadline = time.monotonic() + 2
+        while len(paths) < 2 and time.monotonic() < deadline:
+            paths = [cntrl.Path for cntrl in bluew.controllers(**self.kwargs)]
+        self.assertEqual(paths, ['/org/bluez/hci0', '/org/bluez/hci1'])
+        self.fake.reset_adapter('hci1', downtime=10)
+        while len(paths) > 1 and time.monotonic() < deadline:
+            paths = [cntrl.Path for cntrl in bluew.controllers(**self.kwargs)]
+        self.assertEqual(paths, ['/org/bluez/hci0'])
+        self.assertEqual(self._dumps(), dumps)
@@ -0,0 +1,289 @@
+"""
+bluew.tests
+~~~~~~~~~~~
+
+This module provides tests for the Wired engine, and the D-Bus wire protocol
+implementation it's built on.
+
+
+:copyright: (c) 2017 by Ahmed Alsharif.
+:license: MIT, see LICENSE for more details.
+"""
+
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, skipUnless
+
+from bluew.errors import (BluewError, DeviceNotAvailable,
+                          ControllerSpecifiedNotFound, PairError)
+from bluew.wired import Wired
+from bluew.wired.bus import BusConnection, DBusError, ERR_DISCONNECTED
+from bluew.wired.marshal import (Marshaller, Unmarshaller, Message, Variant,
+                                 split_signature, METHOD_CALL, METHOD_RETURN,
+                                 SIGNAL)
+from tests.fakebluez import (DEVICE_IFACE, ERR, FakeBluez, PrivateBus,
+                             have_dbus_daemon)
+
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+SERVICE = '0000180f-0000-1000-8000-00805f9b34fb'
+BATTERY = '00002a19-0000-1000-8000-00805f9b34fb'
+
+
+class MarshalTest(TestCase):
+    """Tests for the D-Bus wire format."""
+
+    def _roundtrip(self, signature, values, endian='<'):
+        marshaller = Marshaller(endian)
+        marshaller.write_all(signature, values)
+        return Unmarshaller(bytes(marshaller.buf), endian).read_all(signature)
+
+    def test_split_signature(self):
+        """Test splitting signatures into complete types."""
+
+        self.assertEqual(split_signature('sa{sv}as(ii)y'),
+                         ['s', 'a{sv}', 'as', '(ii)', 'y'])
+
+    def test_basic_types(self):
+        """Test fixed size types and strings in both byte orders."""
+
+        values = [1, True, -2, 3, -4, 5, -6, 7, 1.5, 'str', '/obj', 'a{sv}']
+        for endian in '<>':
+            self.assertEqual(self._roundtrip('ybnqiuxtdsog', values, endian),
+                             values)
+
+    def test_containers(self):
+        """Test arrays, dicts, structs and variants."""
+
+        values = [b'\x01\x02', {'a': Variant('q', 1), 'b': 'x'},
+                  [(1, 'one'), (2, 'two')], {}, []]
+        result = self._roundtrip('aya{sv}a(ys)a{sv}as', values)
+        self.assertEqual(result, [b'\x01\x02', {'a': 1, 'b': 'x'},
+                                  [(1, 'one'), (2, 'two')], {}, []])
+
+    def test_message(self):
+        """Test marshalling a whole message."""
+
+        msg = Message(METHOD_CALL, path='/org/bluez/hci0', member='Write',
+                      interface='org.bluez.GattCharacteristic1',
+                      destination='org.bluez', signature='aya{sv}',
+                      body=(b'\x03\x01', {'offset': Variant('q', 2)}),
+                      serial=7)
+        data = msg.marshal()
+        self.assertEqual(len(data), Message.length(data[:16]))
+        parsed = Message.unmarshal(data)
+        self.assertEqual(parsed.serial, 7)
+        self.assertEqual(parsed.path, '/org/bluez/hci0')
+        self.assertEqual(parsed.body, [b'\x03\x01', {'offset': 2}])
+
+
+class BusTest(TestCase):
+    """Tests for the bus connection, against a bus that misbehaves."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'bus')
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.tmp.cleanup()
+
+    @staticmethod
+    async def _serve(reader, writer):
+        # Accept anyone, answer every call, but first send a signal with a
+        # type code we can't read on Ping, and hang up on Bye.
+        await reader.readline()
+        writer.write(b'OK 0123456789abcdef\r\n')
+        await reader.readline()
+        while True:
+            head = await reader.readexactly(16)
+            rest = await reader.readexactly(Message.length(head) - 16)
+            call = Message.unmarshal(head + rest)
+            if call.member == 'Bye':
+                writer.close()
+                return
+            if call.member == 'Ping':
+                signal = Message(SIGNAL, path='/', interface='test.Iface',
+                                 member='Odd', signature='s', body=('x',),
+                                 serial=1).marshal()
+                writer.write(signal.replace(b'\x01s\x00', b'\x01!\x00', 1))
+            writer.write(Message(METHOD_RETURN, reply_serial=call.serial,
+                                 signature='s', body=(':1.1',),
+                                 serial=2).marshal())
+
+    async def _session(self):
+        server = await asyncio.start_unix_server(self._serve, self.path)
+        bus = BusConnection()
+        try:
+            await bus.open('unix:path=' + self.path)
+            reply = await bus.call('test', '/', 'test.Iface', 'Ping',
+                                   timeout=1)
+            self.assertEqual(reply, [':1.1'])
+            with self.assertRaises(DBusError):
+                await bus.call('test', '/', 'test.Iface', 'Bye', timeout=1)
+            self.assertFalse(bus.connected)
+            with self.assertRaises(DBusError) as raised:
+                await bus.call('test', '/', 'test.Iface', 'Ping', timeout=1)
+            self.assertEqual(raised.exception.name, ERR_DISCONNECTED)
+        finally:
+            await bus.aclose()
+            server.close()
+            await server.wait_closed()
+
+    def test_bad_message_and_lost_bus(self):
+        """Test skipping a message, then failing calls once the bus left."""
+
+        with self.assertLogs('bluew.wired.bus', 'WARNING'):
+            self.loop.run_until_complete(self._session())
+
+
+@skipUnless(have_dbus_daemon(), 'dbus-daemon not available')
+class WiredTest(TestCase):
+    """Tests for the Wired engine against a fake bluez service."""
+
+    def setUp(self):
+        self.bus = PrivateBus()
+        self.fake = FakeBluez(self.bus.address)
+        self.fake.add_adapter()
+        self.dev_path = self.fake.add_device(
+            MAC, services={SERVICE: {BATTERY: b'\x64'}})
+        self.engine = Wired(bus_address=self.bus.address, timeout=1)
+
+    def tearDown(self):
+        self.engine.stop_engine()
+        self.fake.close()
+        self.bus.close()
+
+    def test_controller(self):
+        """Test that the controller is picked, and validated."""
+
+        self.assertEqual(self.engine.cntrl, 'hci0')
+        self.assertRaises(ControllerSpecifiedNotFound, Wired,
+                          bus_address=self.bus.address, cntrl='hci1')
+
+    def test_connect_read_write(self):
+        """Test connecting, reading and writing an attribute."""
+
+        self.engine.connect(MAC)
+        self.assertEqual(self.engine.read_attribute(MAC, BATTERY), [b'\x64'])
+        self.engine.write_attribute(MAC, BATTERY, [0x32])
+        self.assertEqual(self.engine.read_attribute(MAC, BATTERY), [b'\x32'])
+        self.assertTrue(self.engine.info(MAC).Connected)
+        self.engine.disconnect(MAC)
+        self.assertFalse(self.engine.info(MAC).Connected)
+
+    def test_read_reconnects(self):
+        """Test that a read on a dropped link connects again."""
+
+        self.engine.connect(MAC)
+        self.engine.read_attribute(MAC, BATTERY)
+        self.fake.call_soon(self.fake.set_prop, self.dev_path,
+                            'org.bluez.Device1', 'Connected', False)
+        self.assertEqual(self.engine.read_attribute(MAC, BATTERY), [b'\x64'])
+
+    def test_notify(self):
+        """Test that notifications are delivered to the handler."""
+
+        self.engine.connect(MAC)
+        received = []
+        done = threading.Event()
+
+        def _handler(data):
+            received.append(data)
+            if len(received) == 2:
+                done.set()
+
+        self.engine.notify(MAC, BATTERY, _handler)
+        chrc = self.fake.chrc_path(self.dev_path, BATTERY)
+        self.fake.notify(chrc, b'\x01')
+        self.fake.notify(chrc, b'\x02')
+        self.assertTrue(done.wait(2))
+        self.assertEqual(received, [b'\x01', b'\x02'])
+        self.engine.stop_notify(MAC, BATTERY)
+
+    def test_call_from_handler(self):
+        """Test that calling the engine from a handler raises."""
+
+        self.engine.connect(MAC)
+        errors = []
+        done = threading.Event()
+
+        def _handler(_):
+            try:
+                self.engine.read_attribute(MAC, BATTERY)
+            except BluewError as exp:
+                errors.append(exp)
+            done.set()
+
+        self.engine.notify(MAC, BATTERY, _handler)
+        self.fake.notify(self.fake.chrc_path(self.dev_path, BATTERY), b'\x01')
+        self.assertTrue(done.wait(2))
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.engine.read_attribute(MAC, BATTERY), [b'\x01'])
+
+    def test_pair_trust_remove(self):
+        """Test pairing, trusting and removing a device."""
+
+        self.engine.pair(MAC)
+        self.engine.trust(MAC)
+        info = self.engine.info(MAC)
+        self.assertTrue(info.Paired)
+        self.assertTrue(info.Trusted)
+        self.engine.remove(MAC)
+        self.assertNotIn(self.dev_path, self.fake.objects)
+
+    def test_pair_failed(self):
+        """Test that a pairing bluez gives up on raises PairError."""
+
+        for error in ('AuthenticationCanceled', 'ConnectionAttemptFailed',
+                      'Failed'):
+            self.fake.fail_next['Pair'] = (ERR + error, error)
+            self.assertRaises(PairError, self.engine.pair, MAC)
+        self.assertFalse(self.fake.objects[self.dev_path][DEVICE_IFACE][
+            'Paired'])
+
+    def test_discovers_hidden_device(self):
+        """Test that unknown devices are found by scanning for them."""
+
+        self.fake.add_device('11:22:33:44:55:66', visible=False)
+        self.engine.connect('11:22:33:44:55:66')
+
+    def test_device_not_available(self):
+        """Test that a missing device raises DeviceNotAvailable."""
+
+        self.engine.client.timeout = 0.1
+        self.assertRaises(DeviceNotAvailable, self.engine.connect,
+                          '00:00:00:00:00:00')
+
+    def test_connect_waits_for_services(self):
+        """Test that connect can wait for service discovery."""
+
+        took = self.engine.connect(MAC, wait_for_services=True)
+        self.assertGreater(took, 0)
+        self.assertTrue(self.engine.info(MAC).ServicesResolved)
+        self.engine.disconnect(MAC)
+        self.fake.resolve_delay = 5
+        self.assertRaises(DeviceNotAvailable, self.engine.connect, MAC,
+                          wait_for_services=True, services_timeout=0.05)
+
+    def test_max_age_reads(self):
+        """Test that reads with max_age are served from known values."""
+
+        self.engine.connect(MAC)
+        self.engine.read_attribute(MAC, BATTERY)
+        del self.fake.calls[:]
+        self.assertEqual(self.engine.read_attribute(MAC, BATTERY, max_age=10),
+                         [b'\x64'])
+        self.assertNotIn('ReadValue',
+                         [member for _, member in self.fake.calls])
+        self.fake.notify(self.fake.chrc_path(self.dev_path, BATTERY), b'\x10')
+        deadline = time.monotonic() + 2
+        while self.engine.read_attribute(MAC, BATTERY, 10) != [b'\x10']:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertEqual(self.engine.value_cache.misses, 0)